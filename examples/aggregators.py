@@ -1,8 +1,9 @@
 '''
 The running-aggregator processors. Each one keeps internal state across the whole
-stream and emits the cumulative result so far. They subclass OneTaskProcessorNode,
-so they are always a single replica -- the running state can't be split across
-competing workers.
+stream and emits the cumulative result so far. They subclass KeyedProcessorNode:
+the state is kept per partition key, so they only replicate under partition_by
+(one running total per camera, say). Here there is a single stream and a single
+replica. WindowAggregator does the same over a tumbling or sliding window.
 
 Here one integer stream fans out to five aggregators, and a joiner recombines
 their latest values into a single (count, sum, product, min, max) tuple per input.
@@ -0,0 +1,23 @@
+'''
+The broker suites of `videoflow bench`, in quick mode against a real NATS: each
+must run its flows to completion and report sane numbers.
+'''
+import os
+
+import pytest
+
+from videoflow.bench.harness import BenchConfig
+from videoflow.bench.suites import run_suites
+
+NATS_URL = os.environ.get('VF_TEST_NATS_URL', 'nats://localhost:4222')
+
+def test_quick_broker_suites():
+    run = run_suites(['hop', 'scaling', 'join', 'blob'], BenchConfig(nats_url = NATS_URL, quick = True))
+    values = {f'{suite}.{m.name}': m.value for suite, ms in run.suites.items() for m in ms}
+    assert values['hop.depth_1.latency_p50_ms'] > 0
+    assert values['scaling.replicas_2.throughput'] > values['scaling.replicas_1.throughput']
+    assert values['join.replicas_2.matched_fraction'] == 1.0
+    assert values['blob.64kb.throughput_mb_s'] > 0
+
+if __name__ == '__main__':
+    pytest.main([__file__])
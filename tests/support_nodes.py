@@ -4,6 +4,7 @@ tests add this directory to PYTHONPATH) so worker subprocesses can import them b
 class path, exactly as they would a real user's node.
 '''
 import asyncio
+import time
 
 from videoflow.core.node import ProcessorNode
 
@@ -20,3 +21,20 @@ class CtxPartitionTagger(ProcessorNode):
         if ctx is not None:
             ctx.set_partition_key(f'k{x % 3}')
         return x
+
+class PidTagger(ProcessorNode):
+    '''Returns (x, pid) so a test can see which pool process handled each input; raises on x == 13.'''
+    def open(self):
+        import os
+        self._pid = os.getpid()
+
+    def process(self, x):
+        if x == 13:
+            raise ValueError('unlucky')
+        time.sleep(0.01 * (x % 3))
+        return (x, self._pid)
+
+class ArrayNegator(ProcessorNode):
+    '''Returns a new array (large enough to cross the pool through shared memory).'''
+    def process(self, arr):
+        return -arr
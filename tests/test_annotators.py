@@ -0,0 +1,101 @@
+'''
+Tests for the vision annotators: the vectorized mask blend against a
+straightforward per-mask reference, batched box drawing, and the opt-in
+in-place drawing.
+'''
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip('cv2')   # optional 'vision' extra
+
+from videoflow.processors.vision.annotators import BoundingBoxAnnotator, SegmenterAnnotator, TrackerAnnotator
+
+LABELS = '''
+item {
+  id: 1
+  display_name: "person"
+}
+item {
+  id: 2
+  display_name: "car"
+}
+'''
+
+
+@pytest.fixture
+def labels_path(tmp_path):
+    path = tmp_path / 'labels.pbtxt'
+    path.write_text(LABELS)
+    return str(path)
+
+
+def _frame(h = 60, w = 80):
+    im = np.random.RandomState(0).randint(0, 256, (h, w, 3)).astype(np.uint8)
+    im.flags.writeable = False   # as decoded off the wire
+    return im
+
+
+def test_segmenter_blend_matches_per_mask_reference(labels_path):
+    im = _frame()
+    masks = np.zeros((3, 60, 80), np.uint8)
+    masks[0, :20] = 1
+    masks[1, 20:40, :30] = 1
+    masks[2, 45:, 50:] = 1
+    classes = np.array([0, 4, 13])
+    annotator = SegmenterAnnotator(class_labels_path = labels_path, transparency = 0.4)
+    out = annotator.process(im, [masks, classes, np.ones(3)])
+
+    expected = im.astype(np.float64)
+    for mask, klass in zip(masks, classes):
+        color = np.array(SegmenterAnnotator.colors[klass % len(SegmenterAnnotator.colors)])
+        sel = mask == 1
+        expected[sel] = 0.6 * expected[sel] + 0.4 * color
+    assert out.dtype == np.uint8
+    assert np.abs(out.astype(np.int64) - expected.round()).max() <= 1
+    # Unmasked pixels are untouched, and the read-only input was not written to.
+    assert np.array_equal(out[20:40, 30:], im[20:40, 30:])
+    assert not np.shares_memory(out, im)
+
+
+def test_segmenter_later_mask_wins_on_overlap(labels_path):
+    im = np.zeros((10, 10, 3), np.uint8)
+    masks = np.ones((2, 10, 10), np.uint8)
+    out = SegmenterAnnotator(class_labels_path = labels_path, transparency = 1.0).process(
+        im, [masks, np.array([0, 1]), np.ones(2)])
+    assert (out == SegmenterAnnotator.colors[1]).all()
+    assert SegmenterAnnotator(class_labels_path = labels_path).process(
+        im, [np.zeros((0, 10, 10)), np.zeros(0), np.zeros(0)]).shape == (10, 10, 3)
+
+
+def test_box_annotators_draw_every_box(labels_path):
+    im = np.zeros((100, 100, 3), np.uint8)
+    boxes = np.array([[10, 10, 40, 40, 1, 0.9], [50, 50, 90, 90, 2, 0.5]])
+    out = BoundingBoxAnnotator(class_labels_path = labels_path, box_color = (255, 0, 0)).process(im, boxes)
+    reference = np.zeros_like(im)
+    for ymin, xmin, ymax, xmax in boxes[:, :4].astype(int):
+        cv2.rectangle(reference, (xmin, ymin), (xmax, ymax), (255, 0, 0), 2)
+    # Box outlines are exactly what per-box cv2.rectangle draws (text aside).
+    assert ((out[..., 0] == 255) >= (reference[..., 0] == 255)).all()
+    tracked = TrackerAnnotator().process(np.zeros((100, 100, 3), np.uint8), boxes[:, :5])
+    assert tracked.any()
+    assert TrackerAnnotator().process(im, np.zeros((0, 5))).shape == im.shape
+
+
+def test_annotator_draws_in_place_only_when_asked(labels_path):
+    boxes = np.array([[5, 5, 20, 20, 7]])
+    frame = np.zeros((30, 30, 3), np.uint8)
+    out = TrackerAnnotator().process(frame, boxes)
+    assert out is not frame and not frame.any()
+    annotator = TrackerAnnotator(inplace = True)
+    assert annotator.process(frame, boxes) is frame
+    assert TrackerAnnotator(**annotator.get_params())._inplace
+    # Read-only or strided frames are still copied.
+    view = np.zeros((30, 60, 3), np.uint8)[:, :30]
+    out = annotator.process(view, boxes)
+    assert out is not view and not view.any()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,205 @@
+'''
+Tests for the backpressure telemetry: the throttled, counted event log, the
+join assemblers' evictions and buffer depths, the NATS messenger's publish
+retries and REALTIME eviction gaps, and the buffer gauges on /metrics.
+'''
+import asyncio
+import json
+import logging
+import threading
+import types
+
+import pytest
+
+from videoflow.core.constants import BATCH, REALTIME
+from videoflow.core.engine import Messenger
+from videoflow.core.policies import JOIN_TIME, MISSING_DROP, JoinPolicy
+from videoflow.messaging.events import (
+    EVENT_JOIN_GROUPS_EVICTED,
+    EVENT_LOGGER_NAME,
+    EventLog,
+)
+from videoflow.messaging.grouping import EnvelopeEntry, TimeGroupAssembler, TraceGroupAssembler
+from videoflow.runtime.health import HealthState, InstrumentedMessenger
+from videoflow.runtime.logging_config import JsonFormatter
+
+
+class _Handle:
+    def __init__(self):
+        self.state = None
+
+    def ack(self):
+        self.state = 'acked'
+
+    def nak(self, delay = None):
+        self.state = 'naked'
+
+    def term(self):
+        self.state = 'termed'
+
+def _entry(trace_id, seq, event_ts = None):
+    return EnvelopeEntry(trace_id = trace_id, seq = seq, event_ts = event_ts, message = 'm',
+                         metadata = None, is_stop_signal = False)
+
+def test_event_log_counts_everything_and_throttles_the_log(caplog):
+    counted = []
+    events = EventLog('det', min_interval = 3600)
+    events.counter_observer = lambda event, n: counted.append((event, n))
+    with caplog.at_level(logging.WARNING, logger = EVENT_LOGGER_NAME):
+        events.emit('publish_retries', 'first', count = 2, throttle = True)
+        events.emit('publish_retries', 'second', count = 3, throttle = True)
+        events.emit('publish_dropped', 'other event', throttle = True)
+        events.emit('publish_retries', 'unthrottled')
+    assert counted == [('publish_retries', 2), ('publish_retries', 3),
+                       ('publish_dropped', 1), ('publish_retries', 1)]
+    assert [r.getMessage() for r in caplog.records] == ['first', 'other event', 'unthrottled']
+    # Once the interval has passed, the next line reports what was suppressed.
+    events._min_interval = 0
+    with caplog.at_level(logging.WARNING, logger = EVENT_LOGGER_NAME):
+        events.emit('publish_retries', 'third', throttle = True, attempts = 1)
+    record = caplog.records[-1]
+    assert record.getMessage() == 'third (+3 more since the last report)'
+    assert record.fields == {'attempts': 1, 'suppressed': 3}
+
+def test_json_formatter_carries_event_fields(caplog):
+    with caplog.at_level(logging.WARNING, logger = EVENT_LOGGER_NAME):
+        EventLog('det').emit('messages_evicted', 'lost 4', count = 4, parent = 'cam')
+    obj = json.loads(JsonFormatter().format(caplog.records[-1]))
+    assert obj['event'] == 'messages_evicted' and obj['node_name'] == 'det'
+    assert obj['fields'] == {'parent': 'cam'}
+
+def test_trace_assembler_reports_evictions_and_depth():
+    counted = []
+    events = EventLog('join')
+    events.counter_observer = lambda event, n: counted.append((event, n))
+    policy = JoinPolicy(timeout_seconds = 60, missing = MISSING_DROP, max_pending = 2)
+    assembler = TraceGroupAssembler('join', ['a', 'b'], policy, events = events)
+    handles = [_Handle() for _ in range(3)]
+    for n, handle in enumerate(handles):
+        assembler.add('a', _entry(f't{n}', n), handle)
+    assert counted == [(EVENT_JOIN_GROUPS_EVICTED, 1)]
+    assert handles[0].state == 'acked'
+    assert assembler.buffer_depths() == [('pending_groups', None, 2, 2)]
+
+def test_time_assembler_reports_collect_drops_and_depths():
+    counted = []
+    events = EventLog('fuse')
+    events.counter_observer = lambda event, n: counted.append((event, n))
+    policy = JoinPolicy(mode = JOIN_TIME, tolerance_ms = 10, collect = {'imu': 50}, max_pending = 4)
+    assembler = TimeGroupAssembler('fuse', ['cam', 'imu'], policy, events = events)
+    assembler._collect_cap = 2
+    for n in range(3):
+        assembler.add('imu', _entry(f'i{n}', n, event_ts = 100.0 + n * 0.01), _Handle())
+    assert counted == [('collect_samples_dropped', 1)]
+    assert assembler.buffer_depths() == [('pending_groups', None, 0, 4),
+                                         ('collect_buffer', 'imu', 2, 2)]
+
+class _PubAckError(Exception):
+    pass
+
+class _FakeJetStream:
+    def __init__(self, failures, error = 'maximum messages exceeded'):
+        self.failures = failures
+        self.error = error
+        self.published = 0
+
+    async def publish(self, subject, payload, headers = None):
+        if self.failures:
+            self.failures -= 1
+            raise _PubAckError(self.error)
+        self.published += 1
+
+def _messenger(flow_type, js):
+    pytest.importorskip('nats')
+    from videoflow.messaging.nats_messenger import NATSMessenger
+    from videoflow.wire.serialization import DEFAULT_ENVELOPE_VERSION
+
+    m = NATSMessenger.__new__(NATSMessenger)  # skip __init__: no broker
+    m._node = types.SimpleNamespace(name = 'det')
+    m._flow_id, m._run_id, m._replica_id = 'flow', 'run', 0
+    m._flow_type = flow_type
+    m._blob_store = None
+    m._blob_readers = 1
+    m._blob_ttl_seconds = 60
+    m._envelope_version = DEFAULT_ENVELOPE_VERSION
+    m._stage_observer = None
+    m._termination_event = threading.Event()
+    m._js = js
+    m._events = EventLog('det')
+    m._loop = asyncio.new_event_loop()
+    threading.Thread(target = m._loop.run_forever, daemon = True).start()
+    return m
+
+def test_batch_publish_retries_are_counted():
+    from videoflow.wire.serialization import MSG_TYPE_DATA
+
+    js = _FakeJetStream(failures = 2)
+    m = _messenger(BATCH, js)
+    counted = []
+    m.set_counter_observer(lambda event, n: counted.append((event, n)))
+    try:
+        m._publish('x', None, 't1', 1, MSG_TYPE_DATA)
+    finally:
+        m._loop.call_soon_threadsafe(m._loop.stop)
+    assert js.published == 1
+    assert counted == [('publish_retries', 2)]
+
+def test_realtime_publish_failure_is_counted_as_dropped():
+    from videoflow.wire.serialization import MSG_TYPE_DATA
+
+    js = _FakeJetStream(failures = 1, error = 'no responders')
+    m = _messenger(REALTIME, js)
+    counted = []
+    m._events.counter_observer = lambda event, n: counted.append((event, n))
+    try:
+        m._publish('x', None, 't1', 1, MSG_TYPE_DATA)
+    finally:
+        m._loop.call_soon_threadsafe(m._loop.stop)
+    assert js.published == 0 and counted == [('publish_dropped', 1)]
+
+def test_realtime_stream_gaps_count_as_evictions():
+    pytest.importorskip('nats')
+    from videoflow.messaging.nats_messenger import NATSMessenger
+
+    m = NATSMessenger.__new__(NATSMessenger)
+    m._node = types.SimpleNamespace(name = 'det')
+    m._events = EventLog('det')
+    m._last_stream_seq = {}
+    counted = []
+    m._events.counter_observer = lambda event, n: counted.append((event, n))
+
+    def msg(seq):
+        sequence = types.SimpleNamespace(stream = seq)
+        return types.SimpleNamespace(metadata = types.SimpleNamespace(sequence = sequence))
+
+    for seq in (5, 6, 10, 9, 11):   # 7-9 evicted; a late 9 (redelivery) is not a gap
+        m._note_stream_seq('cam', msg(seq))
+    assert counted == [('messages_evicted', 3)]
+
+class _Buffered(Messenger):
+    def publish_message(self, message, metadata = None):
+        pass
+
+    def publish_stop_signal(self):
+        pass
+
+    def check_for_termination(self):
+        return False
+
+    def receive_message(self):
+        return {}
+
+    def buffer_depths(self):
+        return [('parent_queue', 'cam', 3, 4), ('live_handles', None, 5, None)]
+
+def test_buffer_depths_become_gauges():
+    state = HealthState('det')
+    InstrumentedMessenger(_Buffered(), state)
+    text = state.render_metrics()
+    assert 'videoflow_buffer_depth{node="det",buffer="parent_queue",parent="cam"} 3' in text
+    assert 'videoflow_buffer_capacity{node="det",buffer="parent_queue",parent="cam"} 4' in text
+    assert 'videoflow_buffer_depth{node="det",buffer="live_handles"} 5' in text
+    assert 'videoflow_buffer_capacity{node="det",buffer="live_handles"}' not in text
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,90 @@
+'''
+Tests for the benchmark harness behind `videoflow bench`: results round-trip
+with their fingerprint, baseline comparison with per-metric thresholds, the
+suite registry, and the CLI's regression exit.
+'''
+import pytest
+
+from videoflow.bench import suites
+from videoflow.bench.harness import (
+    HIGHER_IS_BETTER,
+    BenchConfig,
+    BenchRun,
+    Measurement,
+    compare_runs,
+    fingerprint,
+    format_comparison,
+    load_run,
+    parse_thresholds,
+    save_run,
+)
+from videoflow.bench.suites import register_suite, run_suites
+from videoflow.deploy import cli
+
+
+def _run(encode_ms, throughput, hardware = 'a'):
+    run = BenchRun(fingerprint = {'hardware': {'cpu': hardware}})
+    run.suites['demo'] = [
+        Measurement('encode_ms', encode_ms, 'ms'),
+        Measurement('throughput', throughput, 'msg/s', HIGHER_IS_BETTER),
+        Measurement('messages', 100, '', None),
+    ]
+    return run
+
+def test_results_round_trip(tmp_path):
+    run = _run(1.0, 50.0)
+    run.fingerprint = fingerprint()
+    run.durations['demo'] = 2.5
+    path = str(tmp_path / 'nested' / 'run.json')
+    save_run(path, run)
+    loaded = load_run(path)
+    assert loaded.suites == run.suites and loaded.durations == {'demo': 2.5}
+    assert set(loaded.fingerprint) == {'hardware', 'software', 'commit'}
+    assert loaded.fingerprint['software']['python']
+
+def test_compare_judges_each_direction():
+    rows = {c.name: c for c in compare_runs(_run(1.25, 40.0), _run(1.0, 50.0), threshold = 0.1)}
+    assert rows['encode_ms'].change == pytest.approx(0.25) and rows['encode_ms'].regressed
+    assert rows['throughput'].change == pytest.approx(-0.2) and rows['throughput'].regressed
+    assert not rows['messages'].regressed             # reported, never judged
+    better = {c.name: c for c in compare_runs(_run(0.5, 80.0), _run(1.0, 50.0))}
+    assert better['encode_ms'].improved and better['throughput'].improved
+    assert 'REGRESSED' in format_comparison(list(rows.values()))
+
+def test_metric_thresholds_last_match_wins():
+    thresholds = parse_thresholds(['demo.*=0.5', 'demo.throughput=0.05'])
+    rows = {c.name: c for c in compare_runs(_run(1.25, 40.0), _run(1.0, 50.0),
+                                            thresholds = thresholds)}
+    assert not rows['encode_ms'].regressed and rows['throughput'].regressed
+    for bad in ('demo.*', '=0.1', 'demo.*=-1', 'demo.*=x'):
+        with pytest.raises(ValueError, match = 'PATTERN=FRACTION'):
+            parse_thresholds([bad])
+
+def test_run_suites_wire_and_broker_check():
+    run = run_suites(['wire'], BenchConfig(quick = True))
+    names = {m.name for m in run.suites['wire']}
+    assert {'tensor_1kb.encode_ms', 'frame_640x480.decode_ms', 'blobref_1mb.wire_bytes'} <= names
+    assert run.durations['wire'] > 0 and run.fingerprint['hardware']['cpu_count']
+    with pytest.raises(ValueError, match = 'need a NATS broker'):
+        run_suites(['hop'], BenchConfig())
+    with pytest.raises(ValueError, match = 'unknown bench suite'):
+        run_suites(['nope'], BenchConfig())
+
+def test_cli_fails_on_regression(tmp_path, capsys):
+    speed = {'ms': 1.0}
+    register_suite('fake', lambda config: [Measurement('step_ms', speed['ms'], 'ms')])
+    try:
+        baseline = str(tmp_path / 'baseline.json')
+        cli.main(['bench', 'fake', '--output', baseline])
+        speed['ms'] = 1.3
+        cli.main(['bench', 'fake', '--baseline', baseline, '--threshold', '0.5'])
+        with pytest.raises(SystemExit, match = 'fake.step_ms'):
+            cli.main(['bench', 'fake', '--baseline', baseline])
+        with pytest.raises(SystemExit, match = 'Unknown bench suite'):
+            cli.main(['bench', 'nope'])
+    finally:
+        suites._SUITES.pop('fake', None)
+    assert '+30.0%' in capsys.readouterr().out
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,74 @@
+'''
+Tests for the wire microbenchmark of `videoflow bench`: every case must really
+round-trip through the codec (a benchmark of a broken encoding guards nothing),
+blob cases must actually offload, and each case reports its time, size and
+tracemalloc figures.
+'''
+import numpy as np
+import pytest
+
+from videoflow.bench.harness import BenchConfig
+from videoflow.bench.wire import (
+    WIRE_CASES,
+    InMemoryBlobStore,
+    WireCase,
+    _inline_threshold,
+    measure_case,
+    wire_suite,
+)
+from videoflow.wire import serialization as ser
+
+
+def _same(a, b):
+    if isinstance(a, np.ndarray):
+        return isinstance(b, np.ndarray) and a.dtype == b.dtype and np.array_equal(a, b)
+    if isinstance(a, ser.RawPayload):
+        return (a.payload_type, a.data) == (b.payload_type, b.data)
+    return a == b
+
+@pytest.mark.parametrize('case', [c for c in WIRE_CASES if c.quick], ids = lambda c: c.name)
+def test_every_quick_case_round_trips(case):
+    payload = case.make()
+    store = InMemoryBlobStore() if case.blob else None
+    with _inline_threshold(ser.MAX_INLINE_PAYLOAD_BYTES if case.blob else 64 * 1024 * 1024):
+        buf = ser.encode_envelope('p', 'f', 'r', 't', 1, ser.MSG_TYPE_DATA, case.metadata,
+                                  payload, blob_store = store)
+    decoded = ser.decode_envelope(buf, blob_store = store)
+    assert _same(payload, decoded['message'])
+    assert decoded['metadata'] == case.metadata
+    if case.blob:
+        assert len(buf) < 1024 and len(store._blobs) == 1
+
+def test_measure_case_reports_time_size_and_allocations():
+    case = WireCase('raw', lambda: ser.RawPayload('vendor.bench.v1.Opaque', b'\x02' * 65536))
+    figures = {m.name: m for m in measure_case(case, quick = True)}
+    assert set(figures) == {f'raw.{f}' for f in ('encode_ms', 'decode_ms', 'wire_bytes',
+                                                 'encode_alloc_bytes', 'decode_alloc_bytes',
+                                                 'encode_copies', 'decode_copies')}
+    assert figures['raw.encode_ms'].value > 0 and figures['raw.wire_bytes'].value > 65536
+    # The envelope holds one copy of the payload bytes.
+    assert 0.9 < figures['raw.encode_copies'].value < 3
+    assert figures['raw.encode_copies'].better is None
+
+def test_blob_cases_do_not_accumulate_blobs():
+    store_sizes = []
+    real_clear = InMemoryBlobStore.clear
+
+    def clear(self):
+        store_sizes.append(len(self._blobs))
+        real_clear(self)
+
+    InMemoryBlobStore.clear = clear
+    try:
+        measure_case(WireCase('blob', lambda: np.ones(200_000, dtype = np.float32), blob = True),
+                     quick = True)
+    finally:
+        InMemoryBlobStore.clear = real_clear
+    assert store_sizes and max(store_sizes) == 1
+
+def test_quick_suite_runs_only_quick_cases():
+    names = {m.name.split('.')[0] for m in wire_suite(BenchConfig(quick = True))}
+    assert names == {c.name for c in WIRE_CASES if c.quick}
+
+if __name__ == '__main__':
+    pytest.main([__file__])
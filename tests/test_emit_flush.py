@@ -0,0 +1,171 @@
+'''
+Zero-or-many emission (``ProcessorNode.emit``) and the end-of-stream \
+    ``flush()`` hook: what ``ProcessorTask`` publishes, and the message \
+    identity the NATS messenger derives for each emission.
+'''
+import pytest
+
+from videoflow.core.engine import Messenger
+from videoflow.core.node import ProcessorNode, TaskModuleNode
+from videoflow.core.task import ProcessorTask
+from videoflow.processors import IdentityProcessor, WindowAggregator
+
+
+class _ListMessenger(Messenger):
+    '''Delivers each item as its own group; records (group, emission, message) per publish.'''
+    def __init__(self, items):
+        self._items = list(items)
+        self._current = None
+        self._emission = None
+        self.published = []
+        self.event_ts = []
+        self.acked = []
+        self.stopped = False
+
+    def receive_message(self):
+        if not self._items:
+            self._current = None
+            return {'p': {'message': None, 'metadata': None, 'is_stop_signal': True}}
+        self._current = self._items.pop(0)
+        return {'p': {'message': self._current, 'metadata': None, 'is_stop_signal': False}}
+
+    def set_output_emission(self, index, flush = False):
+        self._emission = (index, flush)
+
+    def set_output_event_timestamp(self, value):
+        self.event_ts.append(value)
+
+    def publish_message(self, message, metadata = None):
+        self.published.append((self._current, self._emission, message))
+        self._emission = None
+
+    def publish_stop_signal(self):
+        # The tail must be out before end of stream.
+        self.stopped = True
+
+    def ack_inputs(self):
+        self.acked.append(self._current)
+
+    def fail_inputs(self, exc):
+        raise exc
+
+class Batcher(ProcessorNode):
+    emits = True
+
+    def __init__(self, size = 3, **kwargs):
+        self._size = size
+        self._batch = []
+        super(Batcher, self).__init__(**kwargs)
+
+    def process(self, inp):
+        self._batch.append(inp)
+        if len(self._batch) == self._size:
+            self.emit(self._batch)
+            self._batch = []
+
+    def flush(self):
+        if self._batch:
+            self.emit(self._batch)
+
+class Splitter(ProcessorNode):
+    emits = True
+
+    def process(self, inp):
+        for i in range(inp):
+            self.emit((inp, i))
+
+def test_emitting_node_publishes_only_what_it_emits():
+    messenger = _ListMessenger(range(7))
+    ProcessorTask(Batcher(name = 'batch'), messenger, True, ['p']).run()
+    assert messenger.published == [
+        (2, (0, False), [0, 1, 2]),
+        (5, (0, False), [3, 4, 5]),
+        (None, (0, True), [6]),
+    ]
+    # Every input is acked, including those that emitted nothing.
+    assert messenger.acked == list(range(7))
+    assert messenger.stopped
+
+def test_many_emissions_per_input_are_numbered():
+    messenger = _ListMessenger([0, 2, 1])
+    ProcessorTask(Splitter(name = 'split'), messenger, True, ['p']).run()
+    assert messenger.published == [
+        (2, (0, False), (2, 0)),
+        (2, (1, False), (2, 1)),
+        (1, (0, False), (1, 0)),
+    ]
+
+def test_emissions_of_a_failed_process_call_are_discarded():
+    class Failing(ProcessorNode):
+        emits = True
+
+        def process(self, inp):
+            self.emit(('partial', inp))
+            if inp == 1:
+                raise ValueError('bad input')
+            self.emit(('done', inp))
+
+    class FailureRecorder(_ListMessenger):
+        def fail_inputs(self, exc):
+            self.failed = self._current
+
+    messenger = FailureRecorder([1, 2])
+    ProcessorTask(Failing(name = 'failing'), messenger, True, ['p']).run()
+    assert messenger.failed == 1
+    assert messenger.published == [
+        (2, (0, False), ('partial', 2)),
+        (2, (1, False), ('done', 2)),
+    ]
+
+def test_plain_node_still_publishes_its_return_value():
+    messenger = _ListMessenger([4, 5])
+    ProcessorTask(IdentityProcessor(name = 'id'), messenger, True, ['p']).run()
+    assert [(group, msg) for group, _, msg in messenger.published] == [(4, 4), (5, 5)]
+
+def test_flush_output_is_dropped_without_children():
+    node = Batcher(name = 'batch')
+    ProcessorTask(node, _ListMessenger(range(4)), False, ['p']).run()
+    assert node.take_emitted() == []
+
+def test_window_aggregator_emits_on_close():
+    agg = WindowAggregator(reduce = 'sum', length = 3, window = 'tumbling', emit_on = 'close', name = 'w')
+    messenger = _ListMessenger([1, 2, 3, 4, 5, 6, 7])
+    ProcessorTask(agg, messenger, True, ['p']).run()
+    assert [msg['value'] for _, _, msg in messenger.published] == pytest.approx([6, 15, 7])
+    assert messenger.published[-1][1] == (0, True)
+    # Each item window is stamped with the time of its last input.
+    assert [msg['window_end'] for _, _, msg in messenger.published] == messenger.event_ts
+
+def test_emitting_node_validation():
+    with pytest.raises(ValueError):
+        Batcher(cache = 'content')
+    with pytest.raises(ValueError):
+        Batcher(workers_per_replica = 2)
+    with pytest.raises(ValueError):
+        WindowAggregator(window = 'sliding', emit_on = 'close')
+    with pytest.raises(ValueError):
+        TaskModuleNode(Batcher(), Batcher())
+
+def test_nats_emission_identity(monkeypatch):
+    from videoflow.messaging.nats_messenger import NATSMessenger
+    m = NATSMessenger.__new__(NATSMessenger)  # skip __init__: no broker
+    m._node = Batcher(name = 'batch')
+    m._replica_id = 2
+    m._trace_counter = 0
+    m._last_trace_id, m._last_seq, m._last_event_ts = 'cam:7', 7, 1.0
+    m._output_event_ts = m._output_partition_key = m._output_emission = m._output_span = None
+    sent = []
+    monkeypatch.setattr(m, '_publish', lambda message, metadata, trace_id, seq, msg_type, **kw:
+                        sent.append((trace_id, seq)))
+    for index in range(3):
+        m.set_output_emission(index)
+        m.publish_message(index)
+    m.publish_message('plain')
+    m._last_trace_id = None
+    m.set_output_emission(1, flush = True)
+    m.publish_message('tail')
+    assert sent == [('cam:7', 7), ('cam:7.1', 7), ('cam:7.2', 7), ('cam:7', 7),
+                    ('batch:flush:r2:1', 1)]
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,127 @@
+'''
+Tests for the flow-level metrics of a local run: worker registration through
+VF_METRICS_DIR, the per-node table (throughput, processing quantiles, queue
+depth, errors, blob bytes) and the blob byte counters behind it.
+'''
+import os
+
+import pytest
+
+from videoflow.messaging.events import EventLog
+from videoflow.runtime.flowmetrics import (
+    FlowMetrics,
+    flow_rows,
+    format_flow_table,
+    register_worker,
+    registered_endpoints,
+    scrape_registry,
+    write_final_metrics,
+)
+from videoflow.runtime.health import HealthServer, HealthState
+from videoflow.wire.serialization import BlobStore
+
+
+def _state(node, received = 0, processed = 0, published = 0, failed = 0, process = (),
+           blob_put = 0, blob_fetched = 0, lag = None):
+    state = HealthState(node, buckets = (0.01, 0.1, 1.0))
+    for counter, n in (('messages_received', received), ('messages_processed', processed),
+                       ('messages_published', published), ('messages_failed', failed),
+                       ('blob_bytes_put', blob_put), ('blob_bytes_fetched', blob_fetched)):
+        if n:
+            state.incr(counter, n)
+    for v in process:
+        state.observe_stage('process', v)
+    if lag is not None:
+        state.add_collector(lambda: [('edge_lag_messages', {'parent': 'src'}, lag)])
+    return state
+
+def test_flow_rows_merge_replicas():
+    texts = [
+        _state('cam', published = 100).render_metrics(),
+        _state('det', received = 40, processed = 40, process = [0.05] * 40,
+               blob_fetched = 4096, lag = 3).render_metrics(),
+        _state('det', received = 60, processed = 58, failed = 2, process = [0.5] * 60,
+               blob_put = 2048, lag = 5).render_metrics(),
+    ]
+    cam, det = flow_rows(texts)
+    # A producer never receives: its throughput is what it publishes.
+    assert cam['node'] == 'cam' and cam['messages'] == 100 and cam['queue'] is None
+    assert det['replicas'] == 2 and det['messages'] == 98 and det['errors'] == 2
+    assert det['queue'] == 8
+    assert det['blob_bytes_put'] == 2048 and det['blob_bytes_fetched'] == 4096
+    assert 0.01 < det['process_p50'] <= 1.0 and det['process_p99'] > det['process_p50']
+
+def test_rates_between_updates_and_snapshot():
+    metrics = FlowMetrics()
+    start = metrics._start
+    rows = metrics.update([_state('det', received = 10, processed = 10).render_metrics()], now = start + 2)
+    assert rows[0]['msg_per_s'] == pytest.approx(5.0)
+    rows = metrics.update([_state('det', received = 40, processed = 40).render_metrics()], now = start + 5)
+    assert rows[0]['msg_per_s'] == pytest.approx(10.0)
+    # A replica that dropped out of the scrape is not negative throughput.
+    rows = metrics.update([_state('det', received = 5, processed = 5).render_metrics()], now = start + 6)
+    assert rows[0]['msg_per_s'] == 0
+    snapshot = metrics.snapshot()
+    assert snapshot['elapsed_seconds'] == pytest.approx(6.0)
+    assert snapshot['nodes'][0]['avg_msg_per_s'] == pytest.approx(5 / 6)
+
+def test_format_flow_table():
+    metrics = FlowMetrics()
+    metrics.update([_state('det', received = 3, processed = 3, process = [0.05],
+                           blob_put = 3 * 1024 * 1024, lag = 7).render_metrics()],
+                   now = metrics._start + 1)
+    header, row = format_flow_table(metrics.rows).splitlines()
+    assert header.split()[:3] == ['NODE', 'REPLICAS', 'MSG/S']
+    assert row.split() == ['det', '1', '3.0', '3', '0.055/0.099', '7', '0', '3.0M/0']
+
+def test_registry_serves_live_then_final_metrics(tmp_path):
+    directory = str(tmp_path)
+    state = _state('det', received = 2, processed = 2)
+    server = HealthServer(state, port = 0, debug = False)
+    server.start()
+    try:
+        register_worker(directory, 'det', 0, server.port)
+        register_worker(directory, 'sink', 0, 1)              # registered, unreachable
+        assert registered_endpoints(directory) == {
+            'det.0': f'http://localhost:{server.port}/metrics',
+            'sink.0': 'http://localhost:1/metrics'}
+        live = scrape_registry(directory, timeout = 0.5)
+        assert len(live) == 1 and 'videoflow_messages_processed_total{node="det"} 2' in live[0]
+        state.incr('messages_processed', 3)
+        write_final_metrics(directory, 'det', 0, state.render_metrics())
+    finally:
+        server.stop()
+    # Once a worker exits its final text stands in for the scrape.
+    final, = scrape_registry(directory, timeout = 0.5)
+    assert 'videoflow_messages_processed_total{node="det"} 5' in final
+    assert not [name for name in os.listdir(directory) if name.endswith('.tmp')]
+
+def test_nats_counts_blob_bytes():
+    from videoflow.messaging.nats_messenger import NATSMessenger
+
+    class _MemStore(BlobStore):
+        def __init__(self):
+            self.data = {}
+
+        def put(self, data, ttl_seconds = 60):
+            self.data['k'] = data
+            return 'k'
+
+        def get(self, ref):
+            return self.data[ref]
+
+    m = NATSMessenger.__new__(NATSMessenger)  # skip __init__: no broker
+    m._blob_store = _MemStore()
+    m._stage_observer = None
+    m._events = EventLog('det')
+    counted = []
+    m.set_counter_observer(lambda counter, n: counted.append((counter, n)))
+    m._blob_store.get(m._blob_store.put(b'x' * 300))
+    assert counted == [('blob_bytes_put', 300), ('blob_bytes_fetched', 300)]
+    # Wrapping for stage timing too keeps the one wrapper.
+    store = m._blob_store
+    m.set_stage_observer(lambda stage, seconds: None)
+    assert m._blob_store is store
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,90 @@
+'''
+Tests for the per-node freshness table behind ``videoflow top``: parsing the
+workers' /metrics, merging replicas and interpolating quantiles.
+'''
+import pytest
+
+from videoflow.runtime.freshness import (
+    expand_endpoints,
+    format_freshness_table,
+    freshness_rows,
+    histogram_quantile,
+    parse_metrics,
+)
+from videoflow.runtime.health import HealthState
+
+
+def _worker(node, input_ages = (), output_ages = (), process = (), lag = None):
+    state = HealthState(node, buckets = (0.1, 0.5, 1.0, 5.0))
+    state.incr('messages_published')
+    for v in input_ages:
+        state.observe('input_age_seconds', v)
+    for v in output_ages:
+        state.observe('output_age_seconds', v)
+    for v in process:
+        state.observe_stage('process', v)
+    if lag is not None:
+        state.add_collector(lambda: [('edge_lag_messages', {'parent': p}, n) for p, n in lag.items()])
+    return state.render_metrics()
+
+def test_parse_metrics():
+    text = '# TYPE x histogram\nx_bucket{node="a",le="+Inf"} 3\nbad line here\ny 2.5\n'
+    assert parse_metrics(text) == [('x_bucket', {'node': 'a', 'le': '+Inf'}, 3.0), ('y', {}, 2.5)]
+
+def test_histogram_quantile_interpolates():
+    buckets = {0.1: 0, 0.5: 50, 1.0: 100, float('inf'): 100}
+    assert histogram_quantile(0.5, buckets) == pytest.approx(0.5)
+    assert histogram_quantile(0.25, buckets) == pytest.approx(0.3)
+    assert histogram_quantile(0.5, {}) is None
+    assert histogram_quantile(0.5, {1.0: 0, float('inf'): 0}) is None
+    # Above the highest finite bound: clamp rather than answer infinity.
+    assert histogram_quantile(0.99, {1.0: 1, float('inf'): 10}) == 1.0
+
+def test_rows_merge_replicas_of_a_node():
+    scrapes = [
+        _worker('det', input_ages = [0.05] * 10, output_ages = [0.3] * 10, process = [0.2] * 10,
+                lag = {'src': 3}),
+        _worker('det', input_ages = [0.05] * 10, output_ages = [0.3] * 10, lag = {'src': 4}),
+        _worker('src'),
+    ]
+    rows = {r['node']: r for r in freshness_rows(scrapes)}
+    det = rows['det']
+    assert det['replicas'] == 2
+    assert det['in_p50'] == pytest.approx(0.05)
+    assert 0.1 < det['out_p99'] <= 0.5
+    assert 0.1 < det['process_p99'] <= 0.5
+    assert det['lag'] == 7
+    src = rows['src']
+    assert src['replicas'] == 1
+    assert src['in_p50'] is None and src['lag'] is None
+
+def test_table_layout():
+    rows = freshness_rows([_worker('det', input_ages = [0.05], lag = {'src': 2}), _worker('src')])
+    lines = format_freshness_table(rows).splitlines()
+    assert lines[0].split()[:2] == ['NODE', 'REPLICAS']
+    assert lines[1].split() == ['det', '1', '0.050/0.099', '-/-', '-', '2']
+    assert lines[2].split() == ['src', '1', '-/-', '-/-', '-', '-']
+
+def test_expand_endpoints():
+    assert expand_endpoints(['localhost:9100-9102']) == [
+        'http://localhost:9100/metrics', 'http://localhost:9101/metrics', 'http://localhost:9102/metrics']
+    assert expand_endpoints(['h:80', 'http://x/metrics']) == ['http://h:80/metrics', 'http://x/metrics']
+    for bad in ('nohost', 'h:abc', 'h:9-1'):
+        with pytest.raises(ValueError):
+            expand_endpoints([bad])
+
+def test_top_once_prints_the_table(monkeypatch, capsys):
+    from videoflow.deploy import cli
+    from videoflow.runtime import freshness
+
+    scraped = []
+    monkeypatch.setattr(freshness, 'scrape',
+                        lambda urls: scraped.extend(urls) or [_worker('det', input_ages = [0.05])])
+    cli.main(['top', 'localhost:9100-9101', '--once'])
+    assert scraped == ['http://localhost:9100/metrics', 'http://localhost:9101/metrics']
+    out = capsys.readouterr().out
+    assert '1/2 workers reachable' in out
+    assert 'det' in out and 'IN AGE p50/p99' in out
+
+if __name__ == "__main__":
+    pytest.main([__file__])
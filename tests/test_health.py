@@ -1,9 +1,17 @@
+import threading
 import time
 
 import pytest
 
 from videoflow.core.engine import Messenger
-from videoflow.runtime.health import LIVENESS_STALL_SECONDS, HealthState, InstrumentedMessenger
+from videoflow.runtime.health import (
+    DEFAULT_LATENCY_BUCKETS,
+    LIVENESS_STALL_SECONDS,
+    HealthState,
+    InstrumentedMessenger,
+    parse_buckets,
+)
+from videoflow.wire.serialization import BlobStore
 
 
 class _FakeInner(Messenger):
@@ -84,5 +92,127 @@ def test_ack_fail_delegate_and_count():
     assert 'videoflow_messages_processed_total{node="n"} 1' in text
     assert 'videoflow_messages_failed_total{node="n"} 1' in text
 
+def test_histogram_buckets_are_cumulative():
+    state = HealthState('n', buckets = (0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        state.observe('proctime_seconds', value)
+    text = state.render_metrics()
+    assert '# TYPE videoflow_proctime_seconds histogram' in text
+    assert 'videoflow_proctime_seconds_bucket{node="n",le="0.1"} 1' in text
+    assert 'videoflow_proctime_seconds_bucket{node="n",le="1.0"} 3' in text
+    assert 'videoflow_proctime_seconds_bucket{node="n",le="+Inf"} 4' in text
+    assert 'videoflow_proctime_seconds_count{node="n"} 4' in text
+
+def test_instrumented_times_stages():
+    class _Staged(_FakeInner):
+        def set_stage_observer(self, observer):
+            self.observer = observer
+
+    inner = _Staged()
+    state = HealthState('n')
+    im = InstrumentedMessenger(inner, state)
+    im.receive_message()
+    im.publish_message('x', {'proctime': 0.02, 'actual_proctime': 0.03})
+    im.ack_inputs()
+    inner.observer('decode', 0.001)
+    text = state.render_metrics()
+    for stage in ('receive_wait', 'process', 'ack', 'decode'):
+        assert f'videoflow_stage_seconds_count{{node="n",stage="{stage}"}} 1' in text
+    assert 'videoflow_stage_seconds_sum{node="n",stage="process"} 0.02' in text
+
+def test_shards_from_many_threads_are_merged():
+    state = HealthState('n')
+
+    def work():
+        for _ in range(1000):
+            state.observe_stage('process', 0.001)
+            state.incr('messages_published')
+
+    threads = [threading.Thread(target = work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    text = state.render_metrics()
+    assert len(state._shards) == 4
+    assert 'videoflow_stage_seconds_count{node="n",stage="process"} 4000' in text
+    assert 'videoflow_messages_published_total{node="n"} 4000' in text
+
+def test_parse_buckets():
+    assert parse_buckets(None) == DEFAULT_LATENCY_BUCKETS
+    assert parse_buckets('1, 0.01,0.1') == (0.01, 0.1, 1.0)
+    with pytest.raises(ValueError):
+        parse_buckets('fast,slow')
+    with pytest.raises(ValueError):
+        parse_buckets('0,1')
+
+def test_nats_codec_stage_split():
+    from videoflow.messaging.nats_messenger import NATSMessenger
+
+    class _SlowStore(BlobStore):
+        def get(self, ref):
+            time.sleep(0.02)
+            return b''
+
+    m = NATSMessenger.__new__(NATSMessenger)  # skip __init__: no broker
+    m._blob_store = _SlowStore()
+    m._stage_observer = None
+    seen = {}
+    m.set_stage_observer(lambda stage, seconds: seen.setdefault(stage, seconds))
+
+    def decode(buf, blob_store = None):
+        blob_store.get('ref')
+        return buf
+
+    assert m._timed_codec('decode', 'blob_fetch', decode, b'x', blob_store = m._blob_store) == b'x'
+    assert seen['blob_fetch'] >= 0.02
+    assert seen['decode'] < seen['blob_fetch']
+
+def test_instrumented_records_freshness_and_edge_lag():
+    class _Fresh(_FakeInner):
+        def receive_message(self):
+            self.received += 1
+            return {'a': {'message': 1, 'metadata': None, 'is_stop_signal': False,
+                          'event_ts': time.time() - 0.5},
+                    'b': {'message': None, 'metadata': None, 'is_stop_signal': True,
+                          'event_ts': time.time() - 100}}
+
+        def last_published_event_ts(self):
+            return time.time() - 0.7
+
+        def input_lag(self):
+            return {'a': 12, 'b': 0}
+
+    state = HealthState('n', buckets = (0.1, 1.0, 10.0))
+    im = InstrumentedMessenger(_Fresh(), state)
+    im.receive_message()
+    im.publish_message('x', None)
+    text = state.render_metrics()
+    # The stop-signal entry is not an event: only one input age is observed.
+    assert 'videoflow_input_age_seconds_bucket{node="n",le="0.1"} 0' in text
+    assert 'videoflow_input_age_seconds_bucket{node="n",le="1.0"} 1' in text
+    assert 'videoflow_input_age_seconds_count{node="n"} 1' in text
+    assert 'videoflow_output_age_seconds_bucket{node="n",le="1.0"} 1' in text
+    assert '# TYPE videoflow_edge_lag_messages gauge' in text
+    assert 'videoflow_edge_lag_messages{node="n",parent="a"} 12' in text
+    assert 'videoflow_edge_lag_messages{node="n",parent="b"} 0' in text
+
+def test_unknown_freshness_is_not_observed():
+    # The default Messenger knows neither the output event time nor the lag.
+    state = HealthState('n')
+    im = InstrumentedMessenger(_FakeInner(), state)
+    im.receive_message()
+    im.publish_message('x', None)
+    text = state.render_metrics()
+    assert 'input_age_seconds' not in text
+    assert 'output_age_seconds' not in text
+    assert 'edge_lag' not in text
+
+def test_failing_collector_is_skipped():
+    state = HealthState('n')
+    state.add_collector(lambda: 1 / 0)
+    state.add_collector(lambda: [('up', {}, 1)])
+    assert 'videoflow_up{node="n"} 1' in state.render_metrics()
+
 if __name__ == "__main__":
     pytest.main([__file__])
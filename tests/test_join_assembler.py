@@ -0,0 +1,138 @@
+'''
+Property tests for the join assemblers, on the synthetic streams of the
+``assembler`` bench suite: whatever the rates, jitter, drops and redeliveries,
+every ack handle ends up emitted or resolved exactly once, and every emitted
+group is a valid group for its policy. The pinned digests record exactly what
+each quick scenario emits and resolves, so an optimization of
+``videoflow/messaging/grouping.py`` that changes behavior fails here.
+'''
+import dataclasses
+import random
+
+import pytest
+
+from videoflow.bench.assembler import (
+    SCENARIOS,
+    JoinScenario,
+    StreamParent,
+    emission_digest,
+    measure_scenario,
+    replay,
+    scenario,
+    synthetic_stream,
+)
+from videoflow.core.policies import JOIN_TIME, MISSING_DROP, MISSING_ERROR, JoinPolicy
+from videoflow.messaging.grouping import CollectEntry
+
+QUICK = [s for s in SCENARIOS if s.quick]
+
+# What each quick scenario emits and resolves with seed 0. Only update these for
+# a deliberate change of join behavior, never for an optimization.
+EXPECTED_DIGESTS = {
+    'trace_diamond': 'f7d70c7780c9da08',
+    'trace_lossy_4': '1a5717b1d9ed4ad7',
+    'trace_backlog_1k': '0801f98027ff835e',
+    'time_cams_3': '8423ca76262a218f',
+    'time_cams_imu': 'cbc22e0491ee65aa',
+    'time_backlog_1k': '44f1b891c8ec4c53',
+}
+
+def _check_invariants(s : JoinScenario, r) -> None:
+    names = [p.name for p in s.parents]
+    policy = s.policy
+    emitted_ids = [h.id for group in r.groups for h in group.handles]
+    assert len(emitted_ids) == len(set(emitted_ids)), 'a handle was emitted twice'
+    emitted = set(emitted_ids)
+    for h in r.handles:
+        if h.id in emitted:
+            assert h.outcome is None, f'handle {h.id} emitted and also {h.outcome}'
+        else:
+            # Everything not emitted was resolved by the assembler once the clock
+            # jumped past every timeout: nothing is stranded unacked.
+            assert h.outcome in ('ack', 'nak', 'term'), f'handle {h.id}: {h.outcome}'
+
+    if policy.mode != JOIN_TIME:
+        for group in r.groups:
+            assert sorted(group.entries) == sorted(names)
+            assert {e.trace_id for e in group.entries.values()} == {group.trace_id}
+            assert group.seq == min(e.seq for e in group.entries.values())
+            assert len(group.handles) == len(names)
+        return
+
+    tolerance = policy.tolerance_ms / 1000.0
+    sync = [n for n in names if n not in policy.collect]
+    needed = policy.quorum if policy.quorum is not None else len(sync)
+    for group in r.groups:
+        present = [group.entries[n] for n in sync if group.entries[n] is not None]
+        assert len(present) >= needed
+        stamps = [e.event_ts for e in present]
+        assert group.event_ts == min(stamps)
+        # Each member was within tolerance of the group's time when it joined.
+        assert max(stamps) - min(stamps) <= 2 * tolerance + 1e-9
+        assert len({e.trace_id for e in present}) == len(present)
+        for parent, window_ms in policy.collect.items():
+            window = group.entries[parent]
+            assert isinstance(window, CollectEntry)
+            assert window.event_ts == sorted(window.event_ts)
+            assert all(abs(t - group.event_ts) <= window_ms / 1000.0 for t in window.event_ts)
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('s', QUICK, ids = lambda s: s.name)
+def test_scenarios_keep_invariants(s, seed):
+    r = replay(s, seed = seed, keep_groups = True)
+    assert r.emitted > 0
+    _check_invariants(s, r)
+
+def _random_scenario(rng : random.Random) -> JoinScenario:
+    n = rng.randint(2, 4)
+    drops = dict(drop_rate = rng.choice([0.0, 0.05]), redeliver_rate = rng.choice([0.0, 0.05]),
+                 jitter_ms = rng.uniform(0.5, 5))
+    missing = rng.choice([MISSING_DROP, MISSING_ERROR])
+    max_pending = rng.choice([8, 64, 1024])
+    if rng.random() < 0.5:
+        rate = rng.choice([30, 100, 500])
+        policy = JoinPolicy(timeout_seconds = rng.choice([0.2, 1.0]), missing = missing,
+                            max_pending = max_pending)
+        parents = [StreamParent(f'p{i}', rate, rng.uniform(1, 50)) for i in range(n)]
+    else:
+        parents = [StreamParent(f'cam{i}', rng.choice([15, 30, 60]), rng.uniform(1, 50),
+                                offset_ms = rng.uniform(0, 3)) for i in range(n)]
+        collect = {}
+        if rng.random() < 0.5:
+            parents.append(StreamParent('imu', 500, rng.uniform(0.5, 5)))
+            collect = {'imu': rng.choice([5, 20])}
+        policy = JoinPolicy(mode = JOIN_TIME, tolerance_ms = rng.choice([4, 10]),
+                            timeout_seconds = 0.5, missing = missing, max_pending = max_pending,
+                            quorum = rng.choice([None, max(1, n - 1)]), collect = collect)
+    return JoinScenario('random', policy, parents, duration_s = 4, **drops)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_random_streams_keep_invariants(seed):
+    s = _random_scenario(random.Random(seed))
+    _check_invariants(s, replay(s, seed = seed, keep_groups = True))
+
+def test_replay_is_deterministic():
+    s = scenario('time_cams_3')
+    assert synthetic_stream(s, 7) == synthetic_stream(s, 7)
+    assert replay(s, seed = 7).log == replay(s, seed = 7).log
+    assert replay(s, seed = 7).log != replay(s, seed = 8).log
+
+@pytest.mark.parametrize('s', QUICK, ids = lambda s: s.name)
+def test_emissions_match_pinned_digest(s):
+    assert emission_digest(replay(s)) == EXPECTED_DIGESTS[s.name], (
+        f'{s.name}: the join assembler now emits or resolves something different')
+
+def test_measure_scenario_reports_costs_and_memory():
+    s = dataclasses.replace(scenario('trace_lossy_4'), duration_s = 2)
+    figures = {m.name.split('.', 1)[1]: m for m in measure_scenario(s)}
+    assert set(figures) == {'add_us', 'pop_ready_us', 'sweep_us', 'peak_bytes',
+                            'bytes_per_pending_group', 'max_pending_groups',
+                            'emitted_groups', 'evicted_groups'}
+    assert figures['add_us'].value > 0 and figures['peak_bytes'].value > 0
+    assert figures['emitted_groups'].better is None
+    untraced = {m.name.split('.', 1)[1]
+                for m in measure_scenario(dataclasses.replace(s, trace_memory = False))}
+    assert 'peak_bytes' not in untraced and 'add_us' in untraced
+
+if __name__ == '__main__':
+    pytest.main([__file__])
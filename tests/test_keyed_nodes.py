@@ -0,0 +1,118 @@
+'''
+Tests for keyed state: ``KeyedProcessorNode``, ``RuntimeContext.key``, the graph \
+    check that a replicated keyed node is partitioned, and the aggregators built on it.
+'''
+import logging
+
+import pytest
+
+from videoflow.consumers import CommandlineConsumer
+from videoflow.core.context import RuntimeContext
+from videoflow.core.engine import Messenger
+from videoflow.core.graph import GraphEngine
+from videoflow.processors import CountAggregator, MaxAggregator, SumAggregator
+from videoflow.producers import IntProducer
+
+
+class _InfoMessenger(Messenger):
+    def __init__(self):
+        self.info = None
+
+    def last_input_info(self):
+        return self.info
+
+def _ctx(partition_by):
+    messenger = _InfoMessenger()
+    ctx = RuntimeContext('flow', 'run', 'node', 0, logging.getLogger('test'),
+                        messenger = messenger, partition_by = partition_by)
+    return ctx, messenger
+
+def _entry(trace_id = 't1', **metadata):
+    return {'event_ts': None, 'metadata': metadata, 'trace_id': trace_id, 'seq': 0}
+
+def test_context_key_reads_partition_field():
+    ctx, messenger = _ctx('camera_id')
+    messenger.info = {'frames': _entry(camera_id = 'cam-3')}
+    assert ctx.key == 'cam-3'
+    # A quorum emission can miss a parent; the key comes from one that is present.
+    messenger.info = {'a': None, 'b': _entry(camera_id = 'cam-4')}
+    assert ctx.key == 'cam-4'
+    messenger.info = {'a': [_entry(camera_id = 'cam-5')]}
+    assert ctx.key == 'cam-5'
+
+def test_context_key_trace_id_and_unpartitioned():
+    ctx, messenger = _ctx('trace_id')
+    messenger.info = {'frames': _entry(trace_id = 'abc')}
+    assert ctx.key == 'abc'
+    ctx, messenger = _ctx(None)
+    messenger.info = {'frames': _entry(camera_id = 'cam-3')}
+    assert ctx.key is None
+
+def test_aggregators_keep_state_per_key():
+    ctx, messenger = _ctx('camera_id')
+    agg = SumAggregator(nb_tasks = 8, partition_by = 'camera_id')
+    results = []
+    for camera, value in [('a', 1), ('b', 10), ('a', 2), ('b', 20), ('a', 3)]:
+        messenger.info = {'frames': _entry(camera_id = camera)}
+        results.append(agg.process(value, ctx))
+    assert results == [1, 10, 3, 30, 6]
+    assert sorted(agg.keys) == ['a', 'b']
+
+def test_aggregators_without_ctx_share_one_state():
+    count, largest = CountAggregator(), MaxAggregator()
+    assert [count.process(x) for x in (5, 1, 7)] == [1, 2, 3]
+    assert [largest.process(x) for x in (5, 1, 7)] == [5, 5, 7]
+
+def test_keyed_node_is_rebuilt_from_params():
+    agg = SumAggregator(name = 'sum', nb_tasks = 4, partition_by = 'camera_id')
+    rebuilt = type(agg)(**agg.get_params())
+    assert rebuilt.nb_tasks == 4 and rebuilt.partition_by == 'camera_id'
+
+def test_keyed_node_rejects_pool_and_cache():
+    with pytest.raises(ValueError):
+        SumAggregator(workers_per_replica = 2)
+    with pytest.raises(ValueError):
+        SumAggregator(cache = 'content')
+
+@pytest.mark.parametrize('partition_by', [None, 'trace_id'])
+def test_replicated_keyed_node_needs_a_partition_field(partition_by):
+    a = IntProducer(name = 'a')
+    agg = SumAggregator(name = 'sum', nb_tasks = 8, partition_by = partition_by)(a)
+    out = CommandlineConsumer(name = 'out')(agg)
+    with pytest.raises(ValueError):
+        GraphEngine([a], [out])
+
+@pytest.mark.parametrize('partition_by', ['trace_id', 'proctime'])
+def test_keyed_node_rejects_a_per_message_key_even_unreplicated(partition_by):
+    a = IntProducer(name = 'a')
+    agg = SumAggregator(name = 'sum', partition_by = partition_by)(a)
+    out = CommandlineConsumer(name = 'out')(agg)
+    with pytest.raises(ValueError, match = 'every message'):
+        GraphEngine([a], [out])
+
+def test_keyed_state_is_bounded_and_can_be_dropped():
+    ctx, messenger = _ctx('camera_id')
+    agg = SumAggregator(nb_tasks = 8, partition_by = 'camera_id', max_keys = 2)
+    for camera in ('a', 'b', 'a', 'c'):
+        messenger.info = {'frames': _entry(camera_id = camera)}
+        agg.process(1, ctx)
+    # 'b' was the least recently used key when 'c' arrived.
+    assert agg.keys == ['a', 'c'] and agg.nb_evicted == 1
+    messenger.info = {'frames': _entry(camera_id = 'a')}
+    assert agg.get_state(ctx) == 2
+    agg.set_state(ctx, None)
+    assert agg.keys == ['c']
+    # A dropped or evicted key starts over from initial_state().
+    assert agg.process(5, ctx) == 5
+    assert type(agg)(**agg.get_params())._max_keys == 2
+    with pytest.raises(ValueError):
+        SumAggregator(max_keys = 0)
+
+def test_replicated_keyed_node_with_partition_field_is_accepted():
+    a = IntProducer(name = 'a')
+    agg = SumAggregator(name = 'sum', nb_tasks = 8, partition_by = 'camera_id')(a)
+    out = CommandlineConsumer(name = 'out')(agg)
+    GraphEngine([a], [out])  # must not raise
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -10,6 +10,8 @@ import signal
 import subprocess
 import sysconfig
 
+import pytest
+
 from videoflow.consumers import CommandlineConsumer
 from videoflow.core import Flow
 from videoflow.core.compiler import compile_flow
@@ -93,6 +95,45 @@ def test_worker_env_carries_blob_reclamation_vars():
     assert 'VF_BLOB_READERS' not in env_legacy
 
 
+def test_metrics_port_gives_each_worker_its_own_port(monkeypatch):
+    monkeypatch.delenv('VF_HEALTH_PORT', raising = False)
+    spec = compile_flow(_flow())[0]
+    assert 'VF_HEALTH_PORT' not in _worker_env(spec, 'nats://x:4222', 'demo', BATCH, 'run1', None, 0, 3)
+    env = _worker_env(spec, 'nats://x:4222', 'demo', BATCH, 'run1', None, 0, 3, health_port = 9101)
+    assert env['VF_HEALTH_PORT'] == '9101'
+
+
+def test_collect_metrics_registers_workers_and_keeps_the_final_table(monkeypatch):
+    from videoflow.runtime.flowmetrics import write_final_metrics
+    from videoflow.runtime.health import HealthState
+    monkeypatch.delenv('VF_HEALTH_PORT', raising = False)
+    monkeypatch.setattr('videoflow.engines.local.provision_flow_sync', lambda *a, **kw: None)
+    envs = []
+
+    def fake_popen(cmd, env = None, **kwargs):
+        # Each "worker" exits at once, leaving its final metrics as a real one does.
+        envs.append(env)
+        state = HealthState(env['VF_NODE_NAME'])
+        state.incr('messages_published', 4)
+        write_final_metrics(env['VF_METRICS_DIR'], env['VF_NODE_NAME'], 0, state.render_metrics())
+        return _FakeProc(0)
+
+    monkeypatch.setattr(subprocess, 'Popen', fake_popen)
+    engine = LocalProcessEngine(collect_metrics = True)
+    monkeypatch.setattr(engine, '_teardown_streams', lambda: None)
+    engine.allocate_and_run_tasks(_flow().tasks_data(), 'demo', BATCH, 'run1')
+    metrics_dir = envs[0]['VF_METRICS_DIR']
+    assert all(env['VF_METRICS_DIR'] == metrics_dir and 'VF_HEALTH_PORT' not in env for env in envs)
+    engine.join_task_processes()
+    assert not os.path.exists(metrics_dir)
+    snapshot = engine.metrics_snapshot()
+    assert [n['node'] for n in snapshot['nodes']] == ['printer', 'producer', 'work']
+    assert all(n['messages'] == 4 for n in snapshot['nodes'])
+    assert engine.flow_metrics() == engine.flow_metrics()     # frozen after the run
+    with pytest.raises(ValueError):
+        LocalProcessEngine().flow_metrics()
+
+
 def test_workers_get_the_graph_dir_on_pythonpath(tmp_path, monkeypatch):
     '''
     The regression test for the original bug: load_flow puts the graph's directory
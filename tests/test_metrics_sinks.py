@@ -0,0 +1,177 @@
+'''
+Tests for the push-based metrics sinks: StatsD over UDP, the OTLP/JSON file,
+the Pushgateway PUT, the registry, and the background pusher with its final
+push on close.
+'''
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from videoflow.core.engine import Messenger
+from videoflow.runtime.health import HealthState, InstrumentedMessenger
+from videoflow.runtime.metrics_sinks import (
+    InMemoryMetricsSink,
+    MetricsPusher,
+    MetricsSink,
+    OTLPMetricsFileSink,
+    PushGatewaySink,
+    StatsDSink,
+    make_metrics_sink,
+    make_metrics_sinks,
+)
+
+
+def _state():
+    state = HealthState('det', buckets = (0.01, 0.1, 1.0))
+    state.incr('messages_processed', 5)
+    for v in (0.005, 0.05, 0.05, 0.5):
+        state.observe_stage('process', v)
+    state.add_collector(lambda: [('edge_lag_messages', {'parent': 'cam'}, 7)])
+    return state
+
+def test_statsd_lines_are_deltas():
+    state = _state()
+    sink = StatsDSink('127.0.0.1', 9, prefix = 'vf')
+    try:
+        first = sink.lines(state.snapshot())
+        assert 'vf.det.messages_processed:5|c' in first
+        assert 'vf.det.stage_seconds.process.count:4|c' in first
+        assert 'vf.det.stage_seconds.process.sum:0.605000|c' in first
+        assert any(line.startswith('vf.det.stage_seconds.process.p99:') for line in first)
+        assert 'vf.det.edge_lag_messages.cam:7|g' in first
+        state.incr('messages_processed', 2)
+        state.observe_stage('process', 0.5)
+        second = sink.lines(state.snapshot())
+        assert 'vf.det.messages_processed:2|c' in second
+        assert 'vf.det.stage_seconds.process.count:1|c' in second
+        # Only the interval's observation: all of it lies in the (0.1, 1] bucket.
+        p50 = next(line for line in second if '.p50:' in line)
+        assert 0.1 < float(p50.split(':')[1].split('|')[0]) <= 1.0
+        # Nothing new: only the gauges are sent again.
+        assert sink.lines(state.snapshot()) == ['vf.det.edge_lag_messages.cam:7|g']
+    finally:
+        sink.close()
+
+def test_statsd_packs_datagrams():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+    server.settimeout(2)
+    state = HealthState('det')
+    for n in range(40):
+        state.incr(f'counter_{n:02d}', n + 1)
+    sink = make_metrics_sink(f'statsd://127.0.0.1:{server.getsockname()[1]}?prefix=p')
+    assert isinstance(sink, StatsDSink)
+    sink._max_packet = 200
+    try:
+        sink.emit(state.snapshot(), {})
+        lines = []
+        while len(lines) < 40:
+            packet = server.recv(65535)
+            assert len(packet) <= 200
+            lines.extend(packet.decode().split('\n'))
+    finally:
+        sink.close()
+        server.close()
+    assert lines[0] == 'p.det.counter_00:1|c' and lines[-1] == 'p.det.counter_39:40|c'
+
+def test_otlp_metrics_file(tmp_path):
+    path = tmp_path / 'metrics.jsonl'
+    sink = make_metrics_sink(f'otlp-file://{path}')
+    assert isinstance(sink, OTLPMetricsFileSink)
+    sink.emit(_state().snapshot(), {'service.name': 'det'})
+    sink.emit(_state().snapshot(), {'service.name': 'det'})
+    first, second = (json.loads(line) for line in path.read_text().splitlines())
+    rm = first['resourceMetrics'][0]
+    assert rm['resource']['attributes'] == [{'key': 'service.name', 'value': {'stringValue': 'det'}}]
+    metrics = {m['name']: m for m in rm['scopeMetrics'][0]['metrics']}
+    counter = metrics['videoflow_messages_processed']['sum']
+    assert counter['isMonotonic'] and counter['dataPoints'][0]['asInt'] == '5'
+    hist = metrics['videoflow_stage_seconds']['histogram']['dataPoints'][0]
+    assert hist['bucketCounts'] == ['1', '2', '1', '0'] and hist['explicitBounds'] == [0.01, 0.1, 1.0]
+    assert {'key': 'stage', 'value': {'stringValue': 'process'}} in hist['attributes']
+    gauge = metrics['videoflow_edge_lag_messages']['gauge']['dataPoints'][0]
+    assert gauge['asDouble'] == 7.0
+    assert {'key': 'parent', 'value': {'stringValue': 'cam'}} in gauge['attributes']
+
+def test_pushgateway_puts_the_metrics_text():
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_PUT(self):
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            received.append((self.path, body.decode()))
+            self.send_response(200)
+            self.end_headers()
+
+    httpd = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target = httpd.handle_request, daemon = True)
+    thread.start()
+    sink = make_metrics_sink(f'pushgateway://127.0.0.1:{httpd.server_address[1]}')
+    assert isinstance(sink, PushGatewaySink)
+    sink.emit(_state().snapshot(), {'videoflow.flow_id': 'demo', 'videoflow.run_id': 'r/1',
+                                    'videoflow.replica_id': 0})
+    thread.join(timeout = 5)
+    httpd.server_close()
+    (path, body), = received
+    assert path == '/metrics/job/videoflow/flow_id/demo/run_id/r%2F1/node/det/replica/0'
+    assert 'videoflow_messages_processed_total{node="det"} 5' in body
+
+def test_registry():
+    sinks = make_metrics_sinks('memory://, memory://')
+    assert len(sinks) == 2 and all(isinstance(s, InMemoryMetricsSink) for s in sinks)
+    with pytest.raises(ValueError, match = 'statsd'):
+        make_metrics_sink('graphite://host')
+
+class _Inner(Messenger):
+    def __init__(self):
+        self.closed = False
+
+    def publish_message(self, message, metadata = None):
+        pass
+
+    def publish_stop_signal(self):
+        pass
+
+    def check_for_termination(self):
+        return False
+
+    def receive_message(self):
+        return {}
+
+    def close(self):
+        self.closed = True
+
+def test_pusher_pushes_periodically_and_on_close():
+    state = HealthState('det')
+    sink = InMemoryMetricsSink()
+
+    class _Broken(MetricsSink):
+        def emit(self, snapshot, resource):
+            raise OSError('unreachable')
+
+    pusher = MetricsPusher(state, [_Broken(), sink], interval = 0.05)
+    pusher.start()
+    inner = _Inner()
+    messenger = InstrumentedMessenger(inner, state, pusher = pusher)
+    messenger.publish_message('x')
+    deadline = time.monotonic() + 5
+    while not sink.snapshots and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sink.snapshots, 'expected a periodic push'
+    messenger.publish_message('y')
+    messenger.close()
+    messenger.close()
+    assert inner.closed and sink.closed
+    assert sink.snapshots[-1].counters['messages_published'] == 2
+    with pytest.raises(ValueError):
+        MetricsPusher(state, [], interval = 0)
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,157 @@
+'''
+Worker-internal process pool (``ProcessorNode(workers_per_replica=N)``): outputs
+come back in receive order with the lineage of the group they were computed from,
+and large arrays round-trip through shared memory.
+'''
+import os
+import sys
+import time
+
+import numpy as np
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TESTS_DIR)  # pool processes are spawned with this sys.path
+
+from support_nodes import ArrayNegator, PidTagger  # noqa: E402
+
+from videoflow.core.engine import Messenger  # noqa: E402
+from videoflow.core.node import OneTaskProcessorNode, ProcessorNode, TaskModuleNode  # noqa: E402
+from videoflow.core.task import ProcessorTask  # noqa: E402
+
+
+@pytest.fixture(autouse = True)
+def _spawnable_sys_path(monkeypatch, tmp_path_factory):
+    # Pool processes are spawned with this process's sys.path. Tests that load
+    # graph files leave their tmp dirs on it (one holds a json.py), which would
+    # shadow stdlib modules in the children.
+    base = str(tmp_path_factory.getbasetemp())
+    monkeypatch.setattr(sys, 'path', [p for p in sys.path if not p.startswith(base)])
+
+class _ListMessenger(Messenger):
+    '''Delivers each item as its own group; records per-group publish/ack/fail against the group's id.'''
+    def __init__(self, items):
+        self._items = list(items)
+        self._current = None
+        self.published = []
+        self.acked = []
+        self.failed = []
+        self.stopped = False
+
+    def receive_message(self):
+        if not self._items:
+            return {'p': {'message': None, 'metadata': None, 'is_stop_signal': True}}
+        self._current = self._items.pop(0)
+        return {'p': {'message': self._current, 'metadata': None, 'is_stop_signal': False}}
+
+    def checkpoint_inputs(self):
+        token, self._current = self._current, None
+        return token
+
+    def restore_inputs(self, token):
+        self._current = token
+
+    def publish_message(self, message, metadata = None):
+        self.published.append((self._current, message))
+
+    def publish_stop_signal(self):
+        self.stopped = True
+
+    def ack_inputs(self):
+        self.acked.append(self._current)
+
+    def fail_inputs(self, exc):
+        self.failed.append(self._current)
+
+def test_pool_publishes_in_order_with_matching_lineage():
+    node = PidTagger(name = 'tagger', workers_per_replica = 3)
+    messenger = _ListMessenger(range(20))
+    ProcessorTask(node, messenger, True, ['p']).run()
+
+    expected = [x for x in range(20) if x != 13]
+    # Publish order is receive order, and each output was published while its own
+    # input group was the current one.
+    assert [group for group, _ in messenger.published] == expected
+    assert all(group == out[0] for group, out in messenger.published)
+    assert messenger.acked == expected
+    assert messenger.failed == [13]
+    assert messenger.stopped is True
+    # The work really was spread over the pool, none of it in this process.
+    pids = {out[1] for _, out in messenger.published}
+    assert os.getpid() not in pids
+    assert 1 < len(pids) <= 3
+
+class _QuietMessenger(_ListMessenger):
+    '''After its items, the input goes quiet until every delivered group has been published.'''
+    def __init__(self, items):
+        super().__init__(items)
+        self.delivered = 0
+        self.blocked_with_results_in_flight = False
+
+    def receive_message(self):
+        if self._items:
+            self.delivered += 1
+        elif len(self.published) < self.delivered:
+            # The old behavior: a blocking receive here would hold finished results
+            # (and their acks) until the next input arrived.
+            self.blocked_with_results_in_flight = True
+        return super().receive_message()
+
+    def poll_message(self, timeout):
+        if not self._items and len(self.published) < self.delivered:
+            time.sleep(timeout)
+            return None
+        return self.receive_message()
+
+def test_pool_publishes_results_while_input_is_quiet():
+    node = PidTagger(name = 'tagger', workers_per_replica = 2)
+    messenger = _QuietMessenger([1, 2])
+    ProcessorTask(node, messenger, True, ['p']).run()
+    assert [group for group, _ in messenger.published] == [1, 2]
+    assert messenger.acked == [1, 2]
+    assert not messenger.blocked_with_results_in_flight
+
+def test_pool_round_trips_large_arrays():
+    node = ArrayNegator(name = 'neg', workers_per_replica = 2)
+    arrays = [np.full((256, 256, 3), i, dtype = np.uint8) for i in range(4)]
+    messenger = _ListMessenger(arrays)
+    ProcessorTask(node, messenger, True, ['p']).run()
+    assert len(messenger.published) == 4
+    for src, out in messenger.published:
+        assert out.shape == src.shape and out.dtype == src.dtype
+        np.testing.assert_array_equal(out, -src)
+
+def test_workers_per_replica_validation():
+    with pytest.raises(ValueError):
+        PidTagger(workers_per_replica = 0)
+
+    class Stateful(OneTaskProcessorNode):
+        def process(self, x):
+            return x
+    with pytest.raises(ValueError):
+        Stateful(workers_per_replica = 2)
+
+    class Async(ProcessorNode):
+        async def process(self, x):
+            return x
+    with pytest.raises(ValueError):
+        Async(workers_per_replica = 2)
+
+    class WithCtx(ProcessorNode):
+        def process(self, x, ctx = None):
+            return x
+    with pytest.raises(ValueError):
+        WithCtx(workers_per_replica = 2)
+
+    a = PidTagger()
+    b = PidTagger()(a)
+    with pytest.raises(ValueError):
+        TaskModuleNode(a, b, workers_per_replica = 2)
+
+def test_workers_per_replica_survives_get_params():
+    node = PidTagger(name = 'tagger', workers_per_replica = 4)
+    rebuilt = PidTagger(**node.get_params())
+    assert rebuilt.workers_per_replica == 4
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,129 @@
+'''
+Tests for the in-process diagnostics behind /debug/pystack and /debug/profile.
+'''
+import asyncio
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+
+import pytest
+
+from videoflow.runtime.health import HealthServer, HealthState
+from videoflow.runtime.profiler import SamplingProfiler, dump_stacks, to_collapsed, to_speedscope
+
+
+def _spin(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+def _busy_thread():
+    stop = threading.Event()
+    thread = threading.Thread(target = _spin, args = (stop,), name = 'busy', daemon = True)
+    thread.start()
+    return thread, stop
+
+def test_dump_stacks_names_threads_and_asyncio_tasks():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target = loop.run_forever, name = 'vf-nats-loop', daemon = True)
+    thread.start()
+
+    async def fetch_forever():
+        await asyncio.sleep(60)
+
+    future = asyncio.run_coroutine_threadsafe(fetch_forever(), loop)
+    time.sleep(0.05)
+    try:
+        text = dump_stacks()
+    finally:
+        future.cancel()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout = 5)
+    assert 'Thread MainThread' in text
+    assert 'Thread vf-nats-loop' in text and 'daemon' in text
+    assert 'asyncio loop: 1 pending tasks' in text
+    assert 'fetch_forever' in text
+
+def test_wall_profile_samples_other_threads():
+    thread, stop = _busy_thread()
+    try:
+        samples = SamplingProfiler().profile(0.3, mode = 'wall', hz = 200)
+    finally:
+        stop.set()
+        thread.join()
+    busy = sum(n for stack, n in samples.items() if stack[0] == 'busy')
+    assert busy > 10
+    assert any(label.startswith('_spin (test_profiler.py:')
+               for stack in samples if stack[0] == 'busy' for label in stack)
+
+def test_cpu_profile_uses_sigprof_on_the_main_thread():
+    profiler = SamplingProfiler()
+    if not profiler.signal_mode_available:
+        pytest.skip('SIGPROF handler not installable here')
+    result = {}
+    worker = threading.Thread(target = lambda: result.update(s = profiler.profile(0.3, hz = 200)))
+    worker.start()
+    deadline = time.monotonic() + 0.3
+    while time.monotonic() < deadline:
+        sum(range(1000))              # the main thread burns CPU while it is profiled
+    worker.join()
+    main = [stack for stack in result['s'] if stack[0] == 'MainThread']
+    assert main and any('test_cpu_profile_uses_sigprof_on_the_main_thread' in label
+                        for stack in main for label in stack)
+    # The handler's own frame is never reported.
+    assert not any('_on_sigprof' in label for stack in result['s'] for label in stack)
+
+def test_profile_argument_validation_and_exclusivity():
+    profiler = SamplingProfiler()
+    for kwargs in ({'seconds': 0}, {'seconds': 1000}, {'seconds': 1, 'mode': 'gpu'},
+                   {'seconds': 1, 'hz': 0}):
+        with pytest.raises(ValueError):
+            profiler.profile(**kwargs)
+    running = threading.Thread(target = profiler.profile, args = (0.3,), kwargs = {'mode': 'wall'})
+    running.start()
+    time.sleep(0.05)
+    with pytest.raises(RuntimeError):
+        SamplingProfiler().profile(0.1, mode = 'wall')
+    running.join()
+
+def test_output_formats():
+    samples = Counter({('MainThread', 'run (task.py:1)', 'process (node.py:9)'): 3,
+                       ('vf-nats-loop', 'run_forever (base_events.py:5)'): 1})
+    assert to_collapsed(samples) == ('MainThread;run (task.py:1);process (node.py:9) 3\n'
+                                     'vf-nats-loop;run_forever (base_events.py:5) 1\n')
+    doc = to_speedscope(samples, 2.0)
+    assert doc['$schema'] == 'https://www.speedscope.app/file-format-schema.json'
+    assert doc['shared']['frames'][1] == {'name': 'process', 'file': 'node.py', 'line': 9}
+    main = next(p for p in doc['profiles'] if p['name'] == 'MainThread')
+    assert main['type'] == 'sampled' and main['samples'] == [[0, 1]] and main['weights'] == [3]
+
+def test_health_server_debug_endpoints():
+    server = HealthServer(HealthState('det'), port = 0)
+    server.start()
+    base = f'http://127.0.0.1:{server.port}'
+    try:
+        with urllib.request.urlopen(f'{base}/debug/pystack') as resp:
+            assert 'Thread vf-health' in resp.read().decode()
+        url = f'{base}/debug/profile?seconds=0.2&mode=wall&format=speedscope'
+        with urllib.request.urlopen(url) as resp:
+            assert resp.headers['Content-Type'] == 'application/json'
+            assert json.loads(resp.read())['exporter'] == 'videoflow'
+        with pytest.raises(urllib.error.HTTPError) as err:
+            urllib.request.urlopen(f'{base}/debug/profile?seconds=-1')
+        assert err.value.code == 400
+    finally:
+        server.stop()
+
+    quiet = HealthServer(HealthState('det'), port = 0, debug = False)
+    quiet.start()
+    try:
+        with pytest.raises(urllib.error.HTTPError) as err:
+            urllib.request.urlopen(f'http://127.0.0.1:{quiet.port}/debug/pystack')
+        assert err.value.code == 404
+    finally:
+        quiet.stop()
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,159 @@
+'''
+Content-addressed processor result cache (``ProcessorNode(cache='content')``).
+'''
+import numpy as np
+import pytest
+
+from videoflow.core.cache import MISSING, ResultCache, SharedResultCache, content_key, params_fingerprint, sizeof
+from videoflow.core.engine import Messenger
+from videoflow.core.node import OneTaskProcessorNode, ProcessorNode
+from videoflow.core.task import ProcessorTask
+from videoflow.runtime.health import HealthState, InstrumentedMessenger
+
+
+class Scaler(ProcessorNode):
+    def __init__(self, factor = 2, **kwargs):
+        self._factor = factor
+        self.calls = 0
+        super(Scaler, self).__init__(**kwargs)
+
+    def process(self, x):
+        self.calls += 1
+        return x * self._factor
+
+class _GroupMessenger(Messenger):
+    '''Delivers (trace_id, value) groups; records each publish with the trace id it was made under.'''
+    def __init__(self, groups):
+        self._groups = list(groups)
+        self._trace = None
+        self._hit = None
+        self.published = []
+
+    def receive_message(self):
+        if not self._groups:
+            return {'p': {'message': None, 'metadata': None, 'is_stop_signal': True}}
+        self._trace, value = self._groups.pop(0)
+        return {'p': {'message': value, 'metadata': None, 'is_stop_signal': False}}
+
+    def set_output_cache_hit(self, hit):
+        self._hit = hit
+
+    def publish_message(self, message, metadata = None):
+        self.published.append((self._trace, message, self._hit, metadata))
+
+    def publish_stop_signal(self):
+        pass
+
+    def ack_inputs(self):
+        pass
+
+    def fail_inputs(self, exc):
+        raise exc
+
+def test_content_key_depends_on_content_and_behaviour_params_only():
+    fp = params_fingerprint(Scaler(factor = 2, name = 'a'))
+    # Deployment params (name, nb_tasks, cache settings...) don't change the key...
+    assert fp == params_fingerprint(Scaler(factor = 2, name = 'b', nb_tasks = 3, cache = 'content'))
+    # ...behaviour params do.
+    assert fp != params_fingerprint(Scaler(factor = 3))
+
+    a = np.arange(12, dtype = np.uint8).reshape(3, 4)
+    assert content_key(fp, [a]) == content_key(fp, [a.copy()])
+    assert content_key(fp, [a]) != content_key(fp, [a.astype(np.int16)])
+    assert content_key(fp, [a]) != content_key(fp, [a.reshape(4, 3)])
+    # Strided views hash by value, like the contiguous copy.
+    assert content_key(fp, [a[:, ::2]]) == content_key(fp, [np.ascontiguousarray(a[:, ::2])])
+    assert content_key(fp, [1]) != content_key(fp, [1.0]) != content_key(fp, [True])
+    assert content_key(fp, [{'a': 1, 'b': 2}]) == content_key(fp, [{'b': 2, 'a': 1}])
+    # No canonical encoding: bypass rather than guess.
+    assert content_key(fp, [object()]) is None
+
+def test_lru_is_bounded_by_bytes():
+    frame = np.zeros((100, 100, 3), dtype = np.uint8)          # ~30KB each
+    cache = ResultCache(max_bytes = 3 * sizeof(frame))
+    for i in range(3):
+        cache.put(f'k{i}', frame)
+    assert len(cache) == 3
+    cache.get('k0')                          # refresh k0: k1 is now least recent
+    cache.put('k3', frame)
+    assert cache.get('k1') == (False, None)
+    assert cache.get('k0')[0] and cache.get('k3')[0]
+    assert cache.nbytes <= 3 * sizeof(frame)
+    # A value bigger than the whole budget is never stored.
+    cache.put('huge', np.zeros((200, 200, 3), dtype = np.uint8))
+    assert cache.get('huge') == (False, None)
+
+def test_shared_tier_is_consulted_and_filled():
+    class DictTier(SharedResultCache):
+        def __init__(self):
+            self.d = {}
+
+        def get(self, key):
+            return self.d.get(key, MISSING)
+
+        def put(self, key, value):
+            self.d[key] = value
+
+    tier = DictTier()
+    ResultCache(shared = tier).put('k', 5)
+    assert tier.d == {'k': 5}
+    # A fresh replica (empty LRU) hits through the shared tier and promotes it.
+    other = ResultCache(shared = tier)
+    assert other.get('k') == (True, 5)
+    assert len(other) == 1
+    # A node that legitimately returns None hits too; only MISSING is a miss.
+    ResultCache(shared = tier).put('none', None)
+    assert ResultCache(shared = tier).get('none') == (True, None)
+    assert ResultCache(shared = tier).get('absent') == (False, None)
+
+def test_hit_is_published_with_its_own_groups_lineage():
+    node = Scaler(factor = 10, cache = 'content')
+    messenger = _GroupMessenger([('t1', 1), ('t2', 2), ('t3', 1)])
+    ProcessorTask(node, messenger, True, ['p']).run()
+    assert node.calls == 2
+    assert [(t, m) for t, m, _, _ in messenger.published] == [('t1', 10), ('t2', 20), ('t3', 10)]
+    assert [hit for _, _, hit, _ in messenger.published] == [False, False, True]
+    # The hit is bookkeeping for metrics, never part of the published envelope.
+    assert all('cache_hit' not in md for _, _, _, md in messenger.published)
+
+def test_no_cache_leaves_metadata_untouched():
+    node = Scaler()
+    messenger = _GroupMessenger([('t1', 1), ('t2', 1)])
+    ProcessorTask(node, messenger, True, ['p']).run()
+    assert node.calls == 2
+    assert all(hit is None and 'cache_hit' not in md for _, _, hit, md in messenger.published)
+
+def test_hit_and_miss_counters():
+    state = HealthState('n')
+    im = InstrumentedMessenger(_GroupMessenger([]), state)
+    for hit in (True, False, True, None):
+        im.set_output_cache_hit(hit)
+        im.publish_message(1, {'proctime': 0.1, 'actual_proctime': 0.1})
+    text = state.render_metrics()
+    assert 'videoflow_cache_hits_total{node="n"} 2' in text
+    assert 'videoflow_cache_misses_total{node="n"} 1' in text
+    # Only the groups that actually ran process() are timed as the 'process' stage.
+    assert 'videoflow_stage_seconds_count{node="n",stage="process"} 2' in text
+
+def test_cache_validation():
+    with pytest.raises(ValueError):
+        Scaler(cache = 'lru')
+
+    class Stateful(OneTaskProcessorNode):
+        def process(self, x):
+            return x
+    with pytest.raises(ValueError):
+        Stateful(cache = 'content')
+
+def test_payload_codec_round_trip():
+    pytest.importorskip('google.protobuf')
+    from videoflow.wire.serialization import decode_payload, encode_payload
+    arr = np.arange(6, dtype = np.float32).reshape(2, 3)
+    out = decode_payload(*encode_payload({'boxes': arr, 'n': 2}))
+    np.testing.assert_array_equal(out['boxes'], arr)
+    assert out['n'] == 2
+    with pytest.raises(TypeError):
+        encode_payload(object())
+
+if __name__ == "__main__":
+    pytest.main([__file__])
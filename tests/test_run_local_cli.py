@@ -5,6 +5,7 @@ non-zero exit when a node fails.
 
 Pure/unit: infra, the engine and flow execution are all monkeypatched.
 '''
+import json
 import subprocess
 import sys
 
@@ -39,6 +40,15 @@ class _FakeEngine:
     def report_failures(self):
         print('reported', file = sys.stderr)
 
+    def metrics_endpoints(self):
+        return [f'http://localhost:{self.kwargs["metrics_port"] + k}/metrics' for k in range(2)]
+
+    def flow_table(self):
+        return 'NODE  MSG/S\ndet   9.0'
+
+    def metrics_snapshot(self):
+        return {'elapsed_seconds': 1.0, 'nodes': [{'node': 'det', 'messages': 9}]}
+
 
 class _FakeFlow:
     def __init__(self, tasks_data = None):
@@ -239,3 +249,24 @@ def test_no_build_skips_the_build_even_when_needed(wiring, monkeypatch):
     _run(tmp_path, '--no-build')
     assert built == []
     assert _FakeEngine.instances[-1].kwargs['default_image'] is None
+
+
+def test_metrics_port_reaches_the_engine_and_names_the_top_command(wiring, capsys):
+    tmp_path, _calls = wiring
+    _run(tmp_path)
+    assert _FakeEngine.instances[-1].kwargs['metrics_port'] is None
+    _run(tmp_path, '--metrics-port', '9100')
+    assert _FakeEngine.instances[-1].kwargs['metrics_port'] == 9100
+    assert 'videoflow top localhost:9100-9101' in capsys.readouterr().out
+
+
+def test_dashboard_and_metrics_json_collect_metrics(wiring, capsys):
+    tmp_path, _calls = wiring
+    _run(tmp_path)
+    assert _FakeEngine.instances[-1].kwargs['collect_metrics'] is False
+    out_path = tmp_path / 'metrics.json'
+    _run(tmp_path, '--dashboard', '--metrics-json', str(out_path))
+    assert _FakeEngine.instances[-1].kwargs['collect_metrics'] is True
+    out = capsys.readouterr().out
+    assert 'Final per-node metrics:\nNODE  MSG/S\ndet   9.0' in out
+    assert json.loads(out_path.read_text())['nodes'] == [{'node': 'det', 'messages': 9}]
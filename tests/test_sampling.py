@@ -0,0 +1,131 @@
+'''
+Adaptive source sampling (``ProducerNode(sampler=SamplerPolicy(...))``).
+'''
+import pytest
+
+from videoflow.core.engine import Messenger
+from videoflow.core.node import ProducerNode
+from videoflow.core.sampling import AdaptiveSampler, SamplerPolicy
+from videoflow.core.task import ProducerTask
+
+
+class _Clock:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+def _drive(sampler, clock, fps, seconds):
+    '''Offers items at a steady ``fps`` for ``seconds``; returns the admitted timestamps.'''
+    admitted = []
+    for _ in range(int(fps * seconds)):
+        if sampler.admit():
+            admitted.append(clock.t)
+        clock.t += 1.0 / fps
+    return admitted
+
+def test_backlog_cuts_rate_down_to_the_floor():
+    clock = _Clock()
+    sampler = AdaptiveSampler(SamplerPolicy(min_fps = 5, poll_seconds = 0.5), lambda: 10, clock = clock)
+    admitted = _drive(sampler, clock, fps = 30, seconds = 10)
+    assert sampler.rate == 5
+    # Over the last few seconds, at the floor: 5 per second, not bunched.
+    tail = [t for t in admitted if t >= 6.0]
+    assert 19 <= len(tail) <= 21
+    gaps = [b - a for a, b in zip(tail, tail[1:])]
+    assert max(gaps) - min(gaps) < 1.0 / 30 + 1e-9
+
+def test_keeping_up_is_unthrottled():
+    clock = _Clock()
+    sampler = AdaptiveSampler(SamplerPolicy(), lambda: 0, clock = clock)
+    assert len(_drive(sampler, clock, fps = 30, seconds = 2)) == 60
+    assert sampler.rate is None
+
+def test_recovers_when_backlog_clears():
+    clock = _Clock()
+    backlog = {'n': 10}
+    sampler = AdaptiveSampler(SamplerPolicy(min_fps = 2, increase_fps = 5, poll_seconds = 0.25),
+                            lambda: backlog['n'], clock = clock)
+    _drive(sampler, clock, fps = 30, seconds = 3)
+    assert sampler.rate == 2
+    backlog['n'] = 0
+    _drive(sampler, clock, fps = 30, seconds = 3)
+    assert sampler.rate is None
+
+def test_ceiling_applies_even_without_backlog():
+    clock = _Clock()
+    sampler = AdaptiveSampler(SamplerPolicy(min_fps = 1, max_fps = 10), lambda: 0, clock = clock)
+    admitted = _drive(sampler, clock, fps = 30, seconds = 5)
+    assert 48 <= len(admitted) <= 52
+
+def test_unknown_backlog_leaves_rate_alone():
+    clock = _Clock()
+    sampler = AdaptiveSampler(SamplerPolicy(max_fps = 10), lambda: None, clock = clock)
+    _drive(sampler, clock, fps = 30, seconds = 2)
+    assert sampler.rate == 10
+
+def test_policy_validation_and_round_trip():
+    with pytest.raises(ValueError):
+        SamplerPolicy(min_fps = 0)
+    with pytest.raises(ValueError):
+        SamplerPolicy(min_fps = 10, max_fps = 5)
+    with pytest.raises(ValueError):
+        SamplerPolicy(decrease_factor = 1.5)
+    p = SamplerPolicy(min_fps = 2, max_fps = 15, target_backlog = 3)
+    assert SamplerPolicy.from_dict(p.to_dict()).to_dict() == p.to_dict()
+
+class Counter(ProducerNode):
+    def __init__(self, n = 100, **kwargs):
+        self._n = n
+        self._i = 0
+        self.skipped = 0
+        super(Counter, self).__init__(**kwargs)
+
+    def next(self):
+        if self._i >= self._n:
+            raise StopIteration()
+        self._i += 1
+        return self._i
+
+    def skip(self):
+        if self._i >= self._n:
+            raise StopIteration()
+        self._i += 1
+        self.skipped += 1
+
+class _BackloggedMessenger(Messenger):
+    def __init__(self):
+        self.published = []
+        self.stopped = False
+
+    def check_for_termination(self):
+        return False
+
+    def output_backlog(self):
+        return 100
+
+    def publish_message(self, message, metadata = None):
+        self.published.append(message)
+
+    def publish_stop_signal(self):
+        self.stopped = True
+
+def test_producer_task_skips_instead_of_publishing():
+    node = Counter(n = 200, sampler = SamplerPolicy(min_fps = 1, max_fps = 2, poll_seconds = 10))
+    messenger = _BackloggedMessenger()
+    ProducerTask(node, messenger, has_children = True).run()
+    assert messenger.stopped
+    assert node.skipped > 0
+    assert len(messenger.published) + node.skipped == 200
+    # The sampler survives get_params() into a worker.
+    assert Counter(**node.get_params()).sampler.max_fps == 2
+
+def test_sampler_survives_video_reader_get_params():
+    cv2 = pytest.importorskip('cv2')  # noqa: F841
+    from videoflow.producers.video import VideoFileReader
+    r = VideoFileReader('x.mp4', sampler = SamplerPolicy(min_fps = 3))
+    assert VideoFileReader(**r.get_params()).sampler.min_fps == 3
+
+if __name__ == "__main__":
+    pytest.main([__file__])
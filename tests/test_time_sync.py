@@ -121,6 +121,16 @@ def test_trace_max_pending_evicts_oldest():
     assert handles[0].state == 'acked'  # oldest dropped
     assert handles[1].state is None and handles[2].state is None
 
+def test_add_takes_the_callers_clock():
+    # A replay on a virtual clock: the timeout runs from the time passed to add.
+    asm = TraceGroupAssembler('n', ['a', 'b'], JoinPolicy(timeout_seconds = 5))
+    h = FakeHandle()
+    asm.add('a', entry('t1', 1), h, now = 100.0)
+    asm.sweep(now = 104.0)
+    assert h.state is None
+    asm.sweep(now = 105.0)
+    assert h.state == 'acked'
+
 def test_trace_redelivery_supersedes_buffered_half():
     asm = TraceGroupAssembler('n', ['a', 'b'], JoinPolicy())
     stale, fresh = FakeHandle(), FakeHandle()
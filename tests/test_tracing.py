@@ -0,0 +1,257 @@
+'''
+Tests for distributed tracing: span creation around node calls, propagation
+through the envelope's span_id/parent_span_id, deterministic sampling, and the
+OTLP/JSON file and in-memory exporters.
+'''
+import json
+import time
+from collections import deque
+
+import pytest
+
+from videoflow.bench.tracing import measure_tracing
+from videoflow.core.engine import Messenger
+from videoflow.runtime.tracing import (
+    SPAN_KIND_CONSUMER,
+    SPAN_KIND_PRODUCER,
+    STATUS_ERROR,
+    STATUS_OK,
+    InMemorySpanExporter,
+    OTLPFileExporter,
+    Tracer,
+    TracingMessenger,
+    format_trace,
+    group_traces,
+    lineage_root,
+    make_trace_exporter,
+    read_otlp_file,
+)
+
+
+class _Hop(Messenger):
+    '''
+    A fake messenger for one node: ``deliver`` queues envelopes (as published \
+        by an upstream ``_Hop``), ``published`` collects this node's own.
+    '''
+    def __init__(self, name, producer = False):
+        self.name = name
+        self.producer = producer
+        self.inbox = deque()
+        self.published = []
+        self._info = None
+        self._span = None
+        self._counter = 0
+        self._last = None
+
+    def deliver(self, envelope, parent = 'p'):
+        self.inbox.append({parent: envelope})
+
+    def receive_message(self):
+        if not self.inbox:
+            return {'p': {'message': None, 'metadata': None, 'is_stop_signal': True}}
+        group = self.inbox.popleft()
+        self._info = {p: {'trace_id': e['trace_id'], 'seq': 0, 'event_ts': None,
+                          'metadata': None, 'span_id': e['span_id'] or None}
+                      for p, e in group.items()}
+        return {p: {'message': e['message'], 'metadata': None, 'is_stop_signal': False}
+                for p, e in group.items()}
+
+    def last_input_info(self):
+        return self._info
+
+    def set_output_span(self, span_id, parent_span_id = None):
+        self._span = (span_id, parent_span_id)
+
+    def publish_message(self, message, metadata = None):
+        if self.producer:
+            self._counter += 1
+            trace_id = f'{self.name}:{self._counter}'
+        else:
+            trace_id = next(iter(self._info.values()))['trace_id']
+        span_id, parent_span_id = self._span or (None, None)
+        self._span = None
+        self._last = trace_id
+        self.published.append({'message': message, 'trace_id': trace_id,
+                               'span_id': span_id or '', 'parent_span_id': parent_span_id or ''})
+
+    def last_published_trace_id(self):
+        return self._last
+
+    def publish_stop_signal(self):
+        pass
+
+    def check_for_termination(self):
+        return False
+
+    def ack_inputs(self):
+        pass
+
+    def fail_inputs(self, exc):
+        pass
+
+    def close(self):
+        pass
+
+def _traced(hop, exporter, sample_rate = 1.0, operation = 'process'):
+    tracer = Tracer(exporter, sample_rate = sample_rate, batch_size = 1)
+    return TracingMessenger(hop, tracer, hop.name, 'flow', 'run', operation = operation)
+
+def test_lineage_root_drops_emission_suffixes():
+    assert lineage_root('cam:7') == 'cam:7'
+    assert lineage_root('cam:7.1.2') == 'cam:7'
+    assert lineage_root('cam.v2:7.3') == 'cam.v2:7'
+    assert lineage_root('win:flush:r0:1') == 'win:flush:r0:1'
+
+def test_spans_chain_across_hops():
+    exporter = InMemorySpanExporter()
+    src, det, sink = _Hop('cam', producer = True), _Hop('det'), _Hop('sink')
+    tsrc = _traced(src, exporter, operation = 'next')
+    tdet = _traced(det, exporter)
+    tsink = _traced(sink, exporter, operation = 'consume')
+
+    tsrc.publish_message('frame', {'proctime': 0.01})
+    det.deliver(src.published[0])
+    tdet.receive_message()
+    tdet.publish_message('boxes')
+    tdet.ack_inputs()
+    sink.deliver(det.published[0])
+    tsink.receive_message()
+    tsink.ack_inputs()
+
+    root, mid, leaf = exporter.spans
+    assert [s.name for s in exporter.spans] == ['cam.next', 'det.process', 'sink.consume']
+    assert root.trace_id == mid.trace_id == leaf.trace_id and len(root.trace_id) == 32
+    assert root.parent_span_id is None and root.kind == SPAN_KIND_PRODUCER
+    assert mid.parent_span_id == root.span_id and mid.kind == SPAN_KIND_CONSUMER
+    assert leaf.parent_span_id == mid.span_id
+    # The wire carries exactly what links the hops.
+    assert src.published[0]['span_id'] == root.span_id
+    assert det.published[0] == {'message': 'boxes', 'trace_id': 'cam:1',
+                                'span_id': mid.span_id, 'parent_span_id': root.span_id}
+    assert root.duration_ns >= 10_000_000        # covers next() via its proctime
+    assert all(s.status == STATUS_OK for s in exporter.spans)
+    assert mid.attributes['videoflow.trace_id'] == 'cam:1'
+
+def test_failed_input_group_is_an_error_span():
+    exporter = InMemorySpanExporter()
+    hop = _Hop('det')
+    hop.deliver({'message': 1, 'trace_id': 'cam:1', 'span_id': 'a' * 16})
+    traced = _traced(hop, exporter)
+    traced.receive_message()
+    traced.fail_inputs(ValueError('bad frame'))
+    span, = exporter.spans
+    assert span.status == STATUS_ERROR and span.status_message == 'bad frame'
+    assert span.events[0][1] == 'exception'
+    assert span.events[0][2]['exception.type'] == 'ValueError'
+
+def test_join_links_the_other_parents():
+    exporter = InMemorySpanExporter()
+    hop = _Hop('join')
+    hop.inbox.append({'a': {'message': 1, 'trace_id': 'cam:1', 'span_id': 'a' * 16},
+                      'b': {'message': 2, 'trace_id': 'cam:1', 'span_id': 'b' * 16}})
+    traced = _traced(hop, exporter)
+    traced.receive_message()
+    traced.ack_inputs()
+    span, = exporter.spans
+    assert span.parent_span_id == 'a' * 16
+    assert span.links == [(span.trace_id, 'b' * 16)]
+
+def test_pooled_groups_keep_their_own_spans():
+    exporter = InMemorySpanExporter()
+    hop = _Hop('det')
+    for n in (1, 2):
+        hop.deliver({'message': n, 'trace_id': f'cam:{n}', 'span_id': f'{n:016x}'})
+    traced = _traced(hop, exporter)
+    traced.receive_message()
+    first = traced.checkpoint_inputs()
+    traced.receive_message()
+    second = traced.checkpoint_inputs()
+    for token in (first, second):
+        traced.restore_inputs(token)
+        traced.publish_message('out')
+        traced.ack_inputs()
+    assert [s.parent_span_id for s in exporter.spans] == [f'{1:016x}', f'{2:016x}']
+    assert [p['parent_span_id'] for p in hop.published] == [f'{1:016x}', f'{2:016x}']
+
+def test_sampling_is_per_trace_and_deterministic():
+    tracer = Tracer(InMemorySpanExporter(), sample_rate = 0.1)
+    decisions = [tracer.trace_context('f', 'r', f'cam:{n}')[1] for n in range(5000)]
+    assert 0.07 < sum(decisions) / len(decisions) < 0.13
+    # Every hop (and every emission of one input) reaches the same decision.
+    assert tracer.trace_context('f', 'r', 'cam:9') == tracer.trace_context('f', 'r', 'cam:9.2')
+    assert not any(Tracer(InMemorySpanExporter(), sample_rate = 0.0).trace_context('f', 'r', f'c:{n}')[1]
+                   for n in range(100))
+    with pytest.raises(ValueError):
+        Tracer(InMemorySpanExporter(), sample_rate = 1.5)
+
+def test_unsampled_messages_carry_no_span():
+    exporter = InMemorySpanExporter()
+    hop = _Hop('det')
+    hop.deliver({'message': 1, 'trace_id': 'cam:1', 'span_id': ''})
+    traced = _traced(hop, exporter, sample_rate = 0.0)
+    traced.receive_message()
+    traced.publish_message('out')
+    traced.ack_inputs()
+    assert exporter.spans == []
+    assert hop.published[0]['span_id'] == ''
+
+def test_otlp_file_round_trip(tmp_path):
+    path = tmp_path / 'spans.jsonl'
+    exporter = make_trace_exporter(f'otlp-file://{path}')
+    assert isinstance(exporter, OTLPFileExporter)
+    src, det = _Hop('cam', producer = True), _Hop('det')
+    tracer = Tracer(exporter, resource = {'service.name': 'cam'})
+    tsrc = TracingMessenger(src, tracer, 'cam', 'flow', 'run', operation = 'next')
+    tdet = TracingMessenger(det, tracer, 'det', 'flow', 'run')
+    for _ in range(3):
+        tsrc.publish_message('frame', {'proctime': 0.001})
+        det.deliver(src.published[-1])
+        tdet.receive_message()
+        time.sleep(0.002)
+        tdet.publish_message('out')
+        tdet.ack_inputs()
+    tracer.shutdown()
+
+    request = json.loads(path.read_text().splitlines()[0])
+    otlp_span = request['resourceSpans'][0]['scopeSpans'][0]['spans'][0]
+    assert set(otlp_span) >= {'traceId', 'spanId', 'name', 'kind', 'startTimeUnixNano',
+                              'endTimeUnixNano', 'attributes', 'status'}
+    spans = read_otlp_file(str(path))
+    assert len(spans) == 6 and spans[0].resource == {'service.name': 'cam'}
+    traces = group_traces(spans)
+    assert len(traces) == 3
+    waterfall = format_trace(next(iter(traces.values())))
+    lines = waterfall.splitlines()
+    assert lines[0].startswith('trace ') and '2 spans' in lines[0]
+    assert lines[1].startswith('cam.next') and lines[2].startswith('  det.process')
+
+def test_unknown_exporter_scheme():
+    with pytest.raises(ValueError, match = 'memory'):
+        make_trace_exporter('zipkin://localhost')
+    assert isinstance(make_trace_exporter('memory://'), InMemorySpanExporter)
+
+def test_nats_stamps_span_ids(monkeypatch):
+    from videoflow.messaging.nats_messenger import NATSMessenger
+    from videoflow.processors.basic import IdentityProcessor
+    m = NATSMessenger.__new__(NATSMessenger)  # skip __init__: no broker
+    m._node = IdentityProcessor(name = 'det')
+    m._trace_counter = 0
+    m._last_trace_id, m._last_seq, m._last_event_ts = 'cam:3', 3, 1.0
+    m._output_event_ts = m._output_partition_key = m._output_emission = m._output_span = None
+    sent = []
+    monkeypatch.setattr(m, '_publish', lambda message, metadata, trace_id, seq, msg_type, **kw:
+                        sent.append((kw['span_id'], kw['parent_span_id'])))
+    m.set_output_span('1' * 16, '2' * 16)
+    m.publish_message('a')
+    m.publish_message('b')
+    assert sent == [('1' * 16, '2' * 16), ('', '')]
+    assert m.last_published_trace_id() == 'cam:3'
+
+def test_overhead_bench_cases():
+    # Timing lives in `videoflow bench tracing`; this pins what it reports.
+    for label, sample_rate in (('unsampled', 0.0), ('sampled', 1.0)):
+        (figure,) = measure_tracing(label, sample_rate, nb_messages = 100)
+        assert figure.name == f'{label}.overhead_us' and figure.value >= 0 and figure.unit == 'us'
+
+if __name__ == '__main__':
+    pytest.main([__file__])
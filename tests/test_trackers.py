@@ -0,0 +1,107 @@
+'''
+Tests for ``SortTracker``: track continuity, per-stream state, the two \
+    assignment methods, and the ``tracker`` bench suite at 200 tracks per frame.
+'''
+import numpy as np
+import pytest
+
+from videoflow.bench.tracker import measure_tracker
+from videoflow.processors.vision.trackers import SortTracker, associate, iou_matrix
+
+
+class _Ctx:
+    def __init__(self, key):
+        self.key = key
+
+def _dets(boxes):
+    boxes = np.asarray(boxes, dtype = np.float64).reshape(-1, 4)
+    return np.concatenate([boxes, np.zeros((len(boxes), 1)), np.ones((len(boxes), 1))], axis = 1)
+
+def _grid(n, shift = 0.0):
+    # n disjoint 10x10 boxes on a grid, all moved right by ``shift``.
+    i = np.arange(n)
+    ymin = (i // 20) * 20.0
+    xmin = (i % 20) * 20.0 + shift
+    return np.stack([ymin, xmin, ymin + 10, xmin + 10], axis = 1)
+
+def test_iou_matrix():
+    a = np.array([[0, 0, 10, 10], [0, 0, 0, 0]], dtype = float)
+    b = np.array([[0, 0, 10, 10], [5, 5, 15, 15], [20, 20, 30, 30]], dtype = float)
+    iou = iou_matrix(a, b)
+    assert iou.shape == (2, 3)
+    np.testing.assert_allclose(iou[0], [1.0, 25 / 175, 0.0])
+    np.testing.assert_allclose(iou[1], 0.0)
+
+def test_greedy_matches_hungarian_on_unambiguous_input():
+    pytest.importorskip('scipy')   # optional dep
+    iou = iou_matrix(_grid(30, shift = 1.0), _grid(30))
+    g = associate(iou, 0.3, 'greedy')
+    h = associate(iou, 0.3, 'hungarian')
+    assert sorted(zip(*map(list, g))) == sorted(zip(*map(list, h)))
+
+def test_greedy_respects_threshold_and_one_to_one():
+    iou = np.array([[0.9, 0.8], [0.85, 0.1], [0.2, 0.25]])
+    rows, cols = associate(iou, 0.3, 'greedy')
+    assert sorted(zip(rows.tolist(), cols.tolist())) == [(0, 0)]
+
+def test_tracks_keep_their_id_across_frames():
+    tracker = SortTracker(min_hits = 1)
+    ids = None
+    for t in range(10):
+        out = tracker.process(_dets(_grid(5, shift = 2.0 * t)))
+        assert out.shape == (5, 5)
+        order = np.argsort(out[:, 1] + 1000 * out[:, 0])
+        frame_ids = out[order, 4].tolist()
+        if ids is None:
+            ids = frame_ids
+        assert frame_ids == ids
+    assert len(set(ids)) == 5
+    # The filter follows the motion.
+    np.testing.assert_allclose(out[order, :4], _grid(5, shift = 18.0), atol = 1.0)
+
+def test_lost_track_is_dropped_after_max_age():
+    tracker = SortTracker(max_age = 1, min_hits = 0)
+    first = tracker.process(_dets([[0, 0, 10, 10]]))
+    tracker.process(_dets(np.zeros((0, 4))))
+    tracker.process(_dets(np.zeros((0, 4))))
+    again = tracker.process(_dets([[0, 0, 10, 10]]))
+    assert again[0, 4] != first[0, 4]
+
+def test_min_hits_delays_new_tracks():
+    tracker = SortTracker(min_hits = 3)
+    for _ in range(4):
+        tracker.process(_dets([[0, 0, 10, 10]]))
+    # Past the warm-up, a newcomer needs min_hits consecutive matches.
+    box = [[100, 100, 110, 110], [0, 0, 10, 10]]
+    counts = [len(tracker.process(_dets(box))) for _ in range(4)]
+    assert counts == [1, 1, 1, 2]
+
+def test_state_is_per_stream_key():
+    tracker = SortTracker(min_hits = 1, nb_tasks = 2, partition_by = 'camera_id')
+    a = tracker.process(_dets([[0, 0, 10, 10]]), _Ctx('a'))
+    b = tracker.process(_dets([[50, 50, 60, 60]]), _Ctx('b'))
+    a2 = tracker.process(_dets([[1, 1, 11, 11]]), _Ctx('a'))
+    b2 = tracker.process(_dets([[51, 51, 61, 61]]), _Ctx('b'))
+    assert a2[0, 4] == a[0, 4] and b2[0, 4] == b[0, 4]
+    # Camera b's box never associated with camera a's track.
+    assert len(a2) == 1 and len(b2) == 1
+    assert sorted(tracker.keys) == ['a', 'b']
+
+def test_validation():
+    with pytest.raises(ValueError):
+        SortTracker(cache = 'content')
+    with pytest.raises(ValueError):
+        SortTracker(assignment = 'optimal')
+    tracker = SortTracker(nb_tasks = 3, partition_by = 'camera_id', iou_threshold = 0.5)
+    rebuilt = type(tracker)(**tracker.get_params())
+    assert rebuilt.partition_by == 'camera_id' and rebuilt._iou_threshold == 0.5
+
+def test_bench_case_keeps_200_tracks():
+    # Timing lives in `videoflow bench tracker`; this pins what it measures.
+    figures = {m.name: m for m in measure_tracker(200, 'greedy', nb_frames = 5)}
+    assert set(figures) == {'greedy_200.process_ms', 'greedy_200.tracks'}
+    assert figures['greedy_200.process_ms'].value > 0
+    assert figures['greedy_200.tracks'].value == 200 and figures['greedy_200.tracks'].better is None
+
+if __name__ == '__main__':
+    pytest.main([__file__])
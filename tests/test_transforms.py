@@ -0,0 +1,69 @@
+'''
+Tests for the producer-side frame transform (``output=FrameSpec(...)``): one
+resize/convert/scale pass at the source instead of a strided view that every
+downstream encode has to copy.
+'''
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip('cv2')   # optional 'vision'/'video' extra
+
+from videoflow.producers.video import ImageProducer
+from videoflow.utils.transforms import FrameSpec, FrameTransform, frame_spec_to_dict
+
+
+@pytest.fixture
+def bgr():
+    return np.random.RandomState(0).randint(0, 256, (48, 64, 3)).astype(np.uint8)
+
+
+def test_default_swap_is_contiguous_rgb(bgr):
+    out = FrameTransform(None, 'rgb')(bgr)
+    assert out.flags.c_contiguous
+    assert np.array_equal(out, bgr[..., ::-1])
+
+
+def test_nothing_to_do_returns_the_decoded_frame(bgr):
+    assert FrameTransform(None, 'bgr')(bgr) is bgr
+    assert FrameTransform(FrameSpec(size = (64, 48)), 'bgr')(bgr) is bgr
+
+
+def test_resize_convert_and_scale_match_the_unfused_ops(bgr):
+    transform = FrameTransform(FrameSpec(size = (32, 24), interpolation = 'linear', dtype = 'float32'))
+    expected = cv2.cvtColor(cv2.resize(bgr, (32, 24), interpolation = cv2.INTER_LINEAR),
+                            cv2.COLOR_BGR2RGB).astype(np.float32) / 255
+    first = transform(bgr)
+    second = transform(bgr)
+    assert first.dtype == np.float32 and first.shape == (24, 32, 3)
+    np.testing.assert_allclose(first, expected, rtol = 1e-6)
+    # Scratch buffers are reused, but every returned frame is its own array.
+    assert not np.shares_memory(first, second)
+
+    gray = FrameTransform(FrameSpec(color = 'gray'))(bgr)
+    assert gray.shape == (48, 64)
+
+
+def test_spec_validation_and_round_trip():
+    spec = FrameSpec(size = (320, 240), color = 'bgr')
+    assert FrameSpec.from_dict(spec.to_dict()).to_dict() == spec.to_dict()
+    assert frame_spec_to_dict({'size': [8, 8]})['interpolation'] == 'area'
+    assert frame_spec_to_dict(None) is None
+    with pytest.raises(ValueError, match = 'size'):
+        FrameSpec(size = (0, 10))
+    with pytest.raises(ValueError, match = 'color'):
+        FrameSpec(color = 'hsv')
+
+
+def test_image_producer_applies_output_spec(tmp_path, bgr):
+    path = str(tmp_path / 'im.png')
+    cv2.imwrite(path, bgr)
+    producer = ImageProducer(path, output = FrameSpec(size = (16, 12)))
+    producer = ImageProducer(**producer.get_params())
+    im = producer.next()
+    assert im.shape == (12, 16, 3) and im.flags.c_contiguous
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -7,11 +7,55 @@ tests pin the contract for the window in between.
 '''
 from __future__ import absolute_import, division, print_function
 
+import os
+import sys
+
+import numpy as np
 import pytest
 
-pytest.importorskip('cv2')   # optional 'vision'/'video' extra
+cv2 = pytest.importorskip('cv2')   # optional 'vision'/'video' extra
+
+from videoflow.producers import video as video_module
+from videoflow.producers.video import (
+    ImageFolderReader,
+    SegmentedVideoFileReader,
+    VideoFileReader,
+    VideoFolderReader,
+    VideoUrlReader,
+    plan_segments,
+)
+
+
+@pytest.fixture
+def small_video(tmp_path):
+    '''A 10-frame, 10 fps MJPG clip whose frame i is filled with the value 20*i.'''
+    path = str(tmp_path / 'clip.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (32, 24))
+    for i in range(10):
+        writer.write(np.full((24, 32, 3), 20 * i, np.uint8))
+    writer.release()
+    return path
+
+
+class _Ctx:
+    def __init__(self):
+        self.stamps = []
+
+    def set_event_timestamp(self, value):
+        self.stamps.append(value)
+
 
-from videoflow.producers.video import VideoFileReader
+def _drain(reader, ctx = None):
+    reader.open()
+    out = []
+    try:
+        while True:
+            out.append(reader.next() if ctx is None else reader.next(ctx))
+    except StopIteration:
+        pass
+    finally:
+        reader.close()
+    return out
 
 
 def test_next_before_open_raises_runtime_error():
@@ -31,5 +75,252 @@ def test_close_before_open_is_a_noop():
     VideoFileReader('/nonexistent/video.mp4').close()
 
 
+@pytest.mark.parametrize('read_ahead', [0, 3])
+def test_read_ahead_matches_inline_decode(small_video, read_ahead):
+    ctx = _Ctx()
+    frames = _drain(VideoFileReader(small_video, read_ahead = read_ahead), ctx)
+    assert [i for i, _ in frames] == list(range(1, 11))
+    assert [round(float(f.mean()) / 20) for _, f in frames] == list(range(10))
+    # Event time comes from the file's own timeline, stamped at decode.
+    assert ctx.stamps == pytest.approx([i / 10 for i in range(10)], abs = 1e-6)
+
+
+@pytest.mark.parametrize('read_ahead', [0, 2])
+def test_nb_frames_is_preserved(small_video, read_ahead):
+    frames = _drain(VideoFileReader(small_video, nb_frames = 4, read_ahead = read_ahead))
+    assert [i for i, _ in frames] == [1, 2, 3, 4]
+
+
+@pytest.mark.parametrize('read_ahead', [0, 2])
+def test_frame_stride_grabs_skipped_frames(small_video, read_ahead):
+    frames = _drain(VideoFileReader(small_video, frame_stride = 3, read_ahead = read_ahead))
+    assert [i for i, _ in frames] == [3, 6, 9]
+    assert [round(float(f.mean()) / 20) for _, f in frames] == [2, 5, 8]
+    # nb_frames counts source frames, skipped ones included.
+    frames = _drain(VideoFileReader(small_video, frame_stride = 3, nb_frames = 7))
+    assert [i for i, _ in frames] == [3, 6]
+
+
+def test_skip_advances_by_one_emitted_frame(small_video):
+    reader = VideoFileReader(small_video, frame_stride = 2)
+    reader.open()
+    reader.skip()
+    index, _ = reader.next()
+    reader.close()
+    assert index == 4
+
+
+def test_hw_acceleration_falls_back_to_software(small_video):
+    frames = _drain(VideoFileReader(small_video, hw_acceleration = True, nb_frames = 2))
+    assert len(frames) == 2
+
+
+def test_read_errors_surface_after_retries(tmp_path):
+    reader = VideoUrlReader(str(tmp_path / 'missing.avi'), nb_retries = 2, read_ahead = 2)
+    assert _drain(reader) == []
+    assert reader._retries_count == 3
+
+
+def test_close_stops_a_blocked_decode_thread(small_video):
+    reader = VideoFileReader(small_video, read_ahead = 1)
+    reader.open()
+    decoder = reader._decoder
+    reader.next()
+    reader.close()
+    assert not decoder.is_alive()
+    # Released by the decode thread itself, never concurrently from close().
+    assert not reader._video.isOpened()
+
+
+@pytest.mark.parametrize('read_ahead', [0, 2])
+def test_output_spec_is_applied_at_decode(small_video, read_ahead):
+    frames = _drain(VideoFileReader(small_video, nb_frames = 3, read_ahead = read_ahead,
+                                    output = {'size': [16, 12], 'color': 'rgb'}))
+    assert [f.shape for _, f in frames] == [(12, 16, 3)] * 3
+    assert all(f.flags.c_contiguous for _, f in frames)
+
+
+def test_new_params_round_trip():
+    for reader in (VideoFileReader('x.avi', read_ahead = 4, frame_stride = 2, hw_acceleration = True),
+                VideoUrlReader('rtsp://cam', read_ahead = 4, frame_stride = 2, hw_acceleration = True)):
+        clone = type(reader)(**reader.get_params())
+        assert (clone._read_ahead, clone._frame_stride, clone._hw_acceleration) == (4, 2, True)
+
+
+def test_invalid_params_rejected():
+    with pytest.raises(ValueError, match = 'frame_stride'):
+        VideoFileReader('x.avi', frame_stride = 0)
+    with pytest.raises(ValueError, match = 'read_ahead'):
+        VideoFileReader('x.avi', read_ahead = -1)
+
+
+@pytest.fixture
+def gop_video(tmp_path):
+    '''A 60-frame MPEG-4 clip (inter-coded, so seeks land between keyframes).'''
+    path = str(tmp_path / 'clip.mp4')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), 25, (64, 48))
+    for i in range(60):
+        frame = np.zeros((48, 64, 3), np.uint8)
+        frame[:, :i] = 255
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def test_plan_segments_aligns_on_keyframes():
+    assert plan_segments(10, 4) == [(0, 4), (4, 8), (8, 10)]
+    assert plan_segments(10, 4, keyframes = [0, 3, 5, 9]) == [(0, 5), (5, 9), (9, 10)]
+    assert plan_segments(0, 4) == []
+
+
+@pytest.mark.parametrize('nb_workers', [1, 3])
+def test_segmented_reader_matches_sequential_reader(gop_video, nb_workers, monkeypatch):
+    # No PyAV/ffprobe here either way; force the even split so seeks are mid-GOP.
+    monkeypatch.setattr(video_module, 'probe_keyframes', lambda path: None)
+    seq_ctx, seg_ctx = _Ctx(), _Ctx()
+    expected = _drain(VideoFileReader(gop_video), seq_ctx)
+    got = _drain(SegmentedVideoFileReader(gop_video, nb_workers = nb_workers, segment_frames = 7,
+                                        read_ahead = 2), seg_ctx)
+    assert [i for i, _ in got] == [i for i, _ in expected] == list(range(1, 61))
+    assert all(np.array_equal(a, b) for (_, a), (_, b) in zip(got, expected))
+    assert seg_ctx.stamps == seq_ctx.stamps
+
+
+def test_segmented_reader_uses_probed_keyframes(gop_video, monkeypatch):
+    monkeypatch.setattr(video_module, 'probe_keyframes', lambda path: ([0, 12, 24, 36, 48], 60))
+    reader = SegmentedVideoFileReader(gop_video, segment_frames = 10, nb_frames = 30)
+    frames = _drain(reader)
+    assert [i for i, _ in frames] == list(range(1, 31))
+
+
+def test_probe_keyframes_gives_up_on_a_stalled_ffprobe(monkeypatch):
+    def stalled(cmd, **kwargs):
+        assert kwargs['timeout'] == video_module._FFPROBE_TIMEOUT_SECONDS
+        raise video_module.subprocess.TimeoutExpired(cmd, kwargs['timeout'])
+    monkeypatch.setitem(sys.modules, 'av', None)   # force the ffprobe path
+    monkeypatch.setattr(video_module.shutil, 'which', lambda name: '/usr/bin/' + name)
+    monkeypatch.setattr(video_module.subprocess, 'run', stalled)
+    # None: the segmented reader then splits the file into fixed-length segments.
+    assert video_module.probe_keyframes('clip.mp4') is None
+
+
+def test_segmented_reader_close_mid_stream_and_params(gop_video):
+    reader = SegmentedVideoFileReader(gop_video, nb_workers = 2, segment_frames = 5, read_ahead = 1)
+    reader.open()
+    threads = list(reader._decoders)
+    reader.next()
+    reader.close()
+    assert not any(t.is_alive() for t in threads)
+    clone = SegmentedVideoFileReader(**reader.get_params())
+    assert (clone._nb_workers, clone._segment_frames, clone._read_ahead) == (2, 5, 1)
+    with pytest.raises(RuntimeError, match = r'open\(\)'):
+        clone.next()
+
+
+@pytest.fixture
+def image_folder(tmp_path):
+    folder = tmp_path / 'images'
+    folder.mkdir()
+    for i in range(7):
+        im = np.zeros((8, 8, 3), np.uint8)
+        im[..., 2] = 10 * i   # red in BGR
+        cv2.imwrite(str(folder / f'{i:03d}.PNG'), im)
+    (folder / '003.PNG').write_bytes(b'not an image')
+    (folder / 'notes.txt').write_text('ignored')
+    return str(folder)
+
+
+def test_image_folder_reader_order_prefetch_and_cursor(image_folder):
+    reader = ImageFolderReader(image_folder, nb_workers = 3, prefetch = 2)
+    names = []
+    for name, im in _drain(reader):
+        names.append(name)
+        assert im[0, 0, 0] == 10 * int(name[:3])   # RGB after the channel swap
+    # Sorted, extension match is case-insensitive, the corrupt file is skipped.
+    assert names == ['000.PNG', '001.PNG', '002.PNG', '004.PNG', '005.PNG', '006.PNG']
+    assert reader.cursor == '006.PNG'
+
+
+def test_image_folder_reader_resumes_after_cursor(image_folder):
+    reader = ImageFolderReader(image_folder)
+    reader.open()
+    reader.next(), reader.next()
+    reader.close()
+    # get_params() carries the cursor, so a node rebuilt from it resumes.
+    assert reader.get_params()['start_after'] == reader.cursor == '001.PNG'
+    resumed = ImageFolderReader(**reader.get_params())
+    assert [n for n, _ in _drain(resumed)] == ['002.PNG', '004.PNG', '005.PNG', '006.PNG']
+
+
+def test_image_folder_reader_checkpoints_to_cursor_file(image_folder, tmp_path):
+    cursor_file = str(tmp_path / 'cursor')
+    reader = ImageFolderReader(image_folder, cursor_file = cursor_file, checkpoint_every = 2)
+    reader.open()
+    reader.next(), reader.next()
+    # Only one file confirmed published: not due for a write yet.
+    assert not os.path.exists(cursor_file)
+    reader.next()
+    # A crash here: '002.PNG' was returned but not known to be published yet.
+    assert open(cursor_file).read() == '001.PNG'
+    assert reader.get_params()['checkpoint_every'] == 2
+    restarted = ImageFolderReader(image_folder, cursor_file = cursor_file)
+    assert [n for n, _ in _drain(restarted)] == ['002.PNG', '004.PNG', '005.PNG', '006.PNG']
+    assert open(cursor_file).read() == '006.PNG'
+    assert _drain(ImageFolderReader(image_folder, cursor_file = cursor_file)) == []
+    with pytest.raises(ValueError, match = 'checkpoint_every'):
+        ImageFolderReader(image_folder, checkpoint_every = 0)
+
+
+def test_image_folder_reader_writes_the_cursor_on_close(image_folder, tmp_path):
+    cursor_file = str(tmp_path / 'cursor')
+    reader = ImageFolderReader(image_folder, cursor_file = cursor_file)
+    reader.open()
+    reader.next(), reader.next(), reader.next()
+    assert not os.path.exists(cursor_file)
+    reader.close()
+    # The last file returned is not known to be published, so it is read again.
+    assert open(cursor_file).read() == '001.PNG'
+
+
+def test_image_folder_shards_are_disjoint_and_stable(image_folder):
+    shards = [[n for n, _ in _drain(ImageFolderReader(image_folder, shard_index = i, nb_shards = 3))]
+                for i in range(3)]
+    assert shards == [['000.PNG', '006.PNG'], ['001.PNG', '004.PNG'], ['002.PNG', '005.PNG']]
+    # start_after does not move files between shards.
+    assert [n for n, _ in _drain(ImageFolderReader(image_folder, shard_index = 1, nb_shards = 3,
+                                                    start_after = '002.PNG'))] == ['004.PNG']
+    with pytest.raises(ValueError, match = 'shard_index'):
+        ImageFolderReader(image_folder, shard_index = 3, nb_shards = 3)
+
+
+def test_video_folder_reader_reads_files_in_order(tmp_path):
+    folder = tmp_path / 'videos'
+    folder.mkdir()
+    for name, n in (('b.avi', 2), ('a.avi', 3)):
+        writer = cv2.VideoWriter(str(folder / name), cv2.VideoWriter_fourcc(*'MJPG'), 10, (16, 16))
+        for _ in range(n):
+            writer.write(np.zeros((16, 16, 3), np.uint8))
+        writer.release()
+    ctx = _Ctx()
+    reader = VideoFolderReader(str(folder), read_ahead = 1)
+    frames = _drain(reader, ctx)
+    assert [(name, i) for name, i, _ in frames] == [('a.avi', 1), ('a.avi', 2), ('a.avi', 3),
+                                                    ('b.avi', 1), ('b.avi', 2)]
+    assert ctx.stamps == pytest.approx([0, 0.1, 0.2, 0, 0.1])
+    assert reader.cursor == 'b.avi'
+    resumed = VideoFolderReader(**dict(reader.get_params(), start_after = 'a.avi'))
+    assert [(name, i) for name, i, _ in _drain(resumed)] == [('b.avi', 1), ('b.avi', 2)]
+
+    cursor_file = str(tmp_path / 'cursor')
+    reader = VideoFolderReader(str(folder), read_ahead = 1, cursor_file = cursor_file)
+    reader.open()
+    for _ in range(4):
+        reader.next()
+    reader.close()
+    assert open(cursor_file).read() == 'a.avi'
+    restarted = VideoFolderReader(str(folder), cursor_file = cursor_file)
+    assert [(name, i) for name, i, _ in _drain(restarted)] == [('b.avi', 1), ('b.avi', 2)]
+
+
 if __name__ == '__main__':
     pytest.main([__file__])
@@ -0,0 +1,209 @@
+'''
+Tests for ``VideofileWriter``: background encoding, the cv2 and ffmpeg backends,
+and that encoder failures surface on ``close()`` instead of vanishing with the
+thread. The ffmpeg backend is exercised against a fake ``ffmpeg`` that records
+its command line and the raw bytes piped to it.
+'''
+from __future__ import absolute_import, division, print_function
+
+import json
+import os
+import shutil
+import stat
+import sys
+import time
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip('cv2')   # optional 'vision'/'video' extra
+
+from videoflow.consumers import video as video_module
+from videoflow.consumers.video import StreamWriter, VideofileWriter
+
+FAKE_FFMPEG = '''#!{python}
+import json, sys
+args = sys.argv[1:]
+if '-encoders' in args:
+    print(' V....D libx264              H.264')
+    print(' V....D h264_nvenc           NVIDIA NVENC')
+    sys.exit(0)
+if 'lavfi' in args:
+    sys.exit(0 if '{usable}' in args else 1)
+data = sys.stdin.buffer.read()
+with open(args[-1], 'w') as f:
+    json.dump({{'args': args, 'nbytes': len(data)}}, f)
+sys.exit({exit_code})
+'''
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch):
+    def install(usable = 'h264_nvenc', exit_code = 0):
+        bin_dir = tmp_path / 'bin'
+        bin_dir.mkdir(exist_ok = True)
+        path = bin_dir / 'ffmpeg'
+        path.write_text(FAKE_FFMPEG.format(python = sys.executable, usable = usable, exit_code = exit_code))
+        path.chmod(path.stat().st_mode | stat.S_IEXEC)
+        monkeypatch.setenv('PATH', f'{bin_dir}{os.pathsep}{os.environ["PATH"]}')
+        video_module.ffmpeg_encoders.cache_clear()
+        video_module._encoder_works.cache_clear()
+    yield install
+    video_module.ffmpeg_encoders.cache_clear()
+    video_module._encoder_works.cache_clear()
+
+
+def _frames(n, h = 24, w = 32):
+    return [np.full((h, w, 3), 10 * i, np.uint8) for i in range(n)]
+
+
+def test_cv2_backend_writes_a_readable_mp4(tmp_path):
+    path = str(tmp_path / 'out.mp4')
+    writer = VideofileWriter(path, fps = 10, backend = 'cv2', queue_size = 2)
+    writer.open()
+    for frame in _frames(5) + [np.zeros((48, 64, 3), np.uint8)]:   # last one is resized
+        writer.consume(frame)
+    writer.close()
+    cap = cv2.VideoCapture(path)
+    assert int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) == 6
+    assert (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))) == (32, 24)
+    cap.release()
+
+
+def test_ffmpeg_backend_pipes_rgb_frames_to_a_hardware_encoder(tmp_path, fake_ffmpeg):
+    fake_ffmpeg(usable = 'h264_nvenc')
+    out = tmp_path / 'out.mkv'
+    writer = VideofileWriter(str(out), fps = 25, hw_acceleration = True)
+    for frame in _frames(4):
+        writer.consume(frame)
+    writer.close()
+    record = json.loads(out.read_text())
+    assert record['nbytes'] == 4 * 24 * 32 * 3
+    args = record['args']
+    assert args[args.index('-pix_fmt') + 1] == 'rgb24'
+    assert args[args.index('-c:v') + 1] == 'h264_nvenc'
+    assert args[args.index('-s') + 1] == '32x24'
+
+
+def test_hardware_encoder_that_does_not_work_falls_back_to_software(tmp_path, fake_ffmpeg):
+    fake_ffmpeg(usable = 'none')
+    out = tmp_path / 'out.mp4'
+    writer = VideofileWriter(str(out), hw_acceleration = True, backend = 'ffmpeg')
+    writer.consume(_frames(1)[0])
+    writer.close()
+    args = json.loads(out.read_text())['args']
+    assert args[args.index('-c:v') + 1] == 'libx264'
+
+
+def test_encoder_failure_is_raised_on_close(tmp_path, fake_ffmpeg):
+    fake_ffmpeg(exit_code = 1)
+    writer = VideofileWriter(str(tmp_path / 'out.mp4'), backend = 'ffmpeg')
+    writer.consume(_frames(1)[0])
+    with pytest.raises(RuntimeError, match = 'ffmpeg exited with code 1'):
+        writer.close()
+
+
+def test_argument_validation_and_params_round_trip(tmp_path):
+    with pytest.raises(ValueError, match = 'formats'):
+        VideofileWriter(str(tmp_path / 'out.gif'))
+    with pytest.raises(ValueError, match = 'codec'):
+        VideofileWriter(str(tmp_path / 'out.mp4'), codec = 'vp9')
+    writer = VideofileWriter(str(tmp_path / 'out.mp4'), codec = 'hevc', queue_size = 4)
+    clone = VideofileWriter(**writer.get_params())
+    assert (clone._codec, clone._queue_size) == ('hevc', 4)
+
+
+class _RecordingPipe:
+    '''Stands in for the ffmpeg pipe: records when each frame was written.'''
+    def __init__(self, delay = 0.0):
+        self.writes = []
+        self.delay = delay
+        self.closed = False
+
+    def write(self, frame):
+        time.sleep(self.delay)
+        self.writes.append((time.monotonic(), int(frame[0, 0, 0]), frame.shape))
+
+    def close(self):
+        self.closed = True
+
+
+class _Ctx:
+    def __init__(self):
+        self.event_ts = None
+
+    @property
+    def input_info(self):
+        return {'frames': {'event_ts': self.event_ts, 'metadata': {}}}
+
+
+def _stream_writer(monkeypatch, pipe, **kwargs):
+    writer = StreamWriter('-', format = 'null', **kwargs)
+    monkeypatch.setattr(writer, '_open_pipe', lambda width, height: pipe)
+    return writer
+
+
+def test_stream_writer_paces_frames_by_event_time(monkeypatch):
+    pipe = _RecordingPipe()
+    writer = _stream_writer(monkeypatch, pipe, max_latency = None)
+    ctx = _Ctx()
+    for i, frame in enumerate(_frames(4)):
+        ctx.event_ts = 1000.0 + 0.05 * i
+        writer.consume(frame, ctx)
+    writer.close()
+    times = [t for t, _, _ in pipe.writes]
+    assert [v for _, v, _ in pipe.writes] == [0, 10, 20, 30]
+    gaps = np.diff(times)
+    assert (gaps > 0.04).all() and (gaps < 0.1).all()
+    assert pipe.closed
+
+
+def test_stream_writer_drops_instead_of_blocking_when_live(monkeypatch):
+    pipe = _RecordingPipe(delay = 0.05)
+    writer = _stream_writer(monkeypatch, pipe, queue_size = 2, max_latency = 0.05)
+    start = time.monotonic()
+    for frame in _frames(20):
+        writer.consume(frame)   # no event time: paced at fps, never behind arrival
+    assert time.monotonic() - start < 0.5
+    writer.close()
+    assert writer.nb_dropped > 0
+    assert len(pipe.writes) + writer.nb_dropped == 20
+    # Whatever went out, went out in order.
+    written = [v for _, v, _ in pipe.writes]
+    assert written == sorted(written)
+
+
+def test_stream_writer_applies_backpressure_in_batch_mode(monkeypatch):
+    pipe = _RecordingPipe(delay = 0.01)
+    # Backpressure, not drops, is the default.
+    writer = _stream_writer(monkeypatch, pipe, queue_size = 1, fps = 1000)
+    frames = _frames(10) + [np.zeros((12, 16, 3), np.uint8)]
+    for frame in frames:
+        writer.consume(frame)
+    writer.close()
+    assert writer.nb_dropped == 0
+    assert [shape for _, _, shape in pipe.writes] == [(24, 32, 3)] * 11
+
+
+def test_stream_writer_output_args_per_target():
+    args = StreamWriter('rtsp://server/live', fps = 25)._output_args()
+    assert args[-3:] == ['-f', 'rtsp', 'rtsp://server/live']
+    assert args[args.index('-g') + 1] == '25' and '-rtsp_transport' in args
+    args = StreamWriter('/srv/hls/live.m3u8', bitrate = '2M', gop = 50)._output_args()
+    assert args[-3:] == ['-f', 'hls', '/srv/hls/live.m3u8']
+    assert args[args.index('-b:v') + 1] == '2M' and args[args.index('-g') + 1] == '50'
+    assert StreamWriter('rtmp://ingest/app/key')._output_args()[-2] == 'flv'
+    with pytest.raises(ValueError, match = 'format'):
+        StreamWriter('/tmp/out.bin')
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason = 'needs the ffmpeg binary')
+def test_stream_writer_against_ffmpeg_null_sink():
+    writer = StreamWriter('-', format = 'null', fps = 50)
+    for frame in _frames(5):
+        writer.consume(frame)
+    writer.close()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,52 @@
+'''
+Tests for ``CropImageTransformer``: the list-of-views mode and the packed mode
+that resizes every crop into one contiguous batch tensor.
+'''
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip('cv2')   # optional 'vision' extra
+
+from videoflow.processors.vision.transformers import CropImageTransformer
+
+BOXES = np.array([[0, 0, 20, 30], [10, 5, 50, 45], [5, 5, 5, 9]])
+
+
+@pytest.fixture
+def frame():
+    im = np.random.RandomState(0).randint(0, 256, (60, 80, 3)).astype(np.uint8)
+    im.flags.writeable = False   # as decoded off the wire
+    return im
+
+
+def test_packed_mode_matches_per_crop_resize(frame):
+    out = CropImageTransformer(output_size = (16, 12)).process(frame, BOXES)
+    assert out.shape == (3, 12, 16, 3) and out.dtype == np.uint8 and out.flags.c_contiguous
+    for crop, (ymin, xmin, ymax, xmax) in zip(out[:2], BOXES[:2]):
+        expected = cv2.resize(frame[ymin:ymax, xmin:xmax], (16, 12), interpolation = cv2.INTER_LINEAR)
+        assert np.array_equal(crop, expected)
+    # An empty box yields an all-zero slot rather than an error.
+    assert not out[2].any()
+    assert CropImageTransformer(output_size = (4, 4)).process(frame, np.zeros((0, 4))).shape == (0, 4, 4, 3)
+
+
+def test_list_mode_copy_is_optional(frame):
+    crops = CropImageTransformer().process(frame, BOXES[:2])
+    assert [c.shape for c in crops] == [(20, 30, 3), (40, 40, 3)]
+    assert not np.shares_memory(crops[0], frame)
+    views = CropImageTransformer(copy_input = False).process(frame, BOXES[:2])
+    assert np.shares_memory(views[0], frame)
+
+
+def test_packed_params_round_trip_and_validation():
+    node = CropImageTransformer(output_size = (32, 32), interpolation = 'area')
+    clone = CropImageTransformer(**node.get_params())
+    assert (clone._output_size, clone._interpolation) == ((32, 32), 'area')
+    with pytest.raises(ValueError, match = 'output_size'):
+        CropImageTransformer(output_size = (0, 32))
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
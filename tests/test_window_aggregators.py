@@ -0,0 +1,122 @@
+'''
+Tests for ``WindowAggregator``: tumbling and sliding windows over items and \
+    seconds, per-key windows, and element-wise reduction of arrays.
+'''
+import numpy as np
+import pytest
+
+from videoflow.processors import WindowAggregator
+
+
+class _Ctx:
+    def __init__(self, ts = None, key = None):
+        self.key = key
+        self.input_info = {'parent': {'event_ts': ts, 'metadata': {}, 'trace_id': 't', 'seq': 0}}
+
+def _run(agg, values, stamps = None, keys = None):
+    stamps = stamps or [None] * len(values)
+    keys = keys or [None] * len(values)
+    return [agg.process(v, _Ctx(ts, key)) for v, ts, key in zip(values, stamps, keys)]
+
+@pytest.mark.parametrize('reduce, expected', [
+    ('sum', [1, 3, 6, 9, 12]),
+    ('mean', [1, 1.5, 2, 3, 4]),
+    ('min', [1, 1, 1, 2, 3]),
+    ('max', [1, 2, 3, 4, 5]),
+    ('count', [1, 2, 3, 3, 3]),
+])
+def test_sliding_item_window(reduce, expected):
+    agg = WindowAggregator(reduce = reduce, length = 3)
+    assert _run(agg, [1, 2, 3, 4, 5]) == pytest.approx(expected)
+
+def test_sliding_min_max_across_ring_wraparound():
+    values = [5, 1, 9, 3, 7, 2, 8, 6, 4]
+    agg = WindowAggregator(reduce = 'max', length = 4)
+    assert _run(agg, values) == [max(values[max(0, i - 3):i + 1]) for i in range(len(values))]
+
+def test_tumbling_item_window_resets():
+    agg = WindowAggregator(reduce = 'sum', length = 2, window = 'tumbling')
+    assert _run(agg, [1, 2, 3, 4, 5]) == pytest.approx([1, 3, 3, 7, 5])
+
+def test_percentile():
+    agg = WindowAggregator(reduce = 'percentile', q = 50, length = 5)
+    assert _run(agg, [10, 20, 30, 40, 50, 60])[-1] == pytest.approx(40)
+
+def test_sliding_time_window_uses_event_time():
+    agg = WindowAggregator(reduce = 'count', length = 1.0, unit = 'seconds')
+    stamps = [0.0, 0.4, 0.8, 1.2, 1.6, 3.0]
+    assert _run(agg, [1] * 6, stamps) == [1, 2, 3, 3, 3, 1]
+
+def test_time_window_grows_past_initial_capacity():
+    agg = WindowAggregator(reduce = 'sum', length = 1000.0, unit = 'seconds')
+    out = _run(agg, list(range(200)), [float(i) for i in range(200)])
+    assert out[-1] == pytest.approx(sum(range(200)))
+
+def test_tumbling_time_window():
+    agg = WindowAggregator(reduce = 'sum', length = 10.0, window = 'tumbling', unit = 'seconds')
+    assert _run(agg, [1, 2, 3, 4], [1.0, 9.0, 10.0, 25.0]) == pytest.approx([1, 3, 3, 4])
+
+def test_closed_windows_carry_key_bounds_and_end_time():
+    agg = WindowAggregator(reduce = 'sum', length = 10.0, window = 'tumbling', unit = 'seconds',
+                            emit_on = 'close', partition_by = 'zone')
+    _run(agg, [1, 2, 5, 3], [1.0, 4.0, 6.0, 12.0], keys = ['a', 'a', 'b', 'a'])
+    # The 'a' window [0, 10) closed when 12.0 arrived; it is stamped with its end,
+    # not with the closing input's time.
+    assert agg.take_emitted() == [({'key': 'a', 'window_start': 0.0, 'window_end': 10.0, 'value': 3.0}, 10.0)]
+    agg.flush()
+    assert sorted(agg.take_emitted(), key = lambda e: e[0]['key']) == [
+        ({'key': 'a', 'window_start': 10.0, 'window_end': 20.0, 'value': 3.0}, 20.0),
+        ({'key': 'b', 'window_start': 0.0, 'window_end': 10.0, 'value': 5.0}, 10.0),
+    ]
+
+def test_evicted_key_publishes_its_open_window():
+    agg = WindowAggregator(reduce = 'sum', length = 10.0, window = 'tumbling', unit = 'seconds',
+                            emit_on = 'close', partition_by = 'zone', max_keys = 2)
+    _run(agg, [1, 2, 4, 8], [1.0, 2.0, 3.0, 4.0], keys = ['a', 'b', 'a', 'c'])
+    # 'c' needed room: 'b', the least recently used key, had its window closed early.
+    assert agg.nb_evicted == 1 and agg.keys == ['a', 'c']
+    assert agg.take_emitted() == [({'key': 'b', 'window_start': 0.0, 'window_end': 10.0, 'value': 2.0}, 10.0)]
+    agg.flush()
+    assert sorted(agg.take_emitted(), key = lambda e: e[0]['key']) == [
+        ({'key': 'a', 'window_start': 0.0, 'window_end': 10.0, 'value': 5.0}, 10.0),
+        ({'key': 'c', 'window_start': 0.0, 'window_end': 10.0, 'value': 8.0}, 10.0),
+    ]
+
+def test_windows_are_per_key():
+    agg = WindowAggregator(reduce = 'sum', length = 2, partition_by = 'zone')
+    out = _run(agg, [1, 10, 2, 20, 3], keys = ['a', 'b', 'a', 'b', 'a'])
+    assert out == pytest.approx([1, 10, 3, 30, 5])
+
+def test_elementwise_max_over_frames():
+    agg = WindowAggregator(reduce = 'max', length = 3)
+    frames = [np.full((2, 2), v, dtype = np.uint8) for v in (1, 7, 3, 2, 2)]
+    frames[3][0, 0] = 9
+    out = _run(agg, frames)
+    assert out[-1].dtype == np.uint8
+    np.testing.assert_array_equal(out[-1], [[9, 3], [3, 3]])
+
+def test_running_sum_matches_recomputed_sum():
+    rng = np.random.default_rng(0)
+    values = rng.normal(size = 1000) * 1e6
+    agg = WindowAggregator(reduce = 'sum', length = 7)
+    out = _run(agg, list(values))
+    assert out[-1] == pytest.approx(values[-7:].sum(), rel = 1e-9)
+
+def test_validation():
+    with pytest.raises(ValueError):
+        WindowAggregator(reduce = 'median')
+    with pytest.raises(ValueError):
+        WindowAggregator(reduce = 'percentile')
+    with pytest.raises(ValueError):
+        WindowAggregator(length = 2.5)
+    with pytest.raises(ValueError):
+        WindowAggregator(window = 'hopping')
+    agg = WindowAggregator(reduce = 'max', length = 3)
+    agg.process(np.zeros(2))
+    with pytest.raises(ValueError):
+        agg.process(np.zeros(3))
+    rebuilt = type(agg)(**agg.get_params())
+    assert rebuilt._reduce == 'max' and rebuilt._length == 3
+
+if __name__ == '__main__':
+    pytest.main([__file__])
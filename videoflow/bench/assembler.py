@@ -0,0 +1,372 @@
+'''
+The ``assembler`` suite of ``videoflow bench``: the join assemblers of
+``videoflow.messaging.grouping`` driven in-process by synthetic streams, the way
+``NATSMessenger.receive_message`` drives them (``sweep``, drain ``pop_ready``,
+then ``add``), on a virtual clock.
+
+    trace_diamond        2 branches of one 30 Hz producer, a trace-id join
+    trace_lossy_4        4 branches at 100 Hz, 2% drops, 2% redeliveries, 1 s timeout
+    trace_backlog_<n>    2 branches at 500 Hz, one far enough behind to hold ~n groups
+                         pending under ``max_pending`` = n
+    time_cams_3          cameras at 30, 30 and 15 Hz, quorum 2 (nak below it), 1% drops
+                         and redeliveries
+    time_cams_imu        2 cameras at 30 Hz and a 500 Hz IMU collected over ±20 ms
+    time_backlog_<n>     the same for a time join of 2 cameras at 500 Hz
+
+A stream is a list of arrivals (virtual time, parent, ``EnvelopeEntry``) built
+from a seed, so a scenario replays identically. Per scenario it reports the mean
+cost of one ``add``, ``pop_ready`` and ``sweep`` call, the ``tracemalloc`` peak
+the assembler's buffers reach and that peak per pending group, plus how many
+groups were emitted and evicted (informational).
+
+``replay`` also records what the assembler did — every group it emitted and
+every handle it resolved, in order — and ``emission_digest`` hashes that record.
+The tests pin the digests: an optimization of ``grouping.py`` must leave them
+unchanged.
+'''
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import random
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Optional
+
+from ..core.policies import JOIN_TIME, MISSING_ERROR, JoinPolicy
+from ..messaging.events import EVENT_JOIN_GROUPS_EVICTED, EventLog
+from ..messaging.grouping import (
+    CollectEntry,
+    EnvelopeEntry,
+    ReadyGroup,
+    make_assembler,
+)
+from .harness import BenchConfig, Measurement, median_of
+
+#: Virtual time (monotonic and event clock alike) at which every stream starts.
+T0 = 1000.0
+
+@dataclass
+class StreamParent:
+    '''
+    One parent of the join.
+
+    - Arguments:
+        - name: the parent node's name.
+        - rate_hz: messages per second it delivers.
+        - latency_ms: mean delay from event time to arrival at the join.
+        - offset_ms: (time mode) where its first event falls after the stream \
+            starts: synced cameras differ by a clock skew, not a random phase.
+    '''
+    name : str
+    rate_hz : float
+    latency_ms : float = 2.0
+    offset_ms : float = 0.0
+
+@dataclass
+class JoinScenario:
+    '''
+    A synthetic stream and the policy of the join it feeds.
+
+    - Arguments:
+        - parents: in the join's parent order. In trace mode they are branches \
+            of one producer, so they share the first parent's rate.
+        - duration_s: virtual seconds of traffic.
+        - jitter_ms: arrival jitter (uniform, added to the latency); in time \
+            mode also the spread of each parent's event-time stamps.
+        - drop_rate: fraction of messages that never arrive.
+        - redeliver_rate: fraction delivered a second time 0.5 to 2 s later, \
+            as an ack-wait redelivery would.
+        - quick: part of the ``--quick`` subset.
+        - max_repeats: caps the timed replays of a slow scenario; one replay \
+            of it already averages over tens of thousands of calls.
+        - trace_memory: run the ``tracemalloc`` pass. Off where it would take \
+            minutes: a time join's ``add`` allocates per pending group, and \
+            ``tracemalloc`` slows every allocation.
+    '''
+    name : str
+    policy : JoinPolicy
+    parents : list[StreamParent]
+    duration_s : float
+    jitter_ms : float = 2.0
+    drop_rate : float = 0.0
+    redeliver_rate : float = 0.0
+    quick : bool = False
+    max_repeats : Optional[int] = None
+    trace_memory : bool = True
+
+def _trace(name : str, rate_hz : float, latencies_ms : list[float], duration_s : float,
+           **kwargs) -> JoinScenario:
+    parents = [StreamParent(f'branch{i}', rate_hz, lat) for i, lat in enumerate(latencies_ms)]
+    policy = kwargs.pop('policy', JoinPolicy())
+    return JoinScenario(name, policy, parents, duration_s, **kwargs)
+
+SCENARIOS = [
+    _trace('trace_diamond', 30, [2, 6], 60, quick = True),
+    _trace('trace_lossy_4', 100, [2, 3, 5, 8], 30, drop_rate = 0.02, redeliver_rate = 0.02,
+           policy = JoinPolicy(timeout_seconds = 1.0, max_pending = 256), quick = True),
+    _trace('trace_backlog_1k', 500, [2, 1900], 2.2,
+           policy = JoinPolicy(max_pending = 1000), quick = True),
+    _trace('trace_backlog_10k', 500, [2, 19500], 20.2,
+           policy = JoinPolicy(max_pending = 10000), max_repeats = 1),
+    JoinScenario('time_cams_3',
+                 JoinPolicy(mode = JOIN_TIME, tolerance_ms = 10, timeout_seconds = 1.0, quorum = 2,
+                            missing = MISSING_ERROR),
+                 [StreamParent('cam0', 30, 3), StreamParent('cam1', 30, 8, offset_ms = 2),
+                  StreamParent('cam2', 15, 5, offset_ms = 4)],
+                 60, jitter_ms = 3, drop_rate = 0.01, redeliver_rate = 0.01, quick = True),
+    JoinScenario('time_cams_imu',
+                 JoinPolicy(mode = JOIN_TIME, tolerance_ms = 10, timeout_seconds = 1.0,
+                            collect = {'imu': 20}),
+                 [StreamParent('cam0', 30, 3), StreamParent('cam1', 30, 6, offset_ms = 3),
+                  StreamParent('imu', 500, 1)],
+                 20, jitter_ms = 2, quick = True),
+    JoinScenario('time_backlog_1k',
+                 JoinPolicy(mode = JOIN_TIME, tolerance_ms = 0.5, max_pending = 1000),
+                 [StreamParent('cam0', 500, 2), StreamParent('cam1', 500, 1900, offset_ms = 0.1)],
+                 2.2, jitter_ms = 0.2, quick = True),
+    JoinScenario('time_backlog_10k',
+                 JoinPolicy(mode = JOIN_TIME, tolerance_ms = 0.5, max_pending = 10000),
+                 [StreamParent('cam0', 500, 2), StreamParent('cam1', 500, 19500, offset_ms = 0.1)],
+                 20.2, jitter_ms = 0.2, max_repeats = 1, trace_memory = False),
+]
+
+def scenario(name : str) -> JoinScenario:
+    for s in SCENARIOS:
+        if s.name == name:
+            return s
+    raise ValueError(f'unknown join scenario {name!r}; known: {[s.name for s in SCENARIOS]}')
+
+class BenchHandle:
+    '''
+    An ack handle that keeps how it was resolved, and appends ``(outcome, id)`` \
+        to ``log`` when one is given.
+    '''
+    __slots__ = ('id', 'outcome', '_log')
+
+    def __init__(self, handle_id : int, log : Optional[list] = None) -> None:
+        self.id = handle_id
+        self.outcome : Optional[str] = None
+        self._log = log
+
+    def _resolve(self, outcome : str) -> None:
+        if self._log is not None:
+            self._log.append((outcome, self.id))
+        self.outcome = outcome if self.outcome is None else f'{self.outcome}+{outcome}'
+
+    def ack(self) -> None:
+        self._resolve('ack')
+
+    def nak(self, delay : Optional[float] = None) -> None:
+        self._resolve('nak')
+
+    def term(self) -> None:
+        self._resolve('term')
+
+@dataclass
+class Arrival:
+    t : float
+    parent : str
+    entry : EnvelopeEntry
+
+def synthetic_stream(s : JoinScenario, seed : int = 0) -> list[Arrival]:
+    '''
+    The arrivals of a scenario in arrival order; the same for the same seed. \
+        Uses ``random.Random``, whose sequence Python keeps stable across versions.
+    '''
+    rng = random.Random(seed)
+    jitter = s.jitter_ms / 1000.0
+    arrivals : list[Arrival] = []
+
+    def deliver(t : float, parent : str, entry : EnvelopeEntry) -> None:
+        if rng.random() < s.drop_rate:
+            return
+        arrivals.append(Arrival(t, parent, entry))
+        if rng.random() < s.redeliver_rate:
+            arrivals.append(Arrival(t + rng.uniform(0.5, 2.0), parent, entry))
+
+    if s.policy.mode == JOIN_TIME:
+        for p in s.parents:
+            period = 1.0 / p.rate_hz
+            start = T0 + p.offset_ms / 1000.0
+            for k in range(int(s.duration_s * p.rate_hz)):
+                event_ts = start + k * period + rng.uniform(-jitter / 2, jitter / 2)
+                entry = EnvelopeEntry(trace_id = f'{p.name}:{k}', seq = k, event_ts = event_ts,
+                                      message = k, metadata = None, is_stop_signal = False)
+                deliver(event_ts + p.latency_ms / 1000.0 + rng.uniform(0, jitter), p.name, entry)
+    else:
+        period = 1.0 / s.parents[0].rate_hz
+        for k in range(int(s.duration_s * s.parents[0].rate_hz)):
+            event_ts = T0 + k * period
+            for p in s.parents:
+                entry = EnvelopeEntry(trace_id = f'src:{k}', seq = k, event_ts = event_ts,
+                                      message = k, metadata = None, is_stop_signal = False)
+                deliver(event_ts + p.latency_ms / 1000.0 + rng.uniform(0, jitter), p.name, entry)
+    # Stable: simultaneous arrivals keep their generation order.
+    arrivals.sort(key = lambda a: a.t)
+    return arrivals
+
+@dataclass
+class Replay:
+    '''
+    What one replay of a stream did.
+
+    - Attributes:
+        - log: when recorded, in order: ``('emit', ...)`` for every group \
+            emitted and ``(outcome, handle id)`` for every handle the assembler \
+            resolved.
+        - groups: the emitted ``ReadyGroup`` objects, when kept.
+        - handles: one per arrival, in arrival order.
+        - emitted: how many groups were emitted.
+        - add_ns, pop_ready_ns, sweep_ns: total time inside each call, and \
+            the number of calls in ``calls``.
+        - events: the backpressure events the assembler counted, by name.
+        - max_pending: the most pending groups seen after an ``add``.
+        - peak_bytes: with ``trace_memory``, the ``tracemalloc`` peak above \
+            the starting point.
+    '''
+    log : Optional[list] = None
+    groups : list[ReadyGroup] = field(default_factory = list)
+    handles : list[BenchHandle] = field(default_factory = list)
+    emitted : int = 0
+    add_ns : int = 0
+    pop_ready_ns : int = 0
+    sweep_ns : int = 0
+    calls : dict[str, int] = field(default_factory = dict)
+    events : dict[str, int] = field(default_factory = dict)
+    max_pending : int = 0
+    peak_bytes : int = 0
+
+def _describe(entry) -> Optional[tuple]:
+    if entry is None:
+        return None
+    if isinstance(entry, CollectEntry):
+        return ('collect', tuple(entry.event_ts))
+    return (entry.trace_id, entry.seq)
+
+def _record(group : ReadyGroup) -> tuple:
+    return ('emit', group.trace_id, group.seq, group.event_ts,
+            tuple((p, _describe(e)) for p, e in sorted(group.entries.items())),
+            tuple(sorted(h.id for h in group.handles)))
+
+def replay(s : JoinScenario, seed : int = 0, arrivals : Optional[list[Arrival]] = None,
+           record : bool = True, keep_groups : bool = False,
+           trace_memory : bool = False) -> Replay:
+    '''
+    Feeds a scenario's stream to a fresh assembler as the messenger's receive \
+        loop would: before each arrival, ``sweep`` and drain ``pop_ready``, all \
+        at the arrival's virtual time. Once the stream ends, the clock jumps past \
+        every timeout and the assembler is drained.
+
+    - Arguments:
+        - arrivals: the stream, when already built (``synthetic_stream(s, seed)``).
+        - record: build ``log``; timing and memory passes leave it off.
+        - keep_groups: keep the emitted groups in ``groups``.
+        - trace_memory: fill ``peak_bytes`` (runs under ``tracemalloc``, so \
+            its timings are meaningless).
+    '''
+    if arrivals is None:
+        arrivals = synthetic_stream(s, seed)
+    result = Replay(log = [] if record else None)
+    log = result.log
+    # Counted, and logged once per event rather than every 10 s of wall time.
+    events = EventLog(f'bench-{s.name}', min_interval = float('inf'))
+    events.counter_observer = lambda event, count: result.events.update(
+        {event: result.events.get(event, 0) + count})
+    asm = make_assembler(f'bench-{s.name}', [p.name for p in s.parents], s.policy,
+                         events = events)
+    handles = [BenchHandle(i, log) for i in range(len(arrivals))]
+    result.handles = handles
+    clock = time.perf_counter_ns
+    add_ns = pop_ns = sweep_ns = 0
+    n_pop = n_sweep = 0
+
+    def drain(now : float) -> None:
+        nonlocal pop_ns, sweep_ns, n_pop, n_sweep
+        start = clock()
+        asm.sweep(now = now)
+        sweep_ns += clock() - start
+        n_sweep += 1
+        while True:
+            start = clock()
+            group = asm.pop_ready(now = now)
+            pop_ns += clock() - start
+            n_pop += 1
+            if group is None:
+                return
+            result.emitted += 1
+            if log is not None:
+                log.append(_record(group))
+            if keep_groups:
+                result.groups.append(group)
+
+    tracing = trace_memory and tracemalloc.is_tracing()
+    if trace_memory:
+        # The stream and handles already exist: what grows from here is the
+        # assembler's buffers.
+        if not tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+    try:
+        for arrival, handle in zip(arrivals, handles):
+            drain(arrival.t)
+            start = clock()
+            asm.add(arrival.parent, arrival.entry, handle, now = arrival.t)
+            add_ns += clock() - start
+            depth = asm.buffer_depths()[0][2]
+            if depth > result.max_pending:
+                result.max_pending = depth
+        end = (arrivals[-1].t if arrivals else T0) + (s.policy.timeout_seconds or 0.0) + 60.0
+        drain(end)
+        if trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            result.peak_bytes = max(0, peak - before)
+    finally:
+        if trace_memory and not tracing:
+            tracemalloc.stop()
+    result.add_ns, result.pop_ready_ns, result.sweep_ns = add_ns, pop_ns, sweep_ns
+    result.calls = {'add': len(arrivals), 'pop_ready': n_pop, 'sweep': n_sweep}
+    return result
+
+def emission_digest(r : Replay) -> str:
+    '''A short hash of everything a recorded replay emitted and resolved, in order.'''
+    return hashlib.sha256(repr(r.log).encode()).hexdigest()[:16]
+
+def measure_scenario(s : JoinScenario, repeats : int = 1) -> list[Measurement]:
+    '''Per-call costs (median of ``repeats`` replays) and memory of one scenario.'''
+    arrivals = synthetic_stream(s)
+    add_us, pop_us, sweep_us = [], [], []
+    for _ in range(max(1, repeats)):
+        r = replay(s, arrivals = arrivals, record = False)
+        add_us.append(r.add_ns / max(1, r.calls['add']) / 1000)
+        pop_us.append(r.pop_ready_ns / max(1, r.calls['pop_ready']) / 1000)
+        sweep_us.append(r.sweep_ns / max(1, r.calls['sweep']) / 1000)
+    name = s.name
+    results = [
+        Measurement(f'{name}.add_us', median_of(add_us), 'us'),
+        Measurement(f'{name}.pop_ready_us', median_of(pop_us), 'us'),
+        Measurement(f'{name}.sweep_us', median_of(sweep_us), 'us'),
+    ]
+    if s.trace_memory:
+        peak = replay(s, arrivals = arrivals, record = False, trace_memory = True).peak_bytes
+        results += [
+            Measurement(f'{name}.peak_bytes', peak, 'bytes'),
+            Measurement(f'{name}.bytes_per_pending_group', peak / max(1, r.max_pending), 'bytes'),
+        ]
+    return results + [
+        Measurement(f'{name}.max_pending_groups', r.max_pending, '', None),
+        Measurement(f'{name}.emitted_groups', r.emitted, '', None),
+        Measurement(f'{name}.evicted_groups', r.events.get(EVENT_JOIN_GROUPS_EVICTED, 0), '', None),
+    ]
+
+def assembler_suite(config : BenchConfig) -> list[Measurement]:
+    results = []
+    for s in SCENARIOS:
+        if config.quick and not s.quick:
+            continue
+        repeats = 1 if config.quick else max(1, config.repeats)
+        if s.max_repeats is not None:
+            repeats = min(repeats, s.max_repeats)
+        results += measure_scenario(s, repeats)
+    return results
@@ -0,0 +1,250 @@
+'''
+Results, fingerprints and baselines for ``videoflow bench``.
+
+A run is a ``BenchRun``: the measurements of each suite it ran, plus a
+fingerprint of where it ran (CPU, OS, Python/numpy/videoflow versions, and the
+git commit of the videoflow checkout). Saved as JSON, a run becomes the baseline
+a later run is compared against:
+
+    videoflow bench wire --output bench/baseline.json
+    videoflow bench wire --baseline bench/baseline.json --threshold 0.15
+
+Each measurement says which way is better, so the comparison can tell a
+regression from an improvement. A change is a regression when it is worse than
+the baseline by more than the threshold, as a fraction of the baseline value.
+Per-metric thresholds (``fnmatch`` patterns over ``<suite>.<measurement>``)
+loosen noisy broker numbers without loosening the in-process ones. Numbers taken
+on different hardware are still compared, but the report says so.
+'''
+from __future__ import absolute_import, division, print_function
+
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Optional, Sequence
+
+import numpy as np
+
+from ..version import __version__
+
+LOWER_IS_BETTER = 'lower'
+HIGHER_IS_BETTER = 'higher'
+
+RESULTS_FORMAT = 1
+DEFAULT_REGRESSION_THRESHOLD = 0.10
+
+@dataclass
+class Measurement:
+    '''
+    One number a suite reports.
+
+    - Arguments:
+        - name: unique within the suite, dotted by case (``frame_640x480.encode_ms``).
+        - value: the measured value.
+        - unit: for display (``ms``, ``msg/s``, ``bytes``...).
+        - better: ``'lower'`` or ``'higher'``; None for a figure that is \
+            reported but never judged (a count, an input size).
+    '''
+    name : str
+    value : float
+    unit : str = ''
+    better : Optional[str] = LOWER_IS_BETTER
+
+@dataclass
+class BenchConfig:
+    '''
+    What a suite may use. Broker suites need ``nats_url``; the blob sweep also \
+        uses ``blob_redis_url`` when set. ``quick`` asks a suite for a smaller \
+        run (fewer messages and cases), for CI smoke checks.
+    '''
+    nats_url : Optional[str] = None
+    blob_redis_url : Optional[str] = None
+    quick : bool = False
+    repeats : int = 3
+
+@dataclass
+class BenchRun:
+    '''Every suite's measurements from one ``videoflow bench`` invocation.'''
+    fingerprint : dict = field(default_factory = dict)
+    created : float = field(default_factory = time.time)
+    suites : dict[str, list[Measurement]] = field(default_factory = dict)
+    durations : dict[str, float] = field(default_factory = dict)
+
+    def to_dict(self) -> dict:
+        return {
+            'format': RESULTS_FORMAT,
+            'created': self.created,
+            'fingerprint': self.fingerprint,
+            'suites': {name: {'duration_seconds': self.durations.get(name),
+                              'measurements': [asdict(m) for m in measurements]}
+                       for name, measurements in self.suites.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data : dict) -> 'BenchRun':
+        if data.get('format') != RESULTS_FORMAT:
+            raise ValueError(f'unsupported bench results format {data.get("format")!r}, '
+                             f'expected {RESULTS_FORMAT}')
+        run = cls(fingerprint = data.get('fingerprint', {}), created = data.get('created', 0.0))
+        for name, suite in data.get('suites', {}).items():
+            run.suites[name] = [Measurement(**m) for m in suite['measurements']]
+            if suite.get('duration_seconds') is not None:
+                run.durations[name] = suite['duration_seconds']
+        return run
+
+def save_run(path : str, run : BenchRun) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok = True)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(run.to_dict(), f, indent = 2)
+    os.replace(tmp, path)
+
+def load_run(path : str) -> BenchRun:
+    with open(path) as f:
+        return BenchRun.from_dict(json.load(f))
+
+def _cpu_model() -> Optional[str]:
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or None
+
+def _git_commit() -> Optional[dict]:
+    # The checkout videoflow is imported from; None for an installed wheel.
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    try:
+        sha = subprocess.run(['git', '-C', root, 'rev-parse', 'HEAD'], capture_output = True,
+                             text = True, timeout = 5, check = True).stdout.strip()
+        status = subprocess.run(['git', '-C', root, 'status', '--porcelain', '--untracked-files=no'],
+                                capture_output = True, text = True, timeout = 5, check = True).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return {'sha': sha, 'dirty': bool(status.strip())}
+
+def fingerprint() -> dict:
+    '''Where a run happened: the hardware, the software versions and the commit.'''
+    return {
+        'hardware': {
+            'cpu': _cpu_model(),
+            'cpu_count': os.cpu_count(),
+            'machine': platform.machine(),
+            'system': f'{platform.system()} {platform.release()}',
+        },
+        'software': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'videoflow': __version__,
+        },
+        'commit': _git_commit(),
+    }
+
+def median_of(values : Sequence[float]) -> float:
+    '''The median of repeated measurements: what suites report, to damp outliers.'''
+    return statistics.median(values)
+
+@dataclass
+class Comparison:
+    '''One measurement against its baseline. ``change`` is relative: +0.2 is 20% higher.'''
+    suite : str
+    name : str
+    unit : str
+    baseline : float
+    current : float
+    change : Optional[float]
+    threshold : float
+    better : Optional[str]
+
+    @property
+    def regressed(self) -> bool:
+        if self.change is None or self.better is None:
+            return False
+        if self.better == LOWER_IS_BETTER:
+            return self.change > self.threshold
+        return self.change < -self.threshold
+
+    @property
+    def improved(self) -> bool:
+        if self.change is None or self.better is None:
+            return False
+        if self.better == LOWER_IS_BETTER:
+            return self.change < -self.threshold
+        return self.change > self.threshold
+
+def parse_thresholds(specs : Sequence[str]) -> dict[str, float]:
+    '''
+    ``['wire.*=0.05', 'scaling.*=0.3']`` → ``{pattern: fraction}``.
+
+    - Raises:
+        - ValueError: a spec is not ``PATTERN=FRACTION`` with a fraction >= 0.
+    '''
+    thresholds = {}
+    for spec in specs:
+        pattern, sep, value = spec.rpartition('=')
+        try:
+            fraction = float(value)
+        except ValueError:
+            fraction = -1.0
+        if not sep or not pattern or fraction < 0:
+            raise ValueError(f'threshold must be PATTERN=FRACTION (e.g. wire.*=0.05), got {spec!r}')
+        thresholds[pattern] = fraction
+    return thresholds
+
+def compare_runs(current : BenchRun, baseline : BenchRun,
+                 threshold : float = DEFAULT_REGRESSION_THRESHOLD,
+                 thresholds : Optional[dict[str, float]] = None) -> list[Comparison]:
+    '''
+    Compares every measurement present in both runs. The last matching pattern \
+        of ``thresholds`` wins over ``threshold``.
+    '''
+    rows = []
+    for suite, measurements in current.suites.items():
+        base = {m.name: m for m in baseline.suites.get(suite, [])}
+        for m in measurements:
+            if m.name not in base:
+                continue
+            key = f'{suite}.{m.name}'
+            limit = threshold
+            for pattern, value in (thresholds or {}).items():
+                if fnmatch.fnmatchcase(key, pattern):
+                    limit = value
+            old = base[m.name].value
+            change = (m.value - old) / abs(old) if old else None
+            rows.append(Comparison(suite, m.name, m.unit, old, m.value, change, limit, m.better))
+    return rows
+
+def hardware_differs(current : BenchRun, baseline : BenchRun) -> bool:
+    return current.fingerprint.get('hardware') != baseline.fingerprint.get('hardware')
+
+def _table(rows : Sequence[tuple[str, ...]]) -> str:
+    widths = [max(len(r[i]) for r in rows) for i in range(len(rows[0]))]
+    return '\n'.join('  '.join(cell.ljust(w) for cell, w in zip(r, widths)).rstrip() for r in rows)
+
+def _fmt(value : float) -> str:
+    return f'{value:.4g}' if isinstance(value, float) else str(value)
+
+def format_run(run : BenchRun) -> str:
+    '''Every measurement of a run as an aligned table, suite by suite.'''
+    rows = [('SUITE', 'MEASUREMENT', 'VALUE', 'UNIT')]
+    for suite, measurements in run.suites.items():
+        for m in measurements:
+            rows.append((suite, m.name, _fmt(m.value), m.unit))
+    return _table(rows)
+
+def format_comparison(rows : list[Comparison]) -> str:
+    '''The comparison as a table, flagging regressions and improvements.'''
+    table = [('SUITE', 'MEASUREMENT', 'BASELINE', 'CURRENT', 'CHANGE', '')]
+    for c in rows:
+        change = '-' if c.change is None else f'{c.change:+.1%}'
+        verdict = 'REGRESSED' if c.regressed else ('improved' if c.improved else '')
+        table.append((c.suite, c.name, _fmt(c.baseline), _fmt(c.current), change, verdict))
+    return _table(table)
@@ -0,0 +1,121 @@
+'''
+Instrumented nodes for the broker benchmarks of ``videoflow bench``. They
+measure the framework rather than do work:
+
+- ``StampedProducer`` emits ``{'i': i, 't0': <produce wall-clock>}`` (optionally \
+    padded to a payload size) and stamps ``event_ts``, so a sink can compute \
+    end-to-end latency and a time join can align on it.
+- ``WorkProcessor`` passes its input through after a fixed service time.
+- ``PairJoiner`` is a two-parent join stage that records which parents arrived.
+- ``RecordingConsumer`` appends one JSON line per item with the consume time.
+
+They live in the package, not the suites module, so every worker subprocess
+imports them by their qualified name. Constructor arguments are JSON-serializable
+and stored as ``self._<name>`` so ``get_params()`` round-trips them.
+'''
+from __future__ import absolute_import, division, print_function
+
+import json
+import time
+from typing import Any, Optional, TextIO
+
+from ..core.node import ConsumerNode, ProcessorNode, ProducerNode
+
+
+class StampedProducer(ProducerNode):
+    '''
+    Produces ``n`` dict payloads ``{'i': i, 't0': <produce wall-clock>}``.
+
+    - Arguments:
+        - n: how many messages to produce before raising ``StopIteration``.
+        - fps: messages per second. Values <= 0 mean "as fast as possible".
+        - payload_bytes: padding added under ``'pad'`` to grow the payload.
+    '''
+    def __init__(self, n : int = 100, fps : float = -1, payload_bytes : int = 0, **kwargs) -> None:
+        self._n = n
+        self._fps = fps
+        self._payload_bytes = payload_bytes
+        self._i = 0
+        super(StampedProducer, self).__init__(**kwargs)
+
+    def next(self, ctx = None) -> dict:
+        if self._i >= self._n:
+            raise StopIteration()
+        if self._fps and self._fps > 0:
+            time.sleep(1.0 / self._fps)
+        item : dict[str, Any] = {'i': self._i, 't0': time.time()}
+        self._i += 1
+        if self._payload_bytes:
+            item['pad'] = b'x' * self._payload_bytes
+        if ctx is not None:
+            ctx.set_event_timestamp(item['t0'])
+        return item
+
+
+class WorkProcessor(ProcessorNode):
+    '''Identity pass-through with a fixed service time of ``work_ms`` milliseconds.'''
+    def __init__(self, work_ms : float = 0, **kwargs) -> None:
+        self._work_ms = work_ms
+        super(WorkProcessor, self).__init__(**kwargs)
+
+    def process(self, item) -> dict:
+        if self._work_ms > 0:
+            time.sleep(self._work_ms / 1000.0)
+        return item
+
+
+class PairJoiner(ProcessorNode):
+    '''
+    Two-parent join stage with a fixed service time. Emits the index and the \
+        earliest stamp of the inputs that were present, plus ``b_i`` when both \
+        were, so the sink can check both halves belong together.
+    '''
+    def __init__(self, work_ms : float = 0, **kwargs) -> None:
+        self._work_ms = work_ms
+        super(PairJoiner, self).__init__(**kwargs)
+
+    # override: one positional arg per parent — the by-parent input contract,
+    # not LSP substitutability. See [tool.mypy] disable/enable notes in pyproject.
+    def process(self, a, b) -> dict:   # type: ignore[override]
+        if self._work_ms > 0:
+            time.sleep(self._work_ms / 1000.0)
+        present = [x for x in (a, b) if isinstance(x, dict)]
+        out = {
+            'i': present[0]['i'] if present else None,
+            't0': min(x['t0'] for x in present) if present else None,
+        }
+        if isinstance(a, dict) and isinstance(b, dict):
+            out['b_i'] = b['i']
+        return out
+
+
+class RecordingConsumer(ConsumerNode):
+    '''
+    Appends ``{'t1': <consume wall-clock>, 'i': ..., 't0': ..., 'b_i': ...}`` \
+        per item to ``filepath``, line-buffered so a stopped run still leaves \
+        complete records.
+    '''
+    _KEEP = ('i', 't0', 'b_i')
+
+    def __init__(self, filepath : str, **kwargs) -> None:
+        self._filepath = filepath
+        self._f : Optional[TextIO] = None   # opened in open(), in the worker
+        super(RecordingConsumer, self).__init__(**kwargs)
+
+    def open(self) -> None:
+        self._f = open(self._filepath, 'a', buffering = 1)
+
+    def consume(self, item) -> None:
+        if self._f is None:
+            raise RuntimeError(f'{type(self).__name__}.consume() called before open()')
+        rec = {'t1': time.time()}
+        if isinstance(item, dict):
+            for k in self._KEEP:
+                if k in item:
+                    rec[k] = item[k]
+        self._f.write(json.dumps(rec) + '\n')
+
+    def close(self) -> None:
+        if self._f is not None:
+            self._f.close()
+            self._f = None
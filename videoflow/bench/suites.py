@@ -0,0 +1,348 @@
+'''
+The benchmark suites ``videoflow bench`` runs, and their registry.
+
+    wire      envelope encode/decode time, size and allocations for every payload
+              type and size class; in-process, no broker (see ``videoflow.bench.wire``)
+    assembler per-call cost and memory of the join assemblers on synthetic streams;
+              in-process, no broker (see ``videoflow.bench.assembler``)
+    tracker   per-frame cost of ``SortTracker`` at 50 and 200 tracks; in-process,
+              no broker (see ``videoflow.bench.tracker``)
+    tracing   per-message overhead of ``TracingMessenger``, sampled and unsampled;
+              in-process, no broker (see ``videoflow.bench.tracing``)
+    hop       end-to-end latency of identity chains of growing depth, and the
+              per-hop cost fitted from them
+    scaling   throughput of a fixed-cost stage with 1, 2, 4 competing replicas
+    join      throughput and pairing correctness of a diamond joined on trace_id,
+              with 1 and 2 partitioned replicas
+    blob      latency and MB/s from producer to sink across payload sizes, through
+              the blob store once a payload crosses the inline threshold
+
+The broker suites run real flows on ``LocalProcessEngine`` against a local
+``nats-server``, one subprocess per node replica, with the nodes of
+``videoflow.bench.nodes``. They are the white paper's experiments
+(``white-paper/code/experiments``) cut down to the numbers worth tracking. Each
+case runs ``BenchConfig.repeats`` times and reports the median.
+
+Other suites plug in with ``register_suite`` or a ``videoflow.bench_suites``
+entry point.
+'''
+from __future__ import absolute_import, division, print_function
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+
+from ..core.constants import BATCH
+from ..core.node import Node
+from ..utils import plugins
+from .harness import (
+    HIGHER_IS_BETTER,
+    BenchConfig,
+    BenchRun,
+    Measurement,
+    fingerprint,
+    median_of,
+)
+
+SUITE_ENTRY_POINT_GROUP = 'videoflow.bench_suites'
+
+@dataclass
+class Suite:
+    name : str
+    run : Callable[[BenchConfig], list[Measurement]]
+    needs_broker : bool = False
+    description : str = ''
+
+_SUITES : dict[str, Suite] = {}
+
+def register_suite(name : str, run : Callable[[BenchConfig], list[Measurement]],
+                   needs_broker : bool = False, description : str = '') -> None:
+    '''
+    Registers a suite: ``run(config)`` returns its measurements. A suite with \
+        ``needs_broker`` is only run once a NATS URL is known.
+    '''
+    _SUITES[name] = Suite(name, run, needs_broker, description)
+
+def registered_suites() -> dict[str, Suite]:
+    '''Every suite by name, the built-ins first, then any from entry points.'''
+    plugins.load_plugin_group(SUITE_ENTRY_POINT_GROUP)
+    return dict(_SUITES)
+
+def run_suites(names : Sequence[str], config : BenchConfig,
+               progress : Optional[Callable[[str], None]] = None) -> BenchRun:
+    '''
+    Runs the named suites in order into one ``BenchRun``.
+
+    - Raises:
+        - ValueError: an unknown suite, or a broker suite without ``config.nats_url``.
+    '''
+    suites = registered_suites()
+    unknown = [name for name in names if name not in suites]
+    if unknown:
+        raise ValueError(f'unknown bench suite(s) {unknown}; known: {sorted(suites)}')
+    if config.nats_url is None:
+        broker = [name for name in names if suites[name].needs_broker]
+        if broker:
+            raise ValueError(f'suite(s) {broker} need a NATS broker (nats_url)')
+    run = BenchRun(fingerprint = fingerprint())
+    for name in names:
+        if progress is not None:
+            progress(name)
+        start = time.perf_counter()
+        run.suites[name] = suites[name].run(config)
+        run.durations[name] = time.perf_counter() - start
+    return run
+
+# -- wire: in-process envelope codec ----------------------------------------
+
+def _wire_suite(config : BenchConfig) -> list[Measurement]:
+    from .wire import wire_suite  # optional dep: the wire format needs protobuf
+    return wire_suite(config)
+
+# -- assembler: in-process join grouping ------------------------------------
+
+def _assembler_suite(config : BenchConfig) -> list[Measurement]:
+    from .assembler import assembler_suite
+    return assembler_suite(config)
+
+# -- tracker: in-process SORT tracking --------------------------------------
+
+def _tracker_suite(config : BenchConfig) -> list[Measurement]:
+    from .tracker import tracker_suite
+    return tracker_suite(config)
+
+# -- tracing: in-process span overhead --------------------------------------
+
+def _tracing_suite(config : BenchConfig) -> list[Measurement]:
+    from .tracing import tracing_suite
+    return tracing_suite(config)
+
+# -- broker suites ----------------------------------------------------------
+
+def _run_flow(consumers : list, config : BenchConfig, flow_type : str = BATCH,
+              timeout_s : float = 120.0) -> None:
+    '''
+    Runs a flow to completion on the local engine. A watchdog stops a run that \
+        outlives ``timeout_s``.
+
+    - Raises:
+        - RuntimeError: a worker failed, or the run timed out — either would make \
+            its numbers meaningless.
+    '''
+    from ..core.flow import Flow
+    from ..engines.local import LocalProcessEngine  # optional dep: the local engine imports nats
+
+    if config.nats_url is None:
+        raise ValueError('running a flow needs a NATS broker (config.nats_url)')
+    flow = Flow(consumers, flow_type = flow_type)
+    engine = LocalProcessEngine(nats_url = config.nats_url, blob_redis_url = config.blob_redis_url)
+    timed_out = threading.Event()
+
+    def _watchdog() -> None:
+        timed_out.set()
+        engine.signal_flow_termination()
+
+    flow.run(engine)
+    timer = threading.Timer(timeout_s, _watchdog)
+    timer.start()
+    try:
+        flow.join()
+    finally:
+        timer.cancel()
+    failures = engine.failures()
+    if failures:
+        raise RuntimeError(f'bench flow failed: {failures}')
+    if timed_out.is_set():
+        raise RuntimeError(f'bench flow did not finish within {timeout_s}s')
+
+def _read_records(path : str) -> list[dict]:
+    records = []
+    if os.path.exists(path):
+        with open(path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    if not records:
+        raise RuntimeError('bench flow finished but no message reached its sink')
+    return records
+
+def _latencies_ms(records : list[dict]) -> list[float]:
+    return [(r['t1'] - r['t0']) * 1000 for r in records if r.get('t0') is not None]
+
+def _throughput(records : list[dict]) -> float:
+    # Sink-side: from the first delivery to the last, so worker start-up is excluded.
+    t1s = [r['t1'] for r in records]
+    span = max(t1s) - min(t1s) if t1s else 0.0
+    return (len(t1s) - 1) / span if span > 0 else 0.0
+
+def _p95(values : Sequence[float]) -> float:
+    return float(np.percentile(values, 95)) if values else 0.0
+
+class _Records:
+    '''A scratch directory of sink record files, one per case and repeat.'''
+    def __init__(self) -> None:
+        self._dir = tempfile.mkdtemp(prefix = 'vf-bench-')
+        self._n = 0
+
+    def path(self) -> str:
+        self._n += 1
+        return os.path.join(self._dir, f'sink-{self._n}.jsonl')
+
+    def close(self) -> None:
+        shutil.rmtree(self._dir, ignore_errors = True)
+
+def _repeats(config : BenchConfig) -> int:
+    return 1 if config.quick else max(1, config.repeats)
+
+def hop_suite(config : BenchConfig) -> list[Measurement]:
+    from .nodes import RecordingConsumer, StampedProducer, WorkProcessor
+
+    n = 50 if config.quick else 200
+    depths = (1, 2) if config.quick else (1, 2, 4)
+    results, medians = [], []
+    records = _Records()
+    try:
+        for depth in depths:
+            p50s, p95s = [], []
+            for _ in range(_repeats(config)):
+                sink_file = records.path()
+                node : Node = StampedProducer(n = n, fps = 50, name = 'producer')
+                for d in range(depth):
+                    node = WorkProcessor(name = f'hop{d}')(node)
+                sink = RecordingConsumer(filepath = sink_file, name = 'sink')(node)
+                _run_flow([sink], config)
+                latencies = _latencies_ms(_read_records(sink_file))
+                p50s.append(median_of(latencies))
+                p95s.append(_p95(latencies))
+            medians.append(median_of(p50s))
+            results += [
+                Measurement(f'depth_{depth}.latency_p50_ms', medians[-1], 'ms'),
+                Measurement(f'depth_{depth}.latency_p95_ms', median_of(p95s), 'ms'),
+            ]
+    finally:
+        records.close()
+    # The slope of median latency over depth: what one more hop costs.
+    slope = float(np.polyfit(depths, medians, 1)[0])
+    results.append(Measurement('per_hop_ms', slope, 'ms'))
+    return results
+
+def scaling_suite(config : BenchConfig) -> list[Measurement]:
+    from .nodes import RecordingConsumer, StampedProducer, WorkProcessor
+
+    n = 60 if config.quick else 240
+    replicas = (1, 2) if config.quick else (1, 2, 4)
+    results = []
+    base = None
+    records = _Records()
+    try:
+        for k in replicas:
+            rates = []
+            for _ in range(_repeats(config)):
+                sink_file = records.path()
+                producer = StampedProducer(n = n, name = 'producer')
+                stage = WorkProcessor(work_ms = 20, nb_tasks = k, name = 'stage')(producer)
+                sink = RecordingConsumer(filepath = sink_file, name = 'sink')(stage)
+                _run_flow([sink], config)
+                rates.append(_throughput(_read_records(sink_file)))
+            rate = median_of(rates)
+            base = rate if base is None else base
+            results.append(Measurement(f'replicas_{k}.throughput', rate, 'msg/s', HIGHER_IS_BETTER))
+            if k > 1 and base:
+                results.append(Measurement(f'replicas_{k}.efficiency', rate / (k * base), '',
+                                           HIGHER_IS_BETTER))
+    finally:
+        records.close()
+    return results
+
+def join_suite(config : BenchConfig) -> list[Measurement]:
+    from .nodes import PairJoiner, RecordingConsumer, StampedProducer, WorkProcessor
+
+    n = 60 if config.quick else 200
+    results = []
+    records = _Records()
+    try:
+        for k in (1, 2):
+            rates, matched = [], []
+            for _ in range(_repeats(config)):
+                sink_file = records.path()
+                producer = StampedProducer(n = n, name = 'producer')
+                left = WorkProcessor(work_ms = 5, name = 'left')(producer)
+                right = WorkProcessor(work_ms = 5, name = 'right')(producer)
+                kwargs = {'partition_by': 'trace_id'} if k > 1 else {}
+                joiner = PairJoiner(work_ms = 10, nb_tasks = k, name = 'joiner', **kwargs)(left, right)
+                sink = RecordingConsumer(filepath = sink_file, name = 'sink')(joiner)
+                _run_flow([sink], config)
+                sink_records = _read_records(sink_file)
+                rates.append(_throughput(sink_records))
+                matched.append(sum(1 for r in sink_records
+                                   if r.get('i') is not None and r.get('b_i') == r['i']) / n)
+            results += [
+                Measurement(f'replicas_{k}.throughput', median_of(rates), 'msg/s', HIGHER_IS_BETTER),
+                Measurement(f'replicas_{k}.matched_fraction', min(matched), '', HIGHER_IS_BETTER),
+            ]
+    finally:
+        records.close()
+    return results
+
+BLOB_SWEEP_SIZES = (16 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024)
+
+def blob_suite(config : BenchConfig) -> list[Measurement]:
+    from ..wire.serialization import MAX_INLINE_PAYLOAD_BYTES
+    from .nodes import RecordingConsumer, StampedProducer
+
+    sizes : tuple[int, ...] = (64 * 1024, 1024 * 1024) if config.quick else BLOB_SWEEP_SIZES
+    if config.blob_redis_url is None:
+        # Without a blob store only the inline sizes can be sent at all.
+        sizes = tuple(s for s in sizes if s < MAX_INLINE_PAYLOAD_BYTES)
+    results = []
+    records = _Records()
+    try:
+        for size in sizes:
+            n = 30 if size > 1024 * 1024 else (60 if size > 64 * 1024 else 150)
+            if config.quick:
+                n = n // 3
+            p50s, rates = [], []
+            for _ in range(_repeats(config)):
+                sink_file = records.path()
+                producer = StampedProducer(n = n, payload_bytes = size, name = 'producer')
+                sink = RecordingConsumer(filepath = sink_file, name = 'sink')(producer)
+                _run_flow([sink], config, timeout_s = 60)
+                sink_records = _read_records(sink_file)
+                p50s.append(median_of(_latencies_ms(sink_records)))
+                rates.append(_throughput(sink_records) * size / 1e6)
+            label = f'{size // 1024}kb'
+            results += [
+                Measurement(f'{label}.latency_p50_ms', median_of(p50s), 'ms'),
+                Measurement(f'{label}.throughput_mb_s', median_of(rates), 'MB/s', HIGHER_IS_BETTER),
+            ]
+    finally:
+        records.close()
+    return results
+
+register_suite('wire', _wire_suite,
+               description = 'Envelope encode/decode time, size and allocations for every payload '
+                             'type and size class (no broker).')
+register_suite('assembler', _assembler_suite,
+               description = 'Per add/pop_ready/sweep cost and memory of the join assemblers '
+                             'on synthetic streams, up to 10k pending groups (no broker).')
+register_suite('tracker', _tracker_suite,
+               description = 'Per-frame SortTracker cost at 50 and 200 tracks, greedy and Hungarian '
+                             'assignment (no broker).')
+register_suite('tracing', _tracing_suite,
+               description = 'Per-message overhead of span tracing on one hop, unsampled and '
+                             'sampled (no broker).')
+register_suite('hop', hop_suite, needs_broker = True,
+               description = 'End-to-end latency of identity chains, and the per-hop cost.')
+register_suite('scaling', scaling_suite, needs_broker = True,
+               description = 'Throughput of a 20 ms stage with 1, 2 and 4 replicas.')
+register_suite('join', join_suite, needs_broker = True,
+               description = 'Throughput and pairing of a trace_id join, 1 and 2 partitioned replicas.')
+register_suite('blob', blob_suite, needs_broker = True,
+               description = 'Producer-to-sink latency and MB/s across payload sizes (blob store '
+                             'past the inline threshold).')
+
@@ -0,0 +1,73 @@
+'''
+The ``tracing`` suite of ``videoflow bench``: what ``TracingMessenger`` adds to
+one hop (receive, publish, ack) of a processor, in-process, over a messenger
+that hands out the same input group forever and discards what is published.
+
+    unsampled   ``sample_rate=0``: the per-message cost every traced flow pays
+    sampled     ``sample_rate=1``: a span recorded per message, exported in
+                batches to an exporter that drops them
+
+Per case it reports the mean overhead per message over the bare messenger. The
+budget for ``unsampled`` is under 1% of a 1k msg/s node: 10 us per message per hop.
+'''
+from __future__ import absolute_import, division, print_function
+
+import time
+from typing import Any, Dict, Optional, Sequence
+
+from ..core.engine import Messenger
+from ..runtime.tracing import Span, SpanExporter, Tracer, TracingMessenger
+from .harness import BenchConfig, Measurement, median_of
+
+SAMPLE_RATES = (('unsampled', 0.0), ('sampled', 1.0))
+
+class _LoopbackMessenger(Messenger):
+    '''One input group, from an upstream span, delivered over and over.'''
+    def __init__(self) -> None:
+        self._group = {'p': {'message': 1, 'metadata': None, 'is_stop_signal': False}}
+        self._info = {'p': {'trace_id': 'cam:1', 'seq': 0, 'event_ts': None, 'metadata': None,
+                            'span_id': '1' * 16}}
+
+    def receive_message(self) -> Dict[str, Dict[str, Any]]:
+        return self._group
+
+    def last_input_info(self) -> Optional[Dict[str, Any]]:
+        return self._info
+
+    def publish_message(self, message : Any, metadata : Optional[Dict[str, Any]] = None) -> None:
+        pass
+
+    def ack_inputs(self) -> None:
+        pass
+
+class _DroppingExporter(SpanExporter):
+    def export(self, spans : Sequence[Span], resource : dict[str, Any]) -> None:
+        pass
+
+def _hop_seconds(messenger : Messenger, nb_messages : int) -> float:
+    start = time.perf_counter()
+    for _ in range(nb_messages):
+        messenger.receive_message()
+        messenger.publish_message('out')
+        messenger.ack_inputs()
+    return time.perf_counter() - start
+
+def measure_tracing(label : str, sample_rate : float, nb_messages : int = 20000,
+                    repeats : int = 1) -> list[Measurement]:
+    '''Per-message overhead (median of ``repeats`` runs) of tracing at ``sample_rate``.'''
+    inner = _LoopbackMessenger()
+    traced = TracingMessenger(inner, Tracer(_DroppingExporter(), sample_rate = sample_rate),
+                              'bench', 'flow', 'run')
+    overheads = []
+    for _ in range(max(1, repeats)):
+        overhead = _hop_seconds(traced, nb_messages) - _hop_seconds(inner, nb_messages)
+        overheads.append(max(0.0, overhead) / nb_messages * 1e6)
+    return [Measurement(f'{label}.overhead_us', median_of(overheads), 'us')]
+
+def tracing_suite(config : BenchConfig) -> list[Measurement]:
+    nb_messages = 2000 if config.quick else 20000
+    repeats = 1 if config.quick else max(1, config.repeats)
+    results = []
+    for label, sample_rate in SAMPLE_RATES:
+        results += measure_tracing(label, sample_rate, nb_messages, repeats)
+    return results
@@ -0,0 +1,65 @@
+'''
+The ``tracker`` suite of ``videoflow bench``: ``SortTracker`` stepped in-process
+over a grid of disjoint boxes drifting right, so every detection continues its
+track and the track count stays fixed.
+
+    greedy_<n>       greedy IoU assignment at n tracks per frame
+    hungarian_<n>    Hungarian assignment (skipped without scipy)
+
+Per case it reports the mean cost of one ``process`` call, and how many tracks
+the last frame reported (informational: n when association kept up).
+'''
+from __future__ import absolute_import, division, print_function
+
+import importlib.util
+import time
+
+import numpy as np
+
+from ..processors.vision.trackers import SortTracker
+from .harness import BenchConfig, Measurement, median_of
+
+TRACK_COUNTS = (50, 200)
+
+def grid_boxes(n : int, shift : float = 0.0) -> np.ndarray:
+    '''``n`` disjoint 10x10 boxes on a 20-wide grid, all moved right by ``shift``.'''
+    i = np.arange(n)
+    ymin = (i // 20) * 20.0
+    xmin = (i % 20) * 20.0 + shift
+    return np.stack([ymin, xmin, ymin + 10, xmin + 10], axis = 1)
+
+def detections(boxes : np.ndarray) -> np.ndarray:
+    '''Boxes as detector output: ``[ymin, xmin, ymax, xmax, class_index, score]`` rows.'''
+    boxes = np.asarray(boxes, dtype = np.float64).reshape(-1, 4)
+    return np.concatenate([boxes, np.zeros((len(boxes), 1)), np.ones((len(boxes), 1))], axis = 1)
+
+def measure_tracker(nb_tracks : int, assignment : str, nb_frames : int = 50,
+                    repeats : int = 1) -> list[Measurement]:
+    '''Per-frame cost (median of ``repeats`` runs) of one case, after a first frame that creates the tracks.'''
+    frames = [detections(grid_boxes(nb_tracks, shift = 0.5 * t)) for t in range(nb_frames + 1)]
+    costs = []
+    out = np.zeros((0, 5))
+    for _ in range(max(1, repeats)):
+        tracker = SortTracker(min_hits = 1, assignment = assignment)
+        tracker.process(frames[0])
+        start = time.perf_counter()
+        for dets in frames[1:]:
+            out = tracker.process(dets)
+        costs.append((time.perf_counter() - start) / nb_frames * 1000)
+    name = f'{assignment}_{nb_tracks}'
+    return [
+        Measurement(f'{name}.process_ms', median_of(costs), 'ms'),
+        Measurement(f'{name}.tracks', len(set(out[:, 4].tolist())), '', None),
+    ]
+
+def tracker_suite(config : BenchConfig) -> list[Measurement]:
+    assignments = ['greedy']
+    if importlib.util.find_spec('scipy') is not None:
+        assignments.append('hungarian')
+    nb_frames = 10 if config.quick else 50
+    repeats = 1 if config.quick else max(1, config.repeats)
+    results = []
+    for assignment in assignments:
+        for nb_tracks in TRACK_COUNTS:
+            results += measure_tracker(nb_tracks, assignment, nb_frames, repeats)
+    return results
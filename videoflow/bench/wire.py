@@ -0,0 +1,223 @@
+'''
+The ``wire`` suite of ``videoflow bench``: ``encode_envelope``/``decode_envelope``
+over every payload type the wire carries, at the sizes that matter, in-process.
+
+    tensor_<size>       a raw ``Tensor`` from 1 KB to 25 MB
+    value_<n>_dets      a nested ``Value`` map: a detector's list of dicts
+    frame_<w>x<h>       a ``Frame`` (pixels tensor, pixel format, capture time)
+    detections_100      ``Detections``: an N×4 box tensor and class names
+    tracks_50           ``Tracks``: an N×5 tensor
+    raw_64kb            ``RawPayload`` passthrough of an unregistered type
+    metadata_64_keys    a small payload under 64 metadata entries
+    blobref_<size>      a tensor over the inline threshold, offloaded to an
+                        in-memory ``BlobStore`` (the put and get are timed)
+
+Every case but ``blobref`` keeps its payload inline, so the numbers are the
+codec's alone. Per case it reports the median encode and decode time, the
+envelope size, and from ``tracemalloc`` the peak memory one call allocates and
+that peak as a multiple of the bytes carried — the payload, or the envelope when
+metadata outweighs it (``copies``): ~1 means the data was copied once on its way
+to or from the wire, ~0 that decode is a zero-copy view. ``tracemalloc`` sees
+Python and numpy allocations; protobuf's own arenas are invisible to it, so a
+copy held only there does not show.
+'''
+from __future__ import absolute_import, division, print_function
+
+import contextlib
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, Optional
+
+import numpy as np
+
+from ..v1 import payloads_pb2
+from ..wire import serialization as ser
+from .harness import BenchConfig, Measurement, median_of
+
+KB = 1024
+MB = 1024 * 1024
+
+# Frames and tensors must stay inline for the codec-only cases; large enough for 25 MB.
+_INLINE_ALL = 64 * MB
+
+class InMemoryBlobStore(ser.BlobStore):
+    '''A dict-backed ``BlobStore``: the blob path without a Redis round trip.'''
+    def __init__(self) -> None:
+        self._blobs : dict[str, bytes] = {}
+        self._next = 0
+
+    def put(self, data : bytes, ttl_seconds : int = ser.DEFAULT_BLOB_TTL_SECONDS) -> str:
+        self._next += 1
+        ref = f'mem-{self._next}'
+        self._blobs[ref] = data
+        return ref
+
+    def get(self, ref : str) -> bytes:
+        return self._blobs[ref]
+
+    def release(self, ref : str) -> None:
+        self._blobs.pop(ref, None)
+
+    def clear(self) -> None:
+        self._blobs.clear()
+
+@dataclass
+class WireCase:
+    '''
+    One payload to put through the codec.
+
+    - Arguments:
+        - make: builds the payload (called once per case).
+        - metadata: the envelope's metadata map.
+        - blob: offload through an ``InMemoryBlobStore`` at the default threshold.
+        - quick: part of the ``--quick`` subset.
+    '''
+    name : str
+    make : Callable[[], Any]
+    metadata : dict = field(default_factory = dict)
+    blob : bool = False
+    quick : bool = False
+
+def _tensor(nbytes : int) -> np.ndarray:
+    # float32 noise: incompressible, and a realistic dtype for features/masks.
+    rng = np.random.default_rng(nbytes)
+    return rng.random(nbytes // 4, dtype = np.float32)
+
+def _detections_map(n : int) -> dict:
+    rng = np.random.default_rng(n)
+    return {
+        'frame_id': 1234,
+        'detections': [{'label': 'person', 'score': round(float(rng.random()), 4),
+                        'box': [float(x) for x in rng.random(4) * 1000]}
+                       for _ in range(n)],
+    }
+
+def _tensor_proto(arr : np.ndarray) -> payloads_pb2.Tensor:
+    return payloads_pb2.Tensor(shape = list(arr.shape), dtype = str(arr.dtype), data = arr.tobytes())
+
+def _frame(width : int, height : int) -> payloads_pb2.Frame:
+    pixels = np.random.default_rng(width).integers(0, 255, (height, width, 3), dtype = np.uint8)
+    return payloads_pb2.Frame(pixels = _tensor_proto(pixels), pixel_format = 'bgr8',
+                              capture_ts = 1700000000.0)
+
+def _detections(n : int) -> payloads_pb2.Detections:
+    boxes = np.random.default_rng(n).random((n, 4), dtype = np.float32) * 1000
+    return payloads_pb2.Detections(boxes = _tensor_proto(boxes),
+                                   class_names = ['person', 'car', 'bicycle', 'dog'] * (n // 4))
+
+def _tracks(n : int) -> payloads_pb2.Tracks:
+    tracks = np.random.default_rng(n).random((n, 5), dtype = np.float32)
+    return payloads_pb2.Tracks(tracks = _tensor_proto(tracks))
+
+def _metadata(n : int) -> dict:
+    return {f'key_{i:02d}': (i if i % 3 == 0 else (i * 0.5 if i % 3 == 1 else f'value-{i}'))
+            for i in range(n)}
+
+WIRE_CASES = [
+    WireCase('tensor_1kb', lambda: _tensor(1 * KB), quick = True),
+    WireCase('tensor_64kb', lambda: _tensor(64 * KB)),
+    WireCase('tensor_1mb', lambda: _tensor(1 * MB), quick = True),
+    WireCase('tensor_8mb', lambda: _tensor(8 * MB)),
+    WireCase('tensor_25mb', lambda: _tensor(25 * MB)),
+    WireCase('value_20_dets', lambda: _detections_map(20), quick = True),
+    WireCase('value_200_dets', lambda: _detections_map(200)),
+    WireCase('frame_640x480', lambda: _frame(640, 480), quick = True),
+    WireCase('frame_1920x1080', lambda: _frame(1920, 1080)),
+    WireCase('detections_100', lambda: _detections(100), quick = True),
+    WireCase('tracks_50', lambda: _tracks(50), quick = True),
+    WireCase('raw_64kb', lambda: ser.RawPayload('vendor.bench.v1.Opaque', b'\x01' * (64 * KB)),
+             quick = True),
+    WireCase('metadata_64_keys', lambda: {'label': 'person', 'score': 0.98},
+             metadata = _metadata(64), quick = True),
+    WireCase('blobref_1mb', lambda: _tensor(1 * MB), blob = True, quick = True),
+    WireCase('blobref_8mb', lambda: _tensor(8 * MB), blob = True),
+]
+
+@contextlib.contextmanager
+def _inline_threshold(nbytes : int) -> Iterator[None]:
+    # Benchmark-only override of the module constant the encoder reads per call.
+    saved = ser.MAX_INLINE_PAYLOAD_BYTES
+    ser.MAX_INLINE_PAYLOAD_BYTES = nbytes
+    try:
+        yield
+    finally:
+        ser.MAX_INLINE_PAYLOAD_BYTES = saved
+
+def _repetitions(payload_bytes : int, quick : bool) -> int:
+    # About 200 MB of payload per timing loop, between 5 and 300 calls.
+    reps = max(5, min(300, (200 * MB) // max(payload_bytes, 1)))
+    return max(3, reps // 5) if quick else reps
+
+def _peak_allocation(fn : Callable[[], Any]) -> int:
+    '''Peak bytes ``fn`` allocates, above what was live before it ran.'''
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    return max(0, peak - before)
+
+def _time_calls(fn : Callable[[], Any], reps : int,
+                reset : Optional[Callable[[], None]] = None) -> list[float]:
+    times = []
+    for _ in range(reps):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+        if reset is not None:
+            reset()
+    return times
+
+def measure_case(case : WireCase, quick : bool = False) -> list[Measurement]:
+    '''Times and sizes one case; names are ``<case>.<figure>``.'''
+    payload = case.make()
+    store : Optional[InMemoryBlobStore] = InMemoryBlobStore() if case.blob else None
+    threshold = ser.MAX_INLINE_PAYLOAD_BYTES if case.blob else _INLINE_ALL
+    payload_bytes = len(ser.encode_payload(payload)[1])
+
+    def encode() -> bytes:
+        return ser.encode_envelope('prod', 'flow', 'run', 'trace', 1, ser.MSG_TYPE_DATA,
+                                   case.metadata, payload, blob_store = store)
+
+    # Blobs put by the timed encodes are dropped between calls, untimed, so a
+    # large case does not pile up copies in the store.
+    reset = store.clear if store is not None else None
+    reps = _repetitions(payload_bytes, quick)
+    with _inline_threshold(threshold):
+        encode_times = _time_calls(encode, reps, reset)
+        encode_peak = _peak_allocation(encode)
+        if reset is not None:
+            reset()
+        buf = encode()
+
+        def decode() -> dict:
+            return ser.decode_envelope(buf, blob_store = store)
+
+        decode_times = _time_calls(decode, reps)
+        decode_peak = _peak_allocation(decode)
+    carried = max(payload_bytes, len(buf))
+    name = case.name
+    return [
+        Measurement(f'{name}.encode_ms', median_of(encode_times) * 1000, 'ms'),
+        Measurement(f'{name}.decode_ms', median_of(decode_times) * 1000, 'ms'),
+        Measurement(f'{name}.wire_bytes', len(buf), 'bytes'),
+        Measurement(f'{name}.encode_alloc_bytes', encode_peak, 'bytes'),
+        Measurement(f'{name}.decode_alloc_bytes', decode_peak, 'bytes'),
+        Measurement(f'{name}.encode_copies', encode_peak / carried, 'x', None),
+        Measurement(f'{name}.decode_copies', decode_peak / carried, 'x', None),
+    ]
+
+def wire_suite(config : BenchConfig) -> list[Measurement]:
+    results = []
+    for case in WIRE_CASES:
+        if config.quick and not case.quick:
+            continue
+        results += measure_case(case, quick = config.quick)
+    return results
@@ -3,4 +3,4 @@ This package contains a collection of consumers that implement the ``videoflow.c
     interface
 '''
 from .basic import CommandlineConsumer, FileAppenderConsumer, VoidConsumer
-from .video import VideofileWriter
+from .video import StreamWriter, VideofileWriter
@@ -1,10 +1,209 @@
 from __future__ import absolute_import, division, print_function
 
+import functools
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from typing import IO, Any, Callable, Dict, List, Optional
+
 import cv2
 import numpy as np
 
+from ..core.context import RuntimeContext
 from ..core.node import ConsumerNode
 
+logger = logging.getLogger(__name__)
+
+#: Codecs ``VideofileWriter`` can be asked for, by their ffmpeg family name.
+VIDEO_CODECS = ('h264', 'hevc', 'mpeg4', 'mjpeg')
+VIDEO_WRITER_BACKENDS = ('auto', 'ffmpeg', 'cv2')
+
+_DEFAULT_CODEC = {'.avi': 'mjpeg', '.mp4': 'h264', '.mkv': 'h264', '.mov': 'h264'}
+
+# ffmpeg encoders per codec: hardware encoders in order of preference, then the
+# software one.
+_FFMPEG_ENCODERS = {
+    'h264': (('h264_nvenc', 'h264_qsv', 'h264_videotoolbox'), 'libx264'),
+    'hevc': (('hevc_nvenc', 'hevc_qsv', 'hevc_videotoolbox'), 'libx265'),
+    'mpeg4': ((), 'mpeg4'),
+    'mjpeg': ((), 'mjpeg'),
+}
+_CV2_FOURCC = {'h264': 'avc1', 'hevc': 'hev1', 'mpeg4': 'mp4v', 'mjpeg': 'MJPG'}
+
+# Marks the end of the frames in an encoder's queue.
+_END_OF_FRAMES = object()
+
+def _fit(frame : np.ndarray, height : int, width : int) -> np.ndarray:
+    # The output size is fixed by the first frame; only a frame that differs pays a resize.
+    if frame.shape[0] == height and frame.shape[1] == width:
+        return frame
+    return cv2.resize(frame, (width, height), interpolation = cv2.INTER_AREA)
+
+@functools.lru_cache(maxsize = None)
+def ffmpeg_encoders() -> frozenset:
+    '''Names of the encoders the ``ffmpeg`` binary on the PATH was built with (empty if there is none).'''
+    if shutil.which('ffmpeg') is None:
+        return frozenset()
+    result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], capture_output = True, text = True)
+    names = set()
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        # Encoder lines look like ' V....D libx264  H.264 / AVC ...'.
+        if len(parts) >= 2 and len(parts[0]) == 6 and parts[0][0] in 'VAS':
+            names.add(parts[1])
+    return frozenset(names)
+
+@functools.lru_cache(maxsize = None)
+def _encoder_works(encoder : str) -> bool:
+    # Being compiled in doesn't mean the device is there (nvenc without a GPU):
+    # encode one synthetic frame to find out.
+    cmd = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-f', 'lavfi', '-i', 'color=size=256x256',
+            '-frames:v', '1', '-c:v', encoder, '-f', 'null', '-']
+    try:
+        return subprocess.run(cmd, capture_output = True, timeout = 30).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+def pick_ffmpeg_encoder(codec : str, hw_acceleration : bool = False) -> str:
+    '''
+    The ffmpeg encoder to use for ``codec``: the first hardware encoder that is \
+        both compiled in and usable on this host when ``hw_acceleration`` is set, \
+        else the software one.
+    '''
+    hardware, software = _FFMPEG_ENCODERS[codec]
+    if hw_acceleration:
+        available = ffmpeg_encoders()
+        for encoder in hardware:
+            if encoder in available and _encoder_works(encoder):
+                return encoder
+        logger.info(f'No usable hardware {codec} encoder, encoding with {software}')
+    return software
+
+class FFmpegPipe:
+    '''
+    A long-lived ``ffmpeg`` process that reads raw frames of a fixed size from \
+        its stdin and writes them to ``output_args`` (a file, a stream URL...).
+
+    - Arguments:
+        - width, height: frame size, in pixels.
+        - fps: input frame rate.
+        - output_args: everything after the input on the ffmpeg command line.
+        - pix_fmt: layout of the frames written: ``bgr24`` or ``rgb24``.
+        - input_args: extra options for the raw input, before ``-i``.
+    '''
+    def __init__(self, width : int, height : int, fps : float, output_args : List[str],
+                pix_fmt : str = 'bgr24', input_args : Optional[List[str]] = None) -> None:
+        if shutil.which('ffmpeg') is None:
+            raise RuntimeError('ffmpeg was not found on the PATH')
+        self.cmd = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostats', '-y',
+                    '-f', 'rawvideo', '-pix_fmt', pix_fmt, '-s', f'{width}x{height}',
+                    '-r', str(fps)] + list(input_args or []) + ['-i', '-'] + list(output_args)
+        self._stderr : List[str] = []
+        self._proc = subprocess.Popen(self.cmd, stdin = subprocess.PIPE, stderr = subprocess.PIPE)
+        assert self._proc.stdin is not None and self._proc.stderr is not None
+        self._stdin : IO[bytes] = self._proc.stdin
+        # Drained continuously so a chatty ffmpeg can never block on a full pipe.
+        self._stderr_reader = threading.Thread(target = self._read_stderr, args = (self._proc.stderr,),
+                                                daemon = True)
+        self._stderr_reader.start()
+
+    def _read_stderr(self, stderr : IO[bytes]) -> None:
+        for line in stderr:
+            self._stderr.append(line.decode('utf-8', 'replace').rstrip())
+        stderr.close()
+
+    def _failure(self) -> RuntimeError:
+        self._stderr_reader.join(timeout = 5)
+        detail = '\n'.join(self._stderr[-20:])
+        return RuntimeError(f'ffmpeg exited with code {self._proc.returncode}: {detail}')
+
+    def write(self, frame : np.ndarray) -> None:
+        try:
+            self._stdin.write(np.ascontiguousarray(frame).data.cast('B'))
+        except (BrokenPipeError, ValueError) as e:
+            self._proc.wait()
+            raise self._failure() from e
+
+    def close(self) -> None:
+        '''Closes stdin, lets ffmpeg flush and finalize the output, and waits for it.'''
+        try:
+            self._stdin.close()
+        except BrokenPipeError:
+            pass
+        if self._proc.wait() != 0:
+            raise self._failure()
+        self._stderr_reader.join(timeout = 5)
+
+    def kill(self) -> None:
+        self._proc.kill()
+        self._proc.wait()
+
+class _Cv2Writer:
+    def __init__(self, video_file : str, codec : str, width : int, height : int, fps : float) -> None:
+        self._out = cv2.VideoWriter(video_file, cv2.VideoWriter_fourcc(*_CV2_FOURCC[codec]),  # type: ignore[attr-defined]
+                                    fps, (width, height))
+        if not self._out.isOpened() and codec in ('h264', 'hevc'):
+            # pip builds of OpenCV ship without H.264/H.265 encoders.
+            logger.warning(f'OpenCV cannot encode {codec} here, writing MPEG-4 part 2 instead; '
+                            'install ffmpeg for H.264/H.265')
+            self._out = cv2.VideoWriter(video_file, cv2.VideoWriter_fourcc(*'mp4v'),  # type: ignore[attr-defined]
+                                        fps, (width, height))
+        if not self._out.isOpened():
+            raise RuntimeError(f'OpenCV could not open {video_file} for writing with codec {codec}')
+
+    def write(self, frame : np.ndarray) -> None:
+        self._out.write(frame)
+
+    def close(self) -> None:
+        self._out.release()
+
+class _EncoderThread:
+    '''
+    Runs ``write`` for every frame ``put`` on it on a background thread, behind \
+        a bounded queue: ``put`` only blocks when the encoder is ``maxsize`` \
+        frames behind. An error on the thread is raised by the next ``put`` or by \
+        ``close``, which drains the queue and then calls ``finish``.
+    '''
+    def __init__(self, write : Callable[[np.ndarray], None], finish : Callable[[], None],
+                maxsize : int, name : str) -> None:
+        self._write = write
+        self._finish = finish
+        self._frames : queue.Queue = queue.Queue(maxsize = maxsize)
+        self._error : Optional[BaseException] = None
+        self._thread = threading.Thread(target = self._run, daemon = True, name = name)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            frame = self._frames.get()
+            if frame is _END_OF_FRAMES:
+                return
+            if self._error is not None:
+                continue
+            try:
+                self._write(frame)
+            except Exception as e:
+                self._error = e
+
+    def put(self, frame : np.ndarray) -> None:
+        if self._error is not None:
+            raise self._error
+        self._frames.put(frame)
+
+    def close(self) -> None:
+        self._frames.put(_END_OF_FRAMES)
+        self._thread.join()
+        try:
+            self._finish()
+        except Exception as e:
+            if self._error is None:
+                self._error = e
+        if self._error is not None:
+            raise self._error
 
 class VideofileWriter(ConsumerNode):
     '''
@@ -12,19 +211,46 @@ class VideofileWriter(ConsumerNode):
     frames received into the object.  If video file exists \
     it overwrites it.
 
-    The video writer will open when it receives the first frame.
+    The video writer will open when it receives the first frame. Frames are \
+    encoded on a background thread: ``consume()`` returns once the frame is \
+    queued, and only blocks when the encoder is ``queue_size`` frames behind. \
+    ``close()`` flushes the queue and finalizes the file.
+
     - Arguments:
-        - video_file: path to video.  Folder where video lives must exist. Extension must be .avi
+        - video_file: path to video.  Folder where video lives must exist. \
+            Extension must be .avi, .mp4, .mkv or .mov
+        - swap_channels: if True, frames are RGB and are written as such (the \
+            video looks right); if False they are taken to be BGR.
         - fps: frames per second
+        - codec: one of ``VIDEO_CODECS``. Defaults to ``mjpeg`` for .avi and \
+            ``h264`` otherwise.
+        - hw_acceleration: encode on a hardware encoder (NVENC, Quick Sync, \
+            VideoToolbox) when ffmpeg has one that works on this host.
+        - backend: ``ffmpeg`` (a pipe to the ``ffmpeg`` binary), ``cv2`` \
+            (``cv2.VideoWriter``) or ``auto`` — ffmpeg when it is on the PATH.
+        - queue_size: frames buffered between ``consume()`` and the encoder.
     '''
 
-    def __init__(self, video_file : str, swap_channels : bool = True, fps : int = 30, **kwargs) -> None:
-        if video_file[-4:] != '.avi':
-            raise ValueError('Only .avi format is supported')
+    def __init__(self, video_file : str, swap_channels : bool = True, fps : int = 30,
+                codec : Optional[str] = None, hw_acceleration : bool = False,
+                backend : str = 'auto', queue_size : int = 32, **kwargs) -> None:
+        ext = os.path.splitext(video_file)[1].lower()
+        if ext not in _DEFAULT_CODEC:
+            raise ValueError(f'Only {", ".join(_DEFAULT_CODEC)} formats are supported')
+        if codec is not None and codec not in VIDEO_CODECS:
+            raise ValueError(f'codec must be one of {VIDEO_CODECS}, got {codec!r}')
+        if backend not in VIDEO_WRITER_BACKENDS:
+            raise ValueError(f'backend must be one of {VIDEO_WRITER_BACKENDS}, got {backend!r}')
+        if not isinstance(queue_size, int) or queue_size < 1:
+            raise ValueError(f'queue_size must be a positive int, got {queue_size!r}')
         self._video_file = video_file
         self._swap_channels = swap_channels
         self._fps = fps
-        self._out: cv2.VideoWriter | None = None  # created lazily on the first frame
+        self._codec = codec
+        self._hw_acceleration = hw_acceleration
+        self._backend = backend
+        self._queue_size = queue_size
+        self._encoder : _EncoderThread | None = None  # created lazily on the first frame
         super(VideofileWriter, self).__init__(**kwargs)
 
     def open(self) -> None:
@@ -36,10 +262,32 @@ class VideofileWriter(ConsumerNode):
 
     def close(self) -> None:
         '''
-        Closes the video stream
+        Flushes the queued frames and closes the video file
         '''
-        if self._out is not None and self._out.isOpened():
-            self._out.release()
+        if self._encoder is not None:
+            encoder, self._encoder = self._encoder, None
+            encoder.close()
+
+    def _start(self, height : int, width : int) -> _EncoderThread:
+        codec = self._codec or _DEFAULT_CODEC[os.path.splitext(self._video_file)[1].lower()]
+        use_ffmpeg = self._backend == 'ffmpeg' or (self._backend == 'auto' and shutil.which('ffmpeg'))
+        writer : FFmpegPipe | _Cv2Writer
+        if use_ffmpeg:
+            encoder = pick_ffmpeg_encoder(codec, self._hw_acceleration)
+            pix_fmt = 'yuvj420p' if codec == 'mjpeg' else 'yuv420p'
+            # ffmpeg reads RGB as readily as BGR: no per-frame channel swap.
+            writer = FFmpegPipe(width, height, self._fps,
+                                ['-c:v', encoder, '-pix_fmt', pix_fmt, self._video_file],
+                                pix_fmt = 'rgb24' if self._swap_channels else 'bgr24')
+            write = writer.write
+        else:
+            writer = _Cv2Writer(self._video_file, codec, width, height, self._fps)
+            if self._swap_channels:
+                write = lambda frame: writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+            else:
+                write = writer.write
+        return _EncoderThread(lambda frame: write(_fit(frame, height, width)), writer.close,
+                            self._queue_size, f'{self.name}-encode')
 
     def consume(self, item : np.ndarray) -> None:
         '''
@@ -53,13 +301,229 @@ class VideofileWriter(ConsumerNode):
         - Arguments:
             - item: np.ndarray of dimension (height, width, 3)
         '''
-        if self._out is None:
-            self._height = item.shape[0]
-            self._width = item.shape[1]
-            fourcc = cv2.VideoWriter_fourcc('M', 'J', 'P', 'G')  # type: ignore[attr-defined]
-            self._out = cv2.VideoWriter(self._video_file, fourcc, self._fps, (self._width, self._height))
-
-        resized = cv2.resize(item, (self._width, self._height), interpolation = cv2.INTER_AREA)
-        if self._swap_channels:
-            resized = resized[...,::-1]
-        self._out.write(resized)
+        if self._encoder is None:
+            self._encoder = self._start(item.shape[0], item.shape[1])
+        self._encoder.put(item)
+
+# A stream's event timeline that drifts this far from the wall clock (a stalled
+# or restarted source, a file replayed in a loop) is re-anchored, not waited out.
+_RESYNC_SECONDS = 5.0
+
+def _stream_format(target : str) -> Optional[str]:
+    if target.startswith(('rtsp://', 'rtsps://')):
+        return 'rtsp'
+    if target.startswith(('rtmp://', 'rtmps://')):
+        return 'flv'
+    if target.endswith('.m3u8'):
+        return 'hls'
+    return None
+
+class StreamWriter(ConsumerNode):
+    '''
+    Restreams the frames it receives live — to an RTSP server, an RTMP ingest or \
+        an HLS playlist — through a long-lived ``ffmpeg`` process fed raw frames \
+        on its stdin.
+
+    Frames are paced by their event time (``ctx.input_info``): the first frame \
+        anchors the event timeline to the wall clock, and each later one is written \
+        when its moment comes, so the stream plays at the source's own cadence \
+        however bursty the pipeline upstream is. Frames without an event time are \
+        paced at ``fps``.
+
+    ``consume()`` hands frames to the writer thread through a queue of \
+        ``queue_size`` frames. By default (``max_latency=None``) nothing is \
+        dropped, and a full queue blocks ``consume()`` — backpressure up the flow, \
+        as BATCH flows and file outputs expect. For live use (REALTIME flows) set \
+        ``max_latency``: ``consume()`` then never blocks, a full queue evicts its \
+        oldest frame, and a frame more than ``max_latency`` seconds past its slot \
+        is dropped rather than sent late.
+
+    - Arguments:
+        - target: stream URL (``rtsp://``, ``rtmp://``), ``.m3u8`` playlist path, \
+            or any ffmpeg output (a file, ``-`` with ``format='null'``...).
+        - fps: output frame rate, and the pace of frames without an event time.
+        - format: ffmpeg muxer. Inferred from ``target`` when None.
+        - codec: ``h264`` or ``hevc``.
+        - hw_acceleration: encode on a hardware encoder when one works here.
+        - bitrate: target video bitrate (ffmpeg syntax, e.g. ``'4M'``).
+        - gop: keyframe interval, in frames (defaults to one per second). Viewers \
+            join, and HLS segments cut, on keyframes.
+        - swap_channels: if True, frames are RGB; if False, BGR.
+        - queue_size: frames buffered between ``consume()`` and the writer.
+        - max_latency: seconds a frame may run behind its slot before it is \
+            dropped; None (the default) never drops.
+        - hls_time: target HLS segment duration, in seconds.
+    '''
+    def __init__(self, target : str, fps : float = 30, format : Optional[str] = None,
+                codec : str = 'h264', hw_acceleration : bool = False, bitrate : Optional[str] = None,
+                gop : Optional[int] = None, swap_channels : bool = True, queue_size : int = 8,
+                max_latency : Optional[float] = None, hls_time : float = 2.0, **kwargs) -> None:
+        if codec not in ('h264', 'hevc'):
+            raise ValueError(f"codec must be 'h264' or 'hevc', got {codec!r}")
+        if format is None and _stream_format(target) is None:
+            raise ValueError(f'Cannot infer the stream format of {target!r}; pass format=')
+        if not isinstance(queue_size, int) or queue_size < 1:
+            raise ValueError(f'queue_size must be a positive int, got {queue_size!r}')
+        if max_latency is not None and max_latency <= 0:
+            raise ValueError(f'max_latency must be positive or None, got {max_latency!r}')
+        self._target = target
+        self._fps = fps
+        self._format = format
+        self._codec = codec
+        self._hw_acceleration = hw_acceleration
+        self._bitrate = bitrate
+        self._gop = gop
+        self._swap_channels = swap_channels
+        self._queue_size = queue_size
+        self._max_latency = max_latency
+        self._hls_time = hls_time
+        # Created on the first frame.
+        self._pipe : FFmpegPipe | None = None
+        self._frames : queue.Queue | None = None
+        self._writer : threading.Thread | None = None
+        self._error : Optional[BaseException] = None
+        self._offset : Optional[float] = None
+        self._last_due : Optional[float] = None
+        # Drops are counted from both consume() and the writer thread.
+        self._nb_dropped = 0
+        self._dropped_lock = threading.Lock()
+        super(StreamWriter, self).__init__(**kwargs)
+
+    @property
+    def nb_dropped(self) -> int:
+        '''Frames dropped so far, as late or evicted from a full queue.'''
+        return self._nb_dropped
+
+    def _count_drop(self) -> None:
+        with self._dropped_lock:
+            self._nb_dropped += 1
+
+    def open(self) -> None:
+        '''
+        The ffmpeg process is started on the first frame, whose size sets the stream's.
+        '''
+        pass
+
+    def close(self) -> None:
+        '''
+        Writes out the queued frames and lets ffmpeg finalize the stream
+        '''
+        if self._writer is None:
+            return
+        # Created together with the writer thread.
+        assert self._frames is not None and self._pipe is not None
+        self._frames.put(_END_OF_FRAMES)
+        self._writer.join()
+        pipe = self._pipe
+        self._writer, self._pipe, self._frames = None, None, None
+        try:
+            pipe.close()
+        except RuntimeError as e:
+            if self._error is None:
+                self._error = e
+        if self._nb_dropped:
+            logger.info(f'{self.name}: dropped {self._nb_dropped} late frames')
+        if self._error is not None:
+            raise self._error
+
+    def _output_args(self) -> List[str]:
+        encoder = pick_ffmpeg_encoder(self._codec, self._hw_acceleration)
+        args = ['-c:v', encoder, '-pix_fmt', 'yuv420p', '-r', str(self._fps),
+                '-g', str(self._gop or max(1, int(round(self._fps))))]
+        if encoder in ('libx264', 'libx265'):
+            args += ['-preset', 'veryfast', '-tune', 'zerolatency']
+        if self._bitrate:
+            args += ['-b:v', self._bitrate]
+        fmt = self._format or _stream_format(self._target)
+        assert fmt is not None   # checked in __init__
+        if fmt == 'rtsp':
+            args += ['-rtsp_transport', 'tcp']
+        elif fmt == 'hls':
+            args += ['-hls_time', str(self._hls_time), '-hls_list_size', '6',
+                    '-hls_flags', 'delete_segments+omit_endlist']
+        return args + ['-f', fmt, self._target]
+
+    def _open_pipe(self, width : int, height : int) -> FFmpegPipe:
+        # Input timestamps from the wall clock at arrival, so dropped or held
+        # frames keep the stream's timing right; '-r' on the output makes it CFR.
+        return FFmpegPipe(width, height, self._fps, self._output_args(),
+                        pix_fmt = 'rgb24' if self._swap_channels else 'bgr24',
+                        input_args = ['-use_wallclock_as_timestamps', '1'])
+
+    def _start(self, height : int, width : int) -> queue.Queue:
+        frames : queue.Queue = queue.Queue(maxsize = self._queue_size)
+        self._pipe = pipe = self._open_pipe(width, height)
+        self._frames = frames
+        self._writer = threading.Thread(target = self._run, args = (pipe, frames, height, width),
+                                        daemon = True, name = f'{self.name}-stream')
+        self._writer.start()
+        return frames
+
+    def _due(self, event_ts : Optional[float], now : float) -> float:
+        '''Wall-clock (monotonic) time at which the frame should go out.'''
+        if event_ts is None:
+            # No event time: pace at fps, but never schedule behind arrival.
+            due = now if self._last_due is None else max(self._last_due + 1.0 / self._fps, now)
+        elif self._offset is None or abs(event_ts + self._offset - now) > _RESYNC_SECONDS:
+            self._offset = now - event_ts
+            due = now
+        else:
+            due = event_ts + self._offset
+        self._last_due = due
+        return due
+
+    def _run(self, pipe : FFmpegPipe, frames : queue.Queue, height : int, width : int) -> None:
+        while True:
+            entry = frames.get()
+            if entry is _END_OF_FRAMES:
+                return
+            if self._error is not None:
+                continue
+            due, frame = entry
+            now = time.monotonic()
+            if self._max_latency is not None and now - due > self._max_latency:
+                self._count_drop()
+                continue
+            if due > now:
+                time.sleep(due - now)
+            try:
+                pipe.write(_fit(frame, height, width))
+            except Exception as e:
+                self._error = e
+
+    @staticmethod
+    def _event_ts(ctx : Optional[RuntimeContext]) -> Optional[float]:
+        info : Optional[Dict[str, Any]] = ctx.input_info if ctx is not None else None
+        for parent in (info or {}).values():
+            ts = parent.get('event_ts') if isinstance(parent, dict) else None
+            if isinstance(ts, (int, float)):
+                return float(ts)
+        return None
+
+    def consume(self, item : np.ndarray, ctx : RuntimeContext | None = None) -> None:
+        '''
+        Queues the frame for the stream.
+
+        - Arguments:
+            - item: np.ndarray of dimension (height, width, 3). Frames of another \
+                size than the first are resized to it.
+        '''
+        if self._error is not None:
+            raise self._error
+        frames = self._frames
+        if frames is None:
+            frames = self._start(item.shape[0], item.shape[1])
+        entry = (self._due(self._event_ts(ctx), time.monotonic()), item)
+        if self._max_latency is None:
+            frames.put(entry)
+            return
+        while True:
+            try:
+                frames.put_nowait(entry)
+                return
+            except queue.Full:
+                try:
+                    frames.get_nowait()
+                    self._count_drop()
+                except queue.Empty:
+                    pass
@@ -0,0 +1,228 @@
+'''
+Content-addressed result cache for deterministic processors (``ProcessorNode(cache='content')``).
+
+The key is a hash of the node's class, its behaviour-defining ``get_params()`` and
+the decoded input payloads, so the same frame seen twice — a BATCH re-run over the
+same videos, two cameras on a static scene — is computed once. A hit is published
+through the normal path, so it carries the trace id / seq / event time of the
+group it answers, exactly as a freshly computed output would.
+
+Two tiers: a byte-bounded LRU in the worker process, then (optionally) a
+``SharedResultCache`` such as ``videoflow.runtime.result_cache.RedisResultCache``
+that replicas and later runs share.
+'''
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import json
+import logging
+import struct
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__package__)
+
+CACHE_CONTENT = 'content'
+CACHE_MODES = (CACHE_CONTENT,)
+
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+#: What ``SharedResultCache.get`` returns on a miss: None is a legitimate result.
+MISSING = object()
+
+#: Constructor parameters that say *where/how* a node runs, not *what* it computes;
+#: two nodes differing only in these produce identical outputs for identical inputs.
+DEPLOYMENT_PARAMS = frozenset({
+    'name', 'image', 'nb_tasks', 'device_type', 'partition_by', 'join_policy',
+    'gpu_count', 'gpu_resource_name', 'workers_per_replica',
+    'cache', 'cache_max_bytes', 'cache_shared',
+})
+
+class _Unhashable(Exception):
+    pass
+
+def _feed(h : Any, obj : Any) -> None:
+    '''
+    Feeds a canonical, type-tagged encoding of ``obj`` into ``h``. Tags keep
+    ``1``/``1.0``/``True``/``'1'`` and ``[1, 2]``/``[[1], 2]`` from colliding.
+    '''
+    if obj is None:
+        h.update(b'N')
+    elif isinstance(obj, bool):
+        h.update(b'T' if obj else b'F')
+    elif isinstance(obj, int):
+        b = str(obj).encode('ascii')
+        h.update(b'I' + struct.pack('<I', len(b)) + b)
+    elif isinstance(obj, float):
+        h.update(b'D' + struct.pack('<d', obj))
+    elif isinstance(obj, str):
+        b = obj.encode('utf-8')
+        h.update(b'S' + struct.pack('<Q', len(b)) + b)
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        h.update(b'B' + struct.pack('<Q', len(obj)))
+        h.update(obj)
+    elif isinstance(obj, np.ndarray):
+        if obj.dtype.hasobject:
+            raise _Unhashable('object arrays')
+        header = f'{obj.dtype.str}{obj.shape}'.encode('ascii')
+        h.update(b'A' + struct.pack('<I', len(header)) + header)
+        # Hashes the contiguous buffer in place; only a strided view is copied.
+        h.update(np.ascontiguousarray(obj).data.cast('B'))
+    elif isinstance(obj, np.generic):
+        _feed(h, obj.item())
+    elif isinstance(obj, (list, tuple)):
+        h.update(b'L' + struct.pack('<Q', len(obj)))
+        for item in obj:
+            _feed(h, item)
+    elif isinstance(obj, dict):
+        h.update(b'M' + struct.pack('<Q', len(obj)))
+        for k in sorted(obj, key = str):
+            _feed(h, str(k))
+            _feed(h, obj[k])
+    elif hasattr(obj, 'SerializeToString') and hasattr(obj, 'DESCRIPTOR'):
+        # A protobuf message; deterministic=True fixes map-field ordering.
+        _feed(h, obj.DESCRIPTOR.full_name)
+        _feed(h, obj.SerializeToString(deterministic = True))
+    elif hasattr(obj, 'payload_type') and hasattr(obj, 'data'):
+        # videoflow.wire.serialization.RawPayload (kept duck-typed: core does not
+        # import the wire module, which needs the optional protobuf dependency).
+        _feed(h, obj.payload_type)
+        _feed(h, obj.data)
+    else:
+        raise _Unhashable(type(obj).__name__)
+
+def params_fingerprint(node : Any) -> str:
+    '''
+    Hash of the node's class path plus its behaviour-defining ``get_params()`` \
+        (everything except ``DEPLOYMENT_PARAMS``). Computed once per node.
+    '''
+    params = {k: v for k, v in node.get_params().items() if k not in DEPLOYMENT_PARAMS}
+    raw = json.dumps([f'{type(node).__module__}.{type(node).__qualname__}', params],
+                    sort_keys = True, default = repr)
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size = 16).hexdigest()
+
+def content_key(fingerprint : str, inputs : Any) -> Optional[str]:
+    '''
+    - Arguments:
+        - fingerprint: ``params_fingerprint(node)``.
+        - inputs: the positional inputs about to be passed to ``process()``.
+
+    - Returns:
+        - a hex key, or None if some input has no canonical encoding (the call \
+            then simply bypasses the cache).
+    '''
+    h = hashlib.blake2b(digest_size = 20)
+    h.update(fingerprint.encode('ascii'))
+    try:
+        _feed(h, list(inputs))
+    except _Unhashable as e:
+        logger.debug(f'cache bypassed: input is not content-hashable ({e})')
+        return None
+    return h.hexdigest()
+
+def sizeof(value : Any) -> int:
+    '''Approximate retained size in bytes, dominated by array/bytes payloads — what the LRU budget counts.'''
+    if isinstance(value, np.ndarray):
+        return value.nbytes + 112
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value) + 49
+    if isinstance(value, (list, tuple)):
+        return 56 + 8 * len(value) + sum(sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return 64 + sum(sizeof(k) + sizeof(v) + 16 for k, v in value.items())
+    byte_size = getattr(value, 'ByteSize', None)
+    if callable(byte_size):
+        return int(byte_size()) + 64
+    return sys.getsizeof(value)
+
+class SharedResultCache:
+    '''
+    A cache tier shared by every replica (and every run) of a node. ``get`` returns \
+        ``MISSING`` on a miss (a stored None is a hit); implementations must treat \
+        their own failures as misses, since the cache is only ever an optimization.
+    '''
+    def get(self, key : str) -> Any:
+        raise NotImplementedError('SharedResultCache subclass must implement get()')
+
+    def put(self, key : str, value : Any) -> None:
+        raise NotImplementedError('SharedResultCache subclass must implement put()')
+
+class ResultCache:
+    '''
+    In-process LRU bounded by total ``sizeof`` of its values rather than entry \
+        count: one 4K frame weighs as much as thousands of small detections. A \
+        value larger than the whole budget is never stored. Misses fall through to \
+        the optional ``shared`` tier, and shared hits are promoted into the LRU.
+
+    Thread-safe (a pooled processor finishes results on the task thread, but a \
+        shared tier may be consulted from anywhere).
+
+    - Arguments:
+        - max_bytes: budget for the in-process tier.
+        - shared: optional ``SharedResultCache``.
+    '''
+    def __init__(self, max_bytes : int = DEFAULT_CACHE_MAX_BYTES,
+                shared : Optional[SharedResultCache] = None) -> None:
+        self._max_bytes = max_bytes
+        self._shared = shared
+        self._lock = threading.Lock()
+        self._entries : "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key : str) -> Tuple[bool, Any]:
+        '''Returns ``(hit, value)``.'''
+        with self._lock:
+            found = self._entries.get(key)
+            if found is not None:
+                self._entries.move_to_end(key)
+                return True, found[0]
+        if self._shared is not None:
+            try:
+                value = self._shared.get(key)
+            except Exception:
+                logger.debug('shared result cache lookup failed', exc_info = True)
+                value = MISSING
+            if value is not MISSING:
+                self._store(key, value)
+                return True, value
+        return False, None
+
+    def put(self, key : str, value : Any) -> None:
+        self._store(key, value)
+        if self._shared is not None:
+            try:
+                self._shared.put(key, value)
+            except Exception:
+                logger.debug('shared result cache store failed', exc_info = True)
+
+    def _store(self, key : str, value : Any) -> None:
+        size = sizeof(value)
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                _, (_, evicted) = self._entries.popitem(last = False)
+                self._bytes -= evicted
+
+def make_result_cache(node : Any, shared : Optional[SharedResultCache] = None) -> Optional[Tuple[str, ResultCache]]:
+    '''``(fingerprint, cache)`` for a node built with ``cache='content'``, else None.'''
+    if getattr(node, 'cache', None) != CACHE_CONTENT:
+        return None
+    tier = shared if node.cache_shared else None
+    return params_fingerprint(node), ResultCache(node.cache_max_bytes, shared = tier)
@@ -20,15 +20,18 @@ class RuntimeContext:
     - Attributes:
         - flow_id / run_id / node_name / replica_id: identity of this running node.
         - logger: a standard library logger scoped to the node.
+        - partition_by: the node's ``partition_by``, which ``key`` reads.
     '''
     def __init__(self, flow_id : str, run_id : str, node_name : str, replica_id : int,
-                logger : logging.Logger, messenger : Optional[Messenger] = None) -> None:
+                logger : logging.Logger, messenger : Optional[Messenger] = None,
+                partition_by : Optional[str] = None) -> None:
         self.flow_id = flow_id
         self.run_id = run_id
         self.node_name = node_name
         self.replica_id = replica_id
         self.logger = logger
         self._messenger = messenger
+        self._partition_by = partition_by
 
     def set_partition_key(self, value : Any) -> None:
         '''
@@ -63,3 +66,23 @@ class RuntimeContext:
         if self._messenger is None:
             return None
         return self._messenger.last_input_info()
+
+    @property
+    def key(self) -> Any:
+        '''
+        The partition key of the input group currently being processed — the \
+            value this replica was chosen by (the ``partition_by`` metadata field, \
+            or the trace id for ``partition_by='trace_id'``). ``None`` when the \
+            node is not partitioned. Keyed state (``KeyedProcessorNode``) is \
+            indexed by it.
+        '''
+        if not self._partition_by:
+            return None
+        for entry in (self.input_info or {}).values():
+            if isinstance(entry, list):
+                entry = entry[0] if entry else None
+            if entry:
+                if self._partition_by == 'trace_id':
+                    return entry.get('trace_id')
+                return (entry.get('metadata') or {}).get(self._partition_by)
+        return None
@@ -1,6 +1,6 @@
 from __future__ import absolute_import, division, print_function
 
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 
 class Messenger:
@@ -73,6 +73,52 @@ class Messenger:
         '''
         pass
 
+    def set_output_emission(self, index : int, flush : bool = False) -> None:
+        '''
+        Number the next published output as emission ``index`` of its input \
+            group, for a processor that publishes zero or many outputs per input \
+            (``ProcessorNode.emit``). Emission 0 keeps the group's identity; later \
+            ones must derive their own, deterministically, so that each has its \
+            own dedup id and a re-run derives the same ids. ``flush`` marks an \
+            emission from ``ProcessorNode.flush`` at end of stream, which has no \
+            input group. Default: no-op.
+        '''
+        pass
+
+    def set_output_span(self, span_id : Optional[str], parent_span_id : Optional[str] = None) -> None:
+        '''
+        Set the trace span ids stamped on this node's next published output: the \
+            span that produced it and that span's parent (see \
+            ``videoflow.runtime.tracing``). Default: no-op.
+        '''
+        pass
+
+    def set_output_cache_hit(self, hit : Optional[bool]) -> None:
+        '''
+        Records whether the outputs published next were served from the node's \
+            result cache (True), computed on a cache miss (False), or not looked \
+            up at all (None). Local bookkeeping only: it is never put on the wire. \
+            Default: no-op.
+        '''
+        pass
+
+    def set_stage_observer(self, observer : Optional[Callable[[str, float], None]]) -> None:
+        '''
+        Have the messenger report the time it spends in each of its own stages \
+            of a message (blob fetch/put, decode/encode, the publish round trip) \
+            as ``observer(stage, seconds)`` — see ``videoflow.runtime.health.STAGES``. \
+            Default: no-op (nothing is timed).
+        '''
+        pass
+
+    def set_counter_observer(self, observer : Optional[Callable[[str, int], None]]) -> None:
+        '''
+        Have the messenger report counts it alone can see (bytes moved through \
+            the blob store, backpressure events such as publish retries and \
+            evictions) as ``observer(counter, amount)``. Default: no-op.
+        '''
+        pass
+
     def last_input_key(self) -> Optional[str]:
         '''
         A stable identity for the input group last returned by ``receive_message``, \
@@ -83,11 +129,71 @@ class Messenger:
     def last_input_info(self) -> Optional[Dict[str, Any]]:
         '''
         Per-parent envelope info (``event_ts``, ``metadata``, ``trace_id``, \
-            ``seq``) for the input group last returned by ``receive_message`` \
+            ``seq``, ``span_id``) for the input group last returned by ``receive_message`` \
             (exposed to nodes as ``ctx.input_info``). Default: None.
         '''
         return None
 
+    def last_published_event_ts(self) -> Optional[float]:
+        '''
+        The event time stamped on the message last published by \
+            ``publish_message`` — what its age downstream is measured from. \
+            Default: None (unknown).
+        '''
+        return None
+
+    def last_published_trace_id(self) -> Optional[str]:
+        '''
+        The lineage ``trace_id`` of the message last published by \
+            ``publish_message`` — for a producer, the one it just minted. \
+            Default: None (unknown).
+        '''
+        return None
+
+    def input_lag(self) -> Optional[Dict[str, int]]:
+        '''
+        Per-parent backlog of this node's input, in messages not yet processed \
+            (delivered-but-unacked plus not-yet-delivered) — how far this node \
+            trails each of its incoming edges. Default: None (unknown).
+        '''
+        return None
+
+    def output_backlog(self) -> Optional[int]:
+        '''
+        How far behind the slowest consumer of this node's output is, in messages \
+            (delivered-but-unacked plus not-yet-delivered). Drives a producer's \
+            adaptive sampler. Default: None (unknown).
+        '''
+        return None
+
+    def buffer_depths(self) -> Optional[List[tuple]]:
+        '''
+        Current fill of the messenger's internal buffers, as \
+            ``(buffer, parent, depth, capacity)`` tuples (``parent`` and \
+            ``capacity`` may be None) — where a slow node's backlog is sitting \
+            locally rather than in the broker. Default: None (no local buffers).
+        '''
+        return None
+
+    def checkpoint_inputs(self) -> Any:
+        '''
+        Detach the input group last returned by ``receive_message`` — its lineage \
+            (trace id, seq, event time, ``input_info``) and its unresolved acks — \
+            into an opaque token, so ``receive_message`` can be called again before \
+            that group's output is published. Used by a processor whose \
+            ``process()`` runs on a worker pool, where several groups are in \
+            flight at once. Default: None (no per-group state to detach).
+        '''
+        return None
+
+    def restore_inputs(self, token : Any) -> None:
+        '''
+        Make the group captured by ``checkpoint_inputs`` current again, so the \
+            next ``publish_message`` derives its identity from it and \
+            ``ack_inputs``/``fail_inputs`` resolve *its* messages. Default: no-op.
+        '''
+        pass
+
     def close(self) -> None:
         '''Release any broker resources held by the messenger. Default: no-op.'''
         pass
@@ -105,6 +211,19 @@ class Messenger:
         '''
         raise NotImplementedError('Messenger subclass must implement method.')
 
+    def poll_message(self, timeout : float) -> Optional[Dict[str, Dict[str, Any]]]:
+        '''
+        ``receive_message``, giving up after ``timeout`` seconds. Lets a task that \
+            holds work in flight (a process pool's results) get back to it while \
+            its input is quiet.
+
+        - Returns:
+            - what ``receive_message`` returns, or None if no complete input was \
+                ready in time. Default: a messenger that cannot time out blocks \
+                in ``receive_message``.
+        '''
+        return self.receive_message()
+
 class ExecutionEngine:
     '''
     Defines the interface of the `execution environment` — how tasks are physically \
@@ -2,10 +2,14 @@ import logging
 from typing import List
 
 from ..utils.graph import has_cycle, topological_sort
-from .node import ConsumerNode, ProcessorNode, ProducerNode
+from .node import ConsumerNode, KeyedProcessorNode, ProcessorNode, ProducerNode
 
 logger = logging.getLogger(__package__)
 
+# partition_by values that differ for every message: the envelope's trace id and
+# the timings every task stamps on its outputs. Fine for routing, useless as a state key.
+_PER_MESSAGE_KEYS = ('trace_id', 'proctime', 'actual_proctime')
+
 class GraphEngine:
     '''
     Validates and topologically sorts a computation graph.
@@ -70,6 +74,26 @@ class GraphEngine:
                     "partition_by='trace_id' (recommended for joins) or nb_tasks=1."
                 )
 
+        # Keyed state is only consistent if every message of a key reaches the
+        # replica holding that key's state. A key that changes with every message
+        # (the trace id, the timings stamped on each output) would scatter one
+        # camera's frames over all replicas, and hold one state per event.
+        for node in self._tsort:
+            if not isinstance(node, KeyedProcessorNode):
+                continue
+            if node.partition_by in _PER_MESSAGE_KEYS:
+                raise ValueError(
+                    f'Node {node.name} keeps per-key state but partition_by={node.partition_by!r} '
+                    'differs for every message. Set partition_by to the metadata field its '
+                    "state is keyed by (e.g. 'camera_id'), or leave it unset with nb_tasks=1."
+                )
+            if node.nb_tasks > 1 and not node.partition_by:
+                raise ValueError(
+                    f'Node {node.name} keeps per-key state with nb_tasks={node.nb_tasks} '
+                    'but no partition_by. Set partition_by to the metadata field its state '
+                    "is keyed by (e.g. 'camera_id') or nb_tasks=1."
+                )
+
         #3. TODO: Check that all producers' results are
         #being read by a consumer.
 
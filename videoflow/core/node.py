@@ -3,19 +3,24 @@ from __future__ import absolute_import, division, print_function
 import inspect
 import logging
 import re
-from typing import Any, Callable, Dict, List, NoReturn, Optional, Set, TypeAlias, Union, cast
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, NoReturn, Optional, Set, Tuple, TypeAlias, Union, cast
 
 logger = logging.getLogger(__package__)
 
 from ..utils.graph import has_cycle, topological_sort
+from .cache import CACHE_MODES, DEFAULT_CACHE_MAX_BYTES
 from .constants import CPU, DEVICE_TYPES, GPU, LOGGING_LEVEL
 from .policies import JoinPolicy
+from .sampling import SamplerPolicy
 
 _SLUG_RE = re.compile(r'[^a-z0-9]+')
 
 #: What a node's ``join_policy=`` argument accepts: a policy object, the plain dict
 #: it serializes to (how it arrives when a worker reconstructs the node), or None.
 JoinPolicyArg : TypeAlias = Union[JoinPolicy, dict, None]
+#: Same convention for a producer's ``sampler=`` argument.
+SamplerArg : TypeAlias = Union[SamplerPolicy, dict, None]
 
 def _slugify(value : str) -> str:
     return _SLUG_RE.sub('-', value.lower()).strip('-')
@@ -266,11 +271,40 @@ class ProcessorNode(Node):
             a MIG profile (``nvidia.com/mig-1g.10gb``) or a renamed time-sliced \
             resource (``nvidia.com/gpu.shared``). None defers to the deploy-time \
             default (``--gpu-resource-name``, else ``nvidia.com/gpu``).
+        - workers_per_replica (int): size of a process pool *inside* each replica. \
+            With ``N > 1`` the replica keeps a single broker connection and fans \
+            assembled input groups out to ``N`` worker processes, each holding its \
+            own instance of this node rebuilt from ``get_params()`` (so ``open()`` \
+            runs once per pool process). Outputs are published in input order. \
+            Meant for CPU-bound nodes whose ``process()`` holds the GIL; ``process()`` \
+            must be a plain (non-async) method that does not take ``ctx``, since \
+            neither the event loop nor the messenger crosses into the pool.
+        - cache (str): ``'content'`` to memoize ``process()`` on the content of its \
+            decoded inputs plus this node's ``get_params()``: a repeated input is \
+            answered from the cache and published with its own group's trace id / \
+            seq. Only for deterministic, side-effect-free ``process()`` methods — a \
+            hit skips the call entirely, including any ``ctx`` calls it would make. \
+            None (the default) disables caching.
+        - cache_max_bytes (int): byte budget of the in-process LRU tier.
+        - cache_shared (bool): also consult/fill a cache shared by every replica and \
+            run of this node, kept in the flow's blob Redis (``VF_BLOB_REDIS_URL``). \
+            Ignored when the flow has no blob store.
         - name (str): see ``Node``.
+
+    A processor publishes what ``process()`` returns, one output per input. A \
+        subclass that sets ``emits = True`` publishes instead whatever it passes \
+        to ``emit()``: zero, one or many outputs per input, in order. ``flush()`` \
+        runs once after every parent has ended, so an accumulating node can emit \
+        its tail before end of stream is passed on.
     '''
+    emits : bool = False
+
     def __init__(self, nb_tasks : int = 1, device_type : str = CPU, name : Optional[str] = None,
                 partition_by : Optional[str] = None, join_policy : JoinPolicyArg = None,
-                gpu_count : int = 1, gpu_resource_name : Optional[str] = None, **kwargs : Any) -> None:
+                gpu_count : int = 1, gpu_resource_name : Optional[str] = None,
+                workers_per_replica : int = 1, cache : Optional[str] = None,
+                cache_max_bytes : int = DEFAULT_CACHE_MAX_BYTES, cache_shared : bool = False,
+                **kwargs : Any) -> None:
         self._nb_tasks = nb_tasks
         if device_type not in DEVICE_TYPES:
             raise ValueError('Device is not one of {}'.format(",".join(DEVICE_TYPES)))
@@ -283,12 +317,47 @@ class ProcessorNode(Node):
             raise ValueError(f'gpu_resource_name must be a non-empty string or None, '
                              f'got {gpu_resource_name!r}')
         self._gpu_resource_name = gpu_resource_name
+        if (not isinstance(workers_per_replica, int) or isinstance(workers_per_replica, bool)
+                or workers_per_replica < 1):
+            raise ValueError(f'workers_per_replica must be a positive integer, got {workers_per_replica!r}')
+        self._workers_per_replica = workers_per_replica
+        if cache is not None and cache not in CACHE_MODES:
+            raise ValueError(f'cache must be one of {CACHE_MODES} or None, got {cache!r}')
+        if not isinstance(cache_max_bytes, int) or cache_max_bytes < 0:
+            raise ValueError(f'cache_max_bytes must be a non-negative integer, got {cache_max_bytes!r}')
+        self._cache = cache
+        self._cache_max_bytes = cache_max_bytes
+        self._cache_shared = cache_shared
         self._partition_by = partition_by
         # Stored as a plain dict so get_params() stays JSON-serializable.
         if isinstance(join_policy, JoinPolicy):
             join_policy = join_policy.to_dict()
         self._join_policy = join_policy
+        self._emitted : List[Tuple[Any, Optional[float]]] = []
         super(ProcessorNode, self).__init__(name = name, **kwargs)
+        if workers_per_replica > 1:
+            self._check_poolable()
+        if self.emits and cache is not None:
+            raise ValueError(f'{self}: a node that emits() its outputs cannot use a result cache')
+
+    def _check_poolable(self) -> None:
+        '''
+        A pooled ``process()`` runs in another process, where there is no task \
+            event loop to await a coroutine on and no messenger behind a ``ctx``.
+        '''
+        if inspect.iscoroutinefunction(self.process):
+            raise ValueError(f'{self}: workers_per_replica > 1 requires a synchronous process(), '
+                            'but it is async')
+        if self.emits:
+            raise ValueError(f'{self}: workers_per_replica > 1 cannot be used with a node that '
+                            'emits() its outputs — emissions do not cross back from the pool')
+        try:
+            params = inspect.signature(self.process).parameters
+        except (TypeError, ValueError):
+            return
+        if 'ctx' in params or 'context' in params:
+            raise ValueError(f'{self}: workers_per_replica > 1 cannot be used with a process() '
+                            'that takes ctx — the runtime context does not cross into the pool')
 
     @property
     def nb_tasks(self) -> int:
@@ -314,6 +383,24 @@ class ProcessorNode(Node):
         '''Extended-resource name each replica requests, or None for the deploy default.'''
         return self._gpu_resource_name
 
+    @property
+    def cache(self) -> Optional[str]:
+        '''The result-cache mode (``'content'``) or None.'''
+        return self._cache
+
+    @property
+    def cache_max_bytes(self) -> int:
+        return self._cache_max_bytes
+
+    @property
+    def cache_shared(self) -> bool:
+        return self._cache_shared
+
+    @property
+    def workers_per_replica(self) -> int:
+        '''Size of the in-replica process pool (1 means ``process()`` runs in the worker itself).'''
+        return self._workers_per_replica
+
     @property
     def partition_by(self) -> Optional[str]:
         return self._partition_by
@@ -342,6 +429,33 @@ class ProcessorNode(Node):
         raise NotImplementedError('process function needs to be implemented\
                             by subclass')
 
+    def emit(self, output : Any, event_ts : Optional[float] = None) -> None:
+        '''
+        Queues ``output`` to be published after the current ``process()`` (or \
+            ``flush()``) call returns. Each emission of one input group gets its \
+            own deterministic message identity, so redelivery still deduplicates.
+
+        - Arguments:
+            - output: the message to publish.
+            - event_ts: the event time stamped on it, when it is not the input \
+                group's (e.g. the end of the window an aggregate covers).
+        '''
+        self._emitted.append((output, event_ts))
+
+    def take_emitted(self) -> List[Tuple[Any, Optional[float]]]:
+        '''Returns and clears the ``(output, event_ts)`` pairs queued by ``emit()``.'''
+        emitted, self._emitted = self._emitted, []
+        return emitted
+
+    def flush(self) -> None:
+        '''
+        Called once after every parent has ended, before this node's end of \
+            stream is published; outputs passed to ``emit()`` here are published \
+            first. Not called for ``workers_per_replica > 1``, whose node instances \
+            live in the pool. Default: no-op.
+        '''
+        pass
+
 class OneTaskProcessorNode(ProcessorNode):
     '''
     Used for processes that keep internal state so they are easily parallelizable.
@@ -353,8 +467,116 @@ class OneTaskProcessorNode(ProcessorNode):
         # reconstructing from get_params(), which captures it from the ProcessorNode
         # level of the MRO) so it doesn't collide with the positional 1 below.
         kwargs.pop('nb_tasks', None)
+        # Same reasoning for the pool: the state lives in one instance, so it can't
+        # be spread over several processes either.
+        if kwargs.get('workers_per_replica', 1) > 1:
+            raise ValueError(f'{type(self).__name__} keeps internal state and cannot use workers_per_replica > 1')
+        # ...and its output depends on history, not just on the current input.
+        if kwargs.get('cache') is not None:
+            raise ValueError(f'{type(self).__name__} keeps internal state and cannot use a result cache')
         super(OneTaskProcessorNode, self).__init__(1, device_type = device_type, name = name, **kwargs)
 
+class KeyedProcessorNode(ProcessorNode):
+    '''
+    Used for processes whose internal state is naturally per key: a tracker per \
+        camera, a count per zone. The state lives in a dict keyed by the message's \
+        partition key, so unlike ``OneTaskProcessorNode`` the node can be replicated \
+        with ``nb_tasks > 1`` under ``partition_by``: every message of one key is \
+        handled by the same replica, which holds that key's state and no other.
+
+    Subclasses implement ``initial_state()`` and a ``process(inp, ctx)`` that \
+        reads and writes the current key's state with ``get_state(ctx)`` / \
+        ``set_state(ctx, value)``. The key is ``ctx.key``; with no ``ctx`` (or no \
+        ``partition_by``) all input shares the state of key ``None``.
+
+    State is bounded: a key that is done (a camera that went away) is dropped \
+        with ``set_state(ctx, None)``, and past ``max_keys`` the least recently \
+        used key is evicted, after being passed to ``on_evict(key, state)`` so a \
+        subclass can publish what it was holding. Either way the key starts over \
+        from ``initial_state()`` if it is seen again.
+
+    - Arguments:
+        - max_keys: keys held at most, or None for no bound.
+
+    - Raises:
+        - ``ValueError`` if ``workers_per_replica > 1``, a result cache is set, or \
+            ``max_keys`` is not a positive int. The graph engine also rejects a \
+            per-message ``partition_by`` such as ``'trace_id'`` (every event would \
+            get a state of its own), and ``nb_tasks > 1`` without a ``partition_by``.
+    '''
+    def __init__(self, nb_tasks : int = 1, device_type : str = CPU, name : Optional[str] = None,
+                max_keys : Optional[int] = 10000, **kwargs : Any) -> None:
+        if kwargs.get('workers_per_replica', 1) > 1:
+            raise ValueError(f'{type(self).__name__} keeps internal state and cannot use workers_per_replica > 1')
+        if kwargs.get('cache') is not None:
+            raise ValueError(f'{type(self).__name__} keeps internal state and cannot use a result cache')
+        if max_keys is not None and (not isinstance(max_keys, int) or max_keys < 1):
+            raise ValueError(f'max_keys must be a positive int or None, got {max_keys!r}')
+        self._max_keys = max_keys
+        # Least recently used first.
+        self._states : OrderedDict[Any, Any] = OrderedDict()
+        self._nb_evicted = 0
+        super(KeyedProcessorNode, self).__init__(nb_tasks, device_type = device_type, name = name, **kwargs)
+
+    def initial_state(self) -> Any:
+        '''
+        Method definition that needs to be implemented by subclasses.
+
+        - Returns:
+            - the state of a key seen for the first time.
+        '''
+        raise NotImplementedError('initial_state function needs to be implemented\
+                            by subclass')
+
+    def get_state(self, ctx : Any = None) -> Any:
+        '''
+        - Returns:
+            - the state of the current message's key, created with \
+                ``initial_state()`` on first use.
+        '''
+        key = getattr(ctx, 'key', None)
+        if key in self._states:
+            self._states.move_to_end(key)
+        else:
+            self._put_state(key, self.initial_state())
+        return self._states[key]
+
+    def set_state(self, ctx : Any, value : Any) -> None:
+        '''Replaces the state of the current message's key; ``None`` drops the key.'''
+        key = getattr(ctx, 'key', None)
+        self._states.pop(key, None)
+        if value is not None:
+            self._put_state(key, value)
+
+    def _put_state(self, key : Any, value : Any) -> None:
+        self._states[key] = value
+        if self._max_keys is not None and len(self._states) > self._max_keys:
+            evicted_key, evicted = self._states.popitem(last = False)
+            if not self._nb_evicted:
+                logger.warning(f'{self.name}: more than max_keys={self._max_keys} keys, evicting '
+                                'the least recently used key states')
+            self._nb_evicted += 1
+            self.on_evict(evicted_key, evicted)
+
+    def on_evict(self, key : Any, state : Any) -> None:
+        '''
+        Called with the state of a key evicted for going over ``max_keys``, from \
+            within the ``process()`` call that needed the room, so it may ``emit()``. \
+            Not called for a key dropped with ``set_state(ctx, None)``. Does nothing \
+            by default.
+        '''
+        pass
+
+    @property
+    def keys(self) -> List[Any]:
+        '''The keys this instance holds state for, least recently used first.'''
+        return list(self._states)
+
+    @property
+    def nb_evicted(self) -> int:
+        '''Key states evicted so far for going over ``max_keys``.'''
+        return self._nb_evicted
+
 class TaskModuleNode(ProcessorNode):
     '''
     Processor node that wraps a graph of processor nodes. This has the effect
@@ -383,6 +605,9 @@ class TaskModuleNode(ProcessorNode):
     def __init__(self, entry_node : ProcessorNode, exit_node: ProcessorNode, nb_tasks : int = 1,
                 name : Optional[str] = None, **kwargs : Any) -> None:
         super(TaskModuleNode, self).__init__(nb_tasks = nb_tasks, device_type = CPU, name = name, **kwargs)
+        if self._workers_per_replica > 1:
+            # Pool processes rebuild the node from get_params(), which this class can't provide.
+            raise ValueError('TaskModuleNode does not support workers_per_replica > 1')
         self._entry_node = entry_node
         self._exit_node = exit_node
 
@@ -424,6 +649,8 @@ class TaskModuleNode(ProcessorNode):
             raise ValueError('TaskModuleNode type of nodes cannot be nested.')
         if any(isinstance(p, OneTaskProcessorNode) for p in self._tsort) and nb_tasks > 1:
             raise ValueError('Cannot have nb_tasks > 1 if one of the processor nodes is derived from OneTaskProcessorNode')
+        if any(p.emits for p in self._tsort):
+            raise ValueError('Nodes that emit() their outputs cannot be part of a TaskModuleNode')
         if any(p.device_type == GPU for p in self._tsort):
             raise ValueError('Cannot have nodes with device type GPU as part of the sequence')
         if len(self._tsort) < 1:
@@ -552,16 +779,41 @@ class ProducerNode(Node):
             RTSP stream) and only stop when told to. The Kubernetes execution engine \
             uses this to decide whether to deploy the producer as a ``Job`` (finite) or \
             a ``Deployment`` (infinite).
+        - sampler (SamplerPolicy | dict): if set, the producer adapts its emit rate \
+            to how far behind its children are (see ``videoflow.core.sampling``): \
+            items over the current rate are skipped *before* being produced, \
+            encoded or published, and the kept ones are evenly spaced in time.
         - name (str): see ``Node``.
     '''
-    def __init__(self, is_finite : bool = True, name : Optional[str] = None, **kwargs : Any) -> None:
+    def __init__(self, is_finite : bool = True, name : Optional[str] = None,
+                sampler : SamplerArg = None, **kwargs : Any) -> None:
         self._is_finite = is_finite
+        # Stored as a plain dict so get_params() stays JSON-serializable.
+        if isinstance(sampler, SamplerPolicy):
+            sampler = sampler.to_dict()
+        self._sampler = sampler
         super(ProducerNode, self).__init__(name = name, **kwargs)
 
     @property
     def is_finite(self) -> bool:
         return self._is_finite
 
+    @property
+    def sampler(self) -> Optional[SamplerPolicy]:
+        '''Returns the ``SamplerPolicy`` object (or None), reconstructed from the stored dict.'''
+        return SamplerPolicy.from_dict(self._sampler)
+
+    def skip(self) -> None:
+        '''
+        Advances past the next element without producing it — called instead of \
+            ``next()`` when the sampler drops an item. Default: calls ``next()`` and \
+            discards the result; override when the source has a cheaper way to \
+            skip (e.g. advancing a video without decoding the frame).
+
+        Raises ``StopIteration`` exactly where ``next()`` would.
+        '''
+        self.next()
+
     def next(self) -> Any:
         '''
         Returns next produced element.
@@ -0,0 +1,234 @@
+'''
+In-replica process pool for CPU-bound processors (``ProcessorNode(workers_per_replica=N)``).
+
+Scaling a node with ``nb_tasks`` gives each replica its own broker connection,
+durables, model load and interpreter. A pool instead keeps *one* messenger per
+replica and spreads ``process()`` over ``N`` worker processes, each holding its
+own copy of the node rebuilt the same way a worker rebuilds it: from the class
+path and ``get_params()``. ``open()`` runs once per pool process, ``close()`` at
+shutdown.
+
+NumPy arrays cross the process boundary through ``multiprocessing.shared_memory``
+rather than the pool's pipe: the parent copies an input array into a block once
+and the child reads it in place; a result array travels back the same way. Small
+arrays and everything else go through the normal pickle channel of the executor
+— that channel is process-local and never touches the wire (RFC 0001 is about
+broker payloads).
+
+Sub-interpreters are not used: NumPy and OpenCV do not support being imported
+into more than one interpreter per process, and those are the nodes this exists
+for.
+'''
+from __future__ import absolute_import, division, print_function
+
+import importlib
+import logging
+import multiprocessing
+import multiprocessing.util
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .node import ProcessorNode
+
+logger = logging.getLogger(__package__)
+
+#: Arrays smaller than this are pickled with the call; copying them into a shared
+#: memory block costs more than it saves.
+SHARED_MEMORY_MIN_BYTES = 64 * 1024
+
+class _SharedArray:
+    '''Picklable pointer to an ndarray stored in a named shared memory block.'''
+    __slots__ = ('name', 'shape', 'dtype')
+
+    def __init__(self, name : str, shape : tuple, dtype : str) -> None:
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+    def __getstate__(self) -> tuple:
+        return (self.name, self.shape, self.dtype)
+
+    def __setstate__(self, state : tuple) -> None:
+        self.name, self.shape, self.dtype = state
+
+def _to_shared(arr : np.ndarray, blocks : List[shared_memory.SharedMemory]) -> _SharedArray:
+    shm = shared_memory.SharedMemory(create = True, size = max(1, arr.nbytes))
+    view : np.ndarray = np.ndarray(arr.shape, dtype = arr.dtype, buffer = shm.buf)
+    np.copyto(view, arr, casting = 'no')
+    del view
+    blocks.append(shm)
+    return _SharedArray(shm.name, arr.shape, arr.dtype.str)
+
+def _pack(obj : Any, blocks : List[shared_memory.SharedMemory]) -> Any:
+    '''Replaces every large ndarray in ``obj`` (recursing into list/tuple/dict) with a ``_SharedArray``.'''
+    if isinstance(obj, np.ndarray):
+        if obj.nbytes >= SHARED_MEMORY_MIN_BYTES and not obj.dtype.hasobject:
+            return _to_shared(obj, blocks)
+        return obj
+    if isinstance(obj, tuple):
+        return tuple(_pack(o, blocks) for o in obj)
+    if isinstance(obj, list):
+        return [_pack(o, blocks) for o in obj]
+    if isinstance(obj, dict):
+        return {k: _pack(v, blocks) for k, v in obj.items()}
+    return obj
+
+def _unpack(obj : Any, blocks : List[shared_memory.SharedMemory], copy : bool) -> Any:
+    '''
+    Inverse of ``_pack``. With ``copy=False`` the arrays are views over the blocks
+    (valid only while ``blocks`` stay open); with ``copy=True`` they are owned copies.
+    '''
+    if isinstance(obj, _SharedArray):
+        shm = shared_memory.SharedMemory(name = obj.name)
+        blocks.append(shm)
+        arr : np.ndarray = np.ndarray(obj.shape, dtype = np.dtype(obj.dtype), buffer = shm.buf)
+        return arr.copy() if copy else arr
+    if isinstance(obj, tuple):
+        return tuple(_unpack(o, blocks, copy) for o in obj)
+    if isinstance(obj, list):
+        return [_unpack(o, blocks, copy) for o in obj]
+    if isinstance(obj, dict):
+        return {k: _unpack(v, blocks, copy) for k, v in obj.items()}
+    return obj
+
+def _release(blocks : List[shared_memory.SharedMemory], unlink : bool) -> None:
+    for shm in blocks:
+        try:
+            shm.close()
+        except BufferError:
+            # A view over the block escaped (e.g. a result aliasing an input);
+            # the mapping is reclaimed when that view is garbage collected.
+            logger.debug(f'shared memory block {shm.name} still referenced at close')
+        if unlink:
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+    blocks.clear()
+
+def _detach(obj : Any, inputs : List[np.ndarray]) -> Any:
+    '''Copies any result array that aliases an input block, so it outlives that block.'''
+    if isinstance(obj, np.ndarray):
+        if any(np.may_share_memory(obj, i) for i in inputs):
+            return obj.copy()
+        return obj
+    if isinstance(obj, tuple):
+        return tuple(_detach(o, inputs) for o in obj)
+    if isinstance(obj, list):
+        return [_detach(o, inputs) for o in obj]
+    if isinstance(obj, dict):
+        return {k: _detach(v, inputs) for k, v in obj.items()}
+    return obj
+
+# -- pool-process side ---------------------------------------------------
+
+# The node instance owned by this pool process (set by _init_pool_process).
+_pool_node : Optional[ProcessorNode] = None
+
+def _init_pool_process(fq_class : str, params : Dict[str, Any], name : str) -> None:
+    global _pool_node
+    module_path, class_name = fq_class.rsplit('.', 1)
+    node_class = getattr(importlib.import_module(module_path), class_name)
+    # Rebuilt as a single-process node: a pool process never starts a pool of its own.
+    node = node_class(**dict(params, workers_per_replica = 1))
+    node._name = name
+    node.open()
+    _pool_node = node
+    # Pool processes leave through multiprocessing's own exit path (not atexit),
+    # which runs registered finalizers: that is where the node gets closed.
+    multiprocessing.util.Finalize(None, _close_pool_process, exitpriority = 10)
+
+def _close_pool_process() -> None:
+    global _pool_node
+    node, _pool_node = _pool_node, None
+    if node is not None:
+        node.close()
+
+def _block_bytes(shm : shared_memory.SharedMemory) -> np.ndarray:
+    buf = shm.buf
+    assert buf is not None, f'shared memory block {shm.name} is already closed'
+    return np.frombuffer(buf, dtype = np.uint8)
+
+def _process_in_pool(packed_inputs : tuple) -> Any:
+    assert _pool_node is not None, 'pool process was not initialized'
+    in_blocks : List[shared_memory.SharedMemory] = []
+    out_blocks : List[shared_memory.SharedMemory] = []
+    try:
+        inputs = _unpack(packed_inputs, in_blocks, copy = False)
+        output = _pool_node.process(*inputs)
+        del inputs
+        if in_blocks:
+            spans = [_block_bytes(shm) for shm in in_blocks]
+            output = _detach(output, spans)
+            del spans
+        packed = _pack(output, out_blocks)
+        del output
+        return packed
+    finally:
+        _release(in_blocks, unlink = False)
+        # The parent attaches by name and unlinks after reading; only our mapping goes.
+        _release(out_blocks, unlink = False)
+
+# -- replica side ----------------------------------------------------------
+
+class ProcessPool:
+    '''
+    A pool of ``node.workers_per_replica`` processes, each running its own copy of
+    ``node``. ``submit()`` returns a future per input group; the caller is in charge
+    of consuming futures in submission order (see ``ProcessorTask``).
+
+    Uses the ``spawn`` start method: the worker process holds a live broker
+    connection and an I/O thread, neither of which survives ``fork``.
+
+    - Arguments:
+        - node: the processor to run; must be reconstructable from ``get_params()``.
+    '''
+    def __init__(self, node : ProcessorNode) -> None:
+        self._node = node
+        self._size = node.workers_per_replica
+        fq_class = f'{type(node).__module__}.{type(node).__name__}'
+        self._executor = ProcessPoolExecutor(
+            max_workers = self._size,
+            mp_context = multiprocessing.get_context('spawn'),
+            initializer = _init_pool_process,
+            initargs = (fq_class, node.get_params(), node.name),
+        )
+        # Input blocks per outstanding future, unlinked once the child is done with them.
+        self._in_blocks : Dict[Future, List[shared_memory.SharedMemory]] = {}
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def submit(self, *inputs : Any) -> Future:
+        blocks : List[shared_memory.SharedMemory] = []
+        try:
+            packed = _pack(tuple(inputs), blocks)
+            fut = self._executor.submit(_process_in_pool, packed)
+        except BaseException:
+            _release(blocks, unlink = True)
+            raise
+        self._in_blocks[fut] = blocks
+        return fut
+
+    def result(self, fut : Future) -> Any:
+        '''Blocks for ``fut`` and returns its output as an owned object, releasing every shared block it used.'''
+        try:
+            packed = fut.result()
+        finally:
+            _release(self._in_blocks.pop(fut, []), unlink = True)
+        out_blocks : List[shared_memory.SharedMemory] = []
+        try:
+            return _unpack(packed, out_blocks, copy = True)
+        finally:
+            _release(out_blocks, unlink = True)
+
+    def shutdown(self) -> None:
+        '''Stops the pool; each pool process runs its node's ``close()`` on the way out.'''
+        self._executor.shutdown(wait = True)
+        for blocks in self._in_blocks.values():
+            _release(blocks, unlink = True)
+        self._in_blocks.clear()
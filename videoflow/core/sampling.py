@@ -0,0 +1,158 @@
+'''
+Adaptive source sampling: a producer that lowers its own emit rate when its
+children fall behind.
+
+In a REALTIME flow a slow stage loses frames anyway — the stream keeps one message
+and evicts the rest — but only *after* the producer has decoded, encoded and
+published them, and the survivors are whichever happened to be in the stream when
+the consumer fetched (bunched, not spaced). Sampling at the source instead drops
+frames before any of that work, and spaces the kept ones evenly in time.
+
+A ``SamplerPolicy`` is attached to a ``ProducerNode`` and travels with it as a
+plain dict (like ``JoinPolicy``). ``AdaptiveSampler`` is the controller the
+``ProducerTask`` runs from it: additive-increase / multiplicative-decrease on the
+emit rate, driven by the children's backlog on this node's output stream
+(``Messenger.output_backlog``), clamped to ``[min_fps, max_fps]``.
+'''
+from __future__ import absolute_import, division, print_function
+
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+class SamplerPolicy:
+    '''
+    - Arguments:
+        - min_fps: floor on the emit rate, however far behind the children are.
+        - max_fps: ceiling on the emit rate. ``None`` means the source's own rate: \
+            when the children keep up, every item is emitted.
+        - target_backlog: the children's backlog (messages delivered-but-unacked \
+            plus not-yet-delivered, for the slowest child) above which the rate is \
+            cut. At or below it, the rate recovers.
+        - decrease_factor: multiplicative cut applied when over target (0 < f < 1).
+        - increase_fps: additive recovery per poll when at or under target.
+        - poll_seconds: how often the backlog is read (one broker round trip).
+    '''
+    def __init__(self, min_fps : float = 1.0, max_fps : Optional[float] = None,
+                target_backlog : int = 2, decrease_factor : float = 0.5,
+                increase_fps : float = 1.0, poll_seconds : float = 0.5) -> None:
+        if not min_fps or min_fps <= 0:
+            raise ValueError(f'min_fps must be positive, got {min_fps!r}')
+        if max_fps is not None and max_fps < min_fps:
+            raise ValueError(f'max_fps ({max_fps}) must be >= min_fps ({min_fps})')
+        if not 0 < decrease_factor < 1:
+            raise ValueError(f'decrease_factor must be in (0, 1), got {decrease_factor!r}')
+        if increase_fps <= 0:
+            raise ValueError(f'increase_fps must be positive, got {increase_fps!r}')
+        if target_backlog < 0:
+            raise ValueError(f'target_backlog must be >= 0, got {target_backlog!r}')
+        if poll_seconds <= 0:
+            raise ValueError(f'poll_seconds must be positive, got {poll_seconds!r}')
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.target_backlog = target_backlog
+        self.decrease_factor = decrease_factor
+        self.increase_fps = increase_fps
+        self.poll_seconds = poll_seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'min_fps': self.min_fps,
+            'max_fps': self.max_fps,
+            'target_backlog': self.target_backlog,
+            'decrease_factor': self.decrease_factor,
+            'increase_fps': self.increase_fps,
+            'poll_seconds': self.poll_seconds,
+        }
+
+    @classmethod
+    def from_dict(cls, d : Optional[Dict[str, Any]]) -> Optional["SamplerPolicy"]:
+        if d is None:
+            return None
+        return cls(
+            min_fps = d.get('min_fps', 1.0),
+            max_fps = d.get('max_fps'),
+            target_backlog = d.get('target_backlog', 2),
+            decrease_factor = d.get('decrease_factor', 0.5),
+            increase_fps = d.get('increase_fps', 1.0),
+            poll_seconds = d.get('poll_seconds', 0.5),
+        )
+
+class AdaptiveSampler:
+    '''
+    Decides, before each ``next()``, whether the item about to be produced is \
+        emitted or skipped.
+
+    Spacing: emission slots are ``1/rate`` apart on the clock, and an item is \
+        admitted when a slot has come due. Slots advance by exactly one period (not \
+        "now + period"), so over time the emitted rate matches ``rate`` even when \
+        the source's own frame grid doesn't divide it; a slot that falls more than \
+        a period behind is resynchronized instead of releasing a burst.
+
+    - Arguments:
+        - policy: the ``SamplerPolicy``.
+        - backlog: callable returning the children's current backlog, or None \
+            when unknown (then the rate is left alone).
+        - clock: monotonic time source, injectable for tests.
+    '''
+    def __init__(self, policy : SamplerPolicy, backlog : Callable[[], Optional[int]],
+                clock : Callable[[], float] = time.monotonic) -> None:
+        self._policy = policy
+        self._backlog = backlog
+        self._clock = clock
+        # None means unthrottled (max_fps=None and the children are keeping up).
+        self._rate : Optional[float] = policy.max_fps
+        self._next_slot : Optional[float] = None
+        self._next_poll = clock()
+        # EWMA of the source's own inter-item interval, the starting point of the
+        # first cut when there is no max_fps to cut from.
+        self._last_seen : Optional[float] = None
+        self._source_interval : Optional[float] = None
+
+    @property
+    def rate(self) -> Optional[float]:
+        '''Current emit-rate ceiling in items/second (None: unthrottled).'''
+        return self._rate
+
+    def _source_fps(self) -> float:
+        if not self._source_interval:
+            return self._policy.max_fps or self._policy.min_fps
+        return 1.0 / self._source_interval
+
+    def _adjust(self, backlog : int) -> None:
+        p = self._policy
+        if backlog > p.target_backlog:
+            base = self._rate if self._rate is not None else self._source_fps()
+            self._rate = max(p.min_fps, base * p.decrease_factor)
+        elif self._rate is not None:
+            rate = self._rate + p.increase_fps
+            if p.max_fps is not None:
+                self._rate = min(p.max_fps, rate)
+            else:
+                # Back at the source's own rate: stop gating altogether.
+                self._rate = None if rate >= self._source_fps() else rate
+
+    def admit(self) -> bool:
+        now = self._clock()
+        if self._last_seen is not None:
+            dt = now - self._last_seen
+            self._source_interval = dt if self._source_interval is None else \
+                0.8 * self._source_interval + 0.2 * dt
+        self._last_seen = now
+
+        if now >= self._next_poll:
+            self._next_poll = now + self._policy.poll_seconds
+            backlog = self._backlog()
+            if backlog is not None:
+                self._adjust(backlog)
+
+        if self._rate is None:
+            self._next_slot = None
+            return True
+        period = 1.0 / self._rate
+        if self._next_slot is None or self._next_slot < now - period:
+            self._next_slot = now
+        if now >= self._next_slot:
+            self._next_slot += period
+            return True
+        return False
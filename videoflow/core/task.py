@@ -4,21 +4,31 @@ import asyncio
 import inspect
 import logging
 import time
-from typing import TYPE_CHECKING, Any, Callable, List, Optional
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, List, Optional, Tuple
 
 from ..utils.generic_utils import DelayedKeyboardInterrupt
+from .cache import ResultCache, SharedResultCache, content_key, make_result_cache
 from .context import RuntimeContext
 from .engine import Messenger
 from .node import ConsumerNode, Node, ProcessorNode, ProducerNode
+from .sampling import AdaptiveSampler
 
 if TYPE_CHECKING:
     # Type-only: the store is constructed in the worker (videoflow.runtime) and
     # handed down to the task, so a real import here would invert the
     # core <- runtime dependency direction for nothing but an annotation.
     from ..runtime.idempotency import IdempotencyStore
+    from .parallel import ProcessPool
 
 logger = logging.getLogger(__package__)
 
+# How long a pooled task waits for input while results are in flight, before it
+# checks them again: the most a finished result waits to be published.
+_POOL_POLL_SECONDS = 0.05
+
 class Task:
     def run(self) -> None:
         '''
@@ -116,13 +126,25 @@ class ProducerTask(NodeTask):
         self._producer = producer
         super(ProducerTask, self).__init__(producer, messenger, has_children, ctx)
 
+    def _make_sampler(self) -> Optional[AdaptiveSampler]:
+        '''The producer's adaptive sampler, if it declared one and anything consumes its output.'''
+        policy = self._producer.sampler
+        if policy is None or not self._has_children:
+            return None
+        return AdaptiveSampler(policy, self._messenger.output_backlog)
+
     def _run(self) -> None:
         previous_end_t = time.time()
+        sampler = self._make_sampler()
         while True:
             try:
                 with DelayedKeyboardInterrupt():
                     if self._messenger.check_for_termination():
                         break
+                    if sampler is not None and not sampler.admit():
+                        # Dropped at the source: never produced, encoded or published.
+                        self._call(self._producer.skip)
+                        continue
                     start_t = time.time()
                     a = self._call(self._producer.next)
                     end_t = time.time()
@@ -150,11 +172,13 @@ class ProcessorTask(NodeTask):
     It runs forever, first blocking until it receives a message from every parent \
     node through the messenger. Then it passes the merged inputs to the processor \
     node and, when it gets back the output, uses the messenger to publish it down \
-    the flow. If every parent has signaled termination, it passes termination \
-    message down the flow and breaks from infinite loop.
+    the flow (or, for a node that ``emits``, publishes whatever it emitted). If \
+    every parent has signaled termination, it runs the node's ``flush()``, passes \
+    termination message down the flow and breaks from infinite loop.
     '''
     def __init__(self, processor : ProcessorNode, messenger : Messenger, has_children : bool,
-                parent_names : List[str], ctx : Optional[RuntimeContext] = None) -> None:
+                parent_names : List[str], ctx : Optional[RuntimeContext] = None,
+                shared_cache : Optional[SharedResultCache] = None) -> None:
         '''
         - Arguments:
             - parent_names ([str]): names of this node's real parents, in the exact \
@@ -163,11 +187,38 @@ class ProcessorTask(NodeTask):
                 worker process only reconstructs the one node it's responsible for \
                 (via ``get_params()``) — it never has the live parent ``Node`` \
                 objects the way the single-process local graph-building step does.
+            - shared_cache: the shared result-cache tier, used when the node was \
+                built with ``cache='content', cache_shared=True``.
         '''
         self._processor = processor
         self._parent_names = list(parent_names)
+        # Result cache (ProcessorNode(cache='content')). Nothing to publish, nothing to cache.
+        made = make_result_cache(processor, shared_cache) if has_children else None
+        self._cache_fp : Optional[str] = made[0] if made else None
+        self._cache : Optional[ResultCache] = made[1] if made else None
         super(ProcessorTask, self).__init__(processor, messenger, has_children, ctx)
 
+    def _cache_lookup(self, inputs : List[Any]) -> Tuple[Optional[str], bool, Any]:
+        '''``(key, hit, value)``; key is None when caching is off or the inputs are not hashable.'''
+        if self._cache is None or self._cache_fp is None:
+            return None, False, None
+        key = content_key(self._cache_fp, inputs)
+        if key is None:
+            return None, False, None
+        hit, value = self._cache.get(key)
+        return key, hit, value
+
+    def _output_metadata(self, proc_time : float, actual_proc_time : float, hit : bool) -> Dict[str, Any]:
+        '''
+        The metadata published with an output. Whether it was a cache hit is \
+            told to the messenger (for metrics) rather than sent on the wire.
+        '''
+        self._messenger.set_output_cache_hit(hit if self._cache is not None else None)
+        return {
+            'proctime': proc_time,
+            'actual_proctime': actual_proc_time
+        }
+
     @property
     def device_type(self) -> str:
         return self._processor.device_type
@@ -175,6 +226,134 @@ class ProcessorTask(NodeTask):
     def change_device(self, device_type : str) -> None:
         self._processor.change_device(device_type)
 
+    def run(self) -> None:
+        '''
+        With ``workers_per_replica > 1`` the node's ``open()``/``process()``/``close()`` \
+            run only inside the pool processes (see ``videoflow.core.parallel``); \
+            this process just moves messages, so it never loads the node's resources.
+        '''
+        if self._processor.workers_per_replica == 1:
+            super(ProcessorTask, self).run()
+            return
+        # Deferred: the pool pulls in multiprocessing/shared_memory, which a plain
+        # single-process worker never needs.
+        from .parallel import ProcessPool
+        self._assert_messenger()
+        pool = ProcessPool(self._processor)
+        try:
+            self._run_pooled(pool)
+        finally:
+            pool.shutdown()
+
+    def _run_pooled(self, pool : "ProcessPool") -> None:
+        '''
+        Keeps up to ``pool.size`` input groups in flight, polling for input while \
+            any is, so a finished result is published within ``_POOL_POLL_SECONDS`` \
+            even when no further input arrives. Each submitted group's \
+            lineage and acks are detached from the messenger (``checkpoint_inputs``) \
+            and restored when its result is taken off the head of the window, so \
+            outputs are published, and inputs acked, strictly in receive order.
+        '''
+        window : Deque[Tuple[Future, Any, float, Optional[str], bool]] = deque()
+        previous_end_t = time.time()
+        while True:
+            try:
+                with DelayedKeyboardInterrupt():
+                    while window and (len(window) >= pool.size or window[0][0].done()):
+                        previous_end_t = self._finish_pooled(pool, window.popleft(), previous_end_t)
+                    if window:
+                        # Results in flight: don't block on a quiet input, come back
+                        # to publish (and ack) each one as soon as it is done.
+                        polled = self._messenger.poll_message(_POOL_POLL_SECONDS)
+                        if polled is None:
+                            continue
+                        inputs_d = polled
+                    else:
+                        inputs_d = self._messenger.receive_message()
+                    entries = [inputs_d[name] for name in self._parent_names]
+                    if any(e['is_stop_signal'] for e in entries):
+                        while window:
+                            previous_end_t = self._finish_pooled(pool, window.popleft(), previous_end_t)
+                        if self._has_children:
+                            self._messenger.publish_stop_signal()
+                        break
+                    inputs = [e['message'] for e in entries]
+                    try:
+                        key, hit, cached = self._cache_lookup(inputs)
+                        if hit:
+                            # Still queued behind in-flight groups, so order holds.
+                            fut : Future[Any] = Future()
+                            fut.set_result(cached)
+                        else:
+                            fut = pool.submit(*inputs)
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        logger.exception(f'{self._processor} failed to submit a message: {e}')
+                        self._messenger.fail_inputs(e)
+                        continue
+                    window.append((fut, self._messenger.checkpoint_inputs(), time.time(), key, hit))
+            except KeyboardInterrupt:
+                continue
+
+    def _finish_pooled(self, pool : "ProcessPool", item : Tuple[Future, Any, float, Optional[str], bool],
+                    previous_end_t : float) -> float:
+        '''
+        Publishes (and acks) one pooled result, or fails its inputs. ``proctime`` \
+            is measured from submission, so it includes time queued in the pool.
+        '''
+        fut, token, submit_t, key, hit = item
+        self._messenger.restore_inputs(token)
+        end_t = previous_end_t
+        try:
+            output = pool.result(fut)
+            if key is not None and not hit and self._cache is not None:
+                self._cache.put(key, output)
+            end_t = time.time()
+            if self._has_children:
+                self._messenger.publish_message(
+                    output, self._output_metadata(end_t - submit_t, end_t - previous_end_t, hit))
+            self._messenger.ack_inputs()
+        except Exception as e:
+            logger.exception(f'{self._processor} failed to process a message: {e}')
+            self._messenger.fail_inputs(e)
+            if isinstance(e, BrokenProcessPool):
+                # A pool process died (e.g. OOM-killed): every later submission would
+                # fail too, so stop the worker and let the un-acked groups redeliver.
+                raise
+        return end_t
+
+    def _publish_outputs(self, output : Any, metadata : Dict[str, Any], flush : bool = False) -> None:
+        '''
+        Publishes ``process()``'s return value (unless the node ``emits``) and then \
+            everything it passed to ``emit()``, numbering each emission so that \
+            every one derives its own message identity.
+        '''
+        outputs = self._processor.take_emitted()
+        if not self._processor.emits and not flush:
+            outputs.insert(0, (output, None))
+        for index, (out, event_ts) in enumerate(outputs):
+            self._messenger.set_output_emission(index, flush)
+            if event_ts is not None:
+                self._messenger.set_output_event_timestamp(event_ts)
+            self._messenger.publish_message(out, metadata)
+
+    def _flush(self) -> None:
+        '''Runs the node's ``flush()`` and publishes what it emits, at end of stream.'''
+        start_t = time.time()
+        try:
+            self._call(self._processor.flush)
+        except Exception as e:
+            logger.exception(f'{self._processor} failed to flush: {e}')
+            self._processor.take_emitted()
+            return
+        if not self._has_children:
+            self._processor.take_emitted()
+            return
+        proc_time = time.time() - start_t
+        self._messenger.set_output_cache_hit(None)
+        self._publish_outputs(None, {'proctime': proc_time, 'actual_proctime': proc_time}, flush = True)
+
     def _run(self) -> None:
         previous_end_t = time.time()
         while True:
@@ -186,6 +365,7 @@ class ProcessorTask(NodeTask):
                     # order (the messenger may assemble the join in arrival order).
                     entries = [inputs_d[name] for name in self._parent_names]
                     if any(e['is_stop_signal'] for e in entries):
+                        self._flush()
                         if self._has_children:
                             self._messenger.publish_stop_signal()
                         break
@@ -198,23 +378,26 @@ class ProcessorTask(NodeTask):
                         inputs = [e['message'] for e in entries]
                         if self._has_children:
                             start_2_t = time.time()
-                            output = self._call(self._processor.process, *inputs)
+                            key, hit, output = self._cache_lookup(inputs)
+                            if not hit:
+                                output = self._call(self._processor.process, *inputs)
+                                if key is not None and self._cache is not None:
+                                    self._cache.put(key, output)
                             end_t = time.time()
                             proc_time = end_t - start_2_t
                             actual_proc_time = end_t - previous_end_t
                             previous_end_t = end_t
-                            self._messenger.publish_message(
-                                output,
-                                {
-                                    'proctime': proc_time,
-                                    'actual_proctime': actual_proc_time
-                                }
-                            )
+                            self._publish_outputs(
+                                output, self._output_metadata(proc_time, actual_proc_time, hit))
                         else:
                             self._call(self._processor.process, *inputs)
+                            self._processor.take_emitted()
                         self._messenger.ack_inputs()
                     except Exception as e:
                         logger.exception(f'{self._processor} failed to process a message: {e}')
+                        # Whatever process() emitted before raising belongs to the
+                        # failed inputs, not to the next group.
+                        self._processor.take_emitted()
                         self._messenger.fail_inputs(e)
             except KeyboardInterrupt:
                 continue
@@ -25,9 +25,12 @@ from __future__ import absolute_import, division, print_function
 
 import argparse
 import asyncio
+import json
 import os
 import subprocess
 import sys
+import threading
+import time
 import uuid
 from typing import Any
 
@@ -520,6 +523,34 @@ def _needs_local_build(flow : Flow) -> bool:
     specs = specs_from_tasks_data(flow.tasks_data())
     return any(needs_container_image(s) and not s.image for s in specs)
 
+class _Dashboard:
+    '''
+    Redraws the engine's per-node table every ``interval`` seconds on a daemon \
+        thread, clearing the screen like ``videoflow top`` does.
+    '''
+    def __init__(self, engine : Any, interval : float) -> None:
+        self._engine = engine
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target = self._run, name = 'vf-dashboard', daemon = True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            try:
+                table = self._engine.flow_table()
+            except Exception:
+                continue
+            print('\033[H\033[J', end = '')     # clear screen, like top(1)
+            print(f'{time.strftime("%H:%M:%S")}  per-node metrics (process times in seconds)')
+            print(table, flush = True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout = self._interval + 1)
+
 def _cmd_run_local(args : argparse.Namespace) -> None:
     graph_path = args.graph.rsplit(':', 1)[0] if ':' in args.graph else args.graph
     if not os.path.isfile(graph_path):
@@ -587,7 +618,10 @@ def _cmd_run_local(args : argparse.Namespace) -> None:
     engine = LocalProcessEngine(nats_url = nats_url, blob_redis_url = blob_redis_url,
                                 local_docker_nats_url = args.local_docker_nats_url,
                                 default_image = image,
-                                blob_ttl_seconds = args.blob_ttl_seconds)
+                                blob_ttl_seconds = args.blob_ttl_seconds,
+                                metrics_port = args.metrics_port,
+                                collect_metrics = args.dashboard or args.metrics_json is not None)
+    dashboard = None
     try:
         try:
             flow.run(engine, run_id = args.run_id)
@@ -597,12 +631,21 @@ def _cmd_run_local(args : argparse.Namespace) -> None:
             raise SystemExit(str(e)) from e
         print(f'Flow {flow.flow_id} run {flow.run_id} running locally against {nats_url}. '
               f'Ctrl-C to stop.')
+        if args.metrics_port is not None:
+            last = args.metrics_port + len(engine.metrics_endpoints()) - 1
+            print(f'Worker metrics on localhost:{args.metrics_port}-{last}; watch freshness with '
+                  f'`videoflow top localhost:{args.metrics_port}-{last}`.')
+        if args.dashboard:
+            dashboard = _Dashboard(engine, args.dashboard_interval)
+            dashboard.start()
         try:
             flow.join()
         except KeyboardInterrupt:
             print('\nInterrupted; stopping...', file = sys.stderr)
             flow.stop()
     finally:
+        if dashboard is not None:
+            dashboard.stop()
         if created and not args.keep_infra:
             teardown_local_infra(created)
         elif created:
@@ -610,6 +653,13 @@ def _cmd_run_local(args : argparse.Namespace) -> None:
             print(f'--keep-infra set: left {" + ".join(created)} running (reused next run; '
                   f'remove with `docker rm -f {names}`).')
 
+    if args.dashboard:
+        print(f'Final per-node metrics:\n{engine.flow_table()}')
+    if args.metrics_json is not None:
+        with open(args.metrics_json, 'w') as f:
+            json.dump(engine.metrics_snapshot(), f, indent = 2)
+        print(f'Wrote per-node metrics to {args.metrics_json}.')
+
     failed = sorted({name for name, _replica, _code in engine.failures()})
     if failed:
         engine.report_failures()
@@ -687,6 +737,105 @@ def _cmd_explain(args : argparse.Namespace) -> None:
     lines.append(f'DLQ stream: {dlq_stream_name(flow.flow_id, run_id)}')
     print('\n'.join(lines))
 
+def _cmd_top(args : argparse.Namespace) -> None:
+    from ..runtime.freshness import expand_endpoints, format_freshness_table, freshness_rows, scrape
+
+    try:
+        urls = expand_endpoints(args.endpoint)
+    except ValueError as e:
+        raise SystemExit(str(e)) from e
+    try:
+        while True:
+            texts = scrape(urls)
+            table = format_freshness_table(freshness_rows(texts))
+            if not args.once:
+                print('\033[H\033[J', end = '')     # clear screen, like top(1)
+            print(f'{len(texts)}/{len(urls)} workers reachable   (ages and process time in seconds)')
+            print(table)
+            if args.once:
+                return
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+def _cmd_bench(args : argparse.Namespace) -> None:
+    from ..bench.harness import (
+        BenchConfig,
+        compare_runs,
+        format_comparison,
+        format_run,
+        hardware_differs,
+        load_run,
+        parse_thresholds,
+        save_run,
+    )
+    from ..bench.suites import registered_suites, run_suites
+
+    suites = registered_suites()
+    if args.list:
+        width = max(len(name) for name in suites)
+        for name, suite in suites.items():
+            where = 'broker' if suite.needs_broker else 'in-process'
+            print(f'{name.ljust(width)}  {where.ljust(10)}  {suite.description}')
+        return
+    names = args.suite or list(suites)
+    unknown = [name for name in names if name not in suites]
+    if unknown:
+        raise SystemExit(f'Unknown bench suite(s) {", ".join(unknown)}; known: {", ".join(suites)}')
+    try:
+        thresholds = parse_thresholds(args.metric_threshold)
+    except ValueError as e:
+        raise SystemExit(str(e)) from e
+    baseline = load_run(args.baseline) if args.baseline else None
+
+    # Broker suites: bring-your-own via --nats, else reuse a local nats-server or
+    # start a dev container, exactly as run-local does.
+    nats_url = args.nats
+    blob_redis_url = args.blob_redis_url or os.environ.get('VIDEOFLOW_BLOB_REDIS_URL')
+    created : list[str] = []
+    if nats_url is None and any(suites[name].needs_broker for name in names):
+        # optional dep: localinfra imports yaml at module scope
+        from .localinfra import DEFAULT_NATS_URL, ensure_local_infra, wait_local_infra_ready
+        if args.no_infra:
+            nats_url = DEFAULT_NATS_URL
+        else:
+            need_redis = 'blob' in names and blob_redis_url is None and not args.no_redis
+            try:
+                urls, created = ensure_local_infra(need_redis = need_redis)
+                wait_local_infra_ready(created, urls)
+            except RuntimeError as e:
+                raise SystemExit(str(e)) from e
+            nats_url = urls['nats']
+            blob_redis_url = blob_redis_url or urls['redis']
+    config = BenchConfig(nats_url = nats_url, blob_redis_url = blob_redis_url, quick = args.quick,
+                         repeats = args.repeats)
+    try:
+        run = run_suites(names, config, progress = lambda name: print(f'== {name}', file = sys.stderr))
+    except (RuntimeError, ValueError) as e:
+        raise SystemExit(f'Benchmark failed: {e}') from e
+    finally:
+        if created:
+            from .localinfra import teardown_local_infra  # optional dep: imports yaml
+            teardown_local_infra(created)
+
+    print(format_run(run))
+    if args.output:
+        save_run(args.output, run)
+        print(f'Wrote results to {args.output}.')
+    if baseline is None:
+        return
+    rows = compare_runs(run, baseline, threshold = args.threshold, thresholds = thresholds)
+    print(f'\nAgainst {args.baseline}:')
+    print(format_comparison(rows))
+    if hardware_differs(run, baseline):
+        print('WARNING: the baseline was recorded on different hardware '
+              f'({baseline.fingerprint.get("hardware")}); changes may not be regressions.',
+              file = sys.stderr)
+    regressed = [f'{c.suite}.{c.name}' for c in rows if c.regressed]
+    if regressed:
+        raise SystemExit(f'{len(regressed)} measurement(s) regressed beyond their threshold: '
+                         f'{", ".join(regressed)}')
+
 def _cmd_provision(args : argparse.Namespace) -> None:
     # optional dep: topology imports nats at module scope
     from ..messaging.topology import provision_flow_sync
@@ -829,6 +978,24 @@ def _cmd_debug_decode(args : argparse.Namespace) -> None:
 
     asyncio.run(_go())
 
+def _cmd_debug_trace(args : argparse.Namespace) -> None:
+    from ..runtime.tracing import format_trace, group_traces, read_otlp_file
+
+    try:
+        traces = group_traces(read_otlp_file(args.file))
+    except (OSError, ValueError, KeyError) as e:
+        raise SystemExit(f'Cannot read spans from {args.file}: {e}') from e
+    if args.trace_id:
+        picked = [spans for trace_id, spans in traces.items() if trace_id.startswith(args.trace_id)]
+        if not picked:
+            raise SystemExit(f'No trace {args.trace_id!r} in {args.file} ({len(traces)} traces).')
+    else:
+        # Slowest end-to-end first: those are the ones worth reading.
+        def extent(spans : list) -> int:
+            return max(s.end_ns for s in spans) - min(s.start_ns for s in spans)
+        picked = sorted(traces.values(), key = extent, reverse = True)[:args.limit]
+    print('\n\n'.join(format_trace(spans) for spans in picked))
+
 def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(prog = 'videoflow', description = 'Deploy videoflow graphs.')
     sub = parser.add_subparsers(dest = 'command', required = True)
@@ -1000,6 +1167,17 @@ def build_parser() -> argparse.ArgumentParser:
     run.add_argument('--build-context', default = None,
                     help = 'docker build context for the auto-build (default: the git root '
                            'enclosing the graph).')
+    run.add_argument('--metrics-port', type = int, default = None, metavar = 'PORT',
+                    help = 'Serve each worker\'s health/metrics on PORT, PORT+1, ... (one per '
+                           'replica) so `videoflow top` can show live freshness. Default: off.')
+    run.add_argument('--dashboard', action = 'store_true',
+                    help = 'Show a live per-node table (throughput, processing p50/p99, queue '
+                           'depth, errors, blob bytes) while the flow runs, and the final one '
+                           'when it ends — for sizing nb_tasks before deploying.')
+    run.add_argument('--dashboard-interval', type = float, default = 2.0, metavar = 'SECONDS',
+                    help = 'Seconds between dashboard refreshes (default 2).')
+    run.add_argument('--metrics-json', default = None, metavar = 'PATH',
+                    help = 'Write the final per-node metrics to PATH as JSON when the run ends.')
     run.set_defaults(func = _cmd_run_local)
 
     comp = sub.add_parser('component', help = 'Work with component descriptors.')
@@ -1034,6 +1212,57 @@ def build_parser() -> argparse.ArgumentParser:
                                 'value so the printed GPU demand matches what deploy will request.')
     explain.set_defaults(func = _cmd_explain)
 
+    top = sub.add_parser(
+        'top',
+        help = 'Live per-node freshness table (input/output age, process time, edge lag) '
+               'scraped from running workers\' /metrics.')
+    top.add_argument('endpoint', nargs = '+',
+                     help = 'Worker metrics endpoint: host:port, a host:port-port range (as printed '
+                            'by run-local --metrics-port), or a full URL.')
+    top.add_argument('--interval', type = float, default = 2.0, help = 'Seconds between refreshes (default 2).')
+    top.add_argument('--once', action = 'store_true', help = 'Print the table once and exit.')
+    top.set_defaults(func = _cmd_top)
+
+    bench = sub.add_parser(
+        'bench',
+        help = 'Run benchmark suites (wire, hop, scaling, join, blob) and compare them with a '
+               'saved baseline.',
+        description = 'Runs the named benchmark suites (all of them by default) and prints every '
+                      'measurement. The wire suite runs in-process; the others run real flows '
+                      'against a local NATS, started in docker when --nats is omitted and nothing '
+                      'listens on localhost:4222. --output saves the results with hardware and '
+                      'commit fingerprints; --baseline compares with such a file and exits '
+                      'non-zero when a measurement got worse by more than its threshold.')
+    bench.add_argument('suite', nargs = '*', help = 'Suites to run (default: all; see --list).')
+    bench.add_argument('--list', action = 'store_true', help = 'List the suites and exit.')
+    bench.add_argument('--quick', action = 'store_true',
+                       help = 'Fewer messages, cases and repeats: a smoke check, not a baseline.')
+    bench.add_argument('--repeats', type = int, default = 3,
+                       help = 'Runs per broker case; the median is reported (default 3).')
+    bench.add_argument('--output', default = None, metavar = 'PATH',
+                       help = 'Save the results as JSON (usable as a later --baseline).')
+    bench.add_argument('--baseline', default = None, metavar = 'PATH',
+                       help = 'Compare with results saved by an earlier --output.')
+    bench.add_argument('--threshold', type = float, default = 0.10, metavar = 'FRACTION',
+                       help = 'How much worse than the baseline a measurement may get before it '
+                              'counts as a regression (default 0.10, i.e. 10%%).')
+    bench.add_argument('--metric-threshold', action = 'append', default = [],
+                       metavar = 'PATTERN=FRACTION',
+                       help = 'Threshold for the measurements matching a glob over '
+                              '<suite>.<measurement>, e.g. \'scaling.*=0.3\'. Repeatable; the last '
+                              'match wins.')
+    bench.add_argument('--nats', default = None,
+                       help = 'NATS URL for the broker suites (default: reuse localhost:4222 or '
+                              'start a dev NATS in docker).')
+    bench.add_argument('--blob-redis-url', default = None,
+                       help = 'Redis URL for the blob suite (default: $VIDEOFLOW_BLOB_REDIS_URL, '
+                              'else auto-provisioned; without one it sweeps inline sizes only).')
+    bench.add_argument('--no-infra', action = 'store_true',
+                       help = 'Never start broker containers; assume NATS already runs.')
+    bench.add_argument('--no-redis', action = 'store_true',
+                       help = 'Do not auto-provision Redis for the blob suite.')
+    bench.set_defaults(func = _cmd_bench)
+
     prov = sub.add_parser('provision', help = 'Create a flow\'s streams/durables on the broker (usually run automatically).')
     prov.add_argument('graph', help = 'path/to/graph.py[:build_flow]')
     prov.add_argument('--nats', required = True)
@@ -1065,6 +1294,12 @@ def build_parser() -> argparse.ArgumentParser:
     decode.add_argument('--run-id', default = None)
     decode.add_argument('--limit', type = int, default = 20, help = 'Max DLQ messages to decode (default 20).')
     decode.set_defaults(func = _cmd_debug_decode)
+    trace = debug_sub.add_parser('trace', help = 'Print per-message span waterfalls from an OTLP/JSON span file '
+                                                 '(VF_TRACE_EXPORTER=otlp-file://...).')
+    trace.add_argument('file', help = 'OTLP/JSON-lines file written by the otlp-file trace exporter.')
+    trace.add_argument('--trace-id', default = None, help = 'Show this trace (a prefix is enough).')
+    trace.add_argument('--limit', type = int, default = 5, help = 'Show the N slowest traces (default 5).')
+    trace.set_defaults(func = _cmd_debug_trace)
 
     return parser
 
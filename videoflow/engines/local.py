@@ -14,11 +14,14 @@ import asyncio
 import json
 import logging
 import os
+import shutil
 import signal
 import site
 import subprocess
 import sys
 import sysconfig
+import tempfile
+import threading
 from typing import List, Optional
 
 import nats  # noqa: F401  (import guard: fail fast if the broker client is missing)
@@ -30,6 +33,7 @@ from ..core.compiler import (
 )
 from ..core.engine import ExecutionEngine
 from ..messaging.topology import control_subject_for, delete_run_streams, provision_flow_sync
+from ..runtime.flowmetrics import FlowMetrics, format_flow_table, registered_endpoints, scrape_registry
 
 logger = logging.getLogger(__package__)
 
@@ -109,17 +113,36 @@ class LocalProcessEngine(ExecutionEngine):
         - blob_ttl_seconds: TTL override for offloaded payloads (PROTOCOL.md \
             BLOB-7); ``None`` lets workers pick the flow-type default \
             (3600s realtime / 86400s batch).
+        - metrics_port: first port of the workers' health/metrics servers; worker \
+            ``k`` (in launch order) listens on ``metrics_port + k``. ``None`` \
+            (default) leaves them off — see ``metrics_endpoints``.
+        - collect_metrics: aggregate every worker's metrics into the per-node \
+            table of ``flow_metrics`` (throughput, processing p50/p99, queue \
+            depth, errors, blob bytes). Workers register their metrics servers \
+            in a temporary directory — on ephemeral ports unless ``metrics_port`` \
+            is given — and the last table is kept after the run (``metrics_snapshot``).
     '''
     def __init__(self, nats_url : str = DEFAULT_NATS_URL, blob_redis_url : str | None = None,
                 specs : List[NodeSpec] | None = None,
                 local_docker_nats_url : str | None = None,
                 python_path : list | None = None, inherit_python_path : bool = True,
                 default_image : str | None = None,
-                blob_ttl_seconds : int | None = None) -> None:
+                blob_ttl_seconds : int | None = None,
+                metrics_port : int | None = None, collect_metrics : bool = False) -> None:
         self._nats_url = nats_url
         self._blob_redis_url = blob_redis_url
         # Blob TTL override (BLOB-7); None ⇒ workers use the flow-type default.
         self._blob_ttl_seconds = blob_ttl_seconds
+        # Workers share this host, so each needs its own metrics port (None ⇒ off).
+        self._metrics_port = metrics_port
+        self._metrics_endpoints: list = []
+        # Worker registry of the flow-level aggregator (runtime/flowmetrics.py):
+        # created per run, removed once the final table is taken.
+        self._collect_metrics = collect_metrics
+        self._metrics_dir: Optional[str] = None
+        self._metrics_lock = threading.Lock()
+        self._flow_metrics: Optional[FlowMetrics] = None
+        self._metrics_final = False
         self._specs = specs
         # Fallback image for a native component that declares none — the solution image
         # run-local auto-builds. A node's own image= still wins.
@@ -176,11 +199,21 @@ class LocalProcessEngine(ExecutionEngine):
                 f'`docker compose up -d`, or `nats-server -js` — or point --nats at a '
                 f'running server.') from e
 
+        self._metrics_endpoints = []
+        if self._collect_metrics:
+            self._metrics_dir = tempfile.mkdtemp(prefix = 'videoflow-metrics-')
+            self._flow_metrics = FlowMetrics()
+            self._metrics_final = False
         for spec in specs:
             for replica_idx in range(spec.nb_tasks):
+                health_port = None
+                if self._metrics_port is not None:
+                    health_port = self._metrics_port + len(self._metrics_endpoints)
+                    self._metrics_endpoints.append(f'http://localhost:{health_port}/metrics')
                 env = _worker_env(spec, self._nats_url, flow_id, flow_type, run_id,
                                 self._blob_redis_url, replica_idx, envelope_version,
-                                self._python_path, blob_ttl_seconds = self._blob_ttl_seconds)
+                                self._python_path, blob_ttl_seconds = self._blob_ttl_seconds,
+                                health_port = health_port, metrics_dir = self._metrics_dir)
                 cmd, run_env = self._launch_command(spec, env)
                 proc = subprocess.Popen(cmd, env = run_env)
                 self._procs.append((spec.name, replica_idx, proc))
@@ -189,6 +222,73 @@ class LocalProcessEngine(ExecutionEngine):
                     f'({"remote" if spec.is_remote else "python"})'
                 )
 
+    def metrics_endpoints(self) -> List[str]:
+        '''
+        The ``/metrics`` URL of every started worker — empty unless the engine was \
+            built with ``metrics_port`` or ``collect_metrics`` (then only the workers \
+            that have registered so far). Feed them to ``videoflow top`` (or \
+            ``videoflow.runtime.freshness``) for the live per-node freshness table.
+        '''
+        if self._metrics_port is None and self._metrics_dir is not None:
+            return list(registered_endpoints(self._metrics_dir).values())
+        return list(self._metrics_endpoints)
+
+    def freshness_table(self) -> str:
+        '''
+        Scrapes every worker once and renders the per-node freshness table \
+            (input/output age, processing time, edge lag) — what ``videoflow top`` \
+            shows. Needs ``metrics_port`` or ``collect_metrics``.
+        '''
+        from ..runtime.freshness import format_freshness_table, freshness_rows, scrape
+        if self._metrics_port is None and not self._collect_metrics:
+            raise ValueError('freshness_table needs the engine built with metrics_port = ... '
+                             'or collect_metrics = True')
+        return format_freshness_table(freshness_rows(scrape(self.metrics_endpoints())))
+
+    def flow_metrics(self) -> List[dict]:
+        '''
+        Scrapes every registered worker (or, once it has exited, reads its final \
+            metrics) and returns the per-node rows of \
+            ``videoflow.runtime.flowmetrics.flow_rows``, with MSG/S over the time \
+            since the previous call. After ``join_task_processes`` it returns the \
+            final rows. Needs ``collect_metrics``.
+        '''
+        if not self._collect_metrics:
+            raise ValueError('flow_metrics needs the engine built with collect_metrics = True')
+        with self._metrics_lock:
+            if self._flow_metrics is None:
+                return []
+            if self._metrics_final or self._metrics_dir is None:
+                return self._flow_metrics.rows
+            return self._flow_metrics.update(scrape_registry(self._metrics_dir))
+
+    def flow_table(self) -> str:
+        '''``flow_metrics`` rendered as the table ``run-local --dashboard`` shows.'''
+        return format_flow_table(self.flow_metrics())
+
+    def metrics_snapshot(self) -> dict:
+        '''
+        The last ``flow_metrics`` rows plus whole-run averages as JSON-ready data — \
+            after ``join_task_processes``, the final totals of the run.
+        '''
+        with self._metrics_lock:
+            if self._flow_metrics is None:
+                return {'elapsed_seconds': 0.0, 'nodes': []}
+            return self._flow_metrics.snapshot()
+
+    def _finish_metrics(self) -> None:
+        '''Takes the final table (every worker has left its last metrics) and drops the registry.'''
+        if self._metrics_dir is None:
+            return
+        try:
+            self.flow_metrics()
+        except Exception:
+            logger.debug('final metrics scrape failed', exc_info = True)
+        with self._metrics_lock:
+            self._metrics_final = True
+            shutil.rmtree(self._metrics_dir, ignore_errors = True)
+            self._metrics_dir = None
+
     def _launch_command(self, spec : NodeSpec, env : dict) -> tuple:
         '''
         The command + environment to start one worker for ``spec``:
@@ -276,6 +376,7 @@ class LocalProcessEngine(ExecutionEngine):
         try:
             self.wait_for_completion()
         finally:
+            self._finish_metrics()
             self._teardown_streams()
 
     def _teardown_streams(self) -> None:
@@ -298,7 +399,8 @@ class LocalProcessEngine(ExecutionEngine):
 def _worker_env(spec : NodeSpec, nats_url : str, flow_id : str, flow_type : str, run_id : str,
                 blob_redis_url : str | None, replica_id : int, envelope_version : int,
                 python_path : list | None = None,
-                blob_ttl_seconds : int | None = None) -> dict:
+                blob_ttl_seconds : int | None = None,
+                health_port : int | None = None, metrics_dir : str | None = None) -> dict:
     env = dict(os.environ)
     if python_path:
         # Prepend, so a caller-supplied path wins over an inherited PYTHONPATH the
@@ -336,6 +438,10 @@ def _worker_env(spec : NodeSpec, nats_url : str, flow_id : str, flow_type : str,
         env['VF_BLOB_READERS'] = str(spec.blob_readers)
     if blob_ttl_seconds is not None:
         env['VF_BLOB_TTL_SECONDS'] = str(blob_ttl_seconds)
+    if health_port is not None:
+        env['VF_HEALTH_PORT'] = str(health_port)
+    if metrics_dir is not None:
+        env['VF_METRICS_DIR'] = metrics_dir
     return env
 
 def _publish_stop(nats_url : str, flow_id : str, run_id : str) -> None:
@@ -0,0 +1,88 @@
+'''
+Backpressure events from the messenger's internal buffers: a publish retried
+because the downstream stream was full, a REALTIME message evicted before this
+node read it, a join group given up on, a collect sample dropped. Each event is
+counted (through the messenger's counter observer, so it reaches ``/metrics``
+as ``videoflow_<event>_total``) and logged on the ``videoflow.events`` logger
+with its fields as ``extra``, so ``VF_STRUCTURED_LOGS=1`` emits one JSON
+object per event:
+
+    {"level": "WARNING", "logger": "videoflow.events", "event": "publish_retries",
+     "node_name": "detector", "fields": {"attempts": 3, "waited_seconds": 0.35}, ...}
+
+Events that can fire per message are throttled: at most one log line per event
+per ``min_interval`` seconds, carrying how many were ``suppressed`` since the
+last one. Counting is never throttled.
+
+    publish_retries           a BATCH publish rejected by a full stream and retried
+    publish_dropped           a REALTIME publish that failed and was abandoned
+    messages_evicted          REALTIME messages the parent's stream discarded
+                              (DiscardPolicy.OLD) before this node fetched them
+    join_groups_evicted       incomplete join groups dropped or nak'ed
+    collect_samples_dropped   collect-parent samples dropped (buffer full or stale)
+'''
+from __future__ import absolute_import, division, print_function
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Optional
+
+EVENT_LOGGER_NAME = 'videoflow.events'
+
+DEFAULT_EVENT_LOG_INTERVAL_SECONDS = 10.0
+
+EVENT_PUBLISH_RETRIES = 'publish_retries'
+EVENT_PUBLISH_DROPPED = 'publish_dropped'
+EVENT_MESSAGES_EVICTED = 'messages_evicted'
+EVENT_JOIN_GROUPS_EVICTED = 'join_groups_evicted'
+EVENT_COLLECT_SAMPLES_DROPPED = 'collect_samples_dropped'
+
+_logger = logging.getLogger(EVENT_LOGGER_NAME)
+
+class EventLog:
+    '''
+    Counts and logs one node's backpressure events. Safe to call from the task \
+        thread and the messenger's I/O thread at once.
+
+    - Arguments:
+        - node_name: stamped on every record as ``node_name``.
+        - min_interval: seconds between log lines of one throttled event.
+    '''
+    def __init__(self, node_name : str, min_interval : float = DEFAULT_EVENT_LOG_INTERVAL_SECONDS) -> None:
+        self._node_name = node_name
+        self._min_interval = min_interval
+        # Set by the messenger's set_counter_observer: receives (event, count).
+        self.counter_observer : Optional[Callable[[str, int], None]] = None
+        self._lock = threading.Lock()
+        self._last_logged : dict[str, float] = {}
+        self._suppressed : dict[str, int] = {}
+
+    def emit(self, event : str, message : str, count : int = 1, throttle : bool = False,
+            level : int = logging.WARNING, **fields : Any) -> None:
+        '''
+        Records ``count`` occurrences of ``event`` and logs ``message`` with ``fields``.
+
+        - Arguments:
+            - event: one of the ``EVENT_*`` names; also the counter name.
+            - message: the human-readable log line.
+            - count: occurrences this call stands for.
+            - throttle: rate-limit the log line (see the module docstring).
+        '''
+        observer = self.counter_observer
+        if observer is not None:
+            observer(event, count)
+        if throttle:
+            now = time.monotonic()
+            with self._lock:
+                last = self._last_logged.get(event)
+                if last is not None and now - last < self._min_interval:
+                    self._suppressed[event] = self._suppressed.get(event, 0) + count
+                    return
+                self._last_logged[event] = now
+                suppressed = self._suppressed.pop(event, 0)
+            if suppressed:
+                fields['suppressed'] = suppressed
+                message = f'{message} (+{suppressed} more since the last report)'
+        _logger.log(level, message, extra = {'event': event, 'node_name': self._node_name,
+                                             'fields': fields})
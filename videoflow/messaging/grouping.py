@@ -39,6 +39,7 @@ from dataclasses import dataclass, field
 from typing import Any, Optional
 
 from ..core.policies import JOIN_TIME, MISSING_ERROR, JoinPolicy
+from .events import EVENT_COLLECT_SAMPLES_DROPPED, EVENT_JOIN_GROUPS_EVICTED, EventLog
 
 logger = logging.getLogger(__package__)
 
@@ -149,19 +150,32 @@ class ReadyGroup:
         self.entries = entries
         self.handles = handles
 
-def make_assembler(node_name : str, parent_names : list[str], policy : JoinPolicy) -> "GroupAssembler":
+def make_assembler(node_name : str, parent_names : list[str], policy : JoinPolicy,
+                   events : Optional[EventLog] = None) -> "GroupAssembler":
     if policy.mode == JOIN_TIME:
-        return TimeGroupAssembler(node_name, parent_names, policy)
-    return TraceGroupAssembler(node_name, parent_names, policy)
+        return TimeGroupAssembler(node_name, parent_names, policy, events = events)
+    return TraceGroupAssembler(node_name, parent_names, policy, events = events)
 
 class GroupAssembler:
-    '''Base interface: feed entries with ``add``, expire with ``sweep``, drain with ``pop_ready``.'''
-    def __init__(self, node_name : str, parent_names : list[str], policy : JoinPolicy) -> None:
+    '''
+    Base interface: feed entries with ``add``, expire with ``sweep``, drain with \
+        ``pop_ready``. What it discards is reported to ``events`` (the messenger's, \
+        so it is counted; a logging-only one by default).
+    '''
+    def __init__(self, node_name : str, parent_names : list[str], policy : JoinPolicy,
+                events : Optional[EventLog] = None) -> None:
         self._node_name = node_name
         self._parent_names = list(parent_names)
         self._policy = policy
+        self._events = events if events is not None else EventLog(node_name)
 
-    def add(self, parent_name : str, entry : EnvelopeEntry, handle : Any) -> None:
+    def add(self, parent_name : str, entry : EnvelopeEntry, handle : Any,
+            now : float | None = None) -> None:
+        '''
+        Buffers one parent's entry with its unresolved ack handle. ``now`` is a \
+            ``time.monotonic()`` reading, like ``sweep``'s and ``pop_ready``'s; \
+            passing it lets a replay run on a virtual clock.
+        '''
         raise NotImplementedError
 
     def sweep(self, now : float | None = None) -> None:
@@ -175,6 +189,15 @@ class GroupAssembler:
         '''Whether any buffered state still holds a message from this parent (EOS drain check).'''
         raise NotImplementedError
 
+    def buffer_depths(self) -> list[tuple[str, Optional[str], int, Optional[int]]]:
+        '''
+        ``(buffer, parent, depth, capacity)`` of each internal buffer: \
+            ``pending_groups`` (incomplete groups, capped by ``max_pending``), plus \
+            a ``collect_buffer`` per collect parent for a time join. Read from the \
+            metrics thread, so it only takes lengths.
+        '''
+        raise NotImplementedError
+
 class TraceGroupAssembler(GroupAssembler):
     '''
     Groups by exact ``trace_id``. A group is ready when every parent's half with
@@ -182,14 +205,16 @@ class TraceGroupAssembler(GroupAssembler):
     evicted per the missing policy, and the oldest group is evicted (as drop)
     beyond ``max_pending``.
     '''
-    def __init__(self, node_name : str, parent_names : list[str], policy : JoinPolicy) -> None:
-        super().__init__(node_name, parent_names, policy)
+    def __init__(self, node_name : str, parent_names : list[str], policy : JoinPolicy,
+                events : Optional[EventLog] = None) -> None:
+        super().__init__(node_name, parent_names, policy, events = events)
         self._groups: dict[str, dict[str, EnvelopeEntry]] = {}   # trace_id -> {parent: entry}
         self._handles: dict[str, dict[str, Any]] = {}   # trace_id -> {parent: handle}
         self._order: list[str] = []
         self._first_seen: dict[str, float] = {}
 
-    def add(self, parent_name : str, entry : EnvelopeEntry, handle : Any) -> None:
+    def add(self, parent_name : str, entry : EnvelopeEntry, handle : Any,
+            now : float | None = None) -> None:
         trace_id = entry.trace_id
         group = self._groups.setdefault(trace_id, {})
         handles = self._handles.setdefault(trace_id, {})
@@ -200,7 +225,7 @@ class TraceGroupAssembler(GroupAssembler):
             handles[parent_name].term()
         elif trace_id not in self._order:
             self._order.append(trace_id)
-            self._first_seen[trace_id] = time.monotonic()
+            self._first_seen[trace_id] = time.monotonic() if now is None else now
         group[parent_name] = entry
         handles[parent_name] = handle
         # Hard cap on buffered groups (last-resort memory guard): drop the oldest.
@@ -229,11 +254,13 @@ class TraceGroupAssembler(GroupAssembler):
                 handle.nak()   # redeliver — the missing half may still arrive
             else:
                 handle.ack()   # DROP: give up on this partial group
-        logger.warning(
+        self._events.emit(
+            EVENT_JOIN_GROUPS_EVICTED,
             f'{self._node_name}: evicting incomplete join group {trace_id} '
             f'(had {list(group.keys())}, needed {self._parent_names}) — {reason}, '
-            f'missing policy={missing}.'
-        )
+            f'missing policy={missing}.',
+            throttle = True, group = trace_id, had = list(group.keys()),
+            needed = self._parent_names, reason = reason, missing_policy = missing)
 
     def pop_ready(self, now : float | None = None) -> Optional[ReadyGroup]:
         for trace_id in self._order:
@@ -255,6 +282,9 @@ class TraceGroupAssembler(GroupAssembler):
     def has_pending_from(self, parent_name : str) -> bool:
         return any(parent_name in group for group in self._groups.values())
 
+    def buffer_depths(self) -> list[tuple[str, Optional[str], int, Optional[int]]]:
+        return [('pending_groups', None, len(self._order), self._policy.max_pending)]
+
 class _TimeGroup:
     __slots__ = ('gid', 'ts', 'first_seen', 'entries', 'handles')
 
@@ -284,8 +314,9 @@ class TimeGroupAssembler(GroupAssembler):
     arrival time — correct enough for co-located low-latency flows, but real
     deployments should stamp at the producer.
     '''
-    def __init__(self, node_name : str, parent_names : list[str], policy : JoinPolicy) -> None:
-        super().__init__(node_name, parent_names, policy)
+    def __init__(self, node_name : str, parent_names : list[str], policy : JoinPolicy,
+                events : Optional[EventLog] = None) -> None:
+        super().__init__(node_name, parent_names, policy, events = events)
         unknown = set(policy.collect) - set(parent_names)
         if unknown:
             raise ValueError(f'{node_name}: collect parents {sorted(unknown)} are not '
@@ -321,8 +352,9 @@ class TimeGroupAssembler(GroupAssembler):
 
     # -- ingestion -----------------------------------------------------
 
-    def add(self, parent_name : str, entry : EnvelopeEntry, handle : Any) -> None:
-        now = time.monotonic()
+    def add(self, parent_name : str, entry : EnvelopeEntry, handle : Any,
+            now : float | None = None) -> None:
+        now = time.monotonic() if now is None else now
         ts = entry.event_ts
         if ts is None:
             ts = time.time()
@@ -332,8 +364,10 @@ class TimeGroupAssembler(GroupAssembler):
             while len(buf) > self._collect_cap:
                 _, _, _, old_handle = buf.pop(0)
                 old_handle.ack()
-                logger.warning(f'{self._node_name}: collect buffer for {parent_name} '
-                            f'full ({self._collect_cap}); dropping oldest sample')
+                self._events.emit(EVENT_COLLECT_SAMPLES_DROPPED,
+                                  f'{self._node_name}: collect buffer for {parent_name} '
+                                  f'full ({self._collect_cap}); dropping oldest sample',
+                                  throttle = True, parent = parent_name, reason = 'buffer full')
             return
 
         # Redelivery of a message already buffered in a pending group: supersede
@@ -404,6 +438,12 @@ class TimeGroupAssembler(GroupAssembler):
                     kept.append(item)
             if len(kept) != len(buf):
                 self._collect_buffers[parent] = kept
+                dropped = len(buf) - len(kept)
+                self._events.emit(EVENT_COLLECT_SAMPLES_DROPPED,
+                                  f'{self._node_name}: dropped {dropped} unclaimed {parent} '
+                                  f'samples older than {self._collect_retention_s:g}s',
+                                  count = dropped, throttle = True, level = logging.INFO,
+                                  parent = parent, reason = 'stale')
 
     def _evict(self, gid : int, missing : str, reason : str) -> None:
         group = self._groups.pop(gid, None)
@@ -415,11 +455,13 @@ class TimeGroupAssembler(GroupAssembler):
                 handle.nak()
             else:
                 handle.ack()
-        logger.warning(
+        self._events.emit(
+            EVENT_JOIN_GROUPS_EVICTED,
             f'{self._node_name}: evicting time group at ts={group.ts:.6f} '
             f'(had {sorted(group.entries.keys())}, needed {self._sync_parents}) — '
-            f'{reason}, missing policy={missing}.'
-        )
+            f'{reason}, missing policy={missing}.',
+            throttle = True, group_ts = group.ts, had = sorted(group.entries.keys()),
+            needed = self._sync_parents, reason = reason, missing_policy = missing)
 
     # -- emission ------------------------------------------------------
 
@@ -477,3 +519,10 @@ class TimeGroupAssembler(GroupAssembler):
         if parent_name in self._collect_buffers:
             return bool(self._collect_buffers[parent_name])
         return any(parent_name in g.entries for g in self._groups.values())
+
+    def buffer_depths(self) -> list[tuple[str, Optional[str], int, Optional[int]]]:
+        depths : list[tuple[str, Optional[str], int, Optional[int]]] = [
+            ('pending_groups', None, len(self._order), self._policy.max_pending)]
+        for parent, buf in list(self._collect_buffers.items()):
+            depths.append(('collect_buffer', parent, len(buf), self._collect_cap))
+        return depths
@@ -20,7 +20,7 @@ import logging
 import threading
 import time
 import uuid
-from typing import Any, Coroutine, Optional, TypeVar
+from typing import Any, Callable, Coroutine, Optional, TypeVar
 
 import nats
 from nats.aio.msg import Msg
@@ -28,9 +28,10 @@ from nats.js import JetStreamContext
 
 from ..core.constants import REALTIME
 from ..core.engine import Messenger
-from ..core.node import Node
+from ..core.node import Node, ProcessorNode
 from ..core.policies import JOIN_TIME, JoinPolicy
 from ..wire.serialization import (
+    DEFAULT_BLOB_TTL_SECONDS,
     DEFAULT_ENVELOPE_VERSION,
     MSG_TYPE_DATA,
     MSG_TYPE_EOS,
@@ -39,6 +40,12 @@ from ..wire.serialization import (
     derive_message_id,
     encode_envelope,
 )
+from .events import (
+    EVENT_MESSAGES_EVICTED,
+    EVENT_PUBLISH_DROPPED,
+    EVENT_PUBLISH_RETRIES,
+    EventLog,
+)
 from .grouping import EnvelopeEntry, make_assembler
 from .topology import (
     consumer_config_for,
@@ -76,6 +83,10 @@ _PUBLISH_RETRY_BACKOFF = [0.05, 0.1, 0.2, 0.5, 1.0]
 #: caller gets back to the coroutine it passed in.
 _T = TypeVar('_T')
 
+def _consumer_backlog(info : Any) -> int:
+    '''``num_pending + num_ack_pending`` of a ``ConsumerInfo``; the broker may leave either unset (0).'''
+    return (info.num_pending or 0) + (info.num_ack_pending or 0)
+
 class _AckHandle:
     '''
     Thread-safe wrapper over a JetStream ``Msg`` so the synchronous task loop (on
@@ -145,6 +156,52 @@ class _AckHandle:
         except Exception:
             logger.debug('term failed', exc_info = True)
 
+class _TimedBlobStore(BlobStore):
+    '''
+    Wraps the flow's blob store to count, per thread, the seconds spent in it, \
+        so the blob I/O inside a decode/encode can be told apart from the codec, \
+        and to report the bytes moved as ``blob_bytes_put`` / ``blob_bytes_fetched``.
+    '''
+    def __init__(self, inner : BlobStore) -> None:
+        self._inner = inner
+        self._local = threading.local()
+        # Set by NATSMessenger.set_counter_observer: receives (counter, bytes).
+        self.counter_observer : Optional[Callable[[str, int], None]] = None
+
+    def elapsed(self) -> float:
+        return getattr(self._local, 'elapsed', 0.0)
+
+    def _timed(self, fn : Callable[..., Any], *args : Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self._local.elapsed = self.elapsed() + time.perf_counter() - start
+
+    def _count(self, counter : str, data : bytes) -> None:
+        observer = self.counter_observer
+        if observer is not None:
+            observer(counter, len(data))
+
+    def put(self, data : bytes, ttl_seconds : int = DEFAULT_BLOB_TTL_SECONDS) -> str:
+        ref = self._timed(self._inner.put, data, ttl_seconds)
+        self._count('blob_bytes_put', data)
+        return ref
+
+    def put_with_readers(self, data : bytes, readers : int,
+                        ttl_seconds : int = DEFAULT_BLOB_TTL_SECONDS) -> str:
+        ref = self._timed(self._inner.put_with_readers, data, readers, ttl_seconds)
+        self._count('blob_bytes_put', data)
+        return ref
+
+    def get(self, ref : str) -> bytes:
+        data = self._timed(self._inner.get, ref)
+        self._count('blob_bytes_fetched', data)
+        return data
+
+    def release(self, ref : str) -> None:
+        return self._inner.release(ref)
+
 class NATSMessenger(Messenger):
     '''
     - Arguments:
@@ -185,6 +242,8 @@ class NATSMessenger(Messenger):
         self._flow_type = flow_type
         self._run_id = run_id
         self._blob_store = blob_store
+        # Set by set_stage_observer: receives (stage, seconds) for the stages timed here.
+        self._stage_observer : Optional[Callable[[str, float], None]] = None
         # Downstream read count for refcounted blob reclamation (BLOB-5): None means
         # the deployment didn't supply one, so blobs stay TTL-only.
         self._blob_readers = blob_readers
@@ -197,6 +256,10 @@ class NATSMessenger(Messenger):
         self._max_deliver = max_deliver_for(flow_type, max_retries)
         self._eos_quiescence_s = max(0.0, eos_quiescence_ms / 1000.0)
         self._nb_tasks = nb_tasks
+        # A pooled processor (workers_per_replica > 1) holds one un-acked group per
+        # pool slot on top of the local prefetch, so the durable must hand out that
+        # many more before it stops delivering.
+        self._inflight_window = node.workers_per_replica if isinstance(node, ProcessorNode) else 1
         # Partitioned iff a key is set and there's more than one replica.
         self._partition_by = partition_by if (partition_by and nb_tasks > 1) else None
         self._join_policy: JoinPolicy = (JoinPolicy.from_dict(join_policy)
@@ -207,9 +270,13 @@ class NATSMessenger(Messenger):
             # of a time window, so no replica could ever complete a group.
             raise ValueError(f'{node.name}: a time-aligned join (join_policy '
                             f"mode='time') requires nb_tasks == 1, got {nb_tasks}")
+        # Backpressure events (publish retries, evictions, join drops): counted via
+        # set_counter_observer and logged on videoflow.events.
+        self._events = EventLog(node.name)
         # Assembles multi-parent input groups (by trace id or by event time) and
         # owns all pending-group buffering/expiry — see videoflow.messaging.grouping.
-        self._assembler = make_assembler(node.name, self._parent_names, self._join_policy)
+        self._assembler = make_assembler(node.name, self._parent_names, self._join_policy,
+                                         events = self._events)
         # Unique per replica: names this replica's EOS consumers so every replica
         # observes end-of-stream (the shared data durable would deliver EOS to only
         # one of them).
@@ -229,6 +296,15 @@ class NATSMessenger(Messenger):
         # next published message.
         self._output_partition_key = None
         self._output_event_ts: Optional[float] = None
+        # (index, flush) of the next output when the node emits zero or many per
+        # input group (see set_output_emission).
+        self._output_emission: Optional[tuple[int, bool]] = None
+        # Event time and lineage of the last published output (for its age at
+        # publish, and for tracing a producer's freshly minted trace id).
+        self._last_output_event_ts: Optional[float] = None
+        self._last_output_trace_id: Optional[str] = None
+        # Span ids for the next output (tracing); None ⇒ empty on the wire.
+        self._output_span: Optional[tuple[Optional[str], Optional[str]]] = None
 
         self._stopped_parents: set[str] = set()
         # EOS drain state: a parent is fully stopped only once its EOS has been
@@ -257,10 +333,15 @@ class NATSMessenger(Messenger):
         self._closing = threading.Event()
 
         self._loop = asyncio.new_event_loop()
-        self._thread = threading.Thread(target = self._run_loop, daemon = True)
+        self._thread = threading.Thread(target = self._run_loop, name = 'vf-nats-loop', daemon = True)
         self._thread.start()
 
         self._parent_queues: dict[str, asyncio.Queue] = {}
+        # Last stream sequence fetched per parent, to spot REALTIME evictions as
+        # gaps — only meaningful when this replica reads every message of the
+        # stream (see _note_stream_seq).
+        self._last_stream_seq: dict[str, int] = {}
+        self._track_evictions = flow_type == REALTIME and (nb_tasks == 1 or self._partition_by is not None)
 
         fut = asyncio.run_coroutine_threadsafe(self._setup(), self._loop)
         fut.result(timeout = 30)
@@ -289,7 +370,7 @@ class NATSMessenger(Messenger):
             base_cfg = consumer_config_for(
                 self._flow_id, self._run_id, self._node.name, parent_name,
                 ack_wait = self._ack_wait, max_deliver = self._max_deliver,
-                max_ack_pending = _QUEUE_MAXSIZE + 2)
+                max_ack_pending = _QUEUE_MAXSIZE + 2 + (self._inflight_window - 1))
             base_cfg.durable_name = data_durable
             data_sub = await self._js.pull_subscribe(
                 subject_for(self._flow_id, self._run_id, parent_name),
@@ -359,12 +440,14 @@ class NATSMessenger(Messenger):
                 await asyncio.sleep(0.5)
                 continue
             for msg in msgs:
+                if self._track_evictions:
+                    self._note_stream_seq(parent_name, msg)
                 try:
                     # The one place a decoded envelope crosses into messaging:
                     # adapt the wire dict to the typed record here so nothing
                     # downstream (join, EOS drain, ownership) reads it by key.
-                    entry = EnvelopeEntry.from_decoded(
-                        decode_envelope(msg.data, blob_store = self._blob_store))
+                    entry = EnvelopeEntry.from_decoded(self._timed_codec(
+                        'decode', 'blob_fetch', decode_envelope, msg.data, blob_store = self._blob_store))
                 except Exception:
                     # Undecodable message: terminate it so it is not redelivered
                     # forever (a genuinely poisoned wire payload).
@@ -397,6 +480,25 @@ class NATSMessenger(Messenger):
                 self._register_handle(handle)
                 await self._parent_queues[parent_name].put((entry, handle))
 
+    def _note_stream_seq(self, parent_name : str, msg : Msg) -> None:
+        # A REALTIME stream (Discard=OLD) drops its oldest message when full, so
+        # what a slow reader loses shows up as a jump in the stream sequence.
+        # Approximate: an upstream replica's EOS marker shares the stream and
+        # reads as one eviction.
+        try:
+            seq = msg.metadata.sequence.stream
+        except Exception:
+            return
+        last = self._last_stream_seq.get(parent_name)
+        if last is not None and seq > last + 1:
+            evicted = seq - last - 1
+            self._events.emit(EVENT_MESSAGES_EVICTED,
+                              f'{self._node.name}: {evicted} message(s) from {parent_name} '
+                              f'evicted by the stream before they were read',
+                              count = evicted, throttle = True, parent = parent_name)
+        if last is None or seq > last:
+            self._last_stream_seq[parent_name] = seq
+
     async def _eos_pull_loop(self, parent_name : str, sub : JetStreamContext.PullSubscription) -> None:
         # Observes end-of-stream for one parent. The EOS message is *not* acked
         # here — it's held (in _eos_handles) and acked only once the parent's data
@@ -439,6 +541,42 @@ class NATSMessenger(Messenger):
                     except Exception:
                         pass
 
+    def _wrap_blob_store(self) -> None:
+        if self._blob_store is not None and not isinstance(self._blob_store, _TimedBlobStore):
+            self._blob_store = _TimedBlobStore(self._blob_store)
+
+    def set_stage_observer(self, observer : Optional[Callable[[str, float], None]]) -> None:
+        self._stage_observer = observer
+        if observer is not None:
+            self._wrap_blob_store()
+
+    def set_counter_observer(self, observer : Optional[Callable[[str, int], None]]) -> None:
+        self._events.counter_observer = observer
+        if observer is not None:
+            self._wrap_blob_store()
+        if isinstance(self._blob_store, _TimedBlobStore):
+            self._blob_store.counter_observer = observer
+
+    def _timed_codec(self, stage : str, io_stage : str, fn : Callable[..., Any],
+                    *args : Any, **kwargs : Any) -> Any:
+        '''
+        Calls an envelope codec, reporting its blob I/O as ``io_stage`` and the \
+            rest as ``stage`` when a stage observer is set.
+        '''
+        observer = self._stage_observer
+        if observer is None:
+            return fn(*args, **kwargs)
+        store = self._blob_store
+        io_before = store.elapsed() if isinstance(store, _TimedBlobStore) else 0.0
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        total = time.perf_counter() - start
+        io = (store.elapsed() - io_before) if isinstance(store, _TimedBlobStore) else 0.0
+        if io > 0:
+            observer(io_stage, io)
+        observer(stage, total - io)
+        return result
+
     def _release_blob(self, blob_ref : str | None) -> None:
         '''
         Decrement-and-maybe-delete a blob after its message was successfully acked \
@@ -507,10 +645,16 @@ class NATSMessenger(Messenger):
     def set_output_event_timestamp(self, value : float) -> None:
         self._output_event_ts = value
 
+    def set_output_emission(self, index : int, flush : bool = False) -> None:
+        self._output_emission = (index, flush)
+
+    def set_output_span(self, span_id : Optional[str], parent_span_id : Optional[str] = None) -> None:
+        self._output_span = (span_id, parent_span_id)
+
     def last_input_info(self) -> Optional[dict[str, Optional[dict]]]:
         '''
-        Per-parent envelope info (``event_ts``, ``metadata``, ``trace_id``, ``seq``)
-        for the input group last returned by ``receive_message``; ``None`` entries
+        Per-parent envelope info (``event_ts``, ``metadata``, ``trace_id``, ``seq``,
+        ``span_id``) for the input group last returned by ``receive_message``; ``None`` entries
         for parents missing from a quorum emission. ``None`` for producers.
         '''
         return self._last_input_info
@@ -526,6 +670,21 @@ class NATSMessenger(Messenger):
         return derive_message_id(self._flow_id, self._run_id, self._node.name,
                                 self._last_trace_id, self._last_seq, MSG_TYPE_DATA)
 
+    def checkpoint_inputs(self) -> tuple:
+        '''
+        Detach the current input group (lineage + un-acked handles) so another can
+        be received while it is still being processed. The handles stay registered
+        with the keepalive loop, so a long pool queue doesn't hit ``ack_wait``.
+        '''
+        token = (self._last_trace_id, self._last_seq, self._last_event_ts,
+                self._last_input_info, self._inflight_handles)
+        self._inflight_handles = []
+        return token
+
+    def restore_inputs(self, token : tuple) -> None:
+        (self._last_trace_id, self._last_seq, self._last_event_ts,
+        self._last_input_info, self._inflight_handles) = token
+
     def publish_message(self, message : Any, metadata : Optional[dict] = None) -> None:
         trace_id = self._last_trace_id
         seq = self._last_seq
@@ -536,6 +695,17 @@ class NATSMessenger(Messenger):
             self._trace_counter += 1
             trace_id = f'{self._node.name}:{self._trace_counter}'
             seq = self._trace_counter
+        emission, self._output_emission = self._output_emission, None
+        if emission is not None:
+            index, flush = emission
+            if flush:
+                # End-of-stream output: no input group to derive from, so the
+                # identity is this replica's own (replicas flush independently).
+                trace_id = f'{self._node.name}:flush:r{self._replica_id}:{index}'
+                seq = index
+            elif index > 0:
+                # Later outputs of one input group: same lineage, own dedup id.
+                trace_id = f'{trace_id}.{index}'
         # Event time: an explicit stamp from the node (ctx.set_event_timestamp)
         # wins; otherwise it is inherited from the input group; a producer with
         # neither gets publish wall-clock as a last resort.
@@ -550,7 +720,18 @@ class NATSMessenger(Messenger):
             metadata = dict(metadata or {})
             metadata['_partition_key'] = self._output_partition_key
             self._output_partition_key = None
-        self._publish(message, metadata, trace_id, seq, MSG_TYPE_DATA, event_ts = event_ts)
+        span, self._output_span = self._output_span, None
+        span_id, parent_span_id = span if span is not None else (None, None)
+        self._publish(message, metadata, trace_id, seq, MSG_TYPE_DATA, event_ts = event_ts,
+                      span_id = span_id or '', parent_span_id = parent_span_id or '')
+        self._last_output_event_ts = event_ts
+        self._last_output_trace_id = trace_id
+
+    def last_published_event_ts(self) -> Optional[float]:
+        return self._last_output_event_ts
+
+    def last_published_trace_id(self) -> Optional[str]:
+        return self._last_output_trace_id
 
     def publish_stop_signal(self) -> None:
         # EOS goes on this node's dedicated _eos subject (not the data subject), so
@@ -561,11 +742,14 @@ class NATSMessenger(Messenger):
         self._publish(None, None, eos_trace, self._last_seq, MSG_TYPE_EOS)
 
     def _publish(self, message : Any, metadata : Optional[dict], trace_id : str, seq : int,
-                msg_type : str, event_ts : float | None = None) -> None:
+                msg_type : str, event_ts : float | None = None, span_id : str = '',
+                parent_span_id : str = '') -> None:
         node_name = self._node.name
-        buf = encode_envelope(
+        buf = self._timed_codec(
+            'encode', 'blob_put', encode_envelope,
             node_name, self._flow_id, self._run_id, trace_id, seq, msg_type,
-            metadata, message, replica_id = self._replica_id, event_ts = event_ts,
+            metadata, message, span_id = span_id, parent_span_id = parent_span_id,
+            replica_id = self._replica_id, event_ts = event_ts,
             blob_store = self._blob_store, version = self._envelope_version,
             blob_readers = self._blob_readers, blob_ttl_seconds = self._blob_ttl_seconds,
         )
@@ -592,24 +776,44 @@ class NATSMessenger(Messenger):
             # a full stream *rejects* the publish; retry with backoff so a slow
             # consumer applies real backpressure instead of losing data.
             attempt = 0
+            waited = 0.0
             while True:
                 try:
                     await self._js.publish(subject, buf, headers = headers)
+                    if attempt:
+                        self._report_retries(subject, attempt, waited, 'published')
                     return
                 except Exception as e:  # noqa: BLE001
                     if is_realtime or self._termination_event.is_set():
                         # REALTIME never blocks; a stopping flow abandons the publish.
                         if is_realtime:
+                            self._events.emit(EVENT_PUBLISH_DROPPED,
+                                              f'{node_name}: REALTIME publish to {subject} failed '
+                                              f'and was dropped: {e}',
+                                              throttle = True, subject = subject, error = str(e))
                             return
+                        if attempt:
+                            self._report_retries(subject, attempt, waited, 'abandoned')
                         raise
                     if 'maximum messages' not in str(e).lower() and 'wrong last sequence' not in str(e).lower():
                         raise
                     delay = _PUBLISH_RETRY_BACKOFF[min(attempt, len(_PUBLISH_RETRY_BACKOFF) - 1)]
                     attempt += 1
+                    waited += delay
                     await asyncio.sleep(delay)
 
+        start = time.perf_counter()
         fut = asyncio.run_coroutine_threadsafe(_do_publish(), self._loop)
         fut.result(timeout = 120)
+        if self._stage_observer is not None and msg_type == MSG_TYPE_DATA:
+            self._stage_observer('publish', time.perf_counter() - start)
+
+    def _report_retries(self, subject : str, attempts : int, waited : float, outcome : str) -> None:
+        self._events.emit(EVENT_PUBLISH_RETRIES,
+                          f'{self._node.name}: publish to {subject} retried {attempts} time(s) '
+                          f'over {waited:.2f}s because the stream was full ({outcome})',
+                          count = attempts, throttle = True, subject = subject,
+                          attempts = attempts, waited_seconds = round(waited, 3), outcome = outcome)
 
     # -- ack / fail (called by the task after process()/consume()) --------
 
@@ -670,6 +874,15 @@ class NATSMessenger(Messenger):
             return False
 
     def receive_message(self) -> dict:
+        inputs = self._receive(None)
+        assert inputs is not None   # no deadline: only returns with an input
+        return inputs
+
+    def poll_message(self, timeout : float) -> Optional[dict]:
+        return self._receive(time.monotonic() + timeout)
+
+    def _receive(self, deadline : Optional[float]) -> Optional[dict]:
+        '''``receive_message`` up to a ``time.monotonic()`` deadline (None: no deadline).'''
         while True:
             # A control-channel stop ends the flow immediately, even mid-stream —
             # surface it to the task loop as an all-parents-stopped result so
@@ -718,6 +931,7 @@ class NATSMessenger(Messenger):
                         'metadata': entry.metadata,
                         'trace_id': entry.trace_id if isinstance(entry, EnvelopeEntry) else None,
                         'seq': entry.seq if isinstance(entry, EnvelopeEntry) else None,
+                        'span_id': (entry.span_id or None) if isinstance(entry, EnvelopeEntry) else None,
                     }
                 self._last_input_info = info
                 return out
@@ -728,10 +942,16 @@ class NATSMessenger(Messenger):
             # all of them must be folded into the assembler here. Discarding
             # all-but-one (an earlier version of this method did) silently lost
             # messages whenever two parents produced close together in time.
-            ready_items = self._recv_ready()
+            wait = _FETCH_TIMEOUT_SECONDS
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                wait = min(wait, remaining)
+            ready_items = self._recv_ready(wait)
             if ready_items:
                 self._idle_polls = 0
-            else:
+            elif wait >= _FETCH_TIMEOUT_SECONDS:
                 # Nothing arriving. If we're in the EOS-drain phase (some parent
                 # already ended) and still not stopped after ~15s of idle polls,
                 # say why — a stall here otherwise looks like a silent hang.
@@ -832,14 +1052,76 @@ class NATSMessenger(Messenger):
         except Exception:
             return 0, 0
 
+    def output_backlog(self) -> Optional[int]:
+        '''
+        Backlog of the slowest child on this node's data subject: ``num_pending +
+        num_ack_pending`` of the data durables on this node's stream (EOS consumers
+        and anchors filter to the ``_eos`` subject and are skipped). None if the
+        broker can't be asked.
+        '''
+        stream = stream_name_for(self._flow_id, self._run_id, self._node.name)
+        data_subject = subject_for(self._flow_id, self._run_id, self._node.name)
+
+        async def _go() -> Optional[int]:
+            try:
+                infos = await self._js.consumers_info(stream)
+            except Exception:
+                return None
+            lags = [_consumer_backlog(info) for info in infos
+                    if info.config.filter_subject == data_subject]
+            return max(lags) if lags else 0
+
+        try:
+            fut = asyncio.run_coroutine_threadsafe(_go(), self._loop)
+            return fut.result(timeout = 5)
+        except Exception:
+            return None
+
+    def input_lag(self) -> Optional[dict[str, int]]:
+        '''
+        Lag of each incoming edge: ``num_pending + num_ack_pending`` of this node's
+        data durable on every parent's stream. None if the broker can't be asked.
+        '''
+        async def _go() -> Optional[dict[str, int]]:
+            lags = {}
+            for parent in self._parent_names:
+                stream = stream_name_for(self._flow_id, self._run_id, parent)
+                try:
+                    info = await self._js.consumer_info(stream, self._data_durable_name(parent))
+                except Exception:
+                    return None
+                lags[parent] = _consumer_backlog(info)
+            return lags
+
+        try:
+            fut = asyncio.run_coroutine_threadsafe(_go(), self._loop)
+            return fut.result(timeout = 5)
+        except Exception:
+            return None
+
+    def buffer_depths(self) -> list[tuple[str, Optional[str], int, Optional[int]]]:
+        '''
+        Local buffers between the broker and the task: each parent's prefetch \
+            queue, the join assembler's pending groups (and collect buffers), and \
+            the unresolved ack handles the keepalive extends.
+        '''
+        depths : list[tuple[str, Optional[str], int, Optional[int]]] = [
+            ('parent_queue', parent, queue.qsize(), _QUEUE_MAXSIZE)
+            for parent, queue in list(self._parent_queues.items())]
+        depths.extend(self._assembler.buffer_depths())
+        with self._live_lock:
+            live = len(self._live_handles)
+        depths.append(('live_handles', None, live, None))
+        return depths
+
     def _ack_eos(self, parent : str) -> None:
         handle = self._eos_handles.pop(parent, None)
         if handle is not None:
             handle.ack()
 
-    def _recv_ready(self) -> list[tuple[str, EnvelopeEntry, _AckHandle]]:
+    def _recv_ready(self, timeout : float = _FETCH_TIMEOUT_SECONDS) -> list[tuple[str, EnvelopeEntry, _AckHandle]]:
         '''
-        Waits up to a short timeout for at least one parent queue to have an item, \
+        Waits up to ``timeout`` seconds for at least one parent queue to have an item, \
             then returns every parent item that became ready within that wait as \
             ``[(parent_name, entry, handle), ...]`` — possibly empty on timeout, \
             which lets ``receive_message`` loop back and re-check the termination \
@@ -852,7 +1134,7 @@ class NATSMessenger(Messenger):
             }
             done, pending = await asyncio.wait(
                 get_tasks.keys(),
-                timeout = _FETCH_TIMEOUT_SECONDS,
+                timeout = timeout,
                 return_when = asyncio.FIRST_COMPLETED,
             )
             for p in pending:
@@ -262,8 +262,11 @@ async def provision_flow(nc : Client, specs : list[NodeSpec], flow_id : str, run
             if parent_name not in by_name:
                 continue
             parent_stream = stream_name_for(flow_id, run_id, parent_name)
+            # A pooled processor keeps one extra un-acked group per additional pool slot.
+            window = max(1, int((spec.params or {}).get('workers_per_replica', 1) or 1))
             base = consumer_config_for(flow_id, run_id, spec.name, parent_name, ack_wait = ack_wait,
-                                    max_deliver = max_deliver, max_ack_pending = max_ack_pending)
+                                    max_deliver = max_deliver,
+                                    max_ack_pending = max_ack_pending + window - 1)
             if partition_by and nb_tasks > 1:
                 for replica_id in range(nb_tasks):
                     cfg = ConsumerConfig(
@@ -1,2 +1,9 @@
-from .aggregators import CountAggregator, MaxAggregator, MinAggregator, MultiplicationAggregator, SumAggregator
+from .aggregators import (
+    CountAggregator,
+    MaxAggregator,
+    MinAggregator,
+    MultiplicationAggregator,
+    SumAggregator,
+    WindowAggregator,
+)
 from .basic import IdentityProcessor, JoinerProcessor
@@ -1,19 +1,28 @@
 from __future__ import absolute_import, division, print_function
 
-from typing import Any
+import math
+import time
+from typing import Any, List, Optional, Tuple
 
-from ..core.node import OneTaskProcessorNode
+import numpy as np
 
+from ..core.context import RuntimeContext
+from ..core.node import KeyedProcessorNode
 
-class SumAggregator(OneTaskProcessorNode):
+WINDOW_REDUCERS = ('sum', 'mean', 'min', 'max', 'count', 'percentile')
+WINDOW_TYPES = ('tumbling', 'sliding')
+WINDOW_UNITS = ('items', 'seconds')
+WINDOW_EMIT_ON = ('input', 'close')
+
+
+class SumAggregator(KeyedProcessorNode):
     '''
-    Keeps a running sum of all the inputs processed
+    Keeps a running sum of all the inputs processed, per partition key
     '''
-    def __init__(self, **kwargs) -> None:
-        self._sum = 0
-        super(SumAggregator, self).__init__(**kwargs)
+    def initial_state(self) -> Any:
+        return 0
 
-    def process(self, inp : Any) -> Any:
+    def process(self, inp : Any, ctx : Optional[RuntimeContext] = None) -> Any:
         '''
         - Arguments:
             - inp: a number
@@ -21,18 +30,18 @@ class SumAggregator(OneTaskProcessorNode):
         - Returns:
             - sum: the cumulative sum up to this point, including ``inp`` in it.
         '''
-        self._sum += inp
-        return self._sum
+        total = self.get_state(ctx) + inp
+        self.set_state(ctx, total)
+        return total
 
-class MultiplicationAggregator(OneTaskProcessorNode):
+class MultiplicationAggregator(KeyedProcessorNode):
     '''
-    Keeps a running multiplication of all the inputs processed
+    Keeps a running multiplication of all the inputs processed, per partition key
     '''
-    def __init__(self, **kwargs) -> None:
-        self._mult = 1
-        super(MultiplicationAggregator, self).__init__(**kwargs)
+    def initial_state(self) -> Any:
+        return 1
 
-    def process(self, inp : Any) -> Any:
+    def process(self, inp : Any, ctx : Optional[RuntimeContext] = None) -> Any:
         '''
         - Arguments:
             - inp: a number
@@ -40,18 +49,18 @@ class MultiplicationAggregator(OneTaskProcessorNode):
         - Returns:
             - mult: the cumulative multiplication up to this point, including ``inp`` in it.
         '''
-        self._mult *= inp
-        return self._mult
+        mult = self.get_state(ctx) * inp
+        self.set_state(ctx, mult)
+        return mult
 
-class CountAggregator(OneTaskProcessorNode):
+class CountAggregator(KeyedProcessorNode):
     '''
-    Keeps count of all the items processed
+    Keeps count of all the items processed, per partition key
     '''
-    def __init__(self, **kwargs) -> None:
-        self._count = 0
-        super(CountAggregator, self).__init__(**kwargs)
+    def initial_state(self) -> Any:
+        return 0
 
-    def process(self, inp : Any) -> Any:
+    def process(self, inp : Any, ctx : Optional[RuntimeContext] = None) -> Any:
         '''
         - Arguments:
             - inp: a number
@@ -59,15 +68,15 @@ class CountAggregator(OneTaskProcessorNode):
         - Returns:
             - count: the cumulative count up to this point
         '''
-        self._count += 1
-        return self._count
+        count = self.get_state(ctx) + 1
+        self.set_state(ctx, count)
+        return count
 
-class MaxAggregator(OneTaskProcessorNode):
-    def __init__(self, **kwargs) -> None:
-        self._max = float("-inf")
-        super(MaxAggregator, self).__init__(**kwargs)
+class MaxAggregator(KeyedProcessorNode):
+    def initial_state(self) -> Any:
+        return float("-inf")
 
-    def process(self, inp : Any) -> Any:
+    def process(self, inp : Any, ctx : Optional[RuntimeContext] = None) -> Any:
         '''
         - Arguments:
             - inp: a number
@@ -75,16 +84,15 @@ class MaxAggregator(OneTaskProcessorNode):
         - Returns:
             - max: the maximum seen value up to this point
         '''
-        if inp > self._max:
-            self._max = inp
-        return self._max
+        if inp > self.get_state(ctx):
+            self.set_state(ctx, inp)
+        return self.get_state(ctx)
 
-class MinAggregator(OneTaskProcessorNode):
-    def __init__(self, **kwargs) -> None:
-        self._min = float("inf")
-        super(MinAggregator, self).__init__(**kwargs)
+class MinAggregator(KeyedProcessorNode):
+    def initial_state(self) -> Any:
+        return float("inf")
 
-    def process(self, inp : Any) -> Any:
+    def process(self, inp : Any, ctx : Optional[RuntimeContext] = None) -> Any:
         '''
         - Arguments:
             - inp: a number
@@ -92,6 +100,224 @@ class MinAggregator(OneTaskProcessorNode):
         - Returns:
             - min: the the minimum seen value up to this point
         '''
-        if inp < self._min:
-            self._min = inp
-        return self._min
+        if inp < self.get_state(ctx):
+            self.set_state(ctx, inp)
+        return self.get_state(ctx)
+
+class _RingWindow:
+    '''
+    One key's window: values and their timestamps in a NumPy ring buffer. \
+        Adding and evicting are O(1); sum and mean are kept as a running total, \
+        so they are O(1) too (re-summed from the buffer once per buffer length, \
+        which bounds float drift at O(1) amortized). min, max and percentiles \
+        reduce the buffer in one vectorized call.
+    '''
+    def __init__(self, capacity : int, growable : bool) -> None:
+        self.capacity = capacity
+        self.growable = growable
+        self.values : Optional[np.ndarray] = None
+        self.stamps = np.zeros(capacity)
+        self.start = 0
+        self.size = 0
+        self.total : Any = 0.0
+        self.since_resum = 0
+        self.window_id : Optional[int] = None
+
+    def clear(self) -> None:
+        self.start = self.size = self.since_resum = 0
+        self.total = 0.0
+
+    def _values(self) -> np.ndarray:
+        # Allocated by the first push(), once the value shape is known.
+        assert self.values is not None, 'empty window'
+        return self.values
+
+    def _segments(self) -> List[slice]:
+        end = self.start + self.size
+        if end <= self.capacity:
+            return [slice(self.start, end)]
+        return [slice(self.start, self.capacity), slice(0, end - self.capacity)]
+
+    def _grow(self) -> None:
+        order = np.concatenate([np.arange(self.capacity)[seg] for seg in self._segments()])
+        capacity = self.capacity * 2
+        old = self._values()
+        values = np.zeros((capacity,) + old.shape[1:], dtype = old.dtype)
+        values[:self.size] = old[order]
+        stamps = np.zeros(capacity)
+        stamps[:self.size] = self.stamps[order]
+        self.values, self.stamps, self.capacity, self.start = values, stamps, capacity, 0
+
+    def push(self, value : np.ndarray, ts : float) -> None:
+        if self.values is None:
+            self.values = np.zeros((self.capacity,) + value.shape, dtype = value.dtype)
+        elif value.shape != self.values.shape[1:]:
+            raise ValueError(f'window inputs must keep one shape, got {value.shape} '
+                            f'after {self.values.shape[1:]}')
+        if self.size == self.capacity:
+            if self.growable:
+                self._grow()
+            else:
+                self.pop()
+        slot = (self.start + self.size) % self.capacity
+        self._values()[slot] = value
+        self.stamps[slot] = ts
+        self.size += 1
+        self.total = self.total + value.astype(np.float64)
+        self.since_resum += 1
+
+    def pop(self) -> None:
+        self.total = self.total - self._values()[self.start].astype(np.float64)
+        self.start = (self.start + 1) % self.capacity
+        self.size -= 1
+
+    def span(self) -> Tuple[float, float]:
+        '''Timestamps of the oldest and newest values held.'''
+        return float(self.stamps[self.start]), float(self.stamps[(self.start + self.size - 1) % self.capacity])
+
+    def evict_before(self, ts : float) -> None:
+        while self.size and self.stamps[self.start] <= ts:
+            self.pop()
+
+    def sum(self) -> Any:
+        if self.since_resum >= self.capacity:
+            values = self._values()
+            self.total = sum(values[seg].sum(axis = 0, dtype = np.float64) for seg in self._segments())
+            self.since_resum = 0
+        return self.total
+
+    def reduce(self, how : str, q : Optional[float]) -> Any:
+        if how == 'count':
+            return self.size
+        if how == 'sum':
+            return self.sum()
+        if how == 'mean':
+            return self.sum() / self.size
+        values = self._values()
+        parts = [values[seg] for seg in self._segments()]
+        if how == 'percentile':
+            assert q is not None   # checked by WindowAggregator
+            return np.percentile(parts[0] if len(parts) == 1 else np.concatenate(parts), q, axis = 0)
+        op = np.maximum if how == 'max' else np.minimum
+        out = op.reduce(parts[0], axis = 0)
+        for part in parts[1:]:
+            out = op(out, op.reduce(part, axis = 0))
+        return out
+
+class WindowAggregator(KeyedProcessorNode):
+    '''
+    Aggregates the inputs of a window, per partition key: the sum, mean, min, \
+        max, count or a percentile of the last ``length`` items or seconds. \
+        Inputs may be numbers or same-shape ``np.ndarray``s, reduced element-wise \
+        (e.g. ``reduce='max'`` over frames builds a motion heatmap).
+
+    To group by a metadata field (a camera or zone id), set ``partition_by`` \
+        to it: each key gets its own window, and the node can then also run with \
+        ``nb_tasks > 1``.
+
+    - Arguments:
+        - reduce: one of ``WINDOW_REDUCERS``.
+        - length: window length, in ``unit``s.
+        - window: ``tumbling`` (consecutive, non-overlapping windows: the state \
+            resets when one closes) or ``sliding`` (the window always ends at \
+            the current input).
+        - unit: ``items`` or ``seconds``. Time windows use the input's event \
+            time (see ``ctx.set_event_timestamp``), else the arrival time.
+        - q: the percentile (0 to 100), for ``reduce='percentile'``.
+        - emit_on: ``input`` publishes, for every input, the aggregate of its \
+            window so far. ``close`` (tumbling windows only) publishes each \
+            window once, when it closes, as ``{'key', 'window_start', \
+            'window_end', 'value'}`` stamped with event time ``window_end``; \
+            windows still open at end of stream, or whose key is evicted past \
+            ``max_keys``, are published then. A time \
+            window spans ``[k * length, (k + 1) * length)`` seconds; an item \
+            window, the timestamps of its first and last inputs.
+
+    - Returns (from ``process``):
+        - the aggregate of the window the input belongs to, so far. Sums and \
+            means are float64.
+    '''
+    def __init__(self, reduce : str = 'sum', length : float = 10, window : str = 'sliding',
+                unit : str = 'items', q : Optional[float] = None, emit_on : str = 'input',
+                **kwargs : Any) -> None:
+        if reduce not in WINDOW_REDUCERS:
+            raise ValueError(f'reduce must be one of {WINDOW_REDUCERS}, got {reduce!r}')
+        if window not in WINDOW_TYPES:
+            raise ValueError(f'window must be one of {WINDOW_TYPES}, got {window!r}')
+        if unit not in WINDOW_UNITS:
+            raise ValueError(f'unit must be one of {WINDOW_UNITS}, got {unit!r}')
+        if not length > 0 or (unit == 'items' and int(length) != length):
+            raise ValueError(f'length must be a positive number (an integer for items), got {length!r}')
+        if reduce == 'percentile' and (q is None or not 0 <= q <= 100):
+            raise ValueError(f'q must be between 0 and 100 for a percentile, got {q!r}')
+        if emit_on not in WINDOW_EMIT_ON:
+            raise ValueError(f'emit_on must be one of {WINDOW_EMIT_ON}, got {emit_on!r}')
+        if emit_on == 'close' and window != 'tumbling':
+            raise ValueError("emit_on='close' needs a tumbling window; a sliding window never closes")
+        self._reduce = reduce
+        self._length = length
+        self._window = window
+        self._unit = unit
+        self._q = q
+        self._emit_on = emit_on
+        self.emits = emit_on == 'close'
+        super(WindowAggregator, self).__init__(**kwargs)
+
+    def initial_state(self) -> _RingWindow:
+        if self._unit == 'items':
+            return _RingWindow(int(self._length), growable = False)
+        return _RingWindow(64, growable = True)
+
+    @staticmethod
+    def _timestamp(ctx : Optional[RuntimeContext]) -> float:
+        for entry in (getattr(ctx, 'input_info', None) or {}).values():
+            if isinstance(entry, dict) and entry.get('event_ts') is not None:
+                return entry['event_ts']
+        return time.time()
+
+    def process(self, inp : Any, ctx : Optional[RuntimeContext] = None) -> Any:
+        '''
+        - Arguments:
+            - inp: a number or an np.ndarray
+
+        - Returns:
+            - the window's aggregate, a number or an np.ndarray of ``inp``'s shape.
+        '''
+        state : _RingWindow = self.get_state(ctx)
+        ts = self._timestamp(ctx)
+        if self._window == 'tumbling' and self._unit == 'seconds':
+            window_id = math.floor(ts / self._length)
+            if window_id != state.window_id:
+                self._close(getattr(ctx, 'key', None), state)
+                state.window_id = window_id
+        elif self._unit == 'seconds':
+            state.evict_before(ts - self._length)
+        state.push(np.asarray(inp), ts)
+        out = self._result(state)
+        if self._window == 'tumbling' and self._unit == 'items' and state.size == state.capacity:
+            self._close(getattr(ctx, 'key', None), state, out)
+        return out
+
+    def _result(self, state : _RingWindow) -> Any:
+        out = state.reduce(self._reduce, self._q)
+        return out.item() if np.ndim(out) == 0 and isinstance(out, (np.ndarray, np.generic)) else out
+
+    def _close(self, key : Any, state : _RingWindow, result : Any = None) -> None:
+        if self.emits and state.size:
+            if state.window_id is not None:
+                start = state.window_id * self._length
+                end = start + self._length
+            else:
+                start, end = state.span()
+            self.emit({'key': key, 'window_start': start, 'window_end': end,
+                        'value': self._result(state) if result is None else result}, event_ts = end)
+        state.clear()
+
+    def on_evict(self, key : Any, state : _RingWindow) -> None:
+        '''With ``emit_on='close'``, publishes the evicted key's open window.'''
+        self._close(key, state)
+
+    def flush(self) -> None:
+        '''With ``emit_on='close'``, publishes every window still open.'''
+        for key, state in self._states.items():
+            self._close(key, state)
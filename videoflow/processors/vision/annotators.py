@@ -10,6 +10,24 @@ from ...utils.downloader import get_file
 from ...utils.parsers import parse_label_map
 from .detectors import BASE_URL_DETECTION
 
+_FONT = cv2.FONT_HERSHEY_SIMPLEX
+_FONT_SCALE = 0.5
+
+def _draw_boxes(im : np.ndarray, boxes : np.ndarray, color : tuple, thickness : int) -> None:
+    '''All rectangles in one ``cv2.polylines`` call. ``boxes`` rows start with ``[ymin, xmin, ymax, xmax]``.'''
+    b = np.asarray(boxes)[:, :4].astype(np.int32)
+    ymin, xmin, ymax, xmax = b[:, 0], b[:, 1], b[:, 2], b[:, 3]
+    corners = np.stack([np.stack([xmin, ymin], 1), np.stack([xmax, ymin], 1),
+                        np.stack([xmax, ymax], 1), np.stack([xmin, ymax], 1)], axis = 1)
+    # A sequence of (4, 2) point arrays, one per box (views into ``corners``, nothing copied).
+    cv2.polylines(im, list(corners), True, color, thickness)
+
+def _label_rows(boxes : np.ndarray) -> np.ndarray:
+    # Above the box when there is room, else just inside its top edge.
+    b = np.asarray(boxes)[:, :4].astype(np.int64)
+    ymin, ymax = b[:, 0], b[:, 2]
+    return np.where(ymin - 15 > 15, ymin - 15, np.minimum(ymin + 15, ymax))
+
 
 class ImageAnnotator(ProcessorNode):
     '''
@@ -17,8 +35,15 @@ class ImageAnnotator(ProcessorNode):
     All image annotators receive as input an image and annotation
     metadata, and return as output a copy of the image with
     the drawings representing the metadata.
+
+    - Arguments:
+        - inplace: draw on the input frame itself instead of a copy, when it is \
+            writable and contiguous. Saves a frame copy, but only safe when no \
+            other node or caller still uses that frame: numpy cannot tell whether \
+            something else holds a reference to the same memory.
     '''
-    def __init__(self, nb_tasks : int = 1, **kwargs) -> None:
+    def __init__(self, nb_tasks : int = 1, inplace : bool = False, **kwargs) -> None:
+        self._inplace = inplace
         super(ImageAnnotator, self).__init__(nb_tasks = nb_tasks, **kwargs)
 
     def _annotate(self, im : np.ndarray, annotations : Any) -> np.ndarray:
@@ -28,9 +53,15 @@ class ImageAnnotator(ProcessorNode):
     # not LSP substitutability. See [tool.mypy] disable/enable notes in pyproject.
     def process(self, im : np.ndarray, annotations : Any) -> np.ndarray:   # type: ignore[override]
         '''
-        Returns a copy of ``im`` visually annotated with the annotations defined in `annotations`
+        Returns a copy of ``im`` (or ``im`` itself, with ``inplace=True`` and a \
+            writable contiguous frame) visually annotated with the annotations \
+            defined in `annotations`
         '''
-        to_annotate = np.array(im)
+        if self._inplace and im.flags.writeable and im.flags.c_contiguous:
+            to_annotate = im
+        else:
+            # Frames decoded off the wire are read-only views of the message buffer.
+            to_annotate = np.array(im)
         return self._annotate(to_annotate, annotations)
 
 class BoundingBoxAnnotator(ImageAnnotator):
@@ -88,16 +119,15 @@ class BoundingBoxAnnotator(ImageAnnotator):
             - annotated_im: image with the visual annotations embedded in it.
         '''
 
-        for i in range(len(boxes)):
-            bbox = boxes[i]
-            ymin, xmin, ymax, xmax = int(bbox[0]), int(bbox[1]), int(bbox[2]), int(bbox[3])
-            y_label = ymin - 15 if ymin - 15 > 15 else min(ymin + 15, ymax)
-            klass_id = int(bbox[4])
-            klass_text = self._index_label_d[klass_id]
-            confidence = bbox[5]
-            label = "{}: {:.2f}%".format(klass_text, confidence * 100)
-            cv2.rectangle(im, (xmin, ymin), (xmax, ymax), self._box_color, self._box_thickness)
-            cv2.putText(im, label, (xmin, y_label), cv2.FONT_HERSHEY_SIMPLEX, 0.5, self._text_color, lineType = cv2.LINE_AA)
+        if len(boxes) == 0:
+            return im
+        _draw_boxes(im, boxes, self._box_color, self._box_thickness)
+        # One conversion to Python scalars up front, not per element access.
+        for (xmin, klass_id, confidence), y_label in zip(np.asarray(boxes)[:, [1, 4, 5]].tolist(),
+                                                        _label_rows(boxes).tolist()):
+            label = "{}: {:.2f}%".format(self._index_label_d[int(klass_id)], confidence * 100)
+            cv2.putText(im, label, (int(xmin), y_label), _FONT, _FONT_SCALE, self._text_color,
+                        lineType = cv2.LINE_AA)
         return im
 
 class TrackerAnnotator(ImageAnnotator):
@@ -122,14 +152,13 @@ class TrackerAnnotator(ImageAnnotator):
         - Returns:
             - annotated_im: image with the visual annotations embedded in it.
         '''
-        for i in range(len(boxes)):
-            bbox = boxes[i]
-            ymin, xmin, ymax, xmax = int(bbox[0]), int(bbox[1]), int(bbox[2]), int(bbox[3])
-            y_label = ymin - 15 if ymin - 15 > 15 else min(ymin + 15, ymax)
-            track_id = int(bbox[4])
-            label = "{}".format(track_id)
-            cv2.rectangle(im, (xmin, ymin), (xmax, ymax), self._box_color, self._box_thickness)
-            cv2.putText(im, label, (xmin, y_label), cv2.FONT_HERSHEY_SIMPLEX, 0.5, self._text_color, lineType = cv2.LINE_AA)
+        if len(boxes) == 0:
+            return im
+        _draw_boxes(im, boxes, self._box_color, self._box_thickness)
+        for (xmin, track_id), y_label in zip(np.asarray(boxes)[:, [1, 4]].tolist(),
+                                            _label_rows(boxes).tolist()):
+            cv2.putText(im, str(int(track_id)), (int(xmin), y_label), _FONT, _FONT_SCALE,
+                        self._text_color, lineType = cv2.LINE_AA)
         return im
 
 class SegmenterAnnotator(ImageAnnotator):
@@ -181,6 +210,7 @@ class SegmenterAnnotator(ImageAnnotator):
         self._class_labels_path = class_labels_path
         self._index_label_d = parse_label_map(class_labels_path)
         self._transparency = transparency
+        self._palette = np.array(self.colors).round().astype(np.uint8)
         super(SegmenterAnnotator, self).__init__(nb_tasks = nb_tasks, **kwargs)
 
     def _annotate(self, im : np.ndarray, annotations : list) -> np.ndarray:
@@ -195,27 +225,25 @@ class SegmenterAnnotator(ImageAnnotator):
         - Returns:
             - annotated_im: image with the visual annotations embedded in it.
         '''
-        masks = annotations[0]
-        classes = annotations[1]
-
-        to_return = im.copy().astype(float)
+        masks = np.asarray(annotations[0])
+        classes = np.asarray(annotations[1])
+        if len(masks) == 0:
+            return im
 
         # TODO: Add border to masks
-        # TODO: Think about how to solve issue of overlaping masks
         # TODO: Add class names to masks
 
-        for idx, mask in enumerate(masks):
-            alpha = cv2.merge((mask, mask, mask))
-            alpha = alpha.astype(float)
-            alpha[alpha == 1.0] = self._transparency
+        # Class-indexed label map: 0 is background, k + 1 is mask k. Where masks
+        # overlap, the later mask wins.
+        covered = masks > 0.5
+        last = len(masks) - 1 - np.argmax(covered[::-1], axis = 0)
+        label_map = np.where(covered.any(axis = 0), last + 1, 0)
 
-            #1. Mask foreground
-            foreground = np.zeros_like(to_return, dtype = float)
-            foreground[:] = self.colors[int(classes[idx]) % len(self.colors)]
-            foreground = cv2.multiply(alpha, foreground)
+        palette = np.zeros((len(masks) + 1, 3), dtype = np.uint8)
+        palette[1:] = self._palette[classes.astype(np.int64) % len(self._palette)]
+        overlay = palette[label_map]
 
-            #2. Image background
-            background = cv2.multiply(1.0 - alpha, to_return)
-            to_return = cv2.add(foreground, background)
-
-        return to_return.astype(np.uint8)
+        # One uint8 blend over the whole frame, kept only where a mask is.
+        blended = cv2.addWeighted(im, 1.0 - self._transparency, overlay, self._transparency, 0)
+        np.copyto(im, blended, where = (label_map > 0)[..., None])
+        return im
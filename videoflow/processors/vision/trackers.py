@@ -1,8 +1,11 @@
 from __future__ import absolute_import, division, print_function
 
+from typing import Any, Optional, Tuple
+
 import numpy as np
 
-from ...core.node import OneTaskProcessorNode
+from ...core.context import RuntimeContext
+from ...core.node import KeyedProcessorNode, OneTaskProcessorNode
 
 
 class BoundingBoxTracker(OneTaskProcessorNode):
@@ -29,3 +32,217 @@ class BoundingBoxTracker(OneTaskProcessorNode):
                 Specifically (nb_boxes, [ymin, xmin, ymax, xmax, track_id])
         '''
         return self._track(dets)
+
+def iou_matrix(a : np.ndarray, b : np.ndarray) -> np.ndarray:
+    '''
+    - Arguments:
+        - a: np.ndarray of shape (n, 4+), rows starting [ymin, xmin, ymax, xmax]
+        - b: np.ndarray of shape (m, 4+), same layout
+
+    - Returns:
+        - np.ndarray of shape (n, m): pairwise intersection over union.
+    '''
+    a = np.asarray(a, dtype = np.float64)[:, None, :4]
+    b = np.asarray(b, dtype = np.float64)[None, :, :4]
+    ih = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    iw = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = ih * iw
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    union = area_a + area_b - inter
+    return np.where(union > 0, inter / np.where(union > 0, union, 1), 0.0)
+
+def _greedy_assignment(iou : np.ndarray, threshold : float) -> Tuple[np.ndarray, np.ndarray]:
+    # Highest-IoU pair first. Only the candidate pairs over the threshold are
+    # walked, which is a handful per detection in practice.
+    rows, cols = np.nonzero(iou >= threshold)
+    order = np.argsort(-iou[rows, cols], kind = 'stable')
+    used_rows, used_cols, out_rows, out_cols = set(), set(), [], []
+    for r, c in zip(rows[order].tolist(), cols[order].tolist()):
+        if r not in used_rows and c not in used_cols:
+            used_rows.add(r)
+            used_cols.add(c)
+            out_rows.append(r)
+            out_cols.append(c)
+    return np.array(out_rows, dtype = np.int64), np.array(out_cols, dtype = np.int64)
+
+def associate(iou : np.ndarray, threshold : float, method : str = 'auto') -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Matches rows (detections) to columns (tracks) maximizing total IoU.
+
+    - Arguments:
+        - iou: np.ndarray of shape (nb_dets, nb_tracks)
+        - threshold: pairs below this IoU are never matched.
+        - method: ``hungarian`` (needs scipy), ``greedy``, or ``auto`` — \
+            Hungarian when scipy is installed.
+
+    - Returns:
+        - (det_indexes, track_indexes) of the matched pairs.
+    '''
+    if iou.size == 0:
+        empty = np.zeros(0, dtype = np.int64)
+        return empty, empty
+    if method != 'greedy':
+        try:
+            from scipy.optimize import linear_sum_assignment  # optional dependency: greedy matching otherwise
+        except ImportError:
+            if method == 'hungarian':
+                raise
+        else:
+            rows, cols = linear_sum_assignment(-iou)
+            keep = iou[rows, cols] >= threshold
+            return rows[keep].astype(np.int64), cols[keep].astype(np.int64)
+    return _greedy_assignment(iou, threshold)
+
+# Constant-velocity model over z = [cx, cy, area, aspect ratio] (SORT): state is
+# z plus the velocities of cx, cy and area; aspect ratio is taken as constant.
+_F = np.eye(7)
+_F[0, 4] = _F[1, 5] = _F[2, 6] = 1.0
+_H = np.eye(4, 7)
+_Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 0.0001])
+_R = np.diag([1.0, 1.0, 10.0, 10.0])
+_P0 = np.diag([10.0, 10.0, 10.0, 10.0, 10000.0, 10000.0, 10000.0])
+
+def _to_z(boxes : np.ndarray) -> np.ndarray:
+    h = boxes[:, 2] - boxes[:, 0]
+    w = boxes[:, 3] - boxes[:, 1]
+    return np.stack([boxes[:, 1] + w / 2, boxes[:, 0] + h / 2, w * h, w / np.maximum(h, 1e-6)], axis = 1)
+
+def _to_boxes(x : np.ndarray) -> np.ndarray:
+    area = np.maximum(x[:, 2], 0)
+    w = np.sqrt(area * np.maximum(x[:, 3], 0))
+    h = area / np.maximum(w, 1e-6)
+    return np.stack([x[:, 1] - h / 2, x[:, 0] - w / 2, x[:, 1] + h / 2, x[:, 0] + w / 2], axis = 1)
+
+class _SortState:
+    '''
+    The tracks of one stream, struct-of-arrays: row ``i`` of every array is \
+        track ``i``, so predict and update are a few batched matrix products \
+        however many tracks there are.
+    '''
+    def __init__(self) -> None:
+        self.x = np.zeros((0, 7))
+        self.P = np.zeros((0, 7, 7))
+        self.ids = np.zeros(0, dtype = np.int64)
+        self.hit_streak = np.zeros(0, dtype = np.int64)
+        self.since_update = np.zeros(0, dtype = np.int64)
+        self.frame_count = 0
+        self.next_id = 1
+
+    def predict(self) -> np.ndarray:
+        # Area can't go negative: stop its velocity before it would.
+        shrinking = self.x[:, 2] + self.x[:, 6] <= 0
+        self.x[shrinking, 6] = 0.0
+        self.x = self.x @ _F.T
+        self.P = _F @ self.P @ _F.T + _Q
+        self.hit_streak[self.since_update > 0] = 0
+        self.since_update += 1
+        return _to_boxes(self.x)
+
+    def update(self, tracks : np.ndarray, z : np.ndarray) -> None:
+        P = self.P[tracks]
+        S = _H @ P @ _H.T + _R
+        # K = P H^T S^-1, solved batched instead of inverting S.
+        K = np.linalg.solve(S, (P @ _H.T).transpose(0, 2, 1)).transpose(0, 2, 1)
+        residual = z - self.x[tracks] @ _H.T
+        self.x[tracks] += np.einsum('nij,nj->ni', K, residual)
+        self.P[tracks] = (np.eye(7) - K @ _H) @ P
+        self.since_update[tracks] = 0
+        self.hit_streak[tracks] += 1
+
+    def add(self, z : np.ndarray) -> None:
+        n = len(z)
+        x = np.zeros((n, 7))
+        x[:, :4] = z
+        self.x = np.concatenate([self.x, x])
+        self.P = np.concatenate([self.P, np.broadcast_to(_P0, (n, 7, 7))])
+        self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + n)])
+        self.hit_streak = np.concatenate([self.hit_streak, np.zeros(n, dtype = np.int64)])
+        self.since_update = np.concatenate([self.since_update, np.zeros(n, dtype = np.int64)])
+        self.next_id += n
+
+    def keep(self, mask : np.ndarray) -> None:
+        self.x, self.P, self.ids = self.x[mask], self.P[mask], self.ids[mask]
+        self.hit_streak, self.since_update = self.hit_streak[mask], self.since_update[mask]
+
+class SortTracker(KeyedProcessorNode):
+    '''
+    SORT (Bewley et al., 2016): a constant-velocity Kalman filter per track, \
+        and detections matched to the predicted tracks by IoU.
+
+    The tracks are keyed state (see ``KeyedProcessorNode``), so the tracker \
+        scales out: with ``nb_tasks=N, partition_by='camera_id'`` each camera's \
+        frames all reach the same replica, which holds that camera's tracks and \
+        no others. With ``nb_tasks=1``, ``partition_by`` still keeps the cameras' \
+        tracks apart.
+
+    - Arguments:
+        - max_age: frames a track survives without a matching detection.
+        - min_hits: consecutive matches before a track is reported (tracks are \
+            reported from the first frame during a stream's first ``min_hits`` frames).
+        - iou_threshold: minimum IoU for a detection to continue a track.
+        - assignment: ``auto`` (Hungarian via scipy when installed, else greedy), \
+            ``hungarian`` or ``greedy``.
+    '''
+    def __init__(self, max_age : int = 1, min_hits : int = 3, iou_threshold : float = 0.3,
+                assignment : str = 'auto', **kwargs : Any) -> None:
+        if assignment not in ('auto', 'hungarian', 'greedy'):
+            raise ValueError(f"assignment must be 'auto', 'hungarian' or 'greedy', got {assignment!r}")
+        self._max_age = max_age
+        self._min_hits = min_hits
+        self._iou_threshold = iou_threshold
+        self._assignment = assignment
+        super(SortTracker, self).__init__(**kwargs)
+
+    def initial_state(self) -> _SortState:
+        return _SortState()
+
+    def track(self, state : _SortState, dets : np.ndarray) -> np.ndarray:
+        '''
+        Advances the tracks in ``state`` by one frame.
+
+        - Arguments:
+            - state: one stream's tracks, as returned by ``get_state``.
+            - dets: np.ndarray of shape (nb_boxes, 4+) \
+                Specifically (nb_boxes, [ymin, xmin, ymax, xmax, ...])
+
+        - Returns:
+            - tracks: np.ndarray of shape (nb_tracks, 5) \
+                Specifically (nb_tracks, [ymin, xmin, ymax, xmax, track_id])
+        '''
+        state.frame_count += 1
+        dets = np.asarray(dets, dtype = np.float64)
+        if dets.ndim != 2:
+            dets = dets.reshape(-1, 4)
+
+        predicted = state.predict()
+        valid = np.isfinite(predicted).all(axis = 1)
+        if not valid.all():
+            state.keep(valid)
+            predicted = predicted[valid]
+
+        det_idx, trk_idx = associate(iou_matrix(dets, predicted), self._iou_threshold, self._assignment)
+        z = _to_z(dets[:, :4])
+        if len(det_idx):
+            state.update(trk_idx, z[det_idx])
+        unmatched = np.ones(len(dets), dtype = bool)
+        unmatched[det_idx] = False
+        state.add(z[unmatched])
+
+        boxes = _to_boxes(state.x)
+        report = (state.since_update < 1) & ((state.hit_streak >= self._min_hits) |
+                                            (state.frame_count <= self._min_hits))
+        out = np.concatenate([boxes[report], state.ids[report, None].astype(np.float64)], axis = 1)
+        state.keep(state.since_update <= self._max_age)
+        return out
+
+    def process(self, dets : np.ndarray, ctx : Optional[RuntimeContext] = None) -> np.ndarray:
+        '''
+        - Arguments:
+            - dets: np.ndarray of shape (nb_boxes, 6) \
+                Specifically (nb_boxes, [ymin, xmin, ymax, xmax, class_index, score])
+        - Returns:
+            - tracks: np.ndarray of shape (nb_boxes, 5) \
+                Specifically (nb_boxes, [ymin, xmin, ymax, xmax, track_id])
+        '''
+        return self.track(self.get_state(ctx), dets)
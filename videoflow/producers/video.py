@@ -1,13 +1,22 @@
 from __future__ import absolute_import, division, print_function
 
 import logging
+import os
+import queue
+import shutil
+import subprocess
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional, Tuple
 
 import cv2
 import numpy as np
 
 from ..core.context import RuntimeContext
 from ..core.node import ProducerNode
+from ..utils.transforms import FrameSpec, FrameSpecArg, FrameTransform, frame_spec_to_dict
 
 logger = logging.getLogger(__name__)
 
@@ -19,14 +28,45 @@ TIMESTAMP_CLOCK = 'clock'
 TIMESTAMP_POSITION = 'position'
 TIMESTAMP_SOURCES = (TIMESTAMP_CLOCK, TIMESTAMP_POSITION)
 
+# Marks the end of the stream in a reader's read-ahead buffer.
+_END_OF_STREAM = object()
+
+def _drain_queue(buf : queue.Queue) -> None:
+    # Frees a decode thread blocked on a full buffer.
+    try:
+        while True:
+            buf.get_nowait()
+    except queue.Empty:
+        pass
+
+def _stop_decoder(decoder : threading.Thread, stop : threading.Event, decoded : queue.Queue) -> None:
+    '''
+    Signals a decode thread to stop and waits for it. A thread still stuck in a \
+        blocking read after the timeout is left to finish on its own: it releases \
+        its capture on the way out, since ``cv2.VideoCapture`` is not thread-safe.
+    '''
+    stop.set()
+    _drain_queue(decoded)
+    decoder.join(timeout = 5)
+    _drain_queue(decoded)
+    if decoder.is_alive():
+        logger.warning(f'{decoder.name} still blocked after close(); it releases its capture when the read returns')
+
 class ImageProducer(ProducerNode):
     '''
     Reads a single image and produces it
+
+    - Arguments:
+        - image_path: path of the image
+        - output: (FrameSpec or dict) resize / color order / dtype applied to \
+            the image after decoding. Its ``color`` defaults to ``rgb``.
     '''
 
-    def __init__(self, image_path : str, **kwargs) -> None:
+    def __init__(self, image_path : str, output : FrameSpecArg = None, **kwargs) -> None:
         self._image_path = image_path
         self._image_returned = False
+        self._output = frame_spec_to_dict(output)
+        self._transform = FrameTransform(FrameSpec.from_dict(self._output), 'rgb')
         super(ImageProducer, self).__init__(**kwargs)
 
     def open(self) -> None:
@@ -37,52 +77,387 @@ class ImageProducer(ProducerNode):
 
     def next(self) -> np.ndarray:
         '''
-        Returns image in RGB format.
+        Returns image in RGB format (or as ``output`` specifies).
         '''
         if not self._image_returned:
             im = cv2.imread(self._image_path)
             if im is None:
                 raise StopIteration()
-            im = im[...,::-1]
+            im = self._transform(im)
             self._image_returned = True
             return im
         else:
             raise StopIteration()
 
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.m4v', '.webm', '.mpg', '.mpeg')
+
+# ffprobe reads the whole packet index; a stalled one (network mount, odd
+# container) must not hold up open() indefinitely.
+_FFPROBE_TIMEOUT_SECONDS = 60.0
+
+def _list_folder(folder : str, extensions : tuple, start_after : Optional[str],
+                shard_index : int, nb_shards : int) -> List[str]:
+    '''
+    File names in ``folder`` with one of ``extensions``, in alphabetical order. \
+        Sharding is by position in the *full* listing, so a shard's files don't \
+        change when ``start_after`` moves; ``start_after`` then drops every name \
+        up to and including it.
+    '''
+    exts = tuple(e.lower() for e in extensions)
+    with os.scandir(folder) as it:
+        names = sorted(e.name for e in it if e.is_file() and e.name.lower().endswith(exts))
+    names = names[shard_index::nb_shards]
+    if start_after is not None:
+        names = [n for n in names if n > start_after]
+    return names
+
+def _check_shard(shard_index : int, nb_shards : int) -> None:
+    if not isinstance(nb_shards, int) or nb_shards < 1:
+        raise ValueError(f'nb_shards must be a positive int, got {nb_shards!r}')
+    if not isinstance(shard_index, int) or not 0 <= shard_index < nb_shards:
+        raise ValueError(f'shard_index must be in [0, {nb_shards}), got {shard_index!r}')
+
+def _load_cursor(cursor_file : Optional[str], start_after : Optional[str]) -> Optional[str]:
+    '''
+    Where a folder reader resumes: the cursor an earlier run saved in \
+        ``cursor_file``, or ``start_after`` if that is further along.
+    '''
+    if cursor_file is None or not os.path.exists(cursor_file):
+        return start_after
+    with open(cursor_file, encoding = 'utf-8') as f:
+        saved = f.read() or None
+    if saved is None or start_after is None:
+        return saved or start_after
+    return max(saved, start_after)
+
+def _save_cursor(cursor_file : str, cursor : str) -> None:
+    '''Records ``cursor`` in ``cursor_file``, written aside and renamed over it so a crash never truncates it.'''
+    tmp = f'{cursor_file}.tmp'
+    with open(tmp, 'w', encoding = 'utf-8') as f:
+        f.write(cursor)
+    os.replace(tmp, cursor_file)
+
+class _CursorCheckpoint:
+    '''
+    Writes a folder reader's cursor to ``cursor_file`` once it has advanced \
+        ``every`` files past the last write, and on ``flush()`` (the reader's \
+        ``close()``), rather than rewriting the file for every item.
+    '''
+    def __init__(self, cursor_file : Optional[str], every : int) -> None:
+        self._cursor_file = cursor_file
+        self._every = every
+        self._latest : Optional[str] = None
+        self._saved : Optional[str] = None
+        self._nb_pending = 0
+
+    def advance(self, cursor : Optional[str]) -> None:
+        if self._cursor_file is None or cursor is None or cursor == self._latest:
+            return
+        self._latest = cursor
+        self._nb_pending += 1
+        if self._nb_pending >= self._every:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._cursor_file is not None and self._latest is not None and self._latest != self._saved:
+            _save_cursor(self._cursor_file, self._latest)
+            self._saved = self._latest
+        self._nb_pending = 0
+
+def _check_checkpoint_every(checkpoint_every : int) -> None:
+    if not isinstance(checkpoint_every, int) or checkpoint_every < 1:
+        raise ValueError(f'checkpoint_every must be a positive int, got {checkpoint_every!r}')
+
 class ImageFolderReader(ProducerNode):
     '''
     Reads from a folder of images and returns them one by one.
     Passes through images in alphabetical order.
+
+    Images are decoded on a thread pool (``cv2.imdecode`` releases the GIL) into \
+        an ordered prefetch window, so reading and decoding overlap with \
+        publishing. Unreadable files are logged and skipped.
+
+    - Arguments:
+        - folder: path of the folder (not recursive).
+        - extensions: file extensions to read, case-insensitive.
+        - swap_channels: if True, it will change channels from BGR to RGB
+        - nb_workers: decode threads.
+        - prefetch: images decoded ahead of ``next()``.
+        - start_after: resume point — files up to and including this name are \
+            skipped. Pass a previous run's ``cursor``; ``get_params()`` reports \
+            the current one here, so a node rebuilt from it carries on.
+        - cursor_file: path of a file the reader checkpoints its ``cursor`` to as \
+            it advances, and resumes from in ``open()``. On storage that outlives \
+            the worker, a restarted worker carries on where the last one stopped. \
+            It only records files whose output ``next()`` was called past (so \
+            already published).
+        - checkpoint_every: files the cursor advances between writes to \
+            ``cursor_file``; it is also written on ``close()``. After a crash, at \
+            most the last ``checkpoint_every`` files are read again.
+        - shard_index, nb_shards: read only every ``nb_shards``-th file, starting \
+            at ``shard_index``, so ``nb_shards`` readers split a folder between them.
+        - output: (FrameSpec or dict) resize / color order / dtype applied to \
+            each frame as it is decoded, so it is published small and contiguous. \
+            Its ``color`` defaults to what ``swap_channels`` says.
     '''
-    def __init__(self, **kwargs) -> None:
-        super(ImageFolderReader, self).__init__(**kwargs)
+    def __init__(self, folder : str, extensions : tuple = IMAGE_EXTENSIONS, swap_channels : bool = True,
+                nb_workers : int = 4, prefetch : int = 16, start_after : Optional[str] = None,
+                cursor_file : Optional[str] = None, checkpoint_every : int = 100, shard_index : int = 0,
+                nb_shards : int = 1, output : FrameSpecArg = None, **kwargs) -> None:
+        _check_shard(shard_index, nb_shards)
+        _check_checkpoint_every(checkpoint_every)
+        if not isinstance(nb_workers, int) or nb_workers < 1:
+            raise ValueError(f'nb_workers must be a positive int, got {nb_workers!r}')
+        if not isinstance(prefetch, int) or prefetch < 1:
+            raise ValueError(f'prefetch must be a positive int, got {prefetch!r}')
+        self._folder = folder
+        self._extensions = tuple(extensions)
+        self._swap_channels = swap_channels
+        self._output = frame_spec_to_dict(output)
+        self._transform = FrameTransform(FrameSpec.from_dict(self._output),
+                                        'rgb' if swap_channels else 'bgr')
+        self._nb_workers = nb_workers
+        self._prefetch = prefetch
+        self._start_after = start_after
+        self._cursor_file = cursor_file
+        self._checkpoint_every = checkpoint_every
+        self._shard_index = shard_index
+        self._nb_shards = nb_shards
+        # Created in open().
+        self._names : List[str] | None = None
+        self._checkpoint = _CursorCheckpoint(cursor_file, checkpoint_every)
+        self._position = 0
+        self._pending : deque = deque()
+        self._pool : ThreadPoolExecutor | None = None
+        self._cursor = start_after
+        super(ImageFolderReader, self).__init__(is_finite = True, **kwargs)
+
+    def get_params(self) -> dict:
+        params = super(ImageFolderReader, self).get_params()
+        # Always finite; not a constructor argument of this class.
+        params.pop('is_finite', None)
+        params['extensions'] = list(self._extensions)
+        params['start_after'] = self._cursor
+        return params
+
+    @property
+    def cursor(self) -> Optional[str]:
+        '''Name of the last file returned by ``next()``: the ``start_after`` to resume from.'''
+        return self._cursor
 
     def open(self) -> None:
-        raise NotImplementedError()
+        if self._names is None:
+            self._cursor = _load_cursor(self._cursor_file, self._cursor)
+            self._names = _list_folder(self._folder, self._extensions, self._cursor,
+                                        self._shard_index, self._nb_shards)
+            self._pool = ThreadPoolExecutor(max_workers = self._nb_workers,
+                                            thread_name_prefix = f'{self.name}-decode')
 
     def close(self) -> None:
-        raise NotImplementedError()
+        if self._pool is not None:
+            for _, fut in self._pending:
+                fut.cancel()
+            self._pending.clear()
+            self._pool.shutdown(wait = True)
+            self._pool = None
+        self._checkpoint.flush()
+
+    def _decode(self, name : str) -> Optional[np.ndarray]:
+        path = os.path.join(self._folder, name)
+        try:
+            # np.fromfile + imdecode rather than imread: handles non-ASCII paths
+            # and keeps the file read on this worker thread too.
+            im = cv2.imdecode(np.fromfile(path, dtype = np.uint8), cv2.IMREAD_COLOR)
+        except (OSError, cv2.error):
+            im = None
+        if im is None:
+            logger.warning(f'Skipping unreadable image {path}')
+            return None
+        return self._transform(im)
+
+    def next(self) -> tuple[str, np.ndarray]:
+        '''
+        - Returns:
+            - name: file name of the image, relative to ``folder``
+            - image: np.ndarray of shape (h, w, 3)
 
-    def next(self) -> np.ndarray:
-        raise NotImplementedError()
+        - Raises:
+            - StopIteration: after the last image.
+        '''
+        names, pool = self._names, self._pool
+        if names is None or pool is None:
+            raise RuntimeError(
+                f'{type(self).__name__}.next() called before open(). The folder is listed '
+                'in open(), which the task runs in the worker — call open() first.')
+        # Whatever the previous call returned has been published by now.
+        self._checkpoint.advance(self._cursor)
+        while True:
+            while len(self._pending) < self._prefetch and self._position < len(names):
+                name = names[self._position]
+                self._pending.append((name, pool.submit(self._decode, name)))
+                self._position += 1
+            if not self._pending:
+                raise StopIteration()
+            name, fut = self._pending.popleft()
+            im = fut.result()
+            self._cursor = name
+            if im is not None:
+                return (name, im)
 
 class VideoFolderReader(ProducerNode):
     '''
     Reads videos from a folder of videos and returns the frames of
     the videos one by one.
     Passes through videos in alphabetical order.
+
+    Frames are decoded on a background thread into a bounded buffer, which \
+        carries on across file boundaries. Each frame's event time is its \
+        position in its own file (``CAP_PROP_POS_MSEC``).
+
+    - Arguments:
+        - folder: path of the folder (not recursive).
+        - extensions: file extensions to read, case-insensitive.
+        - swap_channels: if True, it will change channels from BGR to RGB
+        - read_ahead: frames decoded ahead of ``next()``.
+        - start_after, cursor_file, checkpoint_every, shard_index, nb_shards: as for \
+            ``ImageFolderReader``. The cursor moves once all of a file's frames are \
+            returned, so after a crash the file being read starts over; a video is \
+            many frames, so ``checkpoint_every`` defaults to every file.
+        - output: (FrameSpec or dict) resize / color order / dtype applied to \
+            each frame as it is decoded, so it is published small and contiguous. \
+            Its ``color`` defaults to what ``swap_channels`` says.
     '''
-    def __init__(self, **kwargs) -> None:
-        super(VideoFolderReader, self).__init__(**kwargs)
+    def __init__(self, folder : str, extensions : tuple = VIDEO_EXTENSIONS, swap_channels : bool = True,
+                read_ahead : int = 8, start_after : Optional[str] = None, cursor_file : Optional[str] = None,
+                checkpoint_every : int = 1, shard_index : int = 0, nb_shards : int = 1,
+                output : FrameSpecArg = None, **kwargs) -> None:
+        _check_shard(shard_index, nb_shards)
+        _check_checkpoint_every(checkpoint_every)
+        if not isinstance(read_ahead, int) or read_ahead < 1:
+            raise ValueError(f'read_ahead must be a positive int, got {read_ahead!r}')
+        self._folder = folder
+        self._extensions = tuple(extensions)
+        self._swap_channels = swap_channels
+        self._output = frame_spec_to_dict(output)
+        self._transform = FrameTransform(FrameSpec.from_dict(self._output),
+                                        'rgb' if swap_channels else 'bgr')
+        self._read_ahead = read_ahead
+        self._start_after = start_after
+        self._cursor_file = cursor_file
+        self._checkpoint_every = checkpoint_every
+        self._shard_index = shard_index
+        self._nb_shards = nb_shards
+        self._checkpoint = _CursorCheckpoint(cursor_file, checkpoint_every)
+        # Created in open().
+        self._decoder : threading.Thread | None = None
+        self._decoded : queue.Queue | None = None
+        self._stop_decoding : threading.Event | None = None
+        self._cursor = start_after
+        super(VideoFolderReader, self).__init__(is_finite = True, **kwargs)
+
+    def get_params(self) -> dict:
+        params = super(VideoFolderReader, self).get_params()
+        # Always finite; not a constructor argument of this class.
+        params.pop('is_finite', None)
+        params['extensions'] = list(self._extensions)
+        params['start_after'] = self._cursor
+        return params
+
+    @property
+    def cursor(self) -> Optional[str]:
+        '''Name of the last file whose frames have all been returned: the ``start_after`` to resume from.'''
+        return self._cursor
 
     def open(self) -> None:
-        raise NotImplementedError()
+        if self._decoder is None:
+            self._cursor = _load_cursor(self._cursor_file, self._cursor)
+            names = _list_folder(self._folder, self._extensions, self._cursor,
+                                self._shard_index, self._nb_shards)
+            self._stop_decoding = threading.Event()
+            self._decoded = queue.Queue(maxsize = self._read_ahead)
+            self._decoder = threading.Thread(target = self._decode_loop, args = (names,), daemon = True,
+                                            name = f'{self.name}-decode')
+            self._decoder.start()
 
     def close(self) -> None:
-        raise NotImplementedError()
+        if self._decoder is not None:
+            _stop_decoder(self._decoder, *self._decoder_state())
+            self._decoder = None
+        self._checkpoint.flush()
+
+    def _decoder_state(self) -> tuple[threading.Event, queue.Queue]:
+        '''The stop flag and frame buffer that ``open()`` creates with the decode thread.'''
+        assert self._stop_decoding is not None and self._decoded is not None, 'open() not called'
+        return self._stop_decoding, self._decoded
+
+    def _enqueue(self, item : Any) -> bool:
+        stop, decoded = self._decoder_state()
+        while not stop.is_set():
+            try:
+                decoded.put(item, timeout = 0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _decode_loop(self, names : List[str]) -> None:
+        try:
+            for name in names:
+                video = cv2.VideoCapture(os.path.join(self._folder, name))
+                if not video.isOpened():
+                    logger.warning(f'Skipping unreadable video {name}')
+                index = 0
+                try:
+                    while video.isOpened():
+                        success, frame = video.read()
+                        if not success:
+                            break
+                        index += 1
+                        ts = video.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                        frame = self._transform(frame)
+                        if not self._enqueue((name, index, frame, ts)):
+                            return
+                finally:
+                    video.release()
+                if not self._enqueue(name):
+                    return
+            self._enqueue(_END_OF_STREAM)
+        except Exception as e:
+            self._enqueue(e)
+
+    def next(self, ctx : RuntimeContext | None = None) -> tuple[str, int, np.ndarray]:
+        '''
+        - Returns:
+            - name: file name of the video, relative to ``folder``
+            - frame no / index: position of the frame in its video, from 1
+            - frame: np.ndarray of shape (h, w, 3)
 
-    def next(self) -> np.ndarray:
-        raise NotImplementedError()
+        - Raises:
+            - StopIteration: after the last frame of the last video.
+        '''
+        if self._decoder is None:
+            raise RuntimeError(
+                f'{type(self).__name__}.next() called before open(). The decode thread is '
+                'started in open(), which the task runs in the worker — call open() first.')
+        _, decoded = self._decoder_state()
+        while True:
+            item = decoded.get()
+            if isinstance(item, str):
+                # End of one file, whose frames were all published by earlier calls.
+                self._cursor = item
+                self._checkpoint.advance(item)
+                continue
+            if item is _END_OF_STREAM or isinstance(item, Exception):
+                # Put it back so every later call observes the same end.
+                decoded.put(item)
+                if isinstance(item, Exception):
+                    raise item
+                raise StopIteration()
+            name, index, frame, ts = item
+            if ctx is not None:
+                ctx.set_event_timestamp(ts)
+            return (name, index, frame)
 
 class VideostreamReader(ProducerNode):
     '''
@@ -100,37 +475,179 @@ class VideostreamReader(ProducerNode):
             ``position`` (the video's own timeline). The stamp is attached to the \
             published message via ``ctx.set_event_timestamp`` so time-aligned \
             joins downstream can synchronize this stream with others.
+        - read_ahead: (int) if > 0, frames are decoded on a background thread into \
+            a bounded buffer of this many frames, so decoding overlaps with \
+            serializing and publishing the previous frame. 0 (default) decodes \
+            inline in ``next()``. Event times are taken when the frame is \
+            decoded, not when it is handed out.
+        - hw_acceleration: (bool) ask the capture backend for hardware decoding \
+            (``cv2.CAP_PROP_HW_ACCELERATION``) where this OpenCV build supports \
+            it; silently decodes in software otherwise.
+        - frame_stride: (int) emit every ``frame_stride``-th frame. The frames in \
+            between are only ``grab()``-ed (demuxed, never converted to an array). \
+            ``nb_frames`` and the returned frame index count frames of the \
+            source, skipped ones included.
+        - output: (FrameSpec or dict) resize / color order / dtype applied to \
+            each frame as it is decoded, so it is published small and contiguous. \
+            Its ``color`` defaults to what ``swap_channels`` says.
     '''
     def __init__(self, url_or_deviceid : int | str, swap_channels : bool = True, nb_frames : int = -1,
                 nb_retries : int = 0, is_finite : bool = True,
-                timestamp_source : str = TIMESTAMP_CLOCK, **kwargs) -> None:
+                timestamp_source : str = TIMESTAMP_CLOCK, read_ahead : int = 0,
+                hw_acceleration : bool = False, frame_stride : int = 1,
+                output : FrameSpecArg = None, **kwargs) -> None:
         if timestamp_source not in TIMESTAMP_SOURCES:
             raise ValueError(f'timestamp_source must be one of {TIMESTAMP_SOURCES}, '
                             f'got {timestamp_source!r}')
+        if not isinstance(read_ahead, int) or read_ahead < 0:
+            raise ValueError(f'read_ahead must be a non-negative int, got {read_ahead!r}')
+        if not isinstance(frame_stride, int) or frame_stride < 1:
+            raise ValueError(f'frame_stride must be a positive int, got {frame_stride!r}')
         self._url_or_deviceid = url_or_deviceid
         self._video : cv2.VideoCapture | None = None   # opened lazily in open()
         self._swap_channels = swap_channels
+        self._output = frame_spec_to_dict(output)
+        self._transform = FrameTransform(FrameSpec.from_dict(self._output),
+                                        'rgb' if swap_channels else 'bgr')
         self._nb_frames = nb_frames
         self._frame_count = 0
         self._nb_retries = nb_retries
         self._retries_count = 0
         self._timestamp_source = timestamp_source
+        self._read_ahead = read_ahead
+        self._hw_acceleration = hw_acceleration
+        self._frame_stride = frame_stride
+        # Read-ahead state, created in open(). While the decode thread runs it is
+        # the only one touching self._video and the counters.
+        self._decoder : threading.Thread | None = None
+        self._decoded : queue.Queue | None = None
+        self._stop_decoding : threading.Event | None = None
         super(VideostreamReader, self).__init__(is_finite = is_finite, **kwargs)
 
+    def _open_capture(self) -> cv2.VideoCapture:
+        if self._hw_acceleration and hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+            try:
+                return cv2.VideoCapture(self._url_or_deviceid, cv2.CAP_ANY,
+                                        [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
+            except (cv2.error, TypeError):
+                logger.warning('Hardware-accelerated capture unavailable, decoding in software')
+        return cv2.VideoCapture(self._url_or_deviceid)
+
     def open(self) -> None:
         '''
-        Opens the video stream
+        Opens the video stream, and starts the decode thread if ``read_ahead`` is set
         '''
         if self._video is None:
-            self._video = cv2.VideoCapture(self._url_or_deviceid)
+            self._video = self._open_capture()
+        if self._read_ahead and self._decoder is None:
+            self._stop_decoding = threading.Event()
+            self._decoded = queue.Queue(maxsize = self._read_ahead)
+            self._decoder = threading.Thread(target = self._decode_loop, daemon = True,
+                                            name = f'{self.name}-decode')
+            self._decoder.start()
 
     def close(self) -> None:
         '''
-        Releases the video stream object
+        Stops the decode thread, if any, and releases the video stream object
         '''
-        if self._video and self._video.isOpened():
+        if self._decoder is not None:
+            # The decode thread owns the capture and releases it when it exits.
+            _stop_decoder(self._decoder, *self._decoder_state())
+            self._decoder = None
+        elif self._video and self._video.isOpened():
             self._video.release()
 
+    def _decoder_state(self) -> tuple[threading.Event, queue.Queue]:
+        '''The stop flag and frame buffer that ``open()`` creates with the decode thread.'''
+        assert self._stop_decoding is not None and self._decoded is not None, 'open() not called'
+        return self._stop_decoding, self._decoded
+
+    def _capture(self) -> cv2.VideoCapture:
+        '''The capture object ``open()`` created (``next()`` and ``skip()`` check it first).'''
+        assert self._video is not None, 'open() not called'
+        return self._video
+
+    def _limit_reached(self) -> bool:
+        return 0 <= self._nb_frames <= self._frame_count
+
+    def _grab(self, count : int) -> bool:
+        '''Advances up to ``count`` frames without decoding them. False if a grab failed.'''
+        video = self._capture()
+        for _ in range(count):
+            if self._limit_reached():
+                raise StopIteration()
+            if not (video.isOpened() and video.grab()):
+                return False
+            self._frame_count += 1
+        return True
+
+    def _read_frame(self) -> tuple[int, np.ndarray, float]:
+        '''Reads the next emitted frame as ``(index, frame, event_ts)``, retrying per ``nb_retries``.'''
+        if self._limit_reached():
+            raise StopIteration()
+        # A failed grab falls through to read(), which owns the reconnect/retry logic.
+        self._grab(self._frame_stride - 1)
+        if self._limit_reached():
+            raise StopIteration()
+
+        video = self._capture()
+        while self._retries_count <= self._nb_retries:
+            if video.isOpened():
+                success, frame = video.read()
+                self._frame_count += 1
+                if not success:
+                    if video.isOpened():
+                        video.release()
+                    video = self._video = self._open_capture()
+                else:
+                    if self._timestamp_source == TIMESTAMP_POSITION:
+                        ts = video.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                    else:
+                        ts = time.time()
+                    frame = self._transform(frame)
+                    return (self._frame_count, frame, ts)
+            else:
+                video = self._video = self._open_capture()
+            self._retries_count += 1
+            logger.error(f'Error reading video, increasing retries count to {self._retries_count}')
+        raise StopIteration()
+
+    def _decode_loop(self) -> None:
+        stop, _ = self._decoder_state()
+        try:
+            while not stop.is_set():
+                self._enqueue(self._read_frame())
+        except StopIteration:
+            self._enqueue(_END_OF_STREAM)
+        except Exception as e:
+            self._enqueue(e)
+        finally:
+            video = self._video
+            if video is not None and video.isOpened():
+                video.release()
+
+    def _enqueue(self, item : Any) -> None:
+        stop, decoded = self._decoder_state()
+        while not stop.is_set():
+            try:
+                decoded.put(item, timeout = 0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _next_item(self) -> tuple[int, np.ndarray, float]:
+        if self._decoder is None:
+            return self._read_frame()
+        _, decoded = self._decoder_state()
+        item = decoded.get()
+        if item is _END_OF_STREAM or isinstance(item, Exception):
+            # Put it back so every later call observes the same end.
+            decoded.put(item)
+            if isinstance(item, Exception):
+                raise item
+            raise StopIteration()
+        return item
+
     def next(self, ctx : RuntimeContext | None = None) -> tuple[int, np.ndarray]:
         '''
         - Returns:
@@ -150,32 +667,30 @@ class VideostreamReader(ProducerNode):
             raise RuntimeError(
                 f'{type(self).__name__}.next() called before open(). The capture object is '
                 'created in open(), which the task runs in the worker — call open() first.')
+        index, frame, ts = self._next_item()
+        if ctx is not None:
+            ctx.set_event_timestamp(ts)
+        return (index, frame)
 
-        if self._frame_count == self._nb_frames:
+    def skip(self) -> None:
+        '''
+        Advances one emitted frame without decoding it (``grab()`` only) — what the \
+            adaptive sampler calls for a dropped frame. Falls back to ``next()`` when \
+            the grab fails, so reconnects and retries behave exactly as for a read. \
+            With ``read_ahead`` the frame is already decoded, and is just discarded.
+        '''
+        if self._video is None:
+            raise RuntimeError(
+                f'{type(self).__name__}.skip() called before open(). The capture object is '
+                'created in open(), which the task runs in the worker — call open() first.')
+        if self._decoder is not None:
+            self._next_item()
+            return
+        if self._limit_reached():
             raise StopIteration()
-
-        while self._retries_count <= self._nb_retries:
-            if self._video.isOpened():
-                success, frame = self._video.read()
-                self._frame_count += 1
-                if not success:
-                    if self._video.isOpened():
-                        self._video.release()
-                    self._video = cv2.VideoCapture(self._url_or_deviceid)
-                else:
-                    if ctx is not None:
-                        if self._timestamp_source == TIMESTAMP_POSITION:
-                            ctx.set_event_timestamp(self._video.get(cv2.CAP_PROP_POS_MSEC) / 1000.0)
-                        else:
-                            ctx.set_event_timestamp(time.time())
-                    if self._swap_channels:
-                        frame = frame[...,::-1]
-                    return (self._frame_count, frame)
-            else:
-                self._video = cv2.VideoCapture(self._url_or_deviceid)
-            self._retries_count += 1
-            logger.error(f'Error reading video, increasing retries count to {self._retries_count}')
-        raise StopIteration()
+        if self._grab(self._frame_stride):
+            return
+        self.next()
 
 class VideoUrlReader(VideostreamReader):
     '''
@@ -201,6 +716,11 @@ class VideoUrlReader(VideostreamReader):
             'is_finite': self._is_finite,
             'swap_channels': self._swap_channels,
             'timestamp_source': self._timestamp_source,
+            'read_ahead': self._read_ahead,
+            'hw_acceleration': self._hw_acceleration,
+            'frame_stride': self._frame_stride,
+            'output': self._output,
+            'sampler': self._sampler,
             'name': self._name,
         }
 
@@ -225,6 +745,11 @@ class VideoDeviceReader(VideostreamReader):
             'is_finite': self._is_finite,
             'swap_channels': self._swap_channels,
             'timestamp_source': self._timestamp_source,
+            'read_ahead': self._read_ahead,
+            'hw_acceleration': self._hw_acceleration,
+            'frame_stride': self._frame_stride,
+            'output': self._output,
+            'sampler': self._sampler,
             'name': self._name,
         }
 
@@ -252,9 +777,244 @@ class VideoFileReader(VideostreamReader):
             'swap_channels': self._swap_channels,
             'nb_frames': self._nb_frames,
             'timestamp_source': self._timestamp_source,
+            'read_ahead': self._read_ahead,
+            'hw_acceleration': self._hw_acceleration,
+            'frame_stride': self._frame_stride,
+            'output': self._output,
+            'sampler': self._sampler,
             'name': self._name,
         }
 
+def probe_keyframes(video_file : str) -> Optional[Tuple[List[int], int]]:
+    '''
+    Finds the keyframes of a file's first video stream from its packet index, \
+        without decoding. Uses PyAV when installed, else the ``ffprobe`` binary.
+
+    - Returns:
+        - ``(keyframe_indices, nb_frames)``, indices in presentation order, or \
+            None if neither tool is available, the probe fails, or ``ffprobe`` \
+            runs past ``_FFPROBE_TIMEOUT_SECONDS``.
+    '''
+    packets = None
+    try:
+        import av  # optional dependency: the ffprobe binary is the fallback
+    except ImportError:
+        av = None
+    if av is not None:
+        try:
+            with av.open(video_file) as container:
+                stream = container.streams.video[0]
+                packets = [(p.pts, p.is_keyframe) for p in container.demux(stream)
+                            if p.pts is not None]
+        except Exception:
+            logger.warning(f'PyAV could not probe {video_file}', exc_info = True)
+    if packets is None and shutil.which('ffprobe') is not None:
+        cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+                '-show_entries', 'packet=pts,flags', '-of', 'csv=p=0', video_file]
+        try:
+            result = subprocess.run(cmd, capture_output = True, text = True,
+                                    timeout = _FFPROBE_TIMEOUT_SECONDS)
+        except subprocess.TimeoutExpired:
+            logger.warning(f'ffprobe timed out probing {video_file}, splitting it evenly')
+            return None
+        if result.returncode == 0:
+            packets = []
+            for line in result.stdout.splitlines():
+                pts, _, flags = line.strip().partition(',')
+                if pts.lstrip('-').isdigit():
+                    packets.append((int(pts), 'K' in flags))
+        else:
+            logger.warning(f'ffprobe could not probe {video_file}: {result.stderr.strip()}')
+    if not packets:
+        return None
+    packets.sort()
+    return [i for i, (_, key) in enumerate(packets) if key], len(packets)
+
+def plan_segments(nb_frames : int, segment_frames : int,
+                keyframes : Optional[List[int]] = None) -> List[Tuple[int, int]]:
+    '''
+    Splits ``[0, nb_frames)`` into ``(start, end)`` segments of about \
+        ``segment_frames`` frames. With ``keyframes``, every segment starts on a \
+        keyframe (segments grow to the next one), so a seek to its start costs no \
+        decoding of discarded frames.
+    '''
+    if nb_frames <= 0:
+        return []
+    if keyframes:
+        starts = [0]
+        for k in keyframes:
+            if k >= starts[-1] + segment_frames and k < nb_frames:
+                starts.append(k)
+    else:
+        starts = list(range(0, nb_frames, segment_frames))
+    return list(zip(starts, starts[1:] + [nb_frames]))
+
+class SegmentedVideoFileReader(ProducerNode):
+    '''
+    Reads a video file like ``VideoFileReader``, but decodes it as GOP-aligned \
+        segments on ``nb_workers`` threads, each with its own capture seeked to \
+        its segment's start (OpenCV decodes with the GIL released, so the threads \
+        use as many cores). Frames are still emitted in file order, with the same \
+        indices and ``position`` event times as the sequential reader, so the \
+        output is identical — only faster for long files in BATCH flows.
+
+    Keyframes are probed with PyAV or ``ffprobe`` (see ``probe_keyframes``); \
+        without either, the file is split evenly and each seek decodes forward \
+        from the preceding keyframe.
+
+    - Arguments:
+        - video_file: path to video file
+        - nb_workers: number of segments decoded concurrently.
+        - segment_frames: target segment length, in frames.
+        - read_ahead: frames buffered per in-flight segment. At most \
+            ``nb_workers * read_ahead`` decoded frames are held at once.
+        - swap_channels: If true, swaps from BGR to RGB
+        - nb_frames: number of frames to process. -1 means all of them
+        - output: as for ``VideostreamReader``.
+    '''
+    def __init__(self, video_file : str, nb_workers : int = 4, segment_frames : int = 250,
+                read_ahead : int = 8, swap_channels : bool = False, nb_frames : int = -1,
+                output : FrameSpecArg = None, **kwargs) -> None:
+        for arg, value in (('nb_workers', nb_workers), ('segment_frames', segment_frames),
+                            ('read_ahead', read_ahead)):
+            if not isinstance(value, int) or value < 1:
+                raise ValueError(f'{arg} must be a positive int, got {value!r}')
+        self._video_file = video_file
+        self._nb_workers = nb_workers
+        self._segment_frames = segment_frames
+        self._read_ahead = read_ahead
+        self._swap_channels = swap_channels
+        self._output = frame_spec_to_dict(output)
+        self._transform = FrameTransform(FrameSpec.from_dict(self._output),
+                                        'rgb' if swap_channels else 'bgr')
+        self._nb_frames = nb_frames
+        # Decode state, created in open().
+        self._segments : List[Tuple[int, int]] | None = None
+        self._buffers : List[queue.Queue] = []
+        self._decoders : List[threading.Thread] = []
+        self._stop_decoding : threading.Event | None = None
+        self._current = 0
+        super(SegmentedVideoFileReader, self).__init__(is_finite = True, **kwargs)
+
+    def get_params(self) -> dict:
+        params = super(SegmentedVideoFileReader, self).get_params()
+        # Always finite; not a constructor argument of this class.
+        params.pop('is_finite', None)
+        return params
+
+    def _count_frames(self) -> int:
+        video = cv2.VideoCapture(self._video_file)
+        try:
+            return int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+        finally:
+            video.release()
+
+    def open(self) -> None:
+        '''
+        Probes the file, plans its segments and starts the decode threads
+        '''
+        if self._segments is not None:
+            return
+        probed = probe_keyframes(self._video_file)
+        keyframes, total = probed if probed is not None else (None, self._count_frames())
+        if self._nb_frames >= 0:
+            total = min(total, self._nb_frames)
+        self._segments = plan_segments(total, self._segment_frames, keyframes)
+        logger.info(f'{self._video_file}: {total} frames in {len(self._segments)} segments, '
+                    f'{"keyframe-aligned" if keyframes else "evenly split"}')
+        self._buffers = [queue.Queue(maxsize = self._read_ahead) for _ in self._segments]
+        self._stop_decoding = threading.Event()
+        self._current = 0
+        nb_threads = min(self._nb_workers, len(self._segments))
+        self._decoders = [
+            threading.Thread(target = self._decode_segments, args = (i, nb_threads), daemon = True,
+                            name = f'{self.name}-decode-{i}')
+            for i in range(nb_threads)
+        ]
+        for t in self._decoders:
+            t.start()
+
+    def close(self) -> None:
+        '''
+        Stops the decode threads
+        '''
+        if self._stop_decoding is not None:
+            self._stop_decoding.set()
+        for t in self._decoders:
+            for buf in self._buffers:
+                _drain_queue(buf)
+            t.join(timeout = 5)
+        self._decoders = []
+        self._buffers = []
+        self._segments = None
+
+    def _put(self, buf : queue.Queue, item : Any) -> bool:
+        stop = self._stop_decoding
+        assert stop is not None, 'open() not called'
+        while not stop.is_set():
+            try:
+                buf.put(item, timeout = 0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _decode_segments(self, worker : int, nb_threads : int) -> None:
+        # Worker i owns segments i, i + n, i + 2n, ... Segment k is consumed only
+        # after every segment before it, so a worker blocked on a full buffer is
+        # always the one the consumer is about to read from: no deadlock.
+        segments = self._segments
+        assert segments is not None, 'open() not called'
+        video = cv2.VideoCapture(self._video_file)
+        try:
+            for k in range(worker, len(segments), nb_threads):
+                start, end = segments[k]
+                buf = self._buffers[k]
+                try:
+                    video.set(cv2.CAP_PROP_POS_FRAMES, start)
+                    for index in range(start, end):
+                        success, frame = video.read()
+                        if not success:
+                            break
+                        ts = video.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                        frame = self._transform(frame)
+                        if not self._put(buf, (index + 1, frame, ts)):
+                            return
+                except Exception as e:
+                    self._put(buf, e)
+                    return
+                if not self._put(buf, _END_OF_STREAM):
+                    return
+        finally:
+            video.release()
+
+    def next(self, ctx : RuntimeContext | None = None) -> tuple[int, np.ndarray]:
+        '''
+        - Returns:
+            - frame no / index  : integer value of the frame read
+            - frame: np.ndarray of shape (h, w, 3)
+
+        - Raises:
+            - StopIteration: after the last segment is exhausted.
+        '''
+        if self._segments is None:
+            raise RuntimeError(
+                f'{type(self).__name__}.next() called before open(). The decode threads are '
+                'started in open(), which the task runs in the worker — call open() first.')
+        while self._current < len(self._buffers):
+            item = self._buffers[self._current].get()
+            if item is _END_OF_STREAM:
+                self._current += 1
+                continue
+            if isinstance(item, Exception):
+                self._buffers[self._current].put(item)
+                raise item
+            index, frame, ts = item
+            if ctx is not None:
+                ctx.set_event_timestamp(ts)
+            return (index, frame)
+        raise StopIteration()
+
 # Here for the sake of not breaking
 # old code
 VideofileReader = VideoFileReader
@@ -0,0 +1,179 @@
+'''
+Flow-level metrics for a local run: every ``LocalProcessEngine`` worker
+registers its health server with the engine, which scrapes them all into one
+per-node table — what ``run-local --dashboard`` shows and ``--metrics-json``
+saves at the end of the run:
+
+    NODE      REPLICAS  MSG/S  MESSAGES  PROCESS p50/p99  QUEUE  ERRORS  BLOB PUT/GET
+    detector  2         41.7   1250      0.021/0.048      12     0       118.0M/23.5M
+
+- MSG/S: input groups processed per second since the previous scrape (a \
+    producer counts the messages it published).
+- MESSAGES: the running total behind MSG/S.
+- PROCESS p50/p99: the node's own processing time, in seconds.
+- QUEUE: messages waiting on the node's incoming edges (JetStream \
+    ``num_pending + num_ack_pending``), summed over parents and replicas.
+- ERRORS: input groups that failed (``messages_failed_total``).
+- BLOB PUT/GET: payload bytes offloaded to / fetched from the blob store.
+
+Registration goes through a directory (``VF_METRICS_DIR``) rather than fixed
+ports, so any number of replicas can share a host: a worker binds an ephemeral
+port and writes it to ``<node>.<replica>.port``, and when it exits it writes
+its last ``/metrics`` text to ``<node>.<replica>.prom`` — so the final table
+still counts the workers that have already finished.
+'''
+from __future__ import absolute_import, division, print_function
+
+import glob
+import os
+import time
+from typing import Optional, Sequence
+
+from .freshness import histogram_quantile, merge_scrapes, scrape
+
+FLOW_COLUMNS = ('NODE', 'REPLICAS', 'MSG/S', 'MESSAGES', 'PROCESS p50/p99', 'QUEUE', 'ERRORS',
+                'BLOB PUT/GET')
+
+def _write_atomic(path : str, text : str) -> None:
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def register_worker(directory : str, node : str, replica : int, port : int) -> None:
+    '''Records that ``node``'s replica ``replica`` serves ``/metrics`` on ``port``.'''
+    _write_atomic(os.path.join(directory, f'{node}.{replica}.port'), str(port))
+
+def write_final_metrics(directory : str, node : str, replica : int, text : str) -> None:
+    '''Leaves an exiting worker's last ``/metrics`` text for the engine's final scrape.'''
+    _write_atomic(os.path.join(directory, f'{node}.{replica}.prom'), text)
+
+def registered_endpoints(directory : str) -> dict[str, str]:
+    '''``{'<node>.<replica>': 'http://localhost:<port>/metrics'}`` for every registered worker.'''
+    endpoints = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*.port'))):
+        worker = os.path.basename(path)[:-len('.port')]
+        try:
+            with open(path) as f:
+                port = int(f.read().strip())
+        except (OSError, ValueError):
+            continue
+        endpoints[worker] = f'http://localhost:{port}/metrics'
+    return endpoints
+
+def scrape_registry(directory : str, timeout : float = 2.0) -> list[str]:
+    '''
+    One metrics text per registered worker: its final text once it has exited, \
+        else a live scrape (skipped if unreachable).
+    '''
+    endpoints = registered_endpoints(directory)
+    finished = {os.path.basename(path)[:-len('.prom')]
+                for path in glob.glob(os.path.join(directory, '*.prom'))}
+    texts = []
+    for worker in sorted(finished | set(endpoints)):
+        if worker in finished:
+            try:
+                with open(os.path.join(directory, f'{worker}.prom')) as f:
+                    texts.append(f.read())
+                continue
+            except OSError:
+                pass
+        if worker in endpoints:
+            texts.extend(scrape([endpoints[worker]], timeout = timeout))
+    return texts
+
+def flow_rows(scrapes : Sequence[str]) -> list[dict]:
+    '''
+    Merges the workers' metrics into one row per node, sorted by name, with keys \
+        ``node``, ``replicas``, ``messages``, ``process_p50``, ``process_p99`` \
+        (seconds, or None), ``queue`` (None when unknown), ``errors``, \
+        ``blob_bytes_put`` and ``blob_bytes_fetched``. ``msg_per_s`` is filled \
+        in by ``FlowMetrics``.
+    '''
+    rows = []
+    nodes = merge_scrapes(scrapes)
+    for node in sorted(nodes):
+        merged = nodes[node]
+        counters = merged['counters']
+        # A producer never receives, so its throughput is what it publishes.
+        messages = (counters.get('messages_processed', 0) if 'messages_received' in counters
+                    else counters.get('messages_published', 0))
+        process = merged['hists'].get('process', {})
+        rows.append({
+            'node': node,
+            'replicas': merged['replicas'],
+            'messages': int(messages),
+            'msg_per_s': None,
+            'process_p50': histogram_quantile(0.5, process),
+            'process_p99': histogram_quantile(0.99, process),
+            'queue': None if merged['lag'] is None else int(merged['lag']),
+            'errors': int(counters.get('messages_failed', 0)),
+            'blob_bytes_put': int(counters.get('blob_bytes_put', 0)),
+            'blob_bytes_fetched': int(counters.get('blob_bytes_fetched', 0)),
+        })
+    return rows
+
+class FlowMetrics:
+    '''
+    Turns successive scrapes into rates: each ``update`` computes MSG/S over the \
+        time since the previous one (since construction for the first).
+    '''
+    def __init__(self) -> None:
+        self._start = time.monotonic()
+        self._last_time = self._start
+        self._last_counts : dict[str, int] = {}
+        self.rows : list[dict] = []
+
+    def update(self, scrapes : Sequence[str], now : Optional[float] = None) -> list[dict]:
+        now = time.monotonic() if now is None else now
+        elapsed = now - self._last_time
+        rows = flow_rows(scrapes)
+        for row in rows:
+            delta = row['messages'] - self._last_counts.get(row['node'], 0)
+            # A worker that vanished between scrapes must not read as negative throughput.
+            row['msg_per_s'] = max(delta, 0) / elapsed if elapsed > 0 else None
+        self._last_time = now
+        self._last_counts = {row['node']: row['messages'] for row in rows}
+        self.rows = rows
+        return rows
+
+    def snapshot(self) -> dict:
+        '''The latest rows plus whole-run averages, as JSON-ready data.'''
+        elapsed = self._last_time - self._start
+        nodes = []
+        for row in self.rows:
+            row = dict(row)
+            row['avg_msg_per_s'] = row['messages'] / elapsed if elapsed > 0 else None
+            nodes.append(row)
+        return {'elapsed_seconds': elapsed, 'nodes': nodes}
+
+def _fmt_seconds(value : Optional[float]) -> str:
+    return '-' if value is None else f'{value:.3f}'
+
+def _fmt_bytes(n : int) -> str:
+    if n < 1024:
+        return str(n)
+    value = float(n)
+    for unit in ('K', 'M', 'G'):
+        value /= 1024
+        if value < 1024 or unit == 'G':
+            break
+    return f'{value:.1f}{unit}'
+
+def format_flow_table(rows : Sequence[dict]) -> str:
+    '''Renders ``flow_rows``/``FlowMetrics`` rows as an aligned text table.'''
+    table = [FLOW_COLUMNS]
+    for row in rows:
+        rate = row.get('msg_per_s')
+        table.append((
+            row['node'], str(row['replicas']),
+            '-' if rate is None else f'{rate:.1f}',
+            str(row['messages']),
+            f'{_fmt_seconds(row["process_p50"])}/{_fmt_seconds(row["process_p99"])}',
+            '-' if row['queue'] is None else str(row['queue']),
+            str(row['errors']),
+            f'{_fmt_bytes(row["blob_bytes_put"])}/{_fmt_bytes(row["blob_bytes_fetched"])}',
+        ))
+    widths = [max(len(r[i]) for r in table) for i in range(len(FLOW_COLUMNS))]
+    return '\n'.join('  '.join(cell.ljust(w) for cell, w in zip(r, widths)).rstrip()
+                     for r in table)
@@ -0,0 +1,204 @@
+'''
+Aggregates the workers' ``/metrics`` (see ``videoflow.runtime.health``) into a
+per-node freshness table — what ``videoflow top`` prints:
+
+    NODE      REPLICAS  IN AGE p50/p99  OUT AGE p50/p99  PROCESS p99  LAG
+    detector  2         0.041/0.180     0.090/0.310      0.048        12
+
+- IN AGE: age of an input when the node receives it (now - event_ts).
+- OUT AGE: age of an output when the node publishes it — IN AGE plus the time \
+    the node itself held the event.
+- PROCESS p99: the node's own processing time.
+- LAG: messages still waiting on the node's incoming edges (JetStream \
+    ``num_pending + num_ack_pending``), summed over parents and replicas.
+
+Replicas of a node are merged by adding their histogram buckets, the same way a
+Prometheus ``sum by (le)`` would, so a quantile covers the whole node.
+'''
+from __future__ import absolute_import, division, print_function
+
+import math
+import re
+import urllib.request
+from typing import Optional, Sequence
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)$')
+_LABEL = re.compile(r'(\w+)="([^"]*)"')
+
+FRESHNESS_COLUMNS = ('NODE', 'REPLICAS', 'IN AGE p50/p99', 'OUT AGE p50/p99', 'PROCESS p99', 'LAG')
+
+def parse_metrics(text : str) -> list[tuple[str, dict[str, str], float]]:
+    '''
+    Parses Prometheus text exposition into ``(name, labels, value)`` samples. \
+        Comment lines and unparseable lines are skipped.
+    '''
+    samples = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        m = _SAMPLE.match(line)
+        if m is None:
+            continue
+        name, labels, value = m.groups()
+        try:
+            samples.append((name, dict(_LABEL.findall(labels or '')), float(value)))
+        except ValueError:
+            continue
+    return samples
+
+def histogram_quantile(q : float, buckets : dict[float, float]) -> Optional[float]:
+    '''
+    The ``q``-quantile of a cumulative histogram ``{upper_bound: count}``, linearly \
+        interpolated within the bucket it falls in (Prometheus' ``histogram_quantile``). \
+        An answer in the ``+Inf`` bucket is clamped to the highest finite bound.
+
+    - Returns:
+        - the quantile, or None for an empty histogram
+    '''
+    if not buckets:
+        return None
+    bounds = sorted(buckets)
+    total = buckets[bounds[-1]]
+    if total <= 0:
+        return None
+    rank = q * total
+    prev_bound, prev_count = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= rank:
+            if math.isinf(bound):
+                return prev_bound
+            if count == prev_count:
+                return bound
+            return prev_bound + (bound - prev_bound) * (rank - prev_count) / (count - prev_count)
+        prev_bound, prev_count = bound, count
+    return prev_bound
+
+def merge_scrapes(scrapes : Sequence[str]) -> dict[str, dict]:
+    '''
+    Merges the ``/metrics`` text of every scraped worker per node.
+
+    - Arguments:
+        - scrapes: one metrics text per worker endpoint
+
+    - Returns:
+        - ``{node: {'replicas': int, 'hists': {metric: {le: count}}, \
+            'counters': {name: value}, 'lag': float or None}}``. Histograms are \
+            keyed by metric name without the ``videoflow_`` prefix, except the \
+            ``process`` stage of ``stage_seconds``, keyed ``process`` (the other \
+            stages are dropped); counters by name without ``videoflow_``/``_total``.
+    '''
+    nodes : dict[str, dict] = {}
+    for text in scrapes:
+        seen = set()
+        for name, labels, value in parse_metrics(text):
+            node = labels.get('node')
+            if node is None:
+                continue
+            seen.add(node)
+            into = nodes.setdefault(node, {'replicas': 0, 'hists': {}, 'counters': {}, 'lag': None})
+            if name == 'videoflow_edge_lag_messages':
+                into['lag'] = (into['lag'] or 0) + value
+            elif name.endswith('_bucket') and 'le' in labels:
+                metric = name[len('videoflow_'):-len('_bucket')]
+                if metric == 'stage_seconds':
+                    if labels.get('stage') != 'process':
+                        continue
+                    metric = 'process'
+                hist = into['hists'].setdefault(metric, {})
+                bound = float(labels['le'])
+                hist[bound] = hist.get(bound, 0) + value
+            elif name.startswith('videoflow_') and name.endswith('_total'):
+                counter = name[len('videoflow_'):-len('_total')]
+                into['counters'][counter] = into['counters'].get(counter, 0) + value
+        for node in seen:
+            nodes[node]['replicas'] += 1
+    return nodes
+
+def _quantile(hists : dict, metric : str, quantile : float) -> Optional[float]:
+    return histogram_quantile(quantile, hists.get(metric, {}))
+
+def freshness_rows(scrapes : Sequence[str]) -> list[dict]:
+    '''
+    Merges the ``/metrics`` text of every scraped worker into one row per node.
+
+    - Arguments:
+        - scrapes: one metrics text per worker endpoint
+
+    - Returns:
+        - rows sorted by node name, with keys ``node``, ``replicas``, \
+            ``in_p50``, ``in_p99``, ``out_p50``, ``out_p99``, ``process_p99`` \
+            (seconds, or None when not observed yet) and ``lag`` (None when unknown)
+    '''
+    nodes = merge_scrapes(scrapes)
+    rows = []
+    for node in sorted(nodes):
+        merged = nodes[node]
+        hists = merged['hists']
+        rows.append({
+            'node': node,
+            'replicas': merged['replicas'],
+            'in_p50': _quantile(hists, 'input_age_seconds', 0.5),
+            'in_p99': _quantile(hists, 'input_age_seconds', 0.99),
+            'out_p50': _quantile(hists, 'output_age_seconds', 0.5),
+            'out_p99': _quantile(hists, 'output_age_seconds', 0.99),
+            'process_p99': _quantile(hists, 'process', 0.99),
+            'lag': None if merged['lag'] is None else int(merged['lag']),
+        })
+    return rows
+
+def _fmt(value : Optional[float]) -> str:
+    return '-' if value is None else f'{value:.3f}'
+
+def format_freshness_table(rows : Sequence[dict]) -> str:
+    '''Renders ``freshness_rows`` output as an aligned text table.'''
+    table = [FRESHNESS_COLUMNS]
+    for row in rows:
+        table.append((
+            row['node'], str(row['replicas']),
+            f'{_fmt(row["in_p50"])}/{_fmt(row["in_p99"])}',
+            f'{_fmt(row["out_p50"])}/{_fmt(row["out_p99"])}',
+            _fmt(row['process_p99']),
+            '-' if row['lag'] is None else str(row['lag']),
+        ))
+    widths = [max(len(r[i]) for r in table) for i in range(len(FRESHNESS_COLUMNS))]
+    return '\n'.join('  '.join(cell.ljust(w) for cell, w in zip(r, widths)).rstrip()
+                     for r in table)
+
+def expand_endpoints(specs : Sequence[str]) -> list[str]:
+    '''
+    Expands ``host:PORT-PORT`` ranges (what ``run-local --metrics-port`` hands out) \
+        into one ``http://host:port/metrics`` URL each. A full URL is kept as is.
+    '''
+    urls = []
+    for spec in specs:
+        if '://' in spec:
+            urls.append(spec)
+            continue
+        host, _, ports = spec.rpartition(':')
+        if not host or not ports:
+            raise ValueError(f'metrics endpoint must be host:port or host:port-port, got {spec!r}')
+        first, _, last = ports.partition('-')
+        try:
+            lo, hi = int(first), int(last or first)
+        except ValueError:
+            raise ValueError(f'metrics endpoint must be host:port or host:port-port, got {spec!r}') from None
+        if hi < lo:
+            raise ValueError(f'metrics endpoint port range is empty, got {spec!r}')
+        urls.extend(f'http://{host}:{port}/metrics' for port in range(lo, hi + 1))
+    return urls
+
+def scrape(urls : Sequence[str], timeout : float = 2.0) -> list[str]:
+    '''
+    Fetches each metrics URL. An unreachable worker (not started yet, or already \
+        exited) is skipped rather than failing the whole table.
+    '''
+    texts = []
+    for url in urls:
+        try:
+            with urllib.request.urlopen(url, timeout = timeout) as resp:
+                texts.append(resp.read().decode('utf-8', 'replace'))
+        except Exception:
+            continue
+    return texts
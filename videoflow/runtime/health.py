@@ -5,21 +5,31 @@ metrics for a running worker, plus an ``InstrumentedMessenger`` that feeds it.
 Endpoints (default port 8080):
   /readyz   200 once the node has started processing (see readiness note below), else 503
   /healthz  200 while the run loop is beating, 503 if it has stalled
-  /metrics  Prometheus text exposition of per-node processing metrics
+  /metrics  Prometheus text exposition of per-node processing metrics: latency
+            histograms, per-stage (see STAGES) and end-to-end, the age of inputs
+            and outputs (now - event_ts), per-edge lag gauges, plus counters
+  /debug/pystack, /debug/profile
+            stack dump and sampling profiler (see videoflow.runtime.profiler)
 
 Kept dependency-free (no prometheus_client) so the base image stays lean; the
 metrics text format is simple enough to emit by hand.
 '''
 from __future__ import absolute_import, division, print_function
 
+import bisect
 import logging
 import threading
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
-from typing import Any, Optional
+from typing import TYPE_CHECKING, Any, Callable, Optional, Sequence
+from urllib.parse import parse_qs, urlsplit
 
 from ..core.engine import Messenger
+from .profiler import DEFAULT_PROFILE_HZ, PROFILE_FORMATS, SamplingProfiler, dump_stacks, render_profile
+
+if TYPE_CHECKING:
+    from .metrics_sinks import MetricsPusher
 
 logger = logging.getLogger(__package__)
 
@@ -29,74 +39,203 @@ DEFAULT_HEALTH_PORT = 8080
 # Kubernetes restarts the pod (e.g. a wedged broker connection).
 LIVENESS_STALL_SECONDS = 60
 
+# Upper bounds (seconds) of the latency histogram buckets, from sub-millisecond
+# broker round trips to multi-second model calls. Override per worker with
+# VF_METRICS_BUCKETS (comma-separated seconds).
+DEFAULT_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                        0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Where one message's time goes in a worker, in order. Rendered as the ``stage``
+# label of ``videoflow_stage_seconds``.
+STAGES = ('receive_wait', 'blob_fetch', 'decode', 'process', 'encode', 'blob_put', 'publish', 'ack')
+
+def parse_buckets(spec : Optional[str]) -> tuple[float, ...]:
+    '''``'0.01,0.1,1'`` -> ``(0.01, 0.1, 1.0)``; empty or None gives ``DEFAULT_LATENCY_BUCKETS``.'''
+    if not spec or not spec.strip():
+        return DEFAULT_LATENCY_BUCKETS
+    try:
+        buckets = tuple(sorted(float(b) for b in spec.split(',') if b.strip()))
+    except ValueError:
+        raise ValueError(f'metrics buckets must be comma-separated seconds, got {spec!r}') from None
+    if not buckets or buckets[0] <= 0:
+        raise ValueError(f'metrics buckets must be positive, got {spec!r}')
+    return buckets
+
 @dataclass
 class _MetricAggregate:
     '''
     The running aggregate behind one observed metric: how many observations have
-    arrived and their running total. Rendered as the Prometheus summary pair
-    ``videoflow_<metric>_count`` / ``videoflow_<metric>_sum``, hence the two fields
-    and no others — this is a fixed-shape record, not a bag of metric keys.
-
-    ``total`` starts as a float so a metric's ``_sum`` renders as ``0.0`` rather
-    than ``0`` on the (unreachable in practice) zero-observation path, and so the
-    accumulation is float arithmetic from the first observation on.
+    arrived, their running total, and how many fell in each histogram bucket.
+    Rendered as the Prometheus histogram ``videoflow_<metric>_bucket`` /
+    ``_count`` / ``_sum``, hence these fields and no others — this is a
+    fixed-shape record, not a bag of metric keys.
+
+    ``buckets[i]`` counts observations in bucket ``i`` alone (the last slot is
+    ``+Inf``); the cumulative ``le`` counts are summed at render time, so an
+    observation is one increment however many buckets there are.
     '''
     count : int = 0
     total : float = 0.0
+    buckets : list[int] = field(default_factory = list)
+
+class _Shard:
+    '''One thread's metrics. Only its own thread writes to it, so recording takes no lock.'''
+    def __init__(self) -> None:
+        # (metric, stage) -> running aggregate; stage is None for node-level metrics.
+        self.metrics : dict[tuple[str, Optional[str]], _MetricAggregate] = {}
+        # counter name -> int (rendered as videoflow_<name>_total)
+        self.counters : dict[str, int] = {}
 
 class HealthState:
-    '''Thread-safe holder for readiness/liveness/metrics, shared between the run loop (via the messenger) and the HTTP handler.'''
-    def __init__(self, node_name : str) -> None:
+    '''
+    Readiness/liveness/metrics, shared between the run loop (via the messenger),
+    the messenger's I/O thread and the HTTP handler.
+
+    Recording is lock-free: each thread accumulates into its own ``_Shard`` and
+    ``render_metrics`` merges them. The lock is taken only when a thread records
+    for the first time and when rendering takes its snapshot of the shard list.
+    '''
+    def __init__(self, node_name : str, buckets : Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> None:
         self._node_name = node_name
-        self._lock = threading.Lock()
+        self._buckets = tuple(buckets)
         self._ready = False
         self._last_beat = time.time()
-        # metric name -> its running aggregate. Arbitrary keys, fixed-shape values.
-        self._metrics : dict[str, _MetricAggregate] = {}
-        # counter name -> int (rendered as videoflow_<name>_total)
-        self._counters : dict[str, int] = {}
+        self._local = threading.local()
+        self._shards_lock = threading.Lock()
+        self._shards : list[_Shard] = []
+        # Called at render time for point-in-time gauges: each returns
+        # [(metric, {label: value}, gauge value), ...].
+        self._collectors : list[Callable[[], list[tuple[str, dict[str, str], float]]]] = []
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
 
     def mark_ready(self) -> None:
-        with self._lock:
-            self._ready = True
+        self._ready = True
 
     def beat(self) -> None:
-        with self._lock:
-            self._last_beat = time.time()
+        self._last_beat = time.time()
+
+    def _record(self, key : tuple[str, Optional[str]], value : float) -> None:
+        metrics = self._shard().metrics
+        m = metrics.get(key)
+        if m is None:
+            m = metrics[key] = _MetricAggregate(buckets = [0] * (len(self._buckets) + 1))
+        m.count += 1
+        m.total += value
+        m.buckets[bisect.bisect_left(self._buckets, value)] += 1
 
     def observe(self, metric : str, value : float | None) -> None:
         if value is None:
             return
-        with self._lock:
-            m = self._metrics.setdefault(metric, _MetricAggregate())
-            m.count += 1
-            m.total += value
+        self._record((metric, None), value)
+
+    def observe_stage(self, stage : str, seconds : float) -> None:
+        '''Records ``seconds`` spent in one of ``STAGES`` for one message.'''
+        self._record(('stage_seconds', stage), seconds)
 
     def incr(self, counter : str, amount : int = 1) -> None:
-        with self._lock:
-            self._counters[counter] = self._counters.get(counter, 0) + amount
+        counters = self._shard().counters
+        counters[counter] = counters.get(counter, 0) + amount
+
+    @property
+    def node_name(self) -> str:
+        return self._node_name
+
+    def add_collector(self, collector : Callable[[], list[tuple[str, dict[str, str], float]]]) -> None:
+        '''Registers a gauge source, queried on every render (rendered as ``videoflow_<metric>``).'''
+        self._collectors.append(collector)
 
     def is_ready(self) -> bool:
-        with self._lock:
-            return self._ready
+        return self._ready
 
     def is_live(self) -> bool:
-        with self._lock:
-            return (time.time() - self._last_beat) < LIVENESS_STALL_SECONDS
+        return (time.time() - self._last_beat) < LIVENESS_STALL_SECONDS
+
+    def _merged(self) -> tuple[dict[tuple[str, Optional[str]], _MetricAggregate], dict[str, int]]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        metrics : dict[tuple[str, Optional[str]], _MetricAggregate] = {}
+        counters : dict[str, int] = {}
+        for shard in shards:
+            # list() copies under the GIL, so a concurrent insert by the owning
+            # thread can't break the iteration; a read may be one observation stale.
+            for key, m in list(shard.metrics.items()):
+                into = metrics.setdefault(key, _MetricAggregate(buckets = [0] * len(m.buckets)))
+                into.count += m.count
+                into.total += m.total
+                into.buckets = [a + b for a, b in zip(into.buckets, m.buckets)]
+            for counter, value in list(shard.counters.items()):
+                counters[counter] = counters.get(counter, 0) + value
+        return metrics, counters
+
+    def snapshot(self) -> 'MetricsSnapshot':
+        '''A point-in-time copy of every metric, including the collectors' gauges.'''
+        metrics, counters = self._merged()
+        gauges = []
+        for collector in self._collectors:
+            try:
+                gauges.extend(collector())
+            except Exception:
+                logger.debug('metrics collector failed', exc_info = True)
+        return MetricsSnapshot(self._node_name, time.time(), self._buckets, metrics, counters, gauges)
 
     def render_metrics(self) -> str:
-        with self._lock:
-            lines = []
-            safe_node = self._node_name.replace('"', '')
-            labels = f'{{node="{safe_node}"}}'
-            for metric, m in self._metrics.items():
-                lines.append(f'videoflow_{metric}_count{labels} {m.count}')
-                lines.append(f'videoflow_{metric}_sum{labels} {m.total}')
-            for counter, value in self._counters.items():
-                lines.append(f'videoflow_{counter}_total{labels} {value}')
-            return '\n'.join(lines) + '\n'
-
-def _make_handler(state : HealthState) -> type:
+        return render_prometheus(self.snapshot())
+
+@dataclass
+class MetricsSnapshot:
+    '''
+    What a ``HealthState`` held at ``timestamp`` (unix seconds): the histograms \
+        keyed by ``(metric, stage)`` (stage None for node-level metrics) over the \
+        finite bounds ``buckets``, the counters, and the collectors' gauges as \
+        ``(metric, {label: value}, value)``. ``/metrics`` renders it \
+        (``render_prometheus``); the push sinks of ``videoflow.runtime.metrics_sinks`` \
+        emit it.
+    '''
+    node : str
+    timestamp : float
+    buckets : tuple[float, ...]
+    histograms : dict[tuple[str, Optional[str]], _MetricAggregate]
+    counters : dict[str, int]
+    gauges : list[tuple[str, dict[str, str], float]]
+
+def render_prometheus(snapshot : MetricsSnapshot) -> str:
+    '''Prometheus text exposition of a snapshot, every sample labelled with its node.'''
+    lines = []
+    safe_node = snapshot.node.replace('"', '')
+    typed = set()
+    for (metric, stage), m in sorted(snapshot.histograms.items(), key = lambda kv: (kv[0][0], kv[0][1] or '')):
+        name = f'videoflow_{metric}'
+        if name not in typed:
+            typed.add(name)
+            lines.append(f'# TYPE {name} histogram')
+        labels = f'node="{safe_node}"' + (f',stage="{stage}"' if stage else '')
+        cumulative = 0
+        for bound, n in zip(snapshot.buckets, m.buckets):
+            cumulative += n
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {m.count}')
+        lines.append(f'{name}_count{{{labels}}} {m.count}')
+        lines.append(f'{name}_sum{{{labels}}} {m.total}')
+    for counter, total in snapshot.counters.items():
+        lines.append(f'# TYPE videoflow_{counter}_total counter')
+        lines.append(f'videoflow_{counter}_total{{node="{safe_node}"}} {total}')
+    for metric, extra, value in snapshot.gauges:
+        name = f'videoflow_{metric}'
+        if name not in typed:
+            typed.add(name)
+            lines.append(f'# TYPE {name} gauge')
+        labels = ''.join(f',{k}="{str(v).replace(chr(34), "")}"' for k, v in extra.items())
+        lines.append(f'{name}{{node="{safe_node}"{labels}}} {value}')
+    return '\n'.join(lines) + '\n'
+
+def _make_handler(state : HealthState, profiler : Optional[SamplingProfiler] = None) -> type:
     class Handler(BaseHTTPRequestHandler):
         def log_message(self, *args : Any) -> None:
             pass  # silence per-request stderr logging
@@ -109,8 +248,31 @@ def _make_handler(state : HealthState) -> type:
             self.end_headers()
             self.wfile.write(payload)
 
+        def _profile(self, query : dict[str, list[str]]) -> None:
+            assert profiler is not None
+            try:
+                seconds = float(query.get('seconds', ['10'])[0])
+                fmt = query.get('format', ['collapsed'])[0]
+                if fmt not in PROFILE_FORMATS:
+                    raise ValueError(f'format must be one of {PROFILE_FORMATS}, got {fmt!r}')
+                samples = profiler.profile(seconds, mode = query.get('mode', ['cpu'])[0],
+                                           hz = int(query.get('hz', [str(DEFAULT_PROFILE_HZ)])[0]))
+            except ValueError as e:
+                self._respond(400, f'{e}\n')
+                return
+            except RuntimeError as e:
+                self._respond(409, f'{e}\n')
+                return
+            body, content_type = render_profile(samples, fmt, seconds, name = state.node_name)
+            self._respond(200, body, content_type)
+
         def do_GET(self) -> None:
-            if self.path == '/readyz':
+            url = urlsplit(self.path)
+            if profiler is not None and url.path == '/debug/pystack':
+                self._respond(200, dump_stacks())
+            elif profiler is not None and url.path == '/debug/profile':
+                self._profile(parse_qs(url.query))
+            elif self.path == '/readyz':
                 ok = state.is_ready()
                 self._respond(200 if ok else 503, 'ready' if ok else 'not-ready')
             elif self.path == '/healthz':
@@ -124,10 +286,22 @@ def _make_handler(state : HealthState) -> type:
     return Handler
 
 class HealthServer:
-    def __init__(self, state : HealthState, port : int = DEFAULT_HEALTH_PORT) -> None:
+    '''
+    Serves ``state`` on ``port``. With ``debug`` (the default) it also serves the \
+        ``/debug/pystack`` and ``/debug/profile`` endpoints (see \
+        ``videoflow.runtime.profiler``); construct it on the main thread so the \
+        profiler's cpu mode can install its signal handler.
+    '''
+    def __init__(self, state : HealthState, port : int = DEFAULT_HEALTH_PORT, debug : bool = True) -> None:
         self._state = state
-        self._httpd = ThreadingHTTPServer(('0.0.0.0', port), _make_handler(state))
-        self._thread = threading.Thread(target = self._httpd.serve_forever, daemon = True)
+        profiler = SamplingProfiler() if debug else None
+        self._httpd = ThreadingHTTPServer(('0.0.0.0', port), _make_handler(state, profiler))
+        self._thread = threading.Thread(target = self._httpd.serve_forever, name = 'vf-health', daemon = True)
+
+    @property
+    def port(self) -> int:
+        '''The bound port — the ephemeral one picked when constructed with ``port = 0``.'''
+        return self._httpd.server_address[1]
 
     def start(self) -> None:
         self._thread.start()
@@ -142,19 +316,50 @@ class InstrumentedMessenger(Messenger):
     ready on its first messenger activity (first send or receive), which happens
     only after ``node.open()`` has returned inside ``NodeTask.run()`` — so a slow
     model-loading ``open()`` correctly keeps the pod un-ready until it finishes.
+
+    With a ``pusher`` (``videoflow.runtime.metrics_sinks.MetricsPusher``), closing
+    the messenger also makes the final push, after the inner messenger has acked
+    and flushed everything it will.
     '''
-    def __init__(self, inner : Messenger, state : HealthState) -> None:
+    def __init__(self, inner : Messenger, state : HealthState,
+                pusher : Optional['MetricsPusher'] = None) -> None:
         self._inner = inner
         self._state = state
+        self._pusher = pusher
+        # A cache hit ran no process(), so it has no 'process' stage to time.
+        self._cache_hit = False
+        # The stages inside the messenger (blob I/O, codec, PubAck) are timed there.
+        inner.set_stage_observer(state.observe_stage)
+        inner.set_counter_observer(state.incr)
+        state.add_collector(self._edge_lag)
+        state.add_collector(self._buffer_depths)
+
+    def _edge_lag(self) -> list[tuple[str, dict[str, str], float]]:
+        lags = self._inner.input_lag() or {}
+        return [('edge_lag_messages', {'parent': parent}, lag) for parent, lag in lags.items()]
+
+    def _buffer_depths(self) -> list[tuple[str, dict[str, str], float]]:
+        gauges = []
+        for buffer, parent, depth, capacity in self._inner.buffer_depths() or []:
+            labels = {'buffer': buffer} if parent is None else {'buffer': buffer, 'parent': parent}
+            gauges.append(('buffer_depth', labels, depth))
+            if capacity is not None:
+                gauges.append(('buffer_capacity', labels, capacity))
+        return gauges
 
     def publish_message(self, message : Any, metadata : dict | None = None) -> None:
         self._state.mark_ready()
         self._state.beat()
         if metadata:
+            if metadata.get('proctime') is not None and not self._cache_hit:
+                self._state.observe_stage('process', metadata['proctime'])
             self._state.observe('proctime_seconds', metadata.get('proctime'))
             self._state.observe('actual_proctime_seconds', metadata.get('actual_proctime'))
         self._state.incr('messages_published')
-        return self._inner.publish_message(message, metadata)
+        self._inner.publish_message(message, metadata)
+        event_ts = self._inner.last_published_event_ts()
+        if event_ts is not None:
+            self._state.observe('output_age_seconds', time.time() - event_ts)
 
     def publish_stop_signal(self) -> None:
         return self._inner.publish_stop_signal()
@@ -166,12 +371,34 @@ class InstrumentedMessenger(Messenger):
     def receive_message(self) -> dict:
         self._state.mark_ready()
         self._state.beat()
+        start = time.perf_counter()
+        inputs = self._inner.receive_message()
+        return self._received(inputs, start)
+
+    def poll_message(self, timeout : float) -> Optional[dict]:
+        self._state.mark_ready()
+        self._state.beat()
+        start = time.perf_counter()
+        inputs = self._inner.poll_message(timeout)
+        if inputs is None:
+            return None
+        return self._received(inputs, start)
+
+    def _received(self, inputs : dict, start : float) -> dict:
         self._state.incr('messages_received')
-        return self._inner.receive_message()
+        self._state.observe_stage('receive_wait', time.perf_counter() - start)
+        now = time.time()
+        for entry in inputs.values():
+            # Freshness: how old each input's event already is when it arrives.
+            if not entry.get('is_stop_signal') and entry.get('event_ts') is not None:
+                self._state.observe('input_age_seconds', now - entry['event_ts'])
+        return inputs
 
     def ack_inputs(self) -> None:
         self._state.incr('messages_processed')
-        return self._inner.ack_inputs()
+        start = time.perf_counter()
+        self._inner.ack_inputs()
+        self._state.observe_stage('ack', time.perf_counter() - start)
 
     def fail_inputs(self, exc : BaseException) -> None:
         self._state.incr('messages_failed')
@@ -183,11 +410,54 @@ class InstrumentedMessenger(Messenger):
     def set_output_event_timestamp(self, value : float) -> None:
         return self._inner.set_output_event_timestamp(value)
 
+    def set_output_emission(self, index : int, flush : bool = False) -> None:
+        return self._inner.set_output_emission(index, flush)
+
+    def set_output_span(self, span_id : Optional[str], parent_span_id : Optional[str] = None) -> None:
+        return self._inner.set_output_span(span_id, parent_span_id)
+
+    def set_output_cache_hit(self, hit : Optional[bool]) -> None:
+        self._cache_hit = bool(hit)
+        if hit is not None:
+            self._state.incr('cache_hits' if hit else 'cache_misses')
+        return self._inner.set_output_cache_hit(hit)
+
+    def set_stage_observer(self, observer : Optional[Callable[[str, float], None]]) -> None:
+        return self._inner.set_stage_observer(observer)
+
+    def set_counter_observer(self, observer : Optional[Callable[[str, int], None]]) -> None:
+        return self._inner.set_counter_observer(observer)
+
     def last_input_key(self) -> Optional[str]:
         return self._inner.last_input_key()
 
     def last_input_info(self) -> Optional[dict]:
         return self._inner.last_input_info()
 
+    def output_backlog(self) -> Optional[int]:
+        return self._inner.output_backlog()
+
+    def last_published_event_ts(self) -> Optional[float]:
+        return self._inner.last_published_event_ts()
+
+    def last_published_trace_id(self) -> Optional[str]:
+        return self._inner.last_published_trace_id()
+
+    def input_lag(self) -> Optional[dict[str, int]]:
+        return self._inner.input_lag()
+
+    def buffer_depths(self) -> Optional[list[tuple]]:
+        return self._inner.buffer_depths()
+
+    def checkpoint_inputs(self) -> Any:
+        return self._inner.checkpoint_inputs()
+
+    def restore_inputs(self, token : Any) -> None:
+        return self._inner.restore_inputs(token)
+
     def close(self) -> None:
-        return self._inner.close()
+        try:
+            self._inner.close()
+        finally:
+            if self._pusher is not None:
+                self._pusher.close()
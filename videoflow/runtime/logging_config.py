@@ -2,19 +2,22 @@
 Logging configuration for workers. Opt into JSON structured logs (one object per
 line, easy to ship to a log aggregator) by setting ``VF_STRUCTURED_LOGS=1``;
 otherwise a plain human-readable format is used. Node-scoped fields (flow/run/node/
-replica/trace ids) are included when a log record carries them as ``extra=...``.
+replica/trace ids) are included when a log record carries them as ``extra=...``,
+as are the ``event`` name and ``fields`` of a backpressure event (see
+``videoflow.messaging.events``).
 '''
 from __future__ import absolute_import, division, print_function
 
 import json
 import logging
 import os
+from typing import Any
 
 _CONTEXT_FIELDS = ('flow_id', 'run_id', 'node_name', 'replica_id', 'trace_id', 'span_id', 'edge_id')
 
 class JsonFormatter(logging.Formatter):
     def format(self, record : logging.LogRecord) -> str:
-        payload = {
+        payload : dict[str, Any] = {
             'ts': self.formatTime(record),
             'level': record.levelname,
             'logger': record.name,
@@ -24,6 +27,11 @@ class JsonFormatter(logging.Formatter):
             value = getattr(record, field, None)
             if value is not None:
                 payload[field] = value
+        # Backpressure events (videoflow.messaging.events) carry a name and fields.
+        event = getattr(record, 'event', None)
+        if event is not None:
+            payload['event'] = event
+            payload['fields'] = getattr(record, 'fields', {})
         if record.exc_info:
             payload['exc'] = self.formatException(record.exc_info)
         return json.dumps(payload)
@@ -0,0 +1,353 @@
+'''
+Push-based metrics, for the workers nobody scrapes in time: a BATCH job that
+finishes in seconds, or an edge box without Prometheus. A ``MetricsPusher``
+takes a snapshot of the worker's ``HealthState`` every few seconds on its own
+thread and hands it to each configured ``MetricsSink``, with a final push when
+the messenger is closed — so the task thread never waits on the network and a
+short run still reports its totals.
+
+Sinks are selected by URL (``VF_METRICS_SINKS``, comma-separated):
+
+  statsd://host:8125[?prefix=p]    StatsD over UDP: counter deltas (``|c``),
+                                   gauges, and each histogram's count/sum
+                                   deltas plus its p50/p99 over the interval
+                                   (``|g``), packed into datagrams
+  otlp-file:///path/metrics.jsonl  OTLP/JSON, one ``ExportMetricsServiceRequest``
+                                   per push (cumulative temporality)
+  pushgateway://host:9091          Prometheus Pushgateway: a PUT of the
+  pushgateway+https://host         ``/metrics`` text, grouped by flow, run,
+                                   node and replica
+  memory://                        kept in memory (``InMemoryMetricsSink``), for tests
+
+Others plug in with ``register_metrics_sink`` or a ``videoflow.metrics_sinks``
+entry point. ``VF_METRICS_PUSH_INTERVAL`` (default 10) is the seconds between
+pushes.
+'''
+from __future__ import absolute_import, division, print_function
+
+import json
+import logging
+import re
+import socket
+import threading
+import time
+import urllib.request
+from typing import Any, Callable, Optional, Sequence
+from urllib.parse import parse_qs, quote, urlsplit
+
+from ..utils import plugins
+from .freshness import histogram_quantile
+from .health import HealthState, MetricsSnapshot, render_prometheus
+from .tracing import otlp_attributes
+
+logger = logging.getLogger(__package__)
+
+METRICS_SINK_ENTRY_POINT_GROUP = 'videoflow.metrics_sinks'
+
+DEFAULT_PUSH_INTERVAL_SECONDS = 10.0
+
+# Largest StatsD datagram: fits an Ethernet MTU once IP/UDP headers are added.
+STATSD_MAX_PACKET_BYTES = 1432
+
+# OTLP AggregationTemporality.CUMULATIVE.
+_CUMULATIVE = 2
+
+_STATSD_UNSAFE = re.compile(r'[^A-Za-z0-9_\-]')
+
+class MetricsSink:
+    '''
+    Where pushed metrics go. ``emit`` is called from the pusher's thread with \
+        a snapshot of one worker and its ``resource`` attributes; ``close`` once, \
+        after the final push.
+    '''
+    def emit(self, snapshot : MetricsSnapshot, resource : dict[str, Any]) -> None:
+        raise NotImplementedError('Subclass must implement emit')
+
+    def close(self) -> None:
+        pass
+
+class InMemoryMetricsSink(MetricsSink):
+    '''Keeps every emitted snapshot in ``snapshots`` — for tests and notebooks.'''
+    def __init__(self) -> None:
+        self.snapshots : list[MetricsSnapshot] = []
+        self.closed = False
+
+    def emit(self, snapshot : MetricsSnapshot, resource : dict[str, Any]) -> None:
+        self.snapshots.append(snapshot)
+
+    def close(self) -> None:
+        self.closed = True
+
+def _interval_buckets(bounds : Sequence[float], now : Sequence[int], before : Optional[Sequence[int]]) -> dict[float, float]:
+    '''The cumulative ``{le: count}`` of the observations made since ``before``.'''
+    cumulative = 0.0
+    out : dict[float, float] = {}
+    for i, bound in enumerate(list(bounds) + [float('inf')]):
+        cumulative += now[i] - (before[i] if before else 0)
+        out[bound] = cumulative
+    return out
+
+class StatsDSink(MetricsSink):
+    '''
+    Sends StatsD lines over UDP, named ``<prefix>.<node>.<metric>[.<stage>]``. \
+        Counters go out as the delta since the previous push; the socket is \
+        non-blocking and a datagram that cannot be sent is dropped, as StatsD \
+        expects.
+
+    - Arguments:
+        - host, port: the StatsD daemon.
+        - prefix: first component of every metric name.
+        - max_packet: largest datagram, in bytes; lines are packed up to it.
+    '''
+    def __init__(self, host : str, port : int = 8125, prefix : str = 'videoflow',
+                max_packet : int = STATSD_MAX_PACKET_BYTES) -> None:
+        self._address = (host, port)
+        self._prefix = prefix
+        self._max_packet = max_packet
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._last_counters : dict[str, int] = {}
+        self._last_histograms : dict[tuple[str, Optional[str]], tuple[int, float, list[int]]] = {}
+
+    def _name(self, *parts : Optional[str]) -> str:
+        return '.'.join(_STATSD_UNSAFE.sub('_', p) for p in (self._prefix,) + parts if p)
+
+    def lines(self, snapshot : MetricsSnapshot) -> list[str]:
+        '''The StatsD lines for ``snapshot``, advancing the delta baselines.'''
+        node = snapshot.node
+        lines = []
+        for counter, current in sorted(snapshot.counters.items()):
+            delta = current - self._last_counters.get(counter, 0)
+            self._last_counters[counter] = current
+            if delta:
+                lines.append(f'{self._name(node, counter)}:{delta}|c')
+        for key, m in sorted(snapshot.histograms.items(), key = lambda kv: (kv[0][0], kv[0][1] or '')):
+            count, total, buckets = self._last_histograms.get(key, (0, 0.0, None))
+            self._last_histograms[key] = (m.count, m.total, list(m.buckets))
+            if m.count == count:
+                continue
+            name = self._name(node, *key)
+            lines.append(f'{name}.count:{m.count - count}|c')
+            lines.append(f'{name}.sum:{m.total - total:.6f}|c')
+            interval = _interval_buckets(snapshot.buckets, m.buckets, buckets)
+            for label, q in (('p50', 0.5), ('p99', 0.99)):
+                estimate = histogram_quantile(q, interval)
+                if estimate is not None:
+                    lines.append(f'{name}.{label}:{estimate:.6f}|g')
+        for metric, labels, value in snapshot.gauges:
+            lines.append(f'{self._name(node, metric, *labels.values())}:{value}|g')
+        return lines
+
+    def emit(self, snapshot : MetricsSnapshot, resource : dict[str, Any]) -> None:
+        packet = b''
+        for line in self.lines(snapshot):
+            data = line.encode('utf-8')
+            if packet and len(packet) + 1 + len(data) > self._max_packet:
+                self._send(packet)
+                packet = b''
+            packet = packet + b'\n' + data if packet else data
+        if packet:
+            self._send(packet)
+
+    def _send(self, packet : bytes) -> None:
+        try:
+            self._sock.sendto(packet, self._address)
+        except OSError:
+            logger.debug('statsd datagram dropped', exc_info = True)
+
+    def close(self) -> None:
+        self._sock.close()
+
+def to_otlp_metrics_json(snapshot : MetricsSnapshot, resource : dict[str, Any],
+                         start_ns : int) -> dict:
+    '''
+    Builds an OTLP/JSON ``ExportMetricsServiceRequest`` for one snapshot: counters \
+        as monotonic sums and histograms as explicit-bucket histograms, both \
+        cumulative since ``start_ns``, and the gauges. Every point carries a \
+        ``node`` attribute (and ``stage`` or the gauge's labels), like ``/metrics``.
+    '''
+    now_ns = str(int(snapshot.timestamp * 1e9))
+    start = str(start_ns)
+
+    def point(attributes : dict[str, Any], **fields : Any) -> dict:
+        return dict({'attributes': otlp_attributes(dict({'node': snapshot.node}, **attributes)),
+                     'startTimeUnixNano': start, 'timeUnixNano': now_ns}, **fields)
+
+    metrics = []
+    for counter, total in sorted(snapshot.counters.items()):
+        metrics.append({'name': f'videoflow_{counter}', 'sum': {
+            'aggregationTemporality': _CUMULATIVE, 'isMonotonic': True,
+            'dataPoints': [point({}, asInt = str(total))]}})
+    histograms : dict[str, list[dict]] = {}
+    for (metric, stage), m in sorted(snapshot.histograms.items(), key = lambda kv: (kv[0][0], kv[0][1] or '')):
+        histograms.setdefault(metric, []).append(point(
+            {'stage': stage} if stage else {}, count = str(m.count), sum = m.total,
+            bucketCounts = [str(n) for n in m.buckets], explicitBounds = list(snapshot.buckets)))
+    for metric, points in histograms.items():
+        metrics.append({'name': f'videoflow_{metric}', 'unit': 's', 'histogram': {
+            'aggregationTemporality': _CUMULATIVE, 'dataPoints': points}})
+    gauges : dict[str, list[dict]] = {}
+    for metric, labels, value in snapshot.gauges:
+        gauges.setdefault(metric, []).append(point(labels, asDouble = float(value)))
+    for metric, points in gauges.items():
+        metrics.append({'name': f'videoflow_{metric}', 'gauge': {'dataPoints': points}})
+    return {'resourceMetrics': [{
+        'resource': {'attributes': otlp_attributes(resource)},
+        'scopeMetrics': [{'scope': {'name': 'videoflow'}, 'metrics': metrics}],
+    }]}
+
+class OTLPMetricsFileSink(MetricsSink):
+    '''
+    Appends each push as one line of OTLP/JSON to ``path`` — what the \
+        OpenTelemetry Collector's ``otlpjsonfile`` receiver reads. Opened per \
+        push in append mode, so several workers can share the file.
+    '''
+    def __init__(self, path : str) -> None:
+        if not path:
+            raise ValueError('OTLPMetricsFileSink needs a file path, got an empty one')
+        self._path = path
+        self._start_ns = time.time_ns()
+
+    def emit(self, snapshot : MetricsSnapshot, resource : dict[str, Any]) -> None:
+        line = json.dumps(to_otlp_metrics_json(snapshot, resource, self._start_ns),
+                          separators = (',', ':')) + '\n'
+        with open(self._path, 'a') as f:
+            f.write(line)
+
+class PushGatewaySink(MetricsSink):
+    '''
+    PUTs the ``/metrics`` text to a Prometheus Pushgateway under the grouping \
+        key ``job=videoflow`` plus the resource's flow, run and replica ids and \
+        the node, so each replica replaces only its own group.
+
+    - Arguments:
+        - base_url: the gateway, e.g. ``http://pushgateway:9091``.
+        - timeout: seconds per request.
+    '''
+    def __init__(self, base_url : str, timeout : float = 5.0) -> None:
+        self._base_url = base_url.rstrip('/')
+        self._timeout = timeout
+
+    def url_for(self, snapshot : MetricsSnapshot, resource : dict[str, Any]) -> str:
+        labels = [('job', 'videoflow')]
+        for key in ('videoflow.flow_id', 'videoflow.run_id'):
+            if key in resource:
+                labels.append((key.split('.', 1)[1], str(resource[key])))
+        labels.append(('node', snapshot.node))
+        if 'videoflow.replica_id' in resource:
+            labels.append(('replica', str(resource['videoflow.replica_id'])))
+        return self._base_url + '/metrics' + ''.join(
+            f'/{name}/{quote(value, safe = "")}' for name, value in labels)
+
+    def emit(self, snapshot : MetricsSnapshot, resource : dict[str, Any]) -> None:
+        request = urllib.request.Request(
+            self.url_for(snapshot, resource), data = render_prometheus(snapshot).encode('utf-8'),
+            method = 'PUT', headers = {'Content-Type': 'text/plain; version=0.0.4'})
+        with urllib.request.urlopen(request, timeout = self._timeout):
+            pass
+
+_METRICS_SINKS : dict[str, Callable[[str], MetricsSink]] = {}
+
+def register_metrics_sink(scheme : str, factory : Callable[[str], MetricsSink]) -> None:
+    '''
+    Registers a ``MetricsSink`` factory for a URL scheme. ``factory`` receives \
+        the full URL. Packages may instead declare a ``videoflow.metrics_sinks`` \
+        entry point, so a sink can be selected purely by ``VF_METRICS_SINKS``.
+    '''
+    _METRICS_SINKS[scheme.lower()] = factory
+
+def make_metrics_sink(url : str) -> MetricsSink:
+    '''
+    Builds the metrics sink for ``url``, dispatching on its scheme.
+
+    - Raises:
+        - ValueError: the URL has no scheme, or no sink is registered for it.
+    '''
+    scheme = url.split('://', 1)[0].lower() if '://' in url else ''
+    if scheme and scheme not in _METRICS_SINKS:
+        plugins.load_plugin_group(METRICS_SINK_ENTRY_POINT_GROUP)
+    if scheme not in _METRICS_SINKS:
+        raise ValueError(
+            f'No metrics sink registered for {url!r}. Known schemes: '
+            f'{", ".join(sorted(_METRICS_SINKS))}. Register one with '
+            f'videoflow.runtime.metrics_sinks.register_metrics_sink, or declare a '
+            f'{METRICS_SINK_ENTRY_POINT_GROUP!r} entry point.')
+    return _METRICS_SINKS[scheme](url)
+
+def make_metrics_sinks(spec : str) -> list[MetricsSink]:
+    '''One sink per URL of a comma-separated ``spec`` (``VF_METRICS_SINKS``).'''
+    return [make_metrics_sink(url.strip()) for url in spec.split(',') if url.strip()]
+
+def _statsd_from_url(url : str) -> StatsDSink:
+    parts = urlsplit(url)
+    if not parts.hostname:
+        raise ValueError(f'statsd sink URL needs a host, got {url!r}')
+    prefix = parse_qs(parts.query).get('prefix', ['videoflow'])[0]
+    return StatsDSink(parts.hostname, parts.port or 8125, prefix = prefix)
+
+def _pushgateway_from_url(url : str) -> PushGatewaySink:
+    scheme, rest = url.split('://', 1)
+    return PushGatewaySink(('https' if scheme.lower().endswith('+https') else 'http') + '://' + rest)
+
+register_metrics_sink('memory', lambda url: InMemoryMetricsSink())
+register_metrics_sink('statsd', _statsd_from_url)
+register_metrics_sink('otlp-file', lambda url: OTLPMetricsFileSink(url.split('://', 1)[1]))
+register_metrics_sink('pushgateway', _pushgateway_from_url)
+register_metrics_sink('pushgateway+https', _pushgateway_from_url)
+
+class MetricsPusher:
+    '''
+    Pushes snapshots of ``state`` to ``sinks`` every ``interval`` seconds from a \
+        daemon thread, and once more on ``close``. A failing sink is logged and \
+        skipped; it never reaches the task thread.
+
+    - Arguments:
+        - state: the worker's metrics.
+        - sinks: where snapshots go.
+        - resource: attributes of this process (``service.name``, \
+            ``videoflow.flow_id``, ...), handed to every sink.
+        - interval: seconds between pushes.
+    '''
+    def __init__(self, state : HealthState, sinks : Sequence[MetricsSink],
+                resource : Optional[dict[str, Any]] = None,
+                interval : float = DEFAULT_PUSH_INTERVAL_SECONDS) -> None:
+        if interval <= 0:
+            raise ValueError(f'interval must be > 0, got {interval!r}')
+        self._state = state
+        self._sinks = list(sinks)
+        self._resource = dict(resource or {})
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target = self._run, name = 'vf-metrics-push', daemon = True)
+        self._closed = False
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            self.push()
+
+    def push(self) -> None:
+        snapshot = self._state.snapshot()
+        for sink in self._sinks:
+            try:
+                sink.emit(snapshot, self._resource)
+            except Exception:
+                logger.warning('metrics sink %s failed; dropped one push', type(sink).__name__,
+                               exc_info = True)
+
+    def close(self) -> None:
+        '''Stops the thread, pushes the final snapshot and closes the sinks. Idempotent.'''
+        if self._closed:
+            return
+        self._closed = True
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.push()
+        for sink in self._sinks:
+            try:
+                sink.close()
+            except Exception:
+                logger.debug('metrics sink close failed', exc_info = True)
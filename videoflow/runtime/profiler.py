@@ -0,0 +1,231 @@
+'''
+In-process diagnostics behind the health server's ``/debug`` endpoints, so a
+slow worker can be inspected where it runs — a local subprocess or a pod —
+without exec'ing in to attach py-spy:
+
+  /debug/pystack                   every thread's stack right now, plus the
+                                   pending tasks of any asyncio loop (the
+                                   messenger's NATS loop) — see ``dump_stacks``
+  /debug/profile?seconds=N         a sampling profile of the next N seconds
+      &format=collapsed|speedscope collapsed stacks (flamegraph.pl, speedscope)
+                                   or speedscope's JSON (default collapsed)
+      &mode=cpu|wall               cpu (default): SIGPROF ticks on process CPU
+                                   time, so an idle worker costs nothing;
+                                   wall: a sampler thread on wall-clock time,
+                                   which also shows where threads wait
+      &hz=H                        samples per second (default 100)
+
+Each sample records every thread's stack, root first; the thread name is the
+root frame, so ``MainThread`` (the node's task loop) and ``vf-nats-loop`` (the
+messenger's I/O) separate at the base of a flame graph. One profile runs at a
+time. Python signal handlers run on the main thread between bytecodes, so in
+cpu mode a long native call (a model's forward pass) is attributed once it
+returns — use wall mode to see it while it is running.
+'''
+from __future__ import absolute_import, division, print_function
+
+import asyncio
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from types import FrameType
+from typing import Any, Optional
+
+PROFILE_FORMATS = ('collapsed', 'speedscope')
+PROFILE_MODES = ('cpu', 'wall')
+MAX_PROFILE_SECONDS = 300
+DEFAULT_PROFILE_HZ = 100
+
+def _frame_label(frame : FrameType) -> str:
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+def _stack(frame : Optional[FrameType], skip : Any = None) -> tuple[str, ...]:
+    '''Root-first frame labels of a stack, dropping ``skip`` (the sampler's own code).'''
+    labels = []
+    while frame is not None:
+        if frame.f_code is not skip:
+            labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return tuple(reversed(labels))
+
+def _running_loop(frame : Optional[FrameType]) -> Optional[asyncio.AbstractEventLoop]:
+    '''The asyncio loop a thread is running, found via ``run_forever``'s ``self``.'''
+    while frame is not None:
+        if frame.f_code.co_name == 'run_forever':
+            loop = frame.f_locals.get('self')
+            if isinstance(loop, asyncio.AbstractEventLoop):
+                return loop
+        frame = frame.f_back
+    return None
+
+def dump_stacks() -> str:
+    '''
+    A ``py-spy dump``-style text snapshot: each thread's current stack (innermost \
+        call last), and for a thread running an asyncio loop, the stack of every \
+        task pending on it — where a wedged publish or fetch is waiting.
+    '''
+    names = {t.ident: t for t in threading.enumerate()}
+    frames = sys._current_frames()
+    out = [f'pid {os.getpid()}, {len(frames)} threads, {time.strftime("%Y-%m-%dT%H:%M:%S")}']
+    for ident, frame in frames.items():
+        thread = names.get(ident)
+        name = thread.name if thread is not None else f'thread-{ident}'
+        daemon = ' daemon' if thread is not None and thread.daemon else ''
+        out.append(f'\nThread {name} (ident {ident}{daemon}):')
+        out.append(''.join(traceback.format_stack(frame)).rstrip())
+        loop = _running_loop(frame)
+        if loop is None:
+            continue
+        try:
+            tasks = list(asyncio.all_tasks(loop))
+        except RuntimeError:             # the loop mutated its task set mid-copy
+            tasks = []
+        out.append(f'  asyncio loop: {len(tasks)} pending tasks')
+        for task in tasks:
+            out.append(f'  Task {task.get_name()}:')
+            for task_frame in task.get_stack():
+                code = task_frame.f_code
+                out.append(f'    {code.co_name} ({code.co_filename}:{task_frame.f_lineno})')
+    return '\n'.join(out) + '\n'
+
+# One profile per process at a time (the interval timer is process-wide), and
+# the profiler its SIGPROF ticks are delivered to while it runs.
+_PROFILE_LOCK = threading.Lock()
+_active : Optional['SamplingProfiler'] = None
+
+def _on_sigprof(signum : int, frame : Optional[FrameType]) -> None:
+    profiler = _active
+    if profiler is not None:
+        profiler._sample(frame)
+
+def _install_sigprof() -> bool:
+    '''Installs the shared SIGPROF handler if possible; True if it is (now) ours.'''
+    if not hasattr(signal, 'SIGPROF'):
+        return False
+    current = signal.getsignal(signal.SIGPROF)
+    if current is _on_sigprof:
+        return True
+    if current not in (signal.SIG_DFL, None) or threading.current_thread() is not threading.main_thread():
+        return False
+    signal.signal(signal.SIGPROF, _on_sigprof)
+    return True
+
+class SamplingProfiler:
+    '''
+    A stack sampler for this process. Construct it on the main thread (the \
+        worker does, with the health server) so the SIGPROF handler can be \
+        installed; anywhere else, or where another handler already owns \
+        SIGPROF, cpu mode falls back to the sampler thread.
+    '''
+    def __init__(self) -> None:
+        self._samples : Optional[Counter] = None
+        self._sampler_ident : Optional[int] = None
+        self._signal_ok = _install_sigprof()
+
+    @property
+    def signal_mode_available(self) -> bool:
+        return self._signal_ok
+
+    def _sample(self, main_frame : Optional[FrameType] = None) -> None:
+        samples = self._samples
+        if samples is None:
+            return
+        names = {t.ident: t.name for t in threading.enumerate()}
+        main_ident = threading.main_thread().ident
+        for ident, frame in sys._current_frames().items():
+            if ident == self._sampler_ident:
+                continue                              # the thread running profile() itself
+            if ident == main_ident and main_frame is not None:
+                frame = main_frame                    # the frame the signal interrupted
+            stack = _stack(frame, skip = _on_sigprof.__code__)
+            samples[(names.get(ident, f'thread-{ident}'),) + stack] += 1
+
+    def profile(self, seconds : float, mode : str = 'cpu', hz : int = DEFAULT_PROFILE_HZ) -> Counter:
+        '''
+        Samples for ``seconds`` and returns ``Counter({(thread, frame, ...): count})``.
+
+        - Raises:
+            - ValueError: bad ``seconds``/``mode``/``hz``.
+            - RuntimeError: another profile is already running.
+        '''
+        if not 0 < seconds <= MAX_PROFILE_SECONDS:
+            raise ValueError(f'seconds must be in (0, {MAX_PROFILE_SECONDS}], got {seconds!r}')
+        if mode not in PROFILE_MODES:
+            raise ValueError(f'mode must be one of {PROFILE_MODES}, got {mode!r}')
+        if not 1 <= hz <= 1000:
+            raise ValueError(f'hz must be in [1, 1000], got {hz!r}')
+        global _active
+        if not _PROFILE_LOCK.acquire(blocking = False):
+            raise RuntimeError('a profile is already running')
+        try:
+            self._samples = Counter()
+            self._sampler_ident = threading.get_ident()
+            interval = 1.0 / hz
+            if mode == 'cpu' and self._signal_ok:
+                _active = self
+                signal.setitimer(signal.ITIMER_PROF, interval, interval)
+                try:
+                    time.sleep(seconds)
+                finally:
+                    signal.setitimer(signal.ITIMER_PROF, 0, 0)
+                    _active = None
+            else:
+                deadline = time.monotonic() + seconds
+                while time.monotonic() < deadline:
+                    self._sample()
+                    time.sleep(interval)
+            samples, self._samples = self._samples, None
+            return samples
+        finally:
+            self._samples = None
+            _PROFILE_LOCK.release()
+
+def to_collapsed(samples : Counter) -> str:
+    '''Brendan Gregg's collapsed-stack format: ``root;...;leaf count`` per line.'''
+    return ''.join(f'{";".join(stack)} {count}\n' for stack, count in samples.most_common())
+
+def to_speedscope(samples : Counter, seconds : float, name : str = 'videoflow') -> dict:
+    '''
+    A speedscope file (https://www.speedscope.app/file-format-schema.json) with \
+        one sampled profile per thread; weights are sample counts.
+    '''
+    frames : list[dict] = []
+    index : dict[str, int] = {}
+    profiles : dict[str, dict] = {}
+    for stack, count in samples.items():
+        thread, calls = stack[0], stack[1:]
+        ids = []
+        for label in calls:
+            if label not in index:
+                index[label] = len(frames)
+                func, _, where = label.partition(' (')
+                file, _, line = where.rstrip(')').rpartition(':')
+                frames.append({'name': func, 'file': file, 'line': int(line) if line.isdigit() else 0})
+            ids.append(index[label])
+        profile = profiles.setdefault(thread, {
+            'type': 'sampled', 'name': thread, 'unit': 'none',
+            'startValue': 0, 'endValue': 0, 'samples': [], 'weights': []})
+        profile['samples'].append(ids)
+        profile['weights'].append(count)
+        profile['endValue'] += count
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': f'{name} ({seconds:g}s)',
+        'exporter': 'videoflow',
+        'shared': {'frames': frames},
+        'profiles': list(profiles.values()),
+    }
+
+def render_profile(samples : Counter, fmt : str, seconds : float, name : str = 'videoflow') -> tuple[str, str]:
+    '''``(body, content_type)`` of a profile in ``fmt`` (one of ``PROFILE_FORMATS``).'''
+    if fmt == 'speedscope':
+        return json.dumps(to_speedscope(samples, seconds, name)), 'application/json'
+    if fmt == 'collapsed':
+        return to_collapsed(samples), 'text/plain'
+    raise ValueError(f'format must be one of {PROFILE_FORMATS}, got {fmt!r}')
@@ -0,0 +1,49 @@
+'''
+Shared tier of the processor result cache (``ProcessorNode(cache='content', cache_shared=True)``),
+kept in the flow's blob Redis so every replica of a node — and every later run over
+the same inputs — can reuse a result computed once.
+
+Values are stored with the wire payload codec (``encode_payload``), never pickle:
+the store is shared across processes and images, the same trust boundary the
+broker has (RFC 0001). A consequence worth knowing: a value comes back the way a
+downstream node would have decoded it anyway — tuples as lists.
+'''
+from __future__ import absolute_import, division, print_function
+
+from typing import Any
+
+from ..core.cache import MISSING, SharedResultCache
+
+DEFAULT_RESULT_CACHE_TTL_SECONDS = 86400
+
+class RedisResultCache(SharedResultCache):
+    '''
+    - Arguments:
+        - url: Redis URL (the flow's ``VF_BLOB_REDIS_URL``).
+        - ttl_seconds: lifetime of a cached result.
+    '''
+    def __init__(self, url : str, ttl_seconds : int = DEFAULT_RESULT_CACHE_TTL_SECONDS) -> None:
+        # Deferred: `redis` is an optional dependency (the `blob` extra); the codec
+        # imports the optional protobuf dependency.
+        import redis
+
+        from ..wire.serialization import decode_payload, encode_payload
+        self._client = redis.Redis.from_url(url)
+        self._ttl = ttl_seconds
+        self._encode = encode_payload
+        self._decode = decode_payload
+
+    def _key(self, key : str) -> str:
+        return 'vf-cache-' + key
+
+    def get(self, key : str) -> Any:
+        raw = self._client.get(self._key(key))
+        if raw is None:
+            return MISSING
+        # redis-py types get() more broadly than what we store (always bytes here).
+        payload_type, _, data = bytes(raw).partition(b'\0')  # type: ignore[arg-type]
+        return self._decode(payload_type.decode('utf-8'), data)
+
+    def put(self, key : str, value : Any) -> None:
+        payload_type, data = self._encode(value)
+        self._client.set(self._key(key), payload_type.encode('utf-8') + b'\0' + data, ex = self._ttl)
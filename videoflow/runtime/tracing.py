@@ -0,0 +1,525 @@
+'''
+Distributed tracing: one OpenTelemetry-compatible span per ``next()`` /
+``process()`` / ``consume()`` call, linked across hops through the envelope's
+``span_id`` / ``parent_span_id`` fields.
+
+A ``TracingMessenger`` wraps the worker's messenger. It opens a span when an
+input group is received and ends it when the group is acked (or failed), stamps
+the span's id on every output published in between, and takes its parent from
+the ``span_id`` of the input. A producer's span covers one ``next()`` plus its
+publish.
+
+The OTel trace id is never put on the wire: it is derived from the lineage root
+of the envelope's ``trace_id`` (a producer's ``node:N``, before any ``.k``
+emission suffix), so every hop of one message lands in the same trace. The
+sampling decision is derived from the same hash, so a sampled trace is complete
+end to end and an unsampled message costs a hash and a random id per hop.
+
+Spans are handed to a pluggable ``SpanExporter``, selected by URL
+(``VF_TRACE_EXPORTER``):
+
+  otlp-file:///path/spans.jsonl   OTLP/JSON, one export request per line (the
+                                  format of the OpenTelemetry file exporter);
+                                  several workers may append to the same file
+  memory://                       kept in memory (``InMemorySpanExporter``), for tests
+
+``VF_TRACE_SAMPLE_RATE`` (default 1.0) is the fraction of traces kept; around
+0.01 keeps the cost well under 1% of a 1k msg/s node. ``videoflow debug trace``
+renders an exported file as per-message waterfalls.
+'''
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional, Sequence
+
+from ..core.engine import Messenger
+from ..utils import plugins
+
+logger = logging.getLogger(__package__)
+
+TRACE_EXPORTER_ENTRY_POINT_GROUP = 'videoflow.trace_exporters'
+
+# OTLP span kinds (opentelemetry.proto.trace.v1.Span.SpanKind).
+SPAN_KIND_PRODUCER = 4
+SPAN_KIND_CONSUMER = 5
+
+# OTLP status codes (opentelemetry.proto.trace.v1.Status.StatusCode).
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_EMISSION_SUFFIX = re.compile(r'(\.\d+)+$')
+
+@dataclass
+class Span:
+    '''
+    One finished (or in-flight) span. Ids are lowercase hex: 32 characters for \
+        ``trace_id``, 16 for ``span_id`` / ``parent_span_id`` — the OTLP/JSON form.
+    '''
+    name : str
+    trace_id : str
+    span_id : str
+    parent_span_id : Optional[str] = None
+    kind : int = SPAN_KIND_CONSUMER
+    start_ns : int = 0
+    end_ns : int = 0
+    attributes : dict[str, Any] = field(default_factory = dict)
+    status : int = STATUS_UNSET
+    status_message : str = ''
+    links : list[tuple[str, str]] = field(default_factory = list)
+    events : list[tuple[int, str, dict[str, Any]]] = field(default_factory = list)
+    resource : dict[str, Any] = field(default_factory = dict)
+
+    @property
+    def duration_ns(self) -> int:
+        return self.end_ns - self.start_ns
+
+def lineage_root(trace_id : str) -> str:
+    '''
+    The lineage a (possibly derived) envelope ``trace_id`` descends from: the \
+        ``.k`` suffixes that later emissions of one input group get are dropped, \
+        so all of them trace back to the same message.
+    '''
+    if '.' not in trace_id:         # the common case, and the hot path of every hop
+        return trace_id
+    return _EMISSION_SUFFIX.sub('', trace_id)
+
+def _attr_value(value : Any) -> dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+def otlp_attributes(attributes : dict[str, Any]) -> list[dict]:
+    '''``{key: value}`` as an OTLP ``KeyValue`` list (shared with the OTLP metrics sink).'''
+    return [{'key': k, 'value': _attr_value(v)} for k, v in attributes.items()]
+
+def _from_attrs(attrs : Sequence[dict]) -> dict[str, Any]:
+    out = {}
+    for a in attrs:
+        value = a.get('value', {})
+        if 'intValue' in value:
+            out[a['key']] = int(value['intValue'])
+        elif value:
+            out[a['key']] = next(iter(value.values()))
+    return out
+
+def to_otlp_json(spans : Sequence[Span], resource : dict[str, Any]) -> dict:
+    '''Builds an OTLP/JSON ``ExportTraceServiceRequest`` for spans sharing one resource.'''
+    out = []
+    for s in spans:
+        span = {
+            'traceId': s.trace_id,
+            'spanId': s.span_id,
+            'name': s.name,
+            'kind': s.kind,
+            'startTimeUnixNano': str(s.start_ns),
+            'endTimeUnixNano': str(s.end_ns),
+            'attributes': otlp_attributes(s.attributes),
+            'status': {'code': s.status, 'message': s.status_message} if s.status_message
+                      else {'code': s.status},
+        }
+        if s.parent_span_id:
+            span['parentSpanId'] = s.parent_span_id
+        if s.links:
+            span['links'] = [{'traceId': t, 'spanId': sid} for t, sid in s.links]
+        if s.events:
+            span['events'] = [{'timeUnixNano': str(ts), 'name': name, 'attributes': otlp_attributes(attrs)}
+                              for ts, name, attrs in s.events]
+        out.append(span)
+    return {'resourceSpans': [{
+        'resource': {'attributes': otlp_attributes(resource)},
+        'scopeSpans': [{'scope': {'name': 'videoflow'}, 'spans': out}],
+    }]}
+
+def from_otlp_json(request : dict) -> list[Span]:
+    '''The inverse of ``to_otlp_json``: the spans of one export request.'''
+    spans = []
+    for rs in request.get('resourceSpans', []):
+        resource = _from_attrs(rs.get('resource', {}).get('attributes', []))
+        for ss in rs.get('scopeSpans', []):
+            for s in ss.get('spans', []):
+                status = s.get('status', {})
+                spans.append(Span(
+                    name = s.get('name', ''),
+                    trace_id = s['traceId'],
+                    span_id = s['spanId'],
+                    parent_span_id = s.get('parentSpanId') or None,
+                    kind = s.get('kind', 0),
+                    start_ns = int(s.get('startTimeUnixNano', 0)),
+                    end_ns = int(s.get('endTimeUnixNano', 0)),
+                    attributes = _from_attrs(s.get('attributes', [])),
+                    status = status.get('code', STATUS_UNSET),
+                    status_message = status.get('message', ''),
+                    links = [(link['traceId'], link['spanId']) for link in s.get('links', [])],
+                    events = [(int(e.get('timeUnixNano', 0)), e.get('name', ''),
+                               _from_attrs(e.get('attributes', []))) for e in s.get('events', [])],
+                    resource = resource,
+                ))
+    return spans
+
+class SpanExporter:
+    '''
+    Where finished spans go. ``export`` is called with batches of spans from one \
+        process (sharing ``resource``); ``shutdown`` once, when the worker exits.
+    '''
+    def export(self, spans : Sequence[Span], resource : dict[str, Any]) -> None:
+        raise NotImplementedError('Subclass must implement export')
+
+    def shutdown(self) -> None:
+        pass
+
+class InMemorySpanExporter(SpanExporter):
+    '''Keeps every exported span in ``spans`` — for tests and notebooks.'''
+    def __init__(self) -> None:
+        self.spans : list[Span] = []
+
+    def export(self, spans : Sequence[Span], resource : dict[str, Any]) -> None:
+        for s in spans:
+            s.resource = dict(resource)
+        self.spans.extend(spans)
+
+    def clear(self) -> None:
+        self.spans = []
+
+class OTLPFileExporter(SpanExporter):
+    '''
+    Appends each batch as one line of OTLP/JSON to ``path`` — what the \
+        OpenTelemetry Collector's ``otlpjsonfile`` receiver reads. The file is \
+        opened per batch in append mode, so several workers can share it.
+    '''
+    def __init__(self, path : str) -> None:
+        if not path:
+            raise ValueError('OTLPFileExporter needs a file path, got an empty one')
+        self._path = path
+
+    def export(self, spans : Sequence[Span], resource : dict[str, Any]) -> None:
+        line = json.dumps(to_otlp_json(spans, resource), separators = (',', ':')) + '\n'
+        with open(self._path, 'a') as f:
+            f.write(line)
+
+def read_otlp_file(path : str) -> list[Span]:
+    '''Every span in an OTLP/JSON-lines file (as written by ``OTLPFileExporter``).'''
+    spans = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                spans.extend(from_otlp_json(json.loads(line)))
+    return spans
+
+_TRACE_EXPORTERS : dict[str, Callable[[str], SpanExporter]] = {}
+
+def register_trace_exporter(scheme : str, factory : Callable[[str], SpanExporter]) -> None:
+    '''
+    Registers a ``SpanExporter`` factory for a URL scheme. ``factory`` receives \
+        the full URL. Packages may instead declare a ``videoflow.trace_exporters`` \
+        entry point, so an exporter can be selected purely by ``VF_TRACE_EXPORTER``.
+    '''
+    _TRACE_EXPORTERS[scheme.lower()] = factory
+
+def make_trace_exporter(url : str) -> SpanExporter:
+    '''
+    Builds the span exporter for ``url``, dispatching on its scheme.
+
+    - Raises:
+        - ValueError: the URL has no scheme, or no exporter is registered for it.
+    '''
+    scheme = url.split('://', 1)[0].lower() if '://' in url else ''
+    if scheme and scheme not in _TRACE_EXPORTERS:
+        plugins.load_plugin_group(TRACE_EXPORTER_ENTRY_POINT_GROUP)
+    if scheme not in _TRACE_EXPORTERS:
+        raise ValueError(
+            f'No trace exporter registered for {url!r}. Known schemes: '
+            f'{", ".join(sorted(_TRACE_EXPORTERS))}. Register one with '
+            f'videoflow.runtime.tracing.register_trace_exporter, or declare a '
+            f'{TRACE_EXPORTER_ENTRY_POINT_GROUP!r} entry point.')
+    return _TRACE_EXPORTERS[scheme](url)
+
+register_trace_exporter('memory', lambda url: InMemorySpanExporter())
+register_trace_exporter('otlp-file', lambda url: OTLPFileExporter(url.split('://', 1)[1]))
+
+class Tracer:
+    '''
+    Mints span ids, makes the (deterministic, per-trace) sampling decision and \
+        batches finished spans to an exporter.
+
+    - Arguments:
+        - exporter: where finished spans go.
+        - sample_rate: fraction of traces recorded, in [0, 1].
+        - resource: OTel resource attributes of this process (``service.name``, ...).
+        - batch_size: spans buffered before an export.
+    '''
+    def __init__(self, exporter : SpanExporter, sample_rate : float = 1.0,
+                resource : Optional[dict[str, Any]] = None, batch_size : int = 256) -> None:
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError(f'sample_rate must be within [0, 1], got {sample_rate!r}')
+        if batch_size < 1:
+            raise ValueError(f'batch_size must be >= 1, got {batch_size!r}')
+        self._exporter = exporter
+        self._threshold = int(sample_rate * (1 << 64))
+        self._resource = dict(resource or {})
+        self._batch_size = batch_size
+        self._buffer : list[Span] = []
+        self._lock = threading.Lock()
+
+    def trace_context(self, flow_id : str, run_id : str, lineage : str) -> tuple[str, bool]:
+        '''``(otel_trace_id, sampled)`` of an envelope ``trace_id``, the same on every hop.'''
+        digest = hashlib.blake2b(f'{flow_id}/{run_id}/{lineage_root(lineage)}'.encode(),
+                                 digest_size = 16).digest()
+        return digest.hex(), int.from_bytes(digest[8:], 'big') < self._threshold
+
+    @staticmethod
+    def new_span_id() -> str:
+        return f'{random.getrandbits(64) | 1:016x}'   # never the all-zero (invalid) id
+
+    def record(self, span : Span) -> None:
+        with self._lock:
+            self._buffer.append(span)
+            if len(self._buffer) < self._batch_size:
+                return
+            batch, self._buffer = self._buffer, []
+        self._export(batch)
+
+    def flush(self) -> None:
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if batch:
+            self._export(batch)
+
+    def shutdown(self) -> None:
+        self.flush()
+        self._exporter.shutdown()
+
+    def _export(self, batch : list[Span]) -> None:
+        try:
+            self._exporter.export(batch, self._resource)
+        except Exception:
+            # Tracing must never take the data path down with it.
+            logger.warning('span export failed; dropped %d spans', len(batch), exc_info = True)
+
+class TracingMessenger(Messenger):
+    '''
+    Wraps a messenger to record one span per input group (or per producer output) \
+        and to stamp span ids on outgoing envelopes. Everything else is delegated.
+
+    - Arguments:
+        - inner: the messenger to wrap.
+        - tracer: the ``Tracer`` spans are recorded to.
+        - node_name / flow_id / run_id / replica_id: identify this worker.
+        - operation: the node method a span times — ``'next'``, ``'process'`` or ``'consume'``.
+    '''
+    def __init__(self, inner : Messenger, tracer : Tracer, node_name : str, flow_id : str,
+                run_id : str, replica_id : int = 0, operation : str = 'process') -> None:
+        self._inner = inner
+        self._tracer = tracer
+        self._node_name = node_name
+        self._flow_id = flow_id
+        self._run_id = run_id
+        self._replica_id = replica_id
+        self._operation = operation
+        # The input group in flight: (span id, parent span id, recorded Span), all
+        # None when its trace is not sampled; None outside an input group.
+        self._current : Optional[tuple[Optional[str], Optional[str], Optional[Span]]] = None
+        self._stopped = False
+
+    def _span(self, name : str, trace_id : str, span_id : str, parent_span_id : Optional[str],
+              kind : int, start_ns : int, lineage : str) -> Span:
+        return Span(name = name, trace_id = trace_id, span_id = span_id,
+                    parent_span_id = parent_span_id, kind = kind, start_ns = start_ns,
+                    attributes = {'videoflow.node': self._node_name,
+                                  'videoflow.replica_id': self._replica_id,
+                                  'videoflow.trace_id': lineage})
+
+    def _end(self, status : int, exc : Optional[BaseException] = None) -> None:
+        current, self._current = self._current, None
+        if current is None or current[2] is None:
+            return
+        span = current[2]
+        span.end_ns = time.time_ns()
+        span.status = status
+        if exc is not None:
+            span.status_message = str(exc)
+            span.events.append((span.end_ns, 'exception', {'exception.type': type(exc).__name__,
+                                                            'exception.message': str(exc)}))
+        self._tracer.record(span)
+
+    def receive_message(self) -> dict:
+        self._end(STATUS_UNSET)
+        return self._received(self._inner.receive_message())
+
+    def poll_message(self, timeout : float) -> Optional[dict]:
+        self._end(STATUS_UNSET)
+        inputs = self._inner.poll_message(timeout)
+        return None if inputs is None else self._received(inputs)
+
+    def _received(self, inputs : dict) -> dict:
+        if any(entry.get('is_stop_signal') for entry in inputs.values()):
+            self._stopped = True
+            return inputs
+        entries = [e for e in (self._inner.last_input_info() or {}).values() if e]
+        parent_span_id = next((e['span_id'] for e in entries if e.get('span_id')), None)
+        lineage = next((e['trace_id'] for e in entries if e.get('trace_id')), None)
+        span = None
+        if lineage is not None:
+            trace_id, sampled = self._tracer.trace_context(self._flow_id, self._run_id, lineage)
+            if sampled:
+                span = self._span(f'{self._node_name}.{self._operation}', trace_id,
+                                  self._tracer.new_span_id(), parent_span_id,
+                                  SPAN_KIND_CONSUMER, time.time_ns(), lineage)
+                # The other parents of a join: their own traces, linked rather than parented.
+                for e in entries:
+                    if e.get('span_id') and e['span_id'] != parent_span_id and e.get('trace_id'):
+                        other, _ = self._tracer.trace_context(self._flow_id, self._run_id, e['trace_id'])
+                        span.links.append((other, e['span_id']))
+        # Unsampled: the outputs carry no span ids (nothing downstream records this trace).
+        self._current = (span.span_id, parent_span_id, span) if span is not None else (None, None, None)
+        return inputs
+
+    def publish_message(self, message : Any, metadata : Optional[dict] = None) -> None:
+        if self._current is not None:
+            self._inner.set_output_span(self._current[0], self._current[1])
+            self._inner.publish_message(message, metadata)
+            return
+        # No input group: a producer's output (or a processor's end-of-stream
+        # flush), traced as a root span covering the call that made it.
+        end_ns = time.time_ns()
+        proctime = (metadata or {}).get('proctime')
+        start_ns = end_ns - int(proctime * 1e9) if isinstance(proctime, (int, float)) else end_ns
+        span_id = self._tracer.new_span_id()
+        self._inner.set_output_span(span_id, None)
+        self._inner.publish_message(message, metadata)
+        lineage = self._inner.last_published_trace_id()
+        if lineage is None:
+            return
+        trace_id, sampled = self._tracer.trace_context(self._flow_id, self._run_id, lineage)
+        if sampled:
+            operation = 'flush' if self._stopped else self._operation
+            span = self._span(f'{self._node_name}.{operation}', trace_id, span_id, None,
+                              SPAN_KIND_PRODUCER, start_ns, lineage)
+            span.end_ns = time.time_ns()
+            span.status = STATUS_OK
+            self._tracer.record(span)
+
+    def ack_inputs(self) -> None:
+        self._inner.ack_inputs()
+        self._end(STATUS_OK)
+
+    def fail_inputs(self, exc : BaseException) -> None:
+        self._inner.fail_inputs(exc)
+        self._end(STATUS_ERROR, exc)
+
+    def checkpoint_inputs(self) -> Any:
+        token = (self._inner.checkpoint_inputs(), self._current)
+        self._current = None
+        return token
+
+    def restore_inputs(self, token : Any) -> None:
+        inner_token, self._current = token
+        self._inner.restore_inputs(inner_token)
+
+    def publish_stop_signal(self) -> None:
+        return self._inner.publish_stop_signal()
+
+    def check_for_termination(self) -> bool:
+        return self._inner.check_for_termination()
+
+    def set_output_partition_key(self, value : Any) -> None:
+        return self._inner.set_output_partition_key(value)
+
+    def set_output_event_timestamp(self, value : float) -> None:
+        return self._inner.set_output_event_timestamp(value)
+
+    def set_output_emission(self, index : int, flush : bool = False) -> None:
+        return self._inner.set_output_emission(index, flush)
+
+    def set_output_span(self, span_id : Optional[str], parent_span_id : Optional[str] = None) -> None:
+        return self._inner.set_output_span(span_id, parent_span_id)
+
+    def set_output_cache_hit(self, hit : Optional[bool]) -> None:
+        return self._inner.set_output_cache_hit(hit)
+
+    def set_stage_observer(self, observer : Optional[Callable[[str, float], None]]) -> None:
+        return self._inner.set_stage_observer(observer)
+
+    def set_counter_observer(self, observer : Optional[Callable[[str, int], None]]) -> None:
+        return self._inner.set_counter_observer(observer)
+
+    def last_input_key(self) -> Optional[str]:
+        return self._inner.last_input_key()
+
+    def last_input_info(self) -> Optional[dict]:
+        return self._inner.last_input_info()
+
+    def last_published_event_ts(self) -> Optional[float]:
+        return self._inner.last_published_event_ts()
+
+    def last_published_trace_id(self) -> Optional[str]:
+        return self._inner.last_published_trace_id()
+
+    def input_lag(self) -> Optional[dict[str, int]]:
+        return self._inner.input_lag()
+
+    def output_backlog(self) -> Optional[int]:
+        return self._inner.output_backlog()
+
+    def buffer_depths(self) -> Optional[list[tuple]]:
+        return self._inner.buffer_depths()
+
+    def close(self) -> None:
+        try:
+            self._inner.close()
+        finally:
+            self._end(STATUS_UNSET)
+            self._tracer.flush()
+
+def format_trace(spans : Sequence[Span], width : int = 40) -> str:
+    '''
+    Renders the spans of one trace as a waterfall: one line per span, indented \
+        under its parent, with its start offset, its duration and a bar on a \
+        shared time axis. A gap between a parent's bar and its child's is time \
+        spent in transit (publish, broker, queueing) rather than in a node.
+    '''
+    if not spans:
+        return ''
+    t0 = min(s.start_ns for s in spans)
+    extent = max(max(s.end_ns for s in spans) - t0, 1)
+    by_id = {s.span_id: s for s in spans}
+    children : dict[Optional[str], list[Span]] = {}
+    for s in spans:
+        parent = s.parent_span_id if s.parent_span_id in by_id else None
+        children.setdefault(parent, []).append(s)
+
+    rows = []
+    def walk(parent : Optional[str], depth : int) -> None:
+        for s in sorted(children.get(parent, []), key = lambda s: s.start_ns):
+            rows.append((depth, s))
+            walk(s.span_id, depth + 1)
+    walk(None, 0)
+
+    label_w = max(len('  ' * d + s.name) for d, s in rows)
+    lines = [f'trace {spans[0].trace_id}  {extent / 1e6:.1f} ms  {len(spans)} spans']
+    for depth, s in rows:
+        lo = int((s.start_ns - t0) / extent * width)
+        hi = max(int((s.end_ns - t0) / extent * width), lo + 1)
+        bar = ' ' * lo + '#' * (hi - lo) + ' ' * (width - hi)
+        flag = '  ERROR' if s.status == STATUS_ERROR else ''
+        lines.append(f'{("  " * depth + s.name).ljust(label_w)}  +{(s.start_ns - t0) / 1e6:8.1f}ms '
+                     f'{s.duration_ns / 1e6:8.1f}ms |{bar}|{flag}')
+    return '\n'.join(lines)
+
+def group_traces(spans : Sequence[Span]) -> dict[str, list[Span]]:
+    '''Spans grouped by trace id.'''
+    traces : dict[str, list[Span]] = {}
+    for s in spans:
+        traces.setdefault(s.trace_id, []).append(s)
+    return traces
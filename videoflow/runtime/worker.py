@@ -33,6 +33,20 @@ the original graph-building script.
     VF_BLOB_TTL_SECONDS optional; TTL for offloaded payloads (PROTOCOL.md BLOB-7).
                         Unset ⇒ flow-type default (3600 realtime / 86400 batch).
     VF_ENVELOPE_VERSION optional; wire envelope version to emit (only 4, protobuf)
+    VF_METRICS_DIR      optional; registry directory of a local run's metrics
+                        aggregator: the health server binds an ephemeral port (unless
+                        VF_HEALTH_PORT gives one) and registers it there, and the
+                        final /metrics text is left there on exit (runtime/flowmetrics.py)
+    VF_METRICS_SINKS    optional; comma-separated metrics sink URLs (statsd://host:port,
+                        otlp-file:///path, pushgateway://host:port, or a registered
+                        scheme) pushed to from a background thread and once more on
+                        exit (runtime/metrics_sinks.py)
+    VF_METRICS_PUSH_INTERVAL optional; seconds between pushes to the sinks (default 10)
+    VF_DEBUG_ENDPOINTS  optional; '0' turns off the health server's /debug/pystack and
+                        /debug/profile endpoints (default on; runtime/profiler.py)
+    VF_TRACE_EXPORTER   optional; span exporter URL (otlp-file:///path, memory://, or
+                        a registered scheme) — enables tracing (runtime/tracing.py)
+    VF_TRACE_SAMPLE_RATE optional; fraction of traces recorded (default 1.0)
 '''
 from __future__ import absolute_import, division, print_function
 
@@ -47,9 +61,13 @@ from ..core.context import RuntimeContext
 from ..core.engine import Messenger
 from ..core.node import ConsumerNode, Node, ProcessorNode, ProducerNode
 from ..core.task import ConsumerTask, ProcessorTask, ProducerTask, Task
-from .health import HealthServer, HealthState, InstrumentedMessenger
+from .flowmetrics import register_worker, write_final_metrics
+from .health import HealthServer, HealthState, InstrumentedMessenger, parse_buckets
 from .idempotency import RedisIdempotencyStore
 from .logging_config import configure_logging
+from .metrics_sinks import DEFAULT_PUSH_INTERVAL_SECONDS, MetricsPusher, make_metrics_sinks
+from .result_cache import RedisResultCache
+from .tracing import Tracer, TracingMessenger, make_trace_exporter
 
 logger = logging.getLogger('videoflow.worker')
 
@@ -175,19 +193,53 @@ def run_from_env() -> None:
         blob_ttl_seconds = blob_ttl_seconds,
     )
 
-    # Health/metrics server: reads VF_HEALTH_PORT (0 disables, e.g. under the local
-    # engine where several workers share a host and would collide on the port).
+    # Tracing (opt-in): innermost wrapper, so a span spans the instrumented stages too.
+    tracer = None
+    trace_exporter_url = os.environ.get('VF_TRACE_EXPORTER')
+    if trace_exporter_url:
+        tracer = Tracer(make_trace_exporter(trace_exporter_url),
+                        sample_rate = float(os.environ.get('VF_TRACE_SAMPLE_RATE', '1.0')),
+                        resource = {'service.name': node_name, 'videoflow.flow_id': flow_id,
+                                    'videoflow.run_id': run_id, 'videoflow.replica_id': replica_id})
+        operation = {NODE_KIND_PRODUCER: 'next', NODE_KIND_CONSUMER: 'consume'}.get(kind, 'process')
+        messenger = TracingMessenger(messenger, tracer, node_name, flow_id, run_id,
+                                     replica_id = replica_id, operation = operation)
+
+    # Health/metrics server: reads VF_HEALTH_PORT (0 disables). The local engine
+    # leaves it off unless given a metrics_port, then hands each worker its own,
+    # or collects metrics, then each worker binds any free port and registers it
+    # in VF_METRICS_DIR.
     health_port = int(os.environ.get('VF_HEALTH_PORT', '0'))
+    metrics_dir = os.environ.get('VF_METRICS_DIR') or None
+    # Push sinks need the same instrumentation, with or without a server to scrape.
+    metrics_sinks = os.environ.get('VF_METRICS_SINKS') or None
     health_server = None
-    if health_port > 0:
-        state = HealthState(node_name)
-        health_server = HealthServer(state, port = health_port)
-        health_server.start()
-        messenger = InstrumentedMessenger(messenger, state)
+    state = None
+    if health_port > 0 or metrics_dir or metrics_sinks:
+        state = HealthState(node_name, buckets = parse_buckets(os.environ.get('VF_METRICS_BUCKETS')))
+        if health_port > 0 or metrics_dir:
+            # The /debug profiler endpoints are on unless VF_DEBUG_ENDPOINTS is falsy.
+            debug = os.environ.get('VF_DEBUG_ENDPOINTS', '1').lower() not in ('0', 'false', 'no')
+            health_server = HealthServer(state, port = health_port, debug = debug)
+            health_server.start()
+            if metrics_dir:
+                register_worker(metrics_dir, node_name, replica_id, health_server.port)
+        pusher = None
+        if metrics_sinks:
+            pusher = MetricsPusher(
+                state, make_metrics_sinks(metrics_sinks),
+                resource = {'service.name': node_name, 'videoflow.flow_id': flow_id,
+                            'videoflow.run_id': run_id, 'videoflow.replica_id': replica_id},
+                interval = float(os.environ.get('VF_METRICS_PUSH_INTERVAL',
+                                                str(DEFAULT_PUSH_INTERVAL_SECONDS))))
+            pusher.start()
+        # Closing it (in the finally below) makes the pusher's final push.
+        messenger = InstrumentedMessenger(messenger, state, pusher = pusher)
 
     ctx = RuntimeContext(
         flow_id, run_id, node_name, replica_id,
         logging.getLogger(f'videoflow.node.{node_name}'), messenger = messenger,
+        partition_by = partition_by,
     )
 
     task: Task
@@ -195,8 +247,12 @@ def run_from_env() -> None:
         task = ProducerTask(require_node_kind(node, ProducerNode, kind),
                             messenger, has_children, ctx = ctx)
     elif kind == NODE_KIND_PROCESSOR:
-        task = ProcessorTask(require_node_kind(node, ProcessorNode, kind),
-                            messenger, has_children, parent_names, ctx = ctx)
+        processor = require_node_kind(node, ProcessorNode, kind)
+        shared_cache = None
+        if processor.cache and processor.cache_shared and blob_redis_url:
+            shared_cache = RedisResultCache(blob_redis_url)
+        task = ProcessorTask(processor, messenger, has_children, parent_names, ctx = ctx,
+                            shared_cache = shared_cache)
     elif kind == NODE_KIND_CONSUMER:
         consumer = require_node_kind(node, ConsumerNode, kind)
         idem_store = None
@@ -212,6 +268,10 @@ def run_from_env() -> None:
         task.run()
     finally:
         messenger.close()
+        if tracer is not None:
+            tracer.shutdown()
+        if metrics_dir and state is not None:
+            write_final_metrics(metrics_dir, node_name, replica_id, state.render_metrics())
         if health_server is not None:
             health_server.stop()
     logger.info(f'Worker finished: node={node_name}')
@@ -1,5 +1,8 @@
 from __future__ import absolute_import, division, print_function
 
+import threading
+from typing import Any, Dict, Optional, Tuple, Union
+
 import cv2
 import numpy as np
 
@@ -20,3 +23,128 @@ def resize_add_padding(im : np.ndarray, t_h : int, t_w : int) -> np.ndarray:
     res_im = cv2.resize(im, (res_w, res_h))
     new_im[:res_h, :res_w, :] = res_im
     return new_im
+
+#: ``FrameSpec.interpolation`` names, mapped to their OpenCV flags.
+INTERPOLATIONS = {
+    'nearest': cv2.INTER_NEAREST,
+    'linear': cv2.INTER_LINEAR,
+    'area': cv2.INTER_AREA,
+    'cubic': cv2.INTER_CUBIC,
+}
+COLOR_ORDERS = ('rgb', 'bgr', 'gray')
+FRAME_DTYPES = ('uint8', 'float32')
+
+_FROM_BGR = {'rgb': cv2.COLOR_BGR2RGB, 'gray': cv2.COLOR_BGR2GRAY}
+
+class FrameSpec:
+    '''
+    The layout a producer should publish its frames in, so that work every \
+        consumer of a stream would otherwise repeat (and pay wire cost for) is done \
+        once, at the source.
+
+    - Arguments:
+        - size: ``(width, height)`` to resize to, or None to keep the source size.
+        - interpolation: one of ``INTERPOLATIONS``. ``area`` (default) is the \
+            right choice for downscaling.
+        - color: one of ``COLOR_ORDERS``, or None to follow the producer's own \
+            ``swap_channels``.
+        - dtype: one of ``FRAME_DTYPES``. ``float32`` frames are scaled to [0, 1].
+    '''
+    def __init__(self, size : Optional[Tuple[int, int]] = None, interpolation : str = 'area',
+                color : Optional[str] = None, dtype : str = 'uint8') -> None:
+        if size is not None:
+            if len(size) != 2 or any(not isinstance(v, int) or v < 1 for v in size):
+                raise ValueError(f'size must be a (width, height) pair of positive ints, got {size!r}')
+            size = (size[0], size[1])
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError(f'interpolation must be one of {tuple(INTERPOLATIONS)}, got {interpolation!r}')
+        if color is not None and color not in COLOR_ORDERS:
+            raise ValueError(f'color must be one of {COLOR_ORDERS}, got {color!r}')
+        if dtype not in FRAME_DTYPES:
+            raise ValueError(f'dtype must be one of {FRAME_DTYPES}, got {dtype!r}')
+        self.size = size
+        self.interpolation = interpolation
+        self.color = color
+        self.dtype = dtype
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'size': list(self.size) if self.size is not None else None,
+            'interpolation': self.interpolation,
+            'color': self.color,
+            'dtype': self.dtype,
+        }
+
+    @classmethod
+    def from_dict(cls, d : Optional[Dict[str, Any]]) -> Optional["FrameSpec"]:
+        if d is None:
+            return None
+        return cls(
+            size = tuple(d['size']) if d.get('size') is not None else None,
+            interpolation = d.get('interpolation', 'area'),
+            color = d.get('color'),
+            dtype = d.get('dtype', 'uint8'),
+        )
+
+#: What a producer's ``output=`` argument accepts; stored as the dict form.
+FrameSpecArg = Union[FrameSpec, dict, None]
+
+def frame_spec_to_dict(spec : FrameSpecArg) -> Optional[Dict[str, Any]]:
+    '''Validates a producer's ``output=`` argument and returns its JSON-serializable form.'''
+    if isinstance(spec, dict):
+        spec = FrameSpec.from_dict(spec)
+    return spec.to_dict() if spec is not None else None
+
+class FrameTransform:
+    '''
+    Applies a ``FrameSpec`` to the BGR ``uint8`` frames OpenCV decodes: resize, \
+        then color conversion, then dtype, each as a single OpenCV/numpy call. \
+        Steps before the last write into scratch buffers kept per thread and \
+        reused across frames; only the last step allocates, so the returned frame \
+        is contiguous and owned by the caller (it may sit in a read-ahead buffer \
+        or be published while the next frame is decoded). With nothing to do, the \
+        decoded frame is returned as is.
+
+    - Arguments:
+        - spec: the ``FrameSpec``, or None.
+        - default_color: color order when ``spec`` doesn't set one.
+    '''
+    def __init__(self, spec : Optional[FrameSpec], default_color : str = 'rgb') -> None:
+        spec = spec or FrameSpec()
+        self._size = spec.size
+        self._interpolation = INTERPOLATIONS[spec.interpolation]
+        self._color_code = _FROM_BGR.get(spec.color or default_color)
+        self._float = spec.dtype == 'float32'
+        self._local = threading.local()
+
+    def _resize(self, src : np.ndarray, dst : Optional[np.ndarray]) -> np.ndarray:
+        return cv2.resize(src, self._size, dst = dst, interpolation = self._interpolation)
+
+    def _convert(self, src : np.ndarray, dst : Optional[np.ndarray]) -> np.ndarray:
+        # Only made a step when there is a conversion to do.
+        assert self._color_code is not None
+        return cv2.cvtColor(src, self._color_code, dst = dst)
+
+    def _scale(self, src : np.ndarray, dst : Optional[np.ndarray]) -> np.ndarray:
+        if dst is None or dst.shape != src.shape:
+            dst = np.empty(src.shape, dtype = np.float32)
+        return np.multiply(src, np.float32(1.0 / 255.0), out = dst)
+
+    def __call__(self, frame : np.ndarray) -> np.ndarray:
+        steps = []
+        if self._size is not None and (frame.shape[1], frame.shape[0]) != self._size:
+            steps.append(self._resize)
+        if self._color_code is not None:
+            steps.append(self._convert)
+        if self._float:
+            steps.append(self._scale)
+        scratch = getattr(self._local, 'scratch', None)
+        if scratch is None:
+            scratch = self._local.scratch = {}
+        out = frame
+        for i, step in enumerate(steps):
+            if i == len(steps) - 1:
+                out = step(out, None)
+            else:
+                out = scratch[i] = step(out, scratch.get(i))
+        return out
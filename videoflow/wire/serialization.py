@@ -463,6 +463,19 @@ def _decode_payload_v4(payload_type : str, buf : bytes, blob_store : BlobStore |
     # Unknown type: hand back opaque bytes so a forwarding node can re-emit them.
     return RawPayload(payload_type, buf)
 
+def encode_payload(payload : Any) -> Tuple[str, bytes]:
+    '''
+    Encodes a bare payload — no envelope, no blob offload — to \
+        ``(payload_type, bytes)`` with exactly the rules the wire uses. For \
+        runtime stores that keep payloads outside the broker (the shared result \
+        cache); like the wire, it never falls back to pickle.
+    '''
+    return _encode_payload_v4(payload)
+
+def decode_payload(payload_type : str, buf : bytes) -> Any:
+    '''Inverse of ``encode_payload``.'''
+    return _decode_payload_v4(payload_type, buf)
+
 def _encode_envelope_v4(producer_name : str, flow_id : str, run_id : str, trace_id : str,
                         seq : int, msg_type : str, metadata : dict | None, payload : Any,
                         span_id : str | None, parent_span_id : str | None, replica_id : int,
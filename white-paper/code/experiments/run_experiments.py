@@ -24,6 +24,10 @@ Experiments:
           {1,2,4} partitioned replicas; throughput and join correctness.
 - **e6**  Time-aligned quorum join: two independent producers (one dropping every
           3rd frame) fused with ``mode='time'``, ``quorum=1``; group completeness.
+
+These reproduce the paper's figures. For tracking performance from commit to
+commit, ``videoflow bench`` runs cut-down versions (wire, hop, scaling, join,
+blob) and compares them against a saved baseline.
 '''
 from __future__ import absolute_import, division, print_function
 